@@ -0,0 +1,98 @@
+from benchmark.bench_config import BENCHMARK_DOTENV_DEFAULTS
+from lib.authorization_client import AuthorizationClient
+from lib.util import environment, jws
+from unittest.mock import MagicMock
+import base64
+import timeit
+import json
+import os
+
+
+def build_message(header=None, overrides=None, payload_size=20000):
+    """
+    Builds a flattened JWS message, carrying a payload of roughly the given size.
+    The signature is a placeholder, since verification is not part of what is being timed.
+
+    Arguments:
+        header (dict) : The protected header. Defaults to a whitelisted x5u.
+        overrides (dict) : Members of the message to replace (or, if set to None, remove). Defaults to none.
+        payload_size (int) : The size of the sensor data in the payload, in bytes. Defaults to 20000.
+
+    Returns:
+        MagicMock : An object with the same topic and payload attributes as an MQTTMessage.
+    """
+    # Build the message members.
+    if header is None:
+        header = {'alg': 'ES256', 'x5u': 'dns://device99._device.example.com?type=TLSA'}
+    sensor_data = json.dumps({'readings': [i % 97 for i in range(payload_size // 3)]}).encode()
+    message = {
+        'protected': base64.b64encode(json.dumps(header).encode()).decode(),
+        'payload': base64.urlsafe_b64encode(sensor_data).decode().rstrip('='),
+        'signature': 'c2lnbmF0dXJl',
+    }
+
+    # Apply the overrides, then serialize.
+    for member, value in (overrides or {}).items():
+        if value is None:
+            message.pop(member, None)
+        else:
+            message[member] = value
+    return MagicMock(topic='bench/topic', payload=json.dumps(message).encode())
+
+
+def build_compact_message(payload_size=20000):
+    """
+    Builds the compact serialization of the accepted message built by build_message.
+
+    Arguments:
+        payload_size (int) : The size of the sensor data in the payload, in bytes. Defaults to 20000.
+
+    Returns:
+        MagicMock : An object with the same topic and payload attributes as an MQTTMessage.
+    """
+    message = json.loads(build_message(payload_size=payload_size).payload)
+    protected = base64.urlsafe_b64decode(message['protected'])
+    header = base64.urlsafe_b64encode(protected).decode().rstrip('=')
+    return MagicMock(topic='bench/topic', payload=f'{header}.{message["payload"]}.{message["signature"]}'.encode())
+
+
+def main(number=2000):
+    """
+    Times AuthorizationClient.authorized for the accepted path and for each rejection path.
+    Verification itself is replaced with a stub, so only header extraction and the whitelist check are timed.
+
+    Arguments:
+        number (int) : The number of messages timed per path. Defaults to 2000.
+    """
+    # Fill in the .env variables, then compile the config the same way load_dotenv does.
+    for variable_name, value in BENCHMARK_DOTENV_DEFAULTS.items():
+        os.environ.setdefault(variable_name, value)
+    environment.CONFIG = environment.compile_config()
+
+    # Build one message per path.
+    paths = [
+        ('accepted', build_message()),
+        ('accepted (compact)', build_compact_message()),
+        ('not json', MagicMock(topic='bench/topic', payload=b'{' + b'0' * 20000)),
+        ('missing protected', build_message(overrides={'protected': None})),
+        ('protected not b64', build_message(overrides={'protected': 'abc'})),
+        ('protected not json', build_message(overrides={'protected': base64.b64encode(b'nope').decode()})),
+        ('missing x5u', build_message({'alg': 'ES256'})),
+        ('x5u malformed', build_message({'alg': 'ES256', 'x5u': 'https://device99'})),
+        ('not whitelisted', build_message({'alg': 'ES256', 'x5u': 'dns://stranger?type=TLSA'})),
+    ]
+
+    # Stub out verification, then time each path.
+    verify = AuthorizationClient.verify_authentication_with_timeout
+    AuthorizationClient.verify_authentication_with_timeout = staticmethod(lambda message_payload, dns_name: True)
+    try:
+        print(f'JSON backend: {jws.JSON_BACKEND}')
+        for label, message in paths:
+            seconds = timeit.timeit(lambda: AuthorizationClient.authorized(message), number=number)
+            print(f'{label:>20}: {seconds / number * 1e6:10.3f} us per message ({len(message.payload)} bytes)')
+    finally:
+        AuthorizationClient.verify_authentication_with_timeout = verify
+
+
+if __name__ == '__main__':
+    main()
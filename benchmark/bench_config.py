@@ -0,0 +1,67 @@
+from lib.util import environment
+import timeit
+import os
+
+# Values used for any .env variable that isn't already set, so that the benchmark can run without a .env file.
+BENCHMARK_DOTENV_DEFAULTS = {
+    'DEBUG': '0',
+    'DISABLE_SENDER': '0',
+    'MQTT_LISTENER_USERNAME': 'username',
+    'MQTT_LISTENER_PASSWORD': 'password',
+    'MQTT_LISTENER_HOSTNAME': 'localhost',
+    'MQTT_LISTENER_PORT': '8883',
+    'MQTT_LISTENER_TOPICS': 'my/test/topic',
+    'MQTT_SENDER_USERNAME': 'username',
+    'MQTT_SENDER_PASSWORD': 'password',
+    'MQTT_SENDER_HOSTNAME': 'localhost',
+    'MQTT_SENDER_PORT': '8883',
+    'MQTT_SENDER_TOPICS': 'my/test/topic',
+    'MQTT_CLIENT_CONNECTION_TIMEOUT_SECONDS': '9',
+    'DNS_WHITELIST': ','.join(f'device{i}._device.example.com' for i in range(100)),
+    'DNS_TIMEOUT_SECONDS': '9',
+}
+
+
+def per_message_environment_get(dns_name):
+    """
+    The configuration reads done for every message before the config was compiled.
+
+    Arguments:
+        dns_name (str) : The DNS name to look up in the whitelist.
+    """
+    return dns_name in environment.get('DNS_WHITELIST') and environment.get('DNS_TIMEOUT_SECONDS') \
+        and not environment.get('DISABLE_SENDER')
+
+
+def per_message_config(dns_name):
+    """
+    The configuration reads done for every message with the compiled config.
+
+    Arguments:
+        dns_name (str) : The DNS name to look up in the whitelist.
+    """
+    return dns_name in environment.CONFIG.DNS_WHITELIST and environment.CONFIG.DNS_TIMEOUT_SECONDS \
+        and not environment.CONFIG.DISABLE_SENDER
+
+
+def main(number=100000):
+    """
+    Times the per-message configuration overhead, both with environment.get and with the compiled config.
+
+    Arguments:
+        number (int) : The number of simulated messages. Defaults to 100000.
+    """
+    # Fill in the .env variables, then compile the config the same way load_dotenv does.
+    for variable_name, value in BENCHMARK_DOTENV_DEFAULTS.items():
+        os.environ.setdefault(variable_name, value)
+    environment.CONFIG = environment.compile_config()
+
+    # Look up the last whitelisted name, which is the worst case for a list.
+    dns_name = 'device99._device.example.com'
+    for label, function in [('environment.get', per_message_environment_get), ('CONFIG', per_message_config)]:
+        seconds = timeit.timeit(lambda: function(dns_name), number=number)
+        print(f'{label:>16}: {seconds / number * 1e6:8.3f} us per message ({number} messages)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+from lib.whitelist import Whitelist
+import timeit
+
+
+def main(entries=100000, number=10000):
+    """
+    Times whitelist membership checks with a plain list, a frozenset, and the Whitelist trie.
+    The trie is also timed with a single wildcard rule standing in for the whole fleet.
+
+    Arguments:
+        entries (int) : The number of whitelisted DNS names. Defaults to 100000.
+        number (int) : The number of membership checks timed per variant. Defaults to 10000.
+    """
+    # Build the whitelist every variant is made from.
+    names = [f'device{i}._device.fleet.example.com' for i in range(entries)]
+    variants = [
+        ('list', names),
+        ('frozenset', frozenset(names)),
+        ('Whitelist (exact)', Whitelist(names)),
+        ('Whitelist (wildcard)', Whitelist(['*._device.fleet.example.com'])),
+    ]
+
+    # Check the last name (the worst case for a list), along with a name that isn't whitelisted.
+    checks = [names[-1], 'device0._device.other.example.com']
+    for label, whitelist in variants:
+        list_number = max(1, number // 100) if whitelist is names else number
+        seconds = timeit.timeit(lambda: [dns_name in whitelist for dns_name in checks], number=list_number)
+        print(f'{label:>20}: {seconds / list_number / len(checks) * 1e6:10.3f} us per check ({entries} entries)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import threading
+
+
+class AdmissionControl:
+
+    def __init__(self, max_payload_bytes=0, max_protected_header_bytes=0):
+        """
+        Initializes the AdmissionControl class.
+        Rejects oversized messages before any work is spent on them. Both checks only look at the length of data that
+        is already in memory, so rejecting a message costs the same no matter how large it is.
+
+        Arguments:
+            max_payload_bytes (int) : The largest message payload accepted, in bytes. 0 disables the limit.
+            max_protected_header_bytes (int) : The largest (still encoded) protected header accepted, in bytes.
+                                               0 disables the limit.
+
+        Raises:
+            ValueError : One of the limits is negative.
+        """
+        # Validate the arguments before anything is built.
+        if max_payload_bytes < 0 or max_protected_header_bytes < 0:
+            raise ValueError(f'Admission limits must not be negative, got {max_payload_bytes} and '
+                             f'{max_protected_header_bytes}')
+
+        # Set the limits.
+        self.max_payload_bytes = max_payload_bytes
+        self.max_protected_header_bytes = max_protected_header_bytes
+
+        # Counters used by the stats method.
+        self._lock = threading.Lock()
+        self._rejected_payloads = 0
+        self._rejected_protected_headers = 0
+
+    def admit_payload(self, payload):
+        """
+        Checks a message payload against the payload size limit.
+
+        Arguments:
+            payload (bytes | str) : The message payload.
+
+        Returns:
+            bool : True if the payload may be processed, False if it is too large.
+        """
+        if not self.max_payload_bytes or len(payload) <= self.max_payload_bytes:
+            return True
+        with self._lock:
+            self._rejected_payloads += 1
+        return False
+
+    def admit_protected_header(self, protected):
+        """
+        Checks a protected header, before it is decoded, against the protected header size limit.
+
+        Arguments:
+            protected (bytes | memoryview | str) : The encoded protected header.
+
+        Returns:
+            bool : True if the header may be decoded, False if it is too large.
+        """
+        if not self.max_protected_header_bytes or len(protected) <= self.max_protected_header_bytes:
+            return True
+        with self._lock:
+            self._rejected_protected_headers += 1
+        return False
+
+    def stats(self):
+        """
+        Returns a snapshot of the limits and rejection counters.
+
+        Returns:
+            dict : The limits, along with how many payloads and protected headers were rejected for their size.
+        """
+        with self._lock:
+            return {
+                'max_payload_bytes': self.max_payload_bytes,
+                'max_protected_header_bytes': self.max_protected_header_bytes,
+                'rejected_payloads': self._rejected_payloads,
+                'rejected_protected_headers': self._rejected_protected_headers,
+            }
@@ -0,0 +1,352 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from lib.util import environment, logger
+from lib.authorization_client import AuthorizationClient
+from lib.async_tlsa_resolver import AsyncTLSAResolver
+from lib.async_mqtt_driver import AsyncMQTTDriver
+import concurrent.futures
+import multiprocessing
+import logging
+import asyncio
+import time
+
+
+class AsyncEngine:
+
+    def __init__(self, max_in_flight, verifier_count, name='AsyncEngine'):
+        """
+        Initializes the AsyncEngine class.
+        An alternative to the worker and verifier pools, enabled with AUTH_ENGINE=asyncio. A single event loop drives
+        the MQTTListener's and every MQTTSender's socket, handles each message as a coroutine, and resolves TLSA
+        records with asynchronous DNS, so a message waiting on the network costs a coroutine rather than a thread and a
+        verifier process. Only the signature check, which is CPU bound, is run off the loop, on a pool of spawned
+        processes.
+        At most max_in_flight messages are handled at once. Past that, reading from the listener's socket is paused,
+        so that the broker's messages back up in TCP rather than in memory.
+        Uses the caches and single-flight group set up by AuthorizationClient.initialize, which must create them first.
+
+        Arguments:
+            max_in_flight (int) : The most messages handled at the same time.
+            verifier_count (int) : The number of processes signatures are checked on.
+            name (str) : The name of the engine. Used for logging purposes.
+
+        Raises:
+            ValueError : The number of messages in flight or of processes is not positive.
+        """
+        # Validate the arguments before anything is built.
+        if max_in_flight < 1 or verifier_count < 1:
+            raise ValueError(f'{name} needs at least 1 message in flight and 1 process, got {max_in_flight} and '
+                             f'{verifier_count}')
+
+        # Set the engine's configuration.
+        self.max_in_flight = max_in_flight
+        self.verifier_count = verifier_count
+        self.name = name
+
+        # The loop is created here, so that work can be handed to it from other threads before it runs.
+        self.loop = asyncio.new_event_loop()
+
+        # Processes are spawned rather than forked, so that no threads or locks are inherited from this process.
+        self.executor = self._create_executor()
+
+        # TLSA records are resolved on the loop, with the same caches as the threaded path.
+        self.resolver = AsyncTLSAResolver(AuthorizationClient.tlsa_cache,
+                                          AuthorizationClient.negative_tlsa_cache,
+                                          AuthorizationClient.tlsa_flights)
+
+        # The messages being handled, and the driver of the listener's connection, which is paused when there are
+        # too many of them.
+        self._tasks = set()
+        self.listener_driver = None
+
+        # Counters used by the stats method.
+        self._received = 0
+        self._dropped = 0
+        self._completed = 0
+        self._authorized = 0
+        self._failed = 0
+        self._pauses = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._max_in_flight_seen = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def run(self, listener):
+        """
+        Drives the listener and every sender from the event loop, until the process ends.
+        Takes the place of MQTTListener.begin_listening.
+
+        Arguments:
+            listener (MQTTListener) : The connected listener.
+        """
+        logging.info(f'{self.name} now listening, with at most {self.max_in_flight} messages in flight')
+        self.loop.run_until_complete(self._main(listener))
+
+    def on_message(self, client, user_data, message):
+        """
+        Callback method for receiving a message through the listener's client. Called on the event loop.
+        Discards oversized messages, then starts handling the message as a task. If that makes too many messages in
+        flight, reading from the listener's socket is paused until one of them finishes.
+
+        Arguments:
+            client (paho.mqtt.client.Client) : The client calling this method.
+            user_data : The user data for the established connection.
+            message (paho.mqtt.client.MQTTMessage) : The message object.
+        """
+        self._received += 1
+
+        # Discard the message if it is too large.
+        if not AuthorizationClient.admission.admit_payload(message.payload):
+            self._dropped += 1
+            logging.debug(f'Message recieved on {message.topic} was dropped, payload is {len(message.payload)} bytes')
+            return
+
+        # Handle the message, and stop reading if that's as many as may be in flight.
+        task = self.loop.create_task(self.handle(message, time.monotonic()))
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+        self._max_in_flight_seen = max(self._max_in_flight_seen, len(self._tasks))
+        if len(self._tasks) >= self.max_in_flight and self.listener_driver is not None:
+            self._pauses += 1
+            self.listener_driver.pause()
+
+    async def handle(self, message, received_at):
+        """
+        Authorizes a message, then forwards it if it is authorized.
+        The coroutine counterpart of AuthorizationClient.run.
+
+        Arguments:
+            message (paho.mqtt.client.MQTTMessage) : The message object.
+            received_at (float) : The time.monotonic value the message was received at.
+        """
+        # If logger not yet in post-setup mode, put it in post-setup mode.
+        if not logger.SETUP_OVER:
+            logger.log_setup_end_header()
+
+        # Log the message.
+        logging.debug(f'Message recieved on {message.topic}: {message.payload}')
+
+        # Parse the message, then verify it. Errors are logged, so they can't take the loop down.
+        try:
+            details = {}
+            dns_name, verification_payload, _ = AuthorizationClient.prepare(message, details)
+            authorized = dns_name is not None and await self.verify(verification_payload, dns_name)
+
+            # Authorized, log message, and forward it.
+            if authorized:
+                self._authorized += 1
+                logging.debug('Message authorized, forwarding to sender')
+                logging.info(f'Authorized message recieved on {message.topic}: {message.payload}')
+                AuthorizationClient.forward(message, details)
+        except Exception as e:
+            self._failed += 1
+            logging.error(f'{self.name} could not handle a message recieved on {message.topic}: {repr(e)}')
+
+        # Record how long the message took.
+        latency = time.monotonic() - received_at
+        self._total_latency += latency
+        self._max_latency = max(self._max_latency, latency)
+
+    async def verify(self, message_payload, dns_name):
+        """
+        Verifies a message against the TLSA record of its DNS name, with timeout.
+        The coroutine counterpart of AuthorizationClient.verify_authentication_with_timeout. The timeout covers both
+        resolving the TLSA record and checking the signature.
+
+        Arguments:
+            message_payload (bytes | str) : The message payload, in JSON or compact serialization. Used to verify.
+            dns_name (str) : The DNS name. Used to resolve the TLSA record.
+
+        Returns:
+            bool : Whether or not the message was authenticated in time.
+        """
+        deadline = time.monotonic() + environment.CONFIG.DNS_TIMEOUT_SECONDS
+
+        # Grab the TLSA record. If it could not be resolved, the message can't be authenticated.
+        tlsa_record = await self.resolver.resolve(dns_name, deadline)
+        if tlsa_record is None:
+            return False
+
+        # Check the signature off the loop, with whatever time remains.
+        executor = self.executor
+        try:
+            future = executor.submit(AuthorizationClient.verify_signature, message_payload, tlsa_record)
+            result = await asyncio.wait_for(asyncio.wrap_future(future, loop=self.loop),
+                                            max(0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            logging.debug(f'Timed out when verifying message from {dns_name}')
+            self._timeouts += 1
+
+            # A check that hadn't started is just cancelled. One that is still running holds on to its process, so the
+            # executor is replaced, and the process is terminated once every check on it is past its deadline too.
+            if not future.cancel() and not future.done():
+                self._replace_executor(executor, environment.CONFIG.DNS_TIMEOUT_SECONDS)
+            return False
+        except BrokenProcessPool:
+            # Every check that was running on the executor fails along with this one, so only the first replaces it.
+            if self._replace_executor(executor):
+                logging.error(f'{self.name} lost a verifier process, replaced the executor')
+            return False
+
+        # Log the result and return.
+        logging.debug(f'Message was{" " if result else " not "}authenticated')
+        return result
+
+    def refresh_tlsa_record(self, dns_name):
+        """
+        Resolves the TLSA record for a DNS name on the event loop regardless of what is in the cache, and stores the
+        outcome. Used by the TLSARefresher, from its own threads, in place of AuthorizationClient.refresh_tlsa_record.
+
+        Arguments:
+            dns_name (str) : The DNS name to resolve.
+
+        Returns:
+            dict | None : The authenticated TLSA record, or None if it could not be resolved in time.
+        """
+        # The coroutine is only created once the event loop gets to it, so none is left behind if it never does.
+        timeout = environment.CONFIG.DNS_TIMEOUT_SECONDS
+        future = concurrent.futures.Future()
+        self.loop.call_soon_threadsafe(self._start_refresh, dns_name, time.monotonic() + timeout, future)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            logging.debug(f'Timed out waiting on TSLA refresh for {dns_name}')
+            return None
+
+    def shutdown(self):
+        """
+        Stops the processes signatures are checked on. Checks that haven't started yet are cancelled, and the ones
+        running are waited on, so that no process is left behind.
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        """
+        Returns a snapshot of the engine's counters.
+
+        Returns:
+            dict : The number of messages in flight (now, at most, and the most seen), the number received, dropped for
+                   their size, completed, authorized, and failed with an error, how many times reading was paused, a
+                   signature check timed out, and the executor was replaced, and the average and maximum time (in seconds) a message took, with the AsyncMQTTDriver.stats of the
+                   listener's connection under 'listener'.
+        """
+        return {
+            'in_flight': len(self._tasks),
+            'max_in_flight': self.max_in_flight,
+            'max_in_flight_seen': self._max_in_flight_seen,
+            'received': self._received,
+            'dropped': self._dropped,
+            'completed': self._completed,
+            'authorized': self._authorized,
+            'failed': self._failed,
+            'pauses': self._pauses,
+            'timeouts': self._timeouts,
+            'recycled': self._recycled,
+            'average_latency_seconds': self._total_latency / self._completed if self._completed else 0.0,
+            'max_latency_seconds': self._max_latency,
+            'listener': self.listener_driver.stats() if self.listener_driver is not None else None,
+        }
+
+    async def _main(self, listener):
+        """
+        Protected method that hands every connection to the loop, then runs them until one of them stops.
+
+        Arguments:
+            listener (MQTTListener) : The connected listener.
+        """
+        # Messages are handled here, rather than submitted to the worker pool.
+        listener.client.on_message = self.on_message
+        self.listener_driver = AsyncMQTTDriver(listener.client, listener.monitor, name='MQTTListener')
+        self.listener_driver.attach()
+        coroutines = [self.listener_driver.run()]
+
+        # Each sender's socket is driven here too, along with its queue.
+        for sender in AuthorizationClient.sender.senders:
+            driver = AsyncMQTTDriver(sender.client, sender.monitor, name='MQTTSender')
+            driver.attach()
+            coroutines += [driver.run(), sender.loop.run_async()]
+        await asyncio.gather(*coroutines)
+
+    def _start_refresh(self, dns_name, deadline, future):
+        """
+        Protected method run on the event loop that starts a refresh, unless it was given up on first, and hands its
+        outcome to the refresh_tlsa_record caller.
+
+        Arguments:
+            dns_name (str) : The DNS name to resolve.
+            deadline (float) : The time.monotonic value the record must be resolved by.
+            future (concurrent.futures.Future) : The future the caller is waiting on.
+        """
+        if not future.set_running_or_notify_cancel():
+            return
+
+        # Pass the task's outcome on to the future once it is done.
+        def finish(task):
+            if task.cancelled():
+                future.set_exception(concurrent.futures.CancelledError())
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+        self.loop.create_task(self.resolver.refresh(dns_name, deadline)).add_done_callback(finish)
+
+    def _done(self, task):
+        """
+        Protected method that counts a finished message, and resumes reading once there is room for more.
+
+        Arguments:
+            task (asyncio.Task) : The finished message's task.
+        """
+        self._tasks.discard(task)
+        self._completed += 1
+        if len(self._tasks) < self.max_in_flight and self.listener_driver is not None:
+            self.listener_driver.resume()
+
+    def _replace_executor(self, executor, terminate_after=None):
+        """
+        Protected method that replaces the executor signatures are checked on with a fresh one, and shuts the old one
+        down without waiting on it, cancelling the checks that haven't started on it yet.
+
+        Arguments:
+            executor (concurrent.futures.ProcessPoolExecutor) : The executor to replace.
+            terminate_after (int | float) : How many seconds to give the checks still running on the old executor,
+                                            before its processes are terminated. Defaults to None, which leaves them
+                                            to exit once their checks finish.
+
+        Returns:
+            bool : Whether or not the executor was replaced. False if it already was, by another check that used it.
+        """
+        if self.executor is not executor:
+            return False
+
+        # The executor drops its processes on shutdown, so they are grabbed first.
+        processes = list((executor._processes or {}).values())
+        self.executor = self._create_executor()
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._recycled += 1
+        if terminate_after is not None:
+            self.loop.call_later(terminate_after, self._terminate, processes)
+        return True
+
+    def _terminate(self, processes):
+        """
+        Protected method that terminates the processes of a replaced executor that are still running.
+
+        Arguments:
+            processes (list) : The executor's multiprocessing.Process objects.
+        """
+        for process in processes:
+            if process.is_alive():
+                logging.debug(f'{self.name} terminating hung verifier process {process.pid}')
+                process.terminate()
+
+    def _create_executor(self):
+        """
+        Protected method that creates the pool of processes signatures are checked on.
+
+        Returns:
+            concurrent.futures.ProcessPoolExecutor : The executor.
+        """
+        return ProcessPoolExecutor(self.verifier_count, mp_context=multiprocessing.get_context('spawn'))
@@ -0,0 +1,255 @@
+import paho.mqtt.client as mqtt
+import threading
+import logging
+import asyncio
+import time
+
+
+class AsyncMQTTDriver:
+
+    def __init__(self, client, monitor, misc_interval=1.0, max_pause=None, name='AsyncMQTTDriver'):
+        """
+        Initializes the AsyncMQTTDriver class.
+        Runs a paho client's network loop on an asyncio event loop, in place of loop_forever or loop_start. The
+        client's socket is read and written by the event loop as it becomes ready, using paho's external event loop
+        callbacks, and loop_misc (keepalives and timeouts) is run every misc_interval seconds. A lost connection is
+        retried with the monitor's backoff. Reconnecting opens a blocking socket, so it is run on the loop's default
+        executor rather than on the loop itself.
+        Reading can be paused, but for no longer than max_pause seconds at a time. The broker's answer to a keepalive
+        ping is queued behind its messages, so a pause that outlasts the keepalive interval would get the connection
+        dropped for the missing answer. Once a pause runs that long, reading is resumed, and can't be paused again for
+        another max_pause seconds, which gives the answer time to be read.
+
+        Arguments:
+            client (paho.mqtt.client.Client) : The client, connected (or connecting) but without a loop of its own.
+            monitor (ConnectionMonitor) : Keeps track of the client's connection, and decides when it is retried.
+            misc_interval (int | float) : How many seconds to wait between runs of loop_misc. Defaults to 1.0.
+            max_pause (int | float) : The most seconds reading stays paused. Defaults to None, which is half of the
+                                      client's keepalive interval (or no limit, if keepalives are disabled).
+            name (str) : The name of the driver. Used for logging purposes.
+        """
+        self.client = client
+        self.monitor = monitor
+        self.misc_interval = misc_interval
+        self.name = name
+        if max_pause is None and client.keepalive:
+            max_pause = client.keepalive / 2
+        self.max_pause = max_pause
+
+        # The event loop, and the thread it runs on, set when the driver is attached.
+        self.loop = None
+        self._loop_thread = None
+
+        # The socket being watched (and its file descriptor, which stays usable once the socket is closed), and
+        # whether reading from it is paused.
+        self._socket = None
+        self._fileno = None
+        self._paused = False
+        self._paused_at = 0.0
+        self._pausable_at = 0.0
+        self._forced_resumes = 0
+        self._reads = 0
+        self._writes = 0
+
+    def attach(self):
+        """
+        Hands the client's socket to the running event loop. Must be called from a coroutine on that loop.
+        A socket the client opened before being attached is picked up here, along with anything it still has to write.
+        """
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+
+        # From here on, paho tells the driver whenever its socket opens, closes, or has something to write.
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+        # Watch the socket that is already open, if there is one.
+        socket = self.client.socket()
+        if socket is not None:
+            self._open(socket)
+            if self.client.want_write():
+                self._set_writing(True)
+
+    async def run(self):
+        """
+        Runs loop_misc until cancelled, and reconnects with backoff whenever the connection is lost.
+        """
+        logging.info(f'{self.name} now driving its connection from the event loop')
+        while True:
+            self._limit_pause()
+            rc = self.client.loop_misc()
+            if rc in (mqtt.MQTT_ERR_NO_CONN, mqtt.MQTT_ERR_CONN_LOST):
+                self.monitor.disconnected()
+                await asyncio.sleep(self.monitor.seconds_until_retry())
+                logging.warning(f'{self.name} lost its connection, reconnecting')
+                await self.loop.run_in_executor(None, self.monitor.reconnect, self.client)
+            else:
+                await asyncio.sleep(self.misc_interval)
+
+    def pause(self):
+        """
+        Stops reading from the socket, so that the broker's messages back up in TCP rather than in memory.
+        Does nothing if a pause was just cut short by max_pause, so that the keepalive can be answered.
+        """
+        if not self._paused and time.monotonic() >= self._pausable_at:
+            self._paused = True
+            self._paused_at = time.monotonic()
+            if self._fileno is not None:
+                self.loop.remove_reader(self._fileno)
+
+    def resume(self):
+        """
+        Starts reading from the socket again, after pause.
+        """
+        if self._paused:
+            self._paused = False
+            if self._fileno is not None:
+                self.loop.add_reader(self._fileno, self._read)
+
+    def stats(self):
+        """
+        Returns a snapshot of the driver's counters.
+
+        Returns:
+            dict : Whether or not reading is paused, how many times a pause was cut short by max_pause, and how many
+                   times the socket was read and written.
+        """
+        return {
+            'paused': self._paused,
+            'forced_resumes': self._forced_resumes,
+            'reads': self._reads,
+            'writes': self._writes,
+        }
+
+    def _limit_pause(self):
+        """
+        Protected method that resumes reading if it has been paused for max_pause seconds, and keeps it from being
+        paused again for as long.
+        """
+        if not self._paused or self.max_pause is None:
+            return
+        now = time.monotonic()
+        if now - self._paused_at >= self.max_pause:
+            logging.debug(f'{self.name} paused for {now - self._paused_at:.1f} seconds, resuming for the keepalive')
+            self._forced_resumes += 1
+            self._pausable_at = now + self.max_pause
+            self.resume()
+
+    def _read(self):
+        """
+        Protected method that reads from the socket once it is readable.
+        A TLS socket may hold decrypted data that the socket itself no longer signals, so reading carries on until
+        there is none left.
+        """
+        self._reads += 1
+        self.client.loop_read()
+        socket = self._socket
+        if socket is not None and not self._paused and hasattr(socket, 'pending') and socket.pending():
+            self.loop.call_soon(self._read)
+
+    def _write(self):
+        """
+        Protected method that writes to the socket once it is writable.
+        """
+        self._writes += 1
+        self.client.loop_write()
+
+    def _open(self, socket):
+        """
+        Protected method that starts watching a socket. Only called on the event loop's thread.
+
+        Arguments:
+            socket (socket.socket) : The client's socket.
+        """
+        self._socket = socket
+        self._fileno = socket.fileno()
+        if not self._paused:
+            self.loop.add_reader(self._fileno, self._read)
+
+    def _close(self, socket):
+        """
+        Protected method that stops watching a socket. Only called on the event loop's thread.
+
+        Arguments:
+            socket (socket.socket) : The client's socket.
+        """
+        if self._socket is socket:
+            self.loop.remove_reader(self._fileno)
+            self.loop.remove_writer(self._fileno)
+            self._socket = None
+            self._fileno = None
+
+    def _set_writing(self, writing):
+        """
+        Protected method that starts or stops watching the socket for being writable. Only called on the event loop's
+        thread.
+
+        Arguments:
+            writing (bool) : Whether or not the client has something to write.
+        """
+        if self._fileno is None:
+            return
+        if writing:
+            self.loop.add_writer(self._fileno, self._write)
+        else:
+            self.loop.remove_writer(self._fileno)
+
+    def _call(self, function, *args):
+        """
+        Protected method that calls a function on the event loop's thread. Reconnecting runs on an executor thread,
+        and paho calls the socket callbacks on whatever thread it is run on.
+
+        Arguments:
+            function (callable) : The function.
+            *args : The arguments it is called with.
+        """
+        if threading.get_ident() == self._loop_thread:
+            function(*args)
+        else:
+            self.loop.call_soon_threadsafe(function, *args)
+
+    def _on_socket_open(self, client, user_data, socket):
+        """
+        Protected callback method for the client opening its socket.
+
+        Arguments:
+            client (paho.mqtt.client.Client) : The client calling this method.
+            user_data : The user data for the established connection.
+            socket (socket.socket) : The socket.
+        """
+        self._call(self._open, socket)
+
+    def _on_socket_close(self, client, user_data, socket):
+        """
+        Protected callback method for the client closing its socket.
+
+        Arguments:
+            client (paho.mqtt.client.Client) : The client calling this method.
+            user_data : The user data for the established connection.
+            socket (socket.socket) : The socket.
+        """
+        self._call(self._close, socket)
+
+    def _on_socket_register_write(self, client, user_data, socket):
+        """
+        Protected callback method for the client having something to write.
+
+        Arguments:
+            client (paho.mqtt.client.Client) : The client calling this method.
+            user_data : The user data for the established connection.
+            socket (socket.socket) : The socket.
+        """
+        self._call(self._set_writing, True)
+
+    def _on_socket_unregister_write(self, client, user_data, socket):
+        """
+        Protected callback method for the client having written everything it had.
+
+        Arguments:
+            client (paho.mqtt.client.Client) : The client calling this method.
+            user_data : The user data for the established connection.
+            socket (socket.socket) : The socket.
+        """
+        self._call(self._set_writing, False)
@@ -0,0 +1,199 @@
+from dane_discovery.exceptions import TLSAError
+from dane_discovery.dane import DANE
+from dane_discovery.pki import PKI
+import dns.asyncquery
+import dns.exception
+import dns.rdatatype
+import dns.resolver
+import dns.message
+import dns.flags
+import asyncio
+import hashlib
+import logging
+import time
+
+
+class AsyncTLSAResolver:
+
+    def __init__(self, tlsa_cache, negative_tlsa_cache, flights, nameserver=None, name='AsyncTLSAResolver'):
+        """
+        Initializes the AsyncTLSAResolver class.
+        Resolves TLSA records on an asyncio event loop, so that a lookup waiting on DNS costs a coroutine rather than a
+        thread or a verifier process. Uses the same caches as AuthorizationClient.resolve_tlsa_record, and picks and
+        authenticates records the same way AuthorizationClient._resolve does. Queries are made the way
+        dane_discovery.dane.DANE.get_responses makes them: over TLS if the nameserver accepts it, over UDP (falling back
+        to TCP) otherwise, asking for DNSSEC.
+
+        Arguments:
+            tlsa_cache (TLSACache) : The cache of resolved TLSA records.
+            negative_tlsa_cache (TLSACache) : The cache of failed TLSA lookups.
+            flights (AsyncSingleFlight) : The group concurrent lookups of the same DNS name are coalesced in.
+            nameserver (str) : The address of the nameserver to query. Defaults to None, which uses the system's first
+                               nameserver.
+            name (str) : The name of the resolver. Used for logging purposes.
+        """
+        self.tlsa_cache = tlsa_cache
+        self.negative_tlsa_cache = negative_tlsa_cache
+        self.flights = flights
+        self.nameserver = nameserver
+        self.name = name
+
+    async def resolve(self, dns_name, deadline):
+        """
+        Returns the TLSA record for a DNS name, using the TLSA caches.
+        On a cache miss, the record is resolved and cached for its DNS TTL. Concurrent misses for the same DNS name are
+        coalesced, so only one lookup is in flight per name. Lookups that fail with a TLSAError (which includes
+        NXDOMAIN) or time out are kept in the negative cache.
+
+        Arguments:
+            dns_name (str) : The DNS name to resolve.
+            deadline (float) : The time.monotonic value the record must be resolved by.
+
+        Returns:
+            dict | None : The authenticated TLSA record, or None if it could not be resolved in time.
+        """
+        # Check the cache first.
+        tlsa_record = self.tlsa_cache.get(dns_name)
+        if tlsa_record is not None:
+            logging.debug(f'TLSA record for {dns_name} found in cache')
+            return tlsa_record
+
+        # Then, check whether the DNS name failed recently.
+        failure_reason = self.negative_tlsa_cache.get(dns_name)
+        if failure_reason is not None:
+            logging.debug(f'TLSA lookup for {dns_name} failed recently ({failure_reason}), auth cancelled')
+            return None
+
+        # Cache miss. Concurrent misses for the same DNS name share a single lookup.
+        return await self.refresh(dns_name, deadline)
+
+    async def refresh(self, dns_name, deadline):
+        """
+        Resolves the TLSA record for a DNS name regardless of what is in the cache, and stores the outcome.
+
+        Arguments:
+            dns_name (str) : The DNS name to resolve.
+            deadline (float) : The time.monotonic value the record must be resolved by.
+
+        Returns:
+            dict | None : The authenticated TLSA record, or None if it could not be resolved in time.
+        """
+        try:
+            return await self.flights.do(dns_name, self._resolve_uncached, dns_name, deadline,
+                                         timeout=max(0, deadline - time.monotonic()))
+        except TimeoutError:
+            logging.debug(f'Timed out waiting on in-flight TSLA lookup for {dns_name}')
+            return None
+
+    async def lookup(self, dns_name):
+        """
+        Fetches the TLSA records for a DNS name, then picks and authenticates the first entity certificate.
+        Records delivered without DNSSEC are authenticated with PKIX-CD, which fetches the CA certificate over HTTPS.
+        That is rare, and has no asyncio client, so it is run on the loop's default executor.
+
+        Arguments:
+            dns_name (str) : The DNS name to resolve.
+
+        Returns:
+            tuple : The TLSA record (None if it failed) and the failure reason (only set for TLSA failures).
+        """
+        try:
+            # Fetch the records, and find the first one that carries an entity certificate.
+            tlsa_records = await self._get_tlsa_records(dns_name)
+            tlsa_record = next((record for record in tlsa_records
+                                if record['matching_type'] == 0 and record['certificate_usage'] in [1, 3, 4]), None)
+            if tlsa_record is None:
+                raise TLSAError(f'No entity certificate found for {dns_name}.')
+
+            # Authenticate the record. Records delivered with DNSSEC pass without any further lookups.
+            if not tlsa_record['dnssec']:
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, DANE.authenticate_tlsa, dns_name, tlsa_record)
+                except ValueError as e:
+                    raise TLSAError(e)
+
+        # No TLSA error. This also covers NXDOMAIN, which comes back without any records.
+        except TLSAError as e:
+            logging.debug('No TLSA Records recognized for dns name')
+            return None, repr(e)
+
+        # Unexpected exception, log and return.
+        except Exception as e:
+            logging.debug(f'Unexpected exception: {repr(e)}')
+            return None, None
+
+        # Passed, tag the record with a digest of its certificate (used by the key cache) and return it.
+        tlsa_record['certificate_digest'] = hashlib.sha256(tlsa_record['certificate_association'].encode()).hexdigest()
+        return tlsa_record, None
+
+    async def _resolve_uncached(self, dns_name, deadline):
+        """
+        Protected method that resolves the TLSA record for a DNS name, then fills the TLSA caches with the outcome.
+        Only ever run by the leader of a single-flight group.
+
+        Arguments:
+            dns_name (str) : The DNS name to resolve.
+            deadline (float) : The time.monotonic value the record must be resolved by.
+
+        Returns:
+            dict | None : The authenticated TLSA record, or None if it could not be resolved in time.
+        """
+        # Look the record up, for no longer than the time remaining.
+        try:
+            tlsa_record, failure_reason = await asyncio.wait_for(self.lookup(dns_name),
+                                                                 max(0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            logging.debug(f'Timed out when accessing TSLA records at {dns_name}')
+            self.negative_tlsa_cache.put(dns_name, 'timeout', 0)
+            return None
+
+        # Cache the record if there was one, or the reason it failed if it was a TLSA failure.
+        if tlsa_record is not None:
+            self.tlsa_cache.put(dns_name, tlsa_record, tlsa_record['ttl'])
+        elif failure_reason is not None:
+            self.negative_tlsa_cache.put(dns_name, failure_reason, 0)
+        return tlsa_record
+
+    async def _get_tlsa_records(self, dns_name):
+        """
+        Protected method that fetches and parses the TLSA records for a DNS name.
+        Equivalent to dane_discovery.dane.DANE.get_tlsa_records, with the query made on the event loop.
+
+        Arguments:
+            dns_name (str) : The DNS name to query.
+
+        Returns:
+            list : The records, as dictionaries in the form dane_discovery.dane.DANE.process_response returns, along
+                   with whether they were delivered with DNSSEC, over TLS, and over TCP.
+
+        Raises:
+            dane_discovery.exceptions.TLSAError : The query failed, or there are no records.
+        """
+        # Query over TLS, or over UDP (falling back to TCP) if the nameserver refuses TLS.
+        nameserver = self.nameserver if self.nameserver else dns.resolver.get_default_resolver().nameservers[0]
+        query = dns.message.make_query(dns_name, 'TLSA', want_dnssec=True)
+        details = {'tls': False, 'tcp': True}
+        try:
+            try:
+                response = await dns.asyncquery.tls(query, nameserver)
+                details['tls'] = True
+            except ConnectionRefusedError:
+                response, details['tcp'] = await dns.asyncquery.udp_with_fallback(query, nameserver)
+        except dns.exception.DNSException as e:
+            raise TLSAError(f'Caught error \'{e}\' when retrieving TLSA record.')
+        details['dnssec'] = 'AD' in dns.flags.to_text(response.flags).split()
+
+        # Parse every TLSA record in the answer, leaving out the signatures.
+        records = []
+        for rrset in response.answer:
+            if rrset.rdtype != dns.rdatatype.TLSA:
+                continue
+            for rdata in rrset:
+                record = DANE.process_response(f'{rrset.name} {rrset.ttl} IN TLSA {rdata.to_text()}')
+                if record['matching_type'] == 0:
+                    PKI.validate_certificate_association(record['certificate_association'])
+                record.update(details)
+                records.append(record)
+        if not records:
+            raise TLSAError(f'No TLSA records for {dns_name}')
+        return records
@@ -1,202 +1,833 @@
-from dane_jwe_jws.authentication import Authentication
 from dane_discovery.exceptions import TLSAError
-from jwcrypto.jws import InvalidJWSSignature
+from dane_discovery.dane import DANE
+from dane_discovery.pki import PKI
+from jwcrypto.jws import JWS, InvalidJWSSignature
+from jwcrypto.jwk import JWK
 from binascii import Error as ASCIIError
-from lib.util import environment, logger
-from lib.mqtt_sender import MQTTSender
+from lib.util import environment, logger, jws, forwarding
+from lib.mqtt_sender_pool import MQTTSenderPool
+from lib.worker_pool import WorkerPool
+from lib.keyed_executor import KeyedExecutor
+from lib.batcher import Batcher
+from lib.verifier_pool import VerifierPool
+from lib.tlsa_cache import TLSACache
+from lib.single_flight import SingleFlight, AsyncSingleFlight
+from lib.tlsa_refresher import TLSARefresher
+from lib.key_cache import KeyCache
+from lib.whitelist import Whitelist
+from lib.admission_control import AdmissionControl
+from lib.topic_router import TopicRouter
+from lib.startup_timer import StartupTimer
 from dane_jwe_jws.util import Util
-import multiprocessing
 import threading
+import hashlib
 import logging
 import base64
 import json
+import time
 
 
-class AuthorizationClient(threading.Thread):
+class AuthorizationClient:
 
-    def __init__(self, message=None):
-        """
-        Initializer for AuthorizationClient thread.
-        Used locally in the static handle_message method.
+    # Cache of parsed verification keys. Only used inside verifier processes, where it is created on first use.
+    key_cache = None
 
-        Arguments:
-            message (paho.mqtt.client.MQTTMessage) : The message object.
-        """
-        self.message = message
-        threading.Thread.__init__(self)
+    # Size limits checked before a message is parsed. Unlimited until initialize sets the configured limits.
+    admission = AdmissionControl()
+
+    # The AsyncEngine messages are handled on, if AUTH_ENGINE is 'asyncio'. Otherwise, the worker and verifier pools
+    # are used.
+    engine = None
+
+    # The StagedPipeline messages are handled on, if AUTH_ENGINE is 'staged', and the pool of processes its resolve
+    # stage looks TLSA records up on. Otherwise, TLSA records are looked up on the verifier pool.
+    pipeline = None
+    resolver_pool = None
+
+    # What messages are kept in order by, if AUTH_ORDER_KEY is set. Messages with the same key are verified and
+    # forwarded one at a time, in the order they were received.
+    ORDER_KEYS = ['topic', 'dns_name']
+    order_key = None
 
-    def run(self):
+    # The single worker thread messages are parsed on, in the order they were received, when they are kept in order
+    # by DNS name. Their DNS name has to be known before they are queued, and this keeps parsing off of the listener.
+    parser = None
+
+    # The Batcher that messages from the same DNS name are grouped in, if AUTH_BATCH_MAX_SIZE is over 1. Each batch
+    # has its TLSA record resolved once, and its signatures checked in a single verifier pool job.
+    batcher = None
+
+    # The worker pool, the pool of verifier processes, and the sender connections. Set by initialize.
+    pool = None
+    verifier_pool = None
+    sender = None
+
+    @staticmethod
+    def run(message):
         """
-        The run method is, of course, run when a new thread is started.
+        Handles a single message. Submitted to the worker pool by the static handle_message method.
         It logs the message on the debug channel, authorizes, then logs it on the info level.
+
+        Arguments:
+            message (paho.mqtt.client.MQTTMessage) : The message object.
         """
         # If logger not yet in post-setup mode, put it in post-setup mode.
         if not logger.SETUP_OVER:
             logger.log_setup_end_header()
 
         # Log the message.
-        logging.debug(f'Message recieved on {self.message.topic}: {self.message.payload}')
+        logging.debug(f'Message recieved on {message.topic}: {message.payload}')
+
+        # With batching, the message is only parsed here, and verified along with the rest of its batch.
+        details = {}
+        if AuthorizationClient.batcher is not None:
+            dns_name, verification_payload, _ = AuthorizationClient.prepare(message, details)
+            item = (message, details, verification_payload)
+            if dns_name is not None and not AuthorizationClient.batcher.add(dns_name, item):
+                logging.debug(f'Message recieved on {message.topic} was dropped, batcher is full')
+            return
 
-        # Run the static authorization method.
-        if AuthorizationClient.authorized(self.message)[0]:
+        # Run the static authorization method, which fills in the details (such as the DNS name) it learns on the way.
+        if AuthorizationClient.authorized(message, details)[0]:
 
             # Authorized, log message
             logging.debug('Message authorized, forwarding to sender')
-            logging.info(f'Authorized message recieved on {self.message.topic}: {self.message.payload}')
+            logging.info(f'Authorized message recieved on {message.topic}: {message.payload}')
 
             # Forward the message.
-            if not environment.get('DISABLE_SENDER'):
-                AuthorizationClient.sender.publish(self.message.payload)
+            AuthorizationClient.forward(message, details)
 
     @staticmethod
-    def initialize():
+    def forward(message, details):
+        """
+        Forwards an authorized message to wherever its source topic and DNS name are routed, in the form each
+        destination asks for. Messages from the same DNS name (or, when messages are kept in order by topic, the same
+        source topic) may be kept on the same sender connection.
+        Does nothing if the sender is disabled.
+
+        Arguments:
+            message (paho.mqtt.client.MQTTMessage) : The message object.
+            details (dict) : What authorized learned about the message, such as its 'dns_name'.
+        """
+        if not environment.CONFIG.DISABLE_SENDER:
+            routes = AuthorizationClient.router.route(message.topic, details.get('dns_name'))
+            key = message.topic if AuthorizationClient.order_key == 'topic' else details.get('dns_name')
+            for mode, topics in routes:
+                payload = forwarding.encode(mode, message.payload, details.get('payload_segment'))
+                AuthorizationClient.sender.publish(payload, key=key, topics=topics)
+
+    @staticmethod
+    def initialize(timer=None):
         """
         Initializes the AuthorizationClient's static methods.
-        Individual AuthorizationClient threads are not started here.
+        No messages are handled here.
+        The sender connections are opened in the background, while the pools and caches are built.
+
+        Arguments:
+            timer (StartupTimer) : Times each step, and runs the background ones. Defaults to None, which uses a timer
+                                   of its own that is never logged.
         """
         # Make sure this hasn't been run twice.
         if hasattr(AuthorizationClient, 'initialized') and AuthorizationClient.initialized:
             return
-
-        # Create the MQTTSender.
-        AuthorizationClient.sender = MQTTSender()
+        if timer is None:
+            timer = StartupTimer()
+
+        # Check that messages can be kept in order, before anything is started. Order is only kept all the way to the
+        # broker if every message with the same key goes out on the same sender connection.
+        order_key = environment.get('AUTH_ORDER_KEY') or None
+        if order_key is not None and order_key not in AuthorizationClient.ORDER_KEYS:
+            raise ValueError(f'AUTH_ORDER_KEY must be one of {AuthorizationClient.ORDER_KEYS}, got {order_key}')
+        connections = environment.get('MQTT_SENDER_CONNECTIONS')
+        distribution = environment.get('MQTT_SENDER_DISTRIBUTION')
+        if order_key is not None and connections > 1 and distribution != 'hashed':
+            raise ValueError(f'AUTH_ORDER_KEY needs MQTT_SENDER_DISTRIBUTION=hashed (or a single sender connection) to '
+                             f'keep messages in order, got {distribution} across {connections} connections')
+
+        # Check that batching can be used with the rest of the configuration.
+        batch_size = environment.get('AUTH_BATCH_MAX_SIZE')
+        if batch_size > 1 and order_key == 'topic':
+            raise ValueError('AUTH_BATCH_MAX_SIZE batches by DNS name, so it can\'t be used with '
+                             'AUTH_ORDER_KEY=topic')
+
+        # Ordering and batching are only done on the worker pool, so the other engines can't honor them.
+        auth_engine = environment.get('AUTH_ENGINE')
+        if auth_engine != 'threaded':
+            if order_key is not None:
+                raise ValueError(f'AUTH_ORDER_KEY is only supported by AUTH_ENGINE=threaded, got {auth_engine}')
+            if batch_size > 1:
+                raise ValueError(f'AUTH_BATCH_MAX_SIZE over 1 is only supported by AUTH_ENGINE=threaded, got '
+                                 f'{auth_engine}')
+
+        # Start opening the pool of MQTTSender connections. With the asyncio engine, their loops are run by the engine.
+        asynchronous = auth_engine == 'asyncio'
+        sender = timer.start('sender connections', MQTTSenderPool, connections, distribution, not asynchronous)
+
+        # Compile the rules that decide which topics each message is forwarded to.
+        AuthorizationClient.router = TopicRouter(environment.get('MQTT_SENDER_ROUTES'),
+                                                 environment.get('MQTT_SENDER_TOPICS'),
+                                                 environment.get('MQTT_SENDER_FORWARD_MODE'))
+
+        # Set the size limits that messages are checked against before they are parsed.
+        AuthorizationClient.admission = AdmissionControl(environment.get('MAX_PAYLOAD_BYTES'),
+                                                         environment.get('MAX_PROTECTED_HEADER_BYTES'))
+
+        # Create and start the worker pool that every message is handled on (or, with the staged engine, the pipeline
+        # of stages each message is passed through, and the pool of processes its TLSA records are looked up on), and
+        # the pool of verifier processes that authentication is run on. The asyncio engine handles messages on its
+        # event loop instead.
+        if auth_engine == 'staged':
+            from lib.staged_pipeline import StagedPipeline
+            with timer.stage('staged pipeline'):
+                workers = {stage: environment.get(f'AUTH_STAGE_{stage.upper()}_WORKERS')
+                           for stage in StagedPipeline.STAGES}
+                AuthorizationClient.pipeline = StagedPipeline(workers,
+                                                              environment.get('AUTH_QUEUE_SIZE'),
+                                                              environment.get('AUTH_QUEUE_OVERFLOW_POLICY'))
+                AuthorizationClient.pipeline.start()
+            with timer.stage('resolver pool'):
+                AuthorizationClient.resolver_pool = VerifierPool(environment.get('AUTH_STAGE_RESOLVE_WORKERS'),
+                                                                 name='ResolverPool')
+                AuthorizationClient.resolver_pool.start()
+        elif not asynchronous:
+            # Messages kept in order are run on a keyed executor, which is otherwise configured the same.
+            AuthorizationClient.order_key = order_key
+            with timer.stage('worker pool'):
+                executor = WorkerPool if order_key is None else KeyedExecutor
+                AuthorizationClient.pool = executor(environment.get('AUTH_WORKER_COUNT'),
+                                                    environment.get('AUTH_QUEUE_SIZE'),
+                                                    environment.get('AUTH_QUEUE_OVERFLOW_POLICY'),
+                                                    name='AuthorizationClient')
+                AuthorizationClient.pool.start()
+
+            # Messages kept in order by DNS name are parsed on a single thread of their own, so they stay in order.
+            if order_key == 'dns_name':
+                AuthorizationClient.parser = WorkerPool(1,
+                                                        environment.get('AUTH_QUEUE_SIZE'),
+                                                        environment.get('AUTH_QUEUE_OVERFLOW_POLICY'),
+                                                        name='AuthorizationParser')
+                AuthorizationClient.parser.start()
+
+            # Group messages from the same DNS name into batches, if batching is enabled.
+            if batch_size > 1:
+                AuthorizationClient.batcher = Batcher(batch_size,
+                                                      environment.get('AUTH_BATCH_MAX_WAIT_MS') / 1000,
+                                                      AuthorizationClient._submit_batch,
+                                                      environment.get('AUTH_QUEUE_SIZE'),
+                                                      environment.get('AUTH_QUEUE_OVERFLOW_POLICY'),
+                                                      name='MessageBatcher')
+                AuthorizationClient.batcher.start()
+        if not asynchronous:
+            with timer.stage('verifier pool'):
+                AuthorizationClient.verifier_pool = VerifierPool(environment.get('VERIFIER_PROCESS_COUNT'))
+                AuthorizationClient.verifier_pool.start()
+
+        # Create the cache that resolved TLSA records are kept in between messages.
+        AuthorizationClient.tlsa_cache = TLSACache(environment.get('TLSA_CACHE_MAX_ENTRIES'),
+                                                   environment.get('TLSA_CACHE_MIN_TTL_SECONDS'),
+                                                   environment.get('TLSA_CACHE_MAX_TTL_SECONDS'))
+
+        # Create the cache that failed lookups are kept in, so that repeat failures are rejected right away.
+        negative_ttl = environment.get('TLSA_NEGATIVE_CACHE_TTL_SECONDS')
+        AuthorizationClient.negative_tlsa_cache = TLSACache(environment.get('TLSA_CACHE_MAX_ENTRIES'),
+                                                            negative_ttl,
+                                                            negative_ttl,
+                                                            name='NegativeTLSACache')
+
+        # Create the single-flight group that concurrent lookups of the same DNS name are coalesced in.
+        # With the asyncio engine, lookups are coroutines, and the engine is created around the caches.
+        refresh_tlsa_record = AuthorizationClient.refresh_tlsa_record
+        if asynchronous:
+            from lib.async_engine import AsyncEngine
+            AuthorizationClient.tlsa_flights = AsyncSingleFlight(name='TLSALookups')
+            with timer.stage('async engine'):
+                AuthorizationClient.engine = AsyncEngine(environment.get('ASYNC_MAX_IN_FLIGHT'),
+                                                         environment.get('VERIFIER_PROCESS_COUNT'))
+            refresh_tlsa_record = AuthorizationClient.engine.refresh_tlsa_record
+        else:
+            AuthorizationClient.tlsa_flights = SingleFlight(name='TLSALookups')
+
+        # Create and start the refresher that warms the TLSA cache for the whitelist, unless it is disabled.
+        # Exact names are always kept warm. Names a wildcard rule covers aren't known ahead of time, so they are only
+        # kept warm while messages keep coming from them.
+        if environment.get('TLSA_REFRESH_CONCURRENCY'):
+            whitelist = Whitelist(environment.get('DNS_WHITELIST'))
+            AuthorizationClient.tlsa_refresher = TLSARefresher(whitelist.exact_names(),
+                                                               AuthorizationClient.tlsa_cache,
+                                                               AuthorizationClient.negative_tlsa_cache,
+                                                               refresh_tlsa_record,
+                                                               environment.get('TLSA_REFRESH_CONCURRENCY'),
+                                                               environment.get('TLSA_REFRESH_AHEAD_SECONDS'))
+            AuthorizationClient.tlsa_refresher.start()
+
+        # Finally, wait for the sender connections. If one of them failed, this raises what it raised.
+        with timer.stage('waiting on sender connections'):
+            AuthorizationClient.sender = sender.result()
 
     @staticmethod
     def handle_message(message):
         """
         Handles a message receieved from the MQTTListener.
-        Starts a new thread that handles the authentication, error handling, and forwarding.
+        Submits the authentication, error handling, and forwarding to the bounded worker pool (or, with the staged
+        engine, to the first stage of the pipeline), rather than starting a new thread per message. Depending on the
+        overflow policy, this may block while the queue is full.
+        Oversized messages are discarded here, before they take up a place in the queue.
+        If messages are kept in order, they are submitted to the keyed executor with their key instead.
+
+        Arguments:
+            message (paho.mqtt.client.MQTTMessage) : The message object.
+        """
+        # Discard the message if it is too large.
+        if not AuthorizationClient.admission.admit_payload(message.payload):
+            logging.debug(f'Message recieved on {message.topic} was dropped, payload is {len(message.payload)} bytes')
+            return
+
+        # Submits messages that are kept in order with their key.
+        if AuthorizationClient.order_key is not None:
+            AuthorizationClient._submit_ordered(message)
+            return
+
+        # Submits the message to the first stage of the pipeline, with the staged engine.
+        if AuthorizationClient.pipeline is not None:
+            if not AuthorizationClient.pipeline.submit(message):
+                logging.debug(f'Message recieved on {message.topic} was dropped, parse stage queue is full')
+            return
+
+        # Submits the message to the pool.
+        if not AuthorizationClient.pool.submit(AuthorizationClient.run, message):
+            logging.debug(f'Message recieved on {message.topic} was dropped, worker pool queue is full')
+
+    @staticmethod
+    def deliver(message, details, verification_payload):
+        """
+        Verifies an already parsed and whitelisted message, then forwards it if it is authorized.
+        Used in place of the run method when messages are kept in order by DNS name, since they are parsed (by the
+        parser) before they are queued.
+
+        Arguments:
+            message (paho.mqtt.client.MQTTMessage) : The message object.
+            details (dict) : What prepare learned about the message, such as its 'dns_name'.
+            verification_payload (bytes | str) : The payload to verify, as returned by prepare.
+        """
+        if AuthorizationClient.verify_authentication_with_timeout(verification_payload, details['dns_name']):
+
+            # Authorized, log message
+            logging.debug('Message authorized, forwarding to sender')
+            logging.info(f'Authorized message recieved on {message.topic}: {message.payload}')
+
+            # Forward the message.
+            AuthorizationClient.forward(message, details)
+
+    @staticmethod
+    def deliver_batch(dns_name, batch):
+        """
+        Verifies a batch of already parsed and whitelisted messages from the same DNS name, then forwards the ones
+        that are authorized, in order. The TLSA record is resolved once for the whole batch, and every signature is
+        checked in a single verifier pool job, so the verification key is only built once too.
+
+        Arguments:
+            dns_name (str) : The DNS name every message in the batch is from.
+            batch (list) : The messages, as (message, details, verification payload) tuples, where the details and
+                           verification payload are what prepare returned.
+        """
+        # The timeout (changed in .env) covers both resolving the TLSA record and verifying the whole batch.
+        deadline = time.monotonic() + environment.CONFIG.DNS_TIMEOUT_SECONDS
+
+        # Grab the TLSA record. If it could not be resolved, none of the messages can be authenticated.
+        tlsa_record = AuthorizationClient.resolve_tlsa_record(dns_name, deadline)
+        if tlsa_record is None:
+            logging.debug(f'No TLSA record for {dns_name}, {len(batch)} messages not authenticated')
+            return
+
+        # Run _authorize_batch on the verifier pool with whatever time remains.
+        message_payloads = [verification_payload for _, _, verification_payload in batch]
+        finished, results = AuthorizationClient.verifier_pool.run(AuthorizationClient._authorize_batch,
+                                                                  (message_payloads, tlsa_record,
+                                                                   threading.get_ident()),
+                                                                  max(0, deadline - time.monotonic()))
+
+        # Check if the job timed out (or was skipped for being past its deadline). If so, none of them are forwarded.
+        if not finished or results is None:
+            logging.debug(f'Timed out when verifying {len(batch)} messages from {dns_name}')
+            return
+
+        # Forward every authorized message, in the order they were received.
+        for (message, details, _), authorized in zip(batch, results):
+            if authorized:
+                logging.debug('Message authorized, forwarding to sender')
+                logging.info(f'Authorized message recieved on {message.topic}: {message.payload}')
+                AuthorizationClient.forward(message, details)
+
+    @staticmethod
+    def _submit_batch(dns_name, batch):
+        """
+        Protected method that submits a batch to the worker pool. Called on the batcher's thread.
+        When messages are kept in order by DNS name, the batch is submitted with its DNS name as the key, so it is
+        only verified once the batch before it is done.
+
+        Arguments:
+            dns_name (str) : The DNS name every message in the batch is from.
+            batch (list) : The messages, as (message, details, verification payload) tuples.
+        """
+        if AuthorizationClient.order_key is None:
+            accepted = AuthorizationClient.pool.submit(AuthorizationClient.deliver_batch, dns_name, batch)
+        else:
+            accepted = AuthorizationClient.pool.submit(dns_name, AuthorizationClient.deliver_batch, dns_name, batch)
+        if not accepted:
+            logging.debug(f'Batch of {len(batch)} messages from {dns_name} was dropped, worker pool queue is full')
+
+    @staticmethod
+    def _submit_ordered(message):
+        """
+        Protected method that submits a message to the keyed executor, so that it is verified and forwarded after
+        every message received before it with the same key, and concurrently with messages with other keys.
+        The DNS name has to be known before the message is queued, so when messages are kept in order by DNS name,
+        they are handed to the parser first, which submits them once parsed.
 
         Arguments:
             message (paho.mqtt.client.MQTTMessage) : The message object.
         """
-        # Starts the client.
-        client = AuthorizationClient(message)
-        client.start()
+        # Ordering by topic needs nothing more than the message.
+        if AuthorizationClient.order_key == 'topic':
+            accepted = AuthorizationClient.pool.submit(message.topic, AuthorizationClient.run, message)
+            if not accepted:
+                logging.debug(f'Message recieved on {message.topic} was dropped, worker pool queue is full')
+
+        # Ordering by DNS name needs the message parsed first.
+        elif not AuthorizationClient.parser.submit(AuthorizationClient._parse_ordered, message):
+            logging.debug(f'Message recieved on {message.topic} was dropped, parser queue is full')
 
     @staticmethod
-    def authorized(message):
+    def _parse_ordered(message):
+        """
+        Protected method run by the parser, when messages are kept in order by DNS name. Parses a message and checks it
+        against the whitelist, then submits it to the keyed executor (or its batch) with its DNS name as the key,
+        along with what was parsed, so that it is only verified there.
+
+        Arguments:
+            message (paho.mqtt.client.MQTTMessage) : The message object.
+        """
+        # If logger not yet in post-setup mode, put it in post-setup mode.
+        if not logger.SETUP_OVER:
+            logger.log_setup_end_header()
+
+        # Log the message, then parse it. Messages that can't be authorized go no further.
+        logging.debug(f'Message recieved on {message.topic}: {message.payload}')
+        details = {}
+        dns_name, verification_payload, _ = AuthorizationClient.prepare(message, details)
+        if dns_name is None:
+            return
+
+        # With batching, the message is verified along with the rest of its batch.
+        if AuthorizationClient.batcher is not None:
+            if not AuthorizationClient.batcher.add(dns_name, (message, details, verification_payload)):
+                logging.debug(f'Message recieved on {message.topic} was dropped, batcher is full')
+        elif not AuthorizationClient.pool.submit(dns_name, AuthorizationClient.deliver, message, details,
+                                                 verification_payload):
+            logging.debug(f'Message recieved on {message.topic} was dropped, worker pool queue is full')
+
+    @staticmethod
+    def stats():
+        """
+        Returns the worker pool's statistics, such as queue depth and queue wait time (or, with the asyncio or staged
+        engine, the engine's or pipeline's), along with the TLSA caches' hit, miss, and eviction counts, the number of
+        messages rejected for their size, the sender's delivery counts, and the router's size.
+
+        Returns:
+            dict : The statistics, as returned by WorkerPool.stats (or KeyedExecutor.stats, AsyncEngine.stats, or
+                   StagedPipeline.stats), with the TLSACache.stats under 'tlsa_cache' and 'tlsa_negative_cache', the
+                   SingleFlight.stats under 'tlsa_flights', the AdmissionControl.stats under 'admission', the
+                   MQTTSenderPool.stats under 'sender', the TopicRouter.stats under 'router', with the parser, its
+                   WorkerPool.stats under 'parser', and, with batching, the Batcher.stats under 'batcher'.
+        """
+        if AuthorizationClient.engine is not None:
+            stats = AuthorizationClient.engine.stats()
+        elif AuthorizationClient.pipeline is not None:
+            stats = AuthorizationClient.pipeline.stats()
+        else:
+            stats = AuthorizationClient.pool.stats()
+        if AuthorizationClient.parser is not None:
+            stats['parser'] = AuthorizationClient.parser.stats()
+        if AuthorizationClient.batcher is not None:
+            stats['batcher'] = AuthorizationClient.batcher.stats()
+        stats['admission'] = AuthorizationClient.admission.stats()
+        stats['sender'] = AuthorizationClient.sender.stats()
+        stats['router'] = AuthorizationClient.router.stats()
+        stats['tlsa_cache'] = AuthorizationClient.tlsa_cache.stats()
+        stats['tlsa_negative_cache'] = AuthorizationClient.negative_tlsa_cache.stats()
+        stats['tlsa_flights'] = AuthorizationClient.tlsa_flights.stats()
+        return stats
+
+    @staticmethod
+    def shutdown():
+        """
+        Stops everything initialize started: the parser, batcher, and worker pool (or the pipeline), the verifier and
+        resolver processes (or the engine's), and the sender connections. Messages that are still queued are not
+        waited on. Safe to call before initialize has finished, in which case only what was started is stopped.
+        """
+        # Stop taking in messages first, so that nothing new is handed to the verifiers as they stop.
+        for executor in (AuthorizationClient.parser, AuthorizationClient.batcher, AuthorizationClient.pool,
+                         AuthorizationClient.pipeline):
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+        # Stop the verifier processes, so that none are left behind once this process exits.
+        for verifier_pool in (AuthorizationClient.verifier_pool, AuthorizationClient.resolver_pool):
+            if verifier_pool is not None:
+                verifier_pool.shutdown()
+        if AuthorizationClient.engine is not None:
+            AuthorizationClient.engine.shutdown()
+
+        # Finally, close the sender connections.
+        if AuthorizationClient.sender is not None:
+            AuthorizationClient.sender.shutdown()
+        logging.info('AuthorizationClient shut down')
+
+    @staticmethod
+    def authorized(message, details=None):
         """
         Determines whether or not a message is authorized.
+        Accepts both the JSON (flattened) and compact JWS serializations.
         First checks if the dns name is on the whitelist defined in .env.
         Then checks whether the message itself has a valid TLSA record with the supplied dns name.
         If it passes all the checks, then True is returned.
+        The message is only parsed once, by the prepare method.
 
         Arguments:
             message (MQTTMessage) : The message received from the MQTTListener.
+            details (dict) : If given, filled in with what is learned about the message, such as its 'dns_name',
+                             and its base64url encoded 'payload_segment' (None if the payload is unencoded).
+                             Defaults to None.
 
         Returns:
             bool, Exception : Whether or not the message is authorized to proceed, combined with the reason it failed, if any.
                               Reason failed is used pretty much exclusively for testing purposes.
         """
-        # First, convert the message into a json file.
-        try:
-            message_payload_json = json.loads(message.payload)
-        except json.JSONDecodeError as e:
-            logging.debug('Message not formatted as JSON dict, auth cancelled')
-            return False, e
+        # Parse the message, and check it against the whitelist.
+        dns_name, verification_payload, reason = AuthorizationClient.prepare(message, details)
+        if dns_name is None:
+            return False, reason
 
-        # Grab the protected attribute.
-        try:
-            protected = message_payload_json['protected']
-        except KeyError as e:
-            logging.debug('Message missing "protected" attribute, auth cancelled')
-            return False, e
+        # Now that we know the message is from a whitelisted source, we verify its integrity using the
+        # authorize_with_timeout method.
+        passed_authentication = AuthorizationClient.verify_authentication_with_timeout(verification_payload, dns_name)
+
+        # If no exception has been raised / we have not returned yet, then message passed all the checks.
+        return passed_authentication, None
+
+    @staticmethod
+    def prepare(message, details=None):
+        """
+        Parses a message, and checks it against the whitelist, without verifying it.
+        Where possible, the message is handed on to verification in compact form, so that the verifier doesn't have
+        to parse it again.
+
+        Arguments:
+            message (MQTTMessage) : The message received from the MQTTListener.
+            details (dict) : If given, filled in with what is learned about the message, such as its 'dns_name',
+                             and its base64url encoded 'payload_segment' (None if the payload is unencoded).
+                             Defaults to None.
 
-        # Next, convert the protected attribute out of base64.
+        Returns:
+            str, bytes | str, Exception : The message's DNS name and the payload to verify, or None and None if the
+                                          message can't be authorized, combined with the reason it failed, if any.
+        """
+        # Compact serializations (header.payload.signature) are located by slicing, without parsing or copying.
+        segments = jws.split_compact(message.payload)
+        if segments is not None:
+            message_payload_json = None
+            protected = segments[0]
+        else:
+            # Make sure the protected attribute isn't too large, before the whole message is parsed to get to it.
+            if AuthorizationClient.admission.max_protected_header_bytes:
+                protected = jws.find_protected(message.payload)
+                if protected is not None and not AuthorizationClient.admission.admit_protected_header(protected):
+                    logging.debug(f'Message\'s "protected" attribute is {len(protected)} bytes, auth cancelled')
+                    return None, None, None
+
+            # First, convert the message into a json file.
+            try:
+                message_payload_json = jws.loads(message.payload)
+            except json.JSONDecodeError as e:
+                logging.debug('Message not formatted as JSON dict or compact JWS, auth cancelled')
+                return None, None, e
+
+            # Grab the protected attribute.
+            try:
+                protected = message_payload_json['protected']
+            except KeyError as e:
+                logging.debug('Message missing "protected" attribute, auth cancelled')
+                return None, None, e
+
+        # Make sure the protected attribute isn't too large to decode.
+        if not AuthorizationClient.admission.admit_protected_header(protected):
+            logging.debug(f'Message\'s "protected" attribute is {len(protected)} bytes, auth cancelled')
+            return None, None, None
+
+        # Next, convert the protected attribute out of base64 (base64url, for compact serializations).
         try:
-            protected = base64.b64decode(protected)
+            protected = base64.b64decode(protected) if segments is None else jws.base64url_decode(protected)
         except ASCIIError as e:
             logging.debug('"protected" attribute does not convert out of base64, auth cancelled')
-            return False, e
+            return None, None, e
 
         # Then, we make the protected attribute into a dict as well.
         try:
-            protected_json = json.loads(protected)
+            protected_json = jws.loads(protected)
         except json.JSONDecodeError as e:
             logging.debug('"protected" attribute is not formatted as JSON dict, auth cancelled')
-            return False, e
+            return None, None, e
 
         # Grab the x5u attribute.
         try:
             x5u = protected_json['x5u']
         except KeyError as e:
             logging.debug('Message\'s "protected" attribute missing "x5u" attribute, auth cancelled')
-            return False, e
+            return None, None, e
 
         # Finally, we trim the excess fat off x5u and compare it against the whitelist.
         try:
             x5u = Util.get_name_from_dns_uri(x5u)
         except ValueError as e:
             logging.debug('Message\'s DNS URI is formatted incorrectly, auth cancelled')
-            return False, e
-        if x5u not in environment.get('DNS_WHITELIST'):
+            return None, None, e
+        if x5u not in environment.CONFIG.DNS_WHITELIST:
             logging.debug('Message\'s DNS name is not included in the whitelist, auth cancelled')
-            return False, None
+            return None, None, None
+        if details is not None:
+            details['dns_name'] = x5u
+            details['payload_segment'] = AuthorizationClient._payload_segment(segments, message_payload_json,
+                                                                              protected_json)
 
-        # Now that we know the message is from a whitelisted source, we verify its integrity using the
-        # authorize_with_timeout method.
-        passed_authentication = AuthorizationClient.verify_authentication_with_timeout(message.payload, x5u)
+        # JSON messages are handed on to verification in compact form where they have one.
+        compact_payload = jws.to_compact(message_payload_json, protected_json) if segments is None else None
+        return x5u, compact_payload if compact_payload is not None else message.payload, None
 
-        # If no exception has been raised / we have not returned yet, then message passed all the checks.
-        return passed_authentication, None
+    @staticmethod
+    def _payload_segment(segments, message_payload_json, protected_json):
+        """
+        Protected method that finds a message's base64url encoded JWS payload, without decoding it.
+
+        Arguments:
+            segments (tuple | None) : The compact serialization's segments, or None if the message is JSON.
+            message_payload_json (dict | None) : The parsed message, or None if it is in compact form.
+            protected_json (dict) : The parsed protected header.
+
+        Returns:
+            memoryview | str | None : The payload segment, or None if the payload is unencoded or missing.
+        """
+        if protected_json.get('b64', True) is not True:
+            return None
+        if segments is not None:
+            return segments[1]
+        payload = message_payload_json.get('payload')
+        return payload if isinstance(payload, str) else None
 
     @staticmethod
     def verify_authentication_with_timeout(message_payload, dns_name):
         """
-        Authorizes a message with timeout, implemented using the multiprocessing module.
+        Authorizes a message with timeout, implemented using the persistent pool of verifier processes.
+        The TLSA record for the DNS name is taken from the cache when possible, and only resolved over the network
+        on a miss. If either step hangs past the timeout, the verifier process running it is recycled.
 
         Arguments:
-            message_payload (dict) : The message payload. Used to get the DNS name and verify.
-            dns_name (str) : The DNS name. Used for logging purposes.
+            message_payload (bytes | str) : The message payload, in JSON or compact serialization. Used to verify.
+            dns_name (str) : The DNS name. Used to resolve the TLSA record.
         """
         # Log that we made it this far.
         logging.debug('Authorizing message with timeout...')
 
-        # First, get the context and a queue; this will allow us to return a boolean value from the _authorize method.
-        context = multiprocessing.get_context('spawn')
-        queue = context.Queue()
+        # The timeout variable (changed in .env) covers both resolving the TLSA record and verifying the signature.
+        deadline = time.monotonic() + environment.CONFIG.DNS_TIMEOUT_SECONDS
 
-        # Instantiate the process, with the target at _authorize and the queue and message_payload as arguments.
-        process = context.Process(target=AuthorizationClient._authorize, args=(queue, message_payload, threading.get_ident()))
-        process.start()
+        # Grab the TLSA record. If it could not be resolved, the message can't be authenticated.
+        tlsa_record = AuthorizationClient.resolve_tlsa_record(dns_name, deadline)
+        if tlsa_record is None:
+            return False
 
-        # Wait for the process to join with a timeout variable (changed in .env).
-        process.join(environment.get('DNS_TIMEOUT_SECONDS'))
+        # Check the signature with whatever time remains.
+        return AuthorizationClient.verify_signature_with_timeout(message_payload, tlsa_record, dns_name, deadline)
 
-        # Check if the process is still alive (timed out). If so, kill it and return False.
-        if process.is_alive():
-            process.terminate()
-            logging.debug(f'Timed out when accessing TSLA records at {dns_name}')
-            return False
+    @staticmethod
+    def verify_signature_with_timeout(message_payload, tlsa_record, dns_name, deadline):
+        """
+        Checks a message's signature against an already resolved TLSA record on the verifier pool, with timeout.
+        If the check hangs past the deadline, the verifier process running it is recycled.
 
-        # Process concluded normally, gather the output from the queue.
-        result = queue.get()
+        Arguments:
+            message_payload (bytes | str) : The message payload, in JSON or compact serialization. Used to verify.
+            tlsa_record (dict) : The TLSA record that the message's signing key is taken from.
+            dns_name (str) : The DNS name. Used for logging purposes.
+            deadline (float) : The time.monotonic value the signature must be checked by.
+
+        Returns:
+            bool : Whether or not the message was authenticated in time.
+        """
+        # Run _authorize on the verifier pool with whatever time remains.
+        finished, result = AuthorizationClient.verifier_pool.run(AuthorizationClient._authorize,
+                                                                 (message_payload, tlsa_record, threading.get_ident()),
+                                                                 max(0, deadline - time.monotonic()))
+
+        # Check if the job timed out. If so, return False.
+        if not finished:
+            logging.debug(f'Timed out when verifying message from {dns_name}')
+            return False
 
         # Log the result and return.
         logging.debug(f'Message was{" " if result else " not "}authenticated')
-        return result
+        return bool(result)
 
     @staticmethod
-    def _authorize(queue, message_payload, parent_thread_id):
+    def resolve_tlsa_record(dns_name, deadline):
         """
-        Protected authorize method used in a second process to implement timeout.
+        Returns the TLSA record for a DNS name, using the TLSA caches.
+        On a cache miss, the record is resolved on the verifier pool and cached for its DNS TTL. Concurrent misses
+        for the same DNS name are coalesced, so only one lookup is in flight per name, and every waiter gets its result.
+        Lookups that fail with a TLSAError (which includes NXDOMAIN) or time out are kept in the negative cache,
+        so that messages from the same DNS name are rejected right away until the negative entry expires.
 
         Arguments:
-            queue (context.Queue) : The context queue. Used to return boolean values.
-            message_payload (dict) : The message payload. Used to get the DNS name and verify.
-            parent_thread_id (int) : The id of the parent thread. Used for logging purposes.
+            dns_name (str) : The DNS name to resolve.
+            deadline (float) : The time.monotonic value the record must be resolved by.
+
+        Returns:
+            dict | None : The authenticated TLSA record, or None if it could not be resolved in time.
         """
-        # Run the verification
+        # Check the cache first.
+        tlsa_record = AuthorizationClient.tlsa_cache.get(dns_name)
+        if tlsa_record is not None:
+            logging.debug(f'TLSA record for {dns_name} found in cache')
+            return tlsa_record
+
+        # Then, check whether the DNS name failed recently.
+        failure_reason = AuthorizationClient.negative_tlsa_cache.get(dns_name)
+        if failure_reason is not None:
+            logging.debug(f'TLSA lookup for {dns_name} failed recently ({failure_reason}), auth cancelled')
+            return None
+
+        # Cache miss. Concurrent misses for the same DNS name share a single lookup.
+        try:
+            return AuthorizationClient.tlsa_flights.do(dns_name, AuthorizationClient._resolve_uncached, dns_name, deadline,
+                                                       timeout=max(0, deadline - time.monotonic()))
+        except TimeoutError:
+            logging.debug(f'Timed out waiting on in-flight TSLA lookup for {dns_name}')
+            return None
+
+    @staticmethod
+    def refresh_tlsa_record(dns_name):
+        """
+        Resolves the TLSA record for a DNS name regardless of what is in the cache, and stores the outcome.
+        Used by the TLSARefresher. Shares the single-flight group with message lookups, so a refresh and a cache
+        miss for the same DNS name never both go out to DNS.
+
+        Arguments:
+            dns_name (str) : The DNS name to resolve.
+
+        Returns:
+            dict | None : The authenticated TLSA record, or None if it could not be resolved in time.
+        """
+        deadline = time.monotonic() + environment.CONFIG.DNS_TIMEOUT_SECONDS
         try:
-            Authentication.verify(message_payload)
+            return AuthorizationClient.tlsa_flights.do(dns_name, AuthorizationClient._resolve_uncached, dns_name, deadline,
+                                                       timeout=max(0, deadline - time.monotonic()))
+        except TimeoutError:
+            logging.debug(f'Timed out waiting on in-flight TSLA lookup for {dns_name}')
+            return None
 
-        # No TLSA error.
+    @staticmethod
+    def _resolve_uncached(dns_name, deadline):
+        """
+        Protected method that resolves the TLSA record for a DNS name on the verifier pool (or the resolver pool, if
+        there is one), then fills the TLSA caches with the outcome. Only ever run by the leader of a single-flight group.
+
+        Arguments:
+            dns_name (str) : The DNS name to resolve.
+            deadline (float) : The time.monotonic value the record must be resolved by.
+
+        Returns:
+            dict | None : The authenticated TLSA record, or None if it could not be resolved in time.
+        """
+        # Run _resolve on the resolver pool, so that slow DNS doesn't hold up signature checks, or on the verifier pool.
+        pool = AuthorizationClient.resolver_pool
+        if pool is None:
+            pool = AuthorizationClient.verifier_pool
+        finished, result = pool.run(AuthorizationClient._resolve, (dns_name, threading.get_ident()),
+                                    max(0, deadline - time.monotonic()))
+
+        # Check if the job timed out. If it never started, the pool was busy rather than DNS, so that isn't cached.
+        if not finished:
+            logging.debug(f'Timed out when accessing TSLA records at {dns_name}')
+            if finished is False:
+                AuthorizationClient.negative_tlsa_cache.put(dns_name, 'timeout', 0)
+            return None
+
+        # Cache the record if there was one, or the reason it failed if it was a TLSA failure.
+        # A result of None means the job was skipped for being past its deadline.
+        tlsa_record, failure_reason = result if result is not None else (None, None)
+        if tlsa_record is not None:
+            AuthorizationClient.tlsa_cache.put(dns_name, tlsa_record, tlsa_record['ttl'])
+        elif failure_reason is not None:
+            AuthorizationClient.negative_tlsa_cache.put(dns_name, failure_reason, 0)
+        return tlsa_record
+
+    @staticmethod
+    def _resolve(queue, dns_name, parent_thread_id):
+        """
+        Protected resolve method run in a verifier process to implement timeout.
+        Fetches the TLSA records for the DNS name, then picks and authenticates the first entity certificate, the
+        same way dane_discovery.identity.Identity.get_first_entity_certificate does.
+
+        Arguments:
+            queue (context.Queue) : The context queue. Used to return a (TLSA record, failure reason) tuple, where the
+                                    failure reason is only set for TLSA failures.
+            dns_name (str) : The DNS name to resolve.
+            parent_thread_id (int) : The id of the parent thread. Used for logging purposes.
+        """
+        try:
+            # Fetch the records, and find the first one that carries an entity certificate.
+            tlsa_records = DANE.get_tlsa_records(dns_name)
+            tlsa_record = next((record for record in tlsa_records
+                                if record['matching_type'] == 0 and record['certificate_usage'] in [1, 3, 4]), None)
+            if tlsa_record is None:
+                raise TLSAError(f'No entity certificate found for {dns_name}.')
+
+            # Authenticate the record using DNSSEC (or PKIX, for PKIX-CD).
+            try:
+                DANE.authenticate_tlsa(dns_name, tlsa_record)
+            except ValueError as e:
+                raise TLSAError(e)
+
+        # No TLSA error. This also covers NXDOMAIN, which comes back without any records.
         except TLSAError as e:
             logger.log_outside_main_process(logging.DEBUG, 'No TLSA Records recognized for dns name', parent_thread_id)
-            queue.put(False)
+            queue.put((None, repr(e)))
+            return
+
+        # Unexpected exception, log and return.
+        except Exception as e:
+            logger.log_outside_main_process(logging.DEBUG, f'Unexpected exception: {repr(e)}', parent_thread_id)
+            queue.put((None, None))
             return
 
+        # Passed, tag the record with a digest of its certificate (used by the key cache) and return it.
+        tlsa_record['certificate_digest'] = hashlib.sha256(tlsa_record['certificate_association'].encode()).hexdigest()
+        queue.put((tlsa_record, None))
+
+    @staticmethod
+    def _authorize(queue, message_payload, tlsa_record, parent_thread_id):
+        """
+        Protected authorize method run in a verifier process to implement timeout.
+
+        Arguments:
+            queue (context.Queue) : The context queue. Used to return boolean values.
+            message_payload (bytes | str) : The message payload, in JSON or compact serialization. Used to verify.
+            tlsa_record (dict) : The TLSA record that the message's signing key is taken from.
+            parent_thread_id (int) : The id of the parent thread. Used for logging purposes.
+        """
+        # Run the verification
+        try:
+            AuthorizationClient._verify_signature(message_payload, tlsa_record)
+
         # Invalid signature.
         except InvalidJWSSignature:
             logger.log_outside_main_process(logging.DEBUG, 'JWS Signature was not accepted', parent_thread_id)
@@ -211,3 +842,100 @@ class AuthorizationClient(threading.Thread):
 
         # Passed, set the queue value to true
         queue.put(True)
+
+    @staticmethod
+    def _authorize_batch(queue, message_payloads, tlsa_record, parent_thread_id):
+        """
+        Protected authorize method run in a verifier process to verify a batch of messages from the same DNS name.
+
+        Arguments:
+            queue (context.Queue) : The context queue. Used to return a list with a boolean value per message.
+            message_payloads (list) : The message payloads, in JSON or compact serialization. Used to verify.
+            tlsa_record (dict) : The TLSA record that every message's signing key is taken from.
+            parent_thread_id (int) : The id of the parent thread. Used for logging purposes.
+        """
+        results = []
+        for message_payload in message_payloads:
+            # Run the verification
+            try:
+                AuthorizationClient._verify_signature(message_payload, tlsa_record)
+
+            # Invalid signature.
+            except InvalidJWSSignature:
+                logger.log_outside_main_process(logging.DEBUG, 'JWS Signature was not accepted', parent_thread_id)
+                results.append(False)
+                continue
+
+            # Unexpected exception, log and carry on with the rest.
+            except Exception as e:
+                logger.log_outside_main_process(logging.DEBUG, f'Unexpected exception: {repr(e)}', parent_thread_id)
+                results.append(False)
+                continue
+
+            # Passed.
+            results.append(True)
+        queue.put(results)
+
+    @staticmethod
+    def verify_signature(message_payload, tlsa_record):
+        """
+        Checks a message's signature against the certificate carried in a TLSA record.
+        Used by the AsyncEngine, which runs it on its executor. Picklable, so the executor may be a process pool.
+
+        Arguments:
+            message_payload (bytes | str) : The message payload, in JSON or compact serialization.
+            tlsa_record (dict) : The TLSA record that the message's signing key is taken from.
+
+        Returns:
+            bool : Whether or not the signature is valid.
+        """
+        try:
+            AuthorizationClient._verify_signature(message_payload, tlsa_record)
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def _verify_signature(message_payload, tlsa_record):
+        """
+        Verifies a message's signature against the certificate carried in a TLSA record.
+        Equivalent to dane_jwe_jws.authentication.Authentication.verify, minus the DNS lookup. The verification key
+        is taken from the key cache, so it is only built again when the TLSA record changes.
+
+        Arguments:
+            message_payload (bytes | str) : The message payload, in JSON or compact serialization.
+            tlsa_record (dict) : The TLSA record that the message's signing key is taken from.
+
+        Raises:
+            jwcrypto.jws.InvalidJWSSignature : The signature does not match the key.
+        """
+        # Create the key cache on first use in this process.
+        if AuthorizationClient.key_cache is None:
+            AuthorizationClient.key_cache = KeyCache(environment.get('KEY_CACHE_MAX_ENTRIES'))
+
+        # Grab the public key for the record's certificate.
+        key = AuthorizationClient.key_cache.get(tlsa_record['name'], tlsa_record['certificate_digest'],
+                                                AuthorizationClient._build_key, tlsa_record)
+
+        # Deserialize and verify the message. Compact serializations have to be text to be split.
+        if isinstance(message_payload, bytes):
+            message_payload = message_payload.decode()
+        jws_token = JWS()
+        jws_token.deserialize(message_payload)
+        jws_token.verify(key)
+
+    @staticmethod
+    def _build_key(tlsa_record):
+        """
+        Builds the verification key from the certificate carried in a TLSA record.
+
+        Arguments:
+            tlsa_record (dict) : The TLSA record.
+
+        Returns:
+            jwcrypto.jwk.JWK : The public key.
+        """
+        certificate = PKI.build_x509_object(PKI.certificate_association_to_der(tlsa_record['certificate_association']))
+        key = JWK()
+        key.import_from_pyca(certificate.public_key())
+        return key
@@ -0,0 +1,238 @@
+from collections import deque, OrderedDict
+import threading
+import logging
+import time
+
+
+class Batcher:
+
+    # The overflow policies that decide what happens when an item is added while the batcher is full.
+    OVERFLOW_POLICIES = ['block', 'drop-oldest', 'drop-newest']
+
+    def __init__(self, max_size, max_wait, submit, queue_size, overflow_policy='block', name='Batcher'):
+        """
+        Initializes the Batcher class.
+        Groups items by key into batches, so that work that is the same for every item with a key (such as resolving
+        the TLSA record of a DNS name) is done once per batch rather than once per item. A batch is submitted once it
+        holds max_size items, or once its first item has waited max_wait seconds, whichever comes first. Batches are
+        submitted on the batcher's own thread, in the order they were filled or timed out, and items keep the order
+        they were added in.
+        At most queue_size items may be waiting to be submitted at once. Past that, the overflow policy decides
+        whether add blocks, drops the oldest waiting item, or drops the new one, the same as WorkerPool.submit.
+        The thread is not started here; call the start method to do so.
+
+        Arguments:
+            max_size (int) : The most items in a batch.
+            max_wait (int | float) : The most seconds an item waits for its batch to fill up.
+            submit (callable) : Called with the key and the list of items of every batch. May block, which holds up
+                                later batches, and (once the batcher is full) add.
+            queue_size (int) : The most items that may be waiting, across every batch not yet submitted.
+            overflow_policy (str) : What to do when the batcher is full. One of 'block', 'drop-oldest', or
+                                    'drop-newest'. Defaults to 'block'.
+            name (str) : The name of the batcher. Used for the thread name and logging purposes.
+
+        Raises:
+            ValueError : The batch size or queue size is not positive, the wait is negative, or the overflow policy
+                         is not recognized.
+        """
+        # Validate the arguments before anything is built.
+        if max_size < 1:
+            raise ValueError(f'{name} batch size must be at least 1, got {max_size}')
+        if max_wait < 0:
+            raise ValueError(f'{name} wait must not be negative, got {max_wait}')
+        if queue_size < 1:
+            raise ValueError(f'{name} queue size must be at least 1, got {queue_size}')
+        if overflow_policy not in Batcher.OVERFLOW_POLICIES:
+            raise ValueError(f'{name} overflow policy must be one of {Batcher.OVERFLOW_POLICIES}, got {overflow_policy}')
+
+        # Set the batcher's configuration.
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.submit = submit
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.name = name
+
+        # The batches being filled, as (opened at, items) tuples keyed by key, oldest first, and the batches that are
+        # ready to be submitted, as (key, items, full) tuples, along with the number of items in both. Guarded by the
+        # condition.
+        self._open = OrderedDict()
+        self._ready = deque()
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._running = False
+
+        # Counters used by the stats method.
+        self._batches = 0
+        self._items = 0
+        self._full = 0
+        self._dropped = 0
+        self._max_batch_size = 0
+        self._batch_sizes = {}
+
+        # Create (but do not start) the thread batches are submitted on.
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        """
+        Starts the thread batches are submitted on.
+        """
+        self._running = True
+        self._thread.start()
+        logging.info(f'{self.name} started, with batches of up to {self.max_size} items and {self.max_wait} seconds, '
+                     f'and up to {self.queue_size} items waiting ({self.overflow_policy})')
+
+    def add(self, key, item):
+        """
+        Adds an item to the batch for its key, opening a new batch if there isn't one.
+        If the batcher is full, the overflow policy decides whether this call blocks (until a batch is submitted),
+        drops the oldest waiting item, or drops this one.
+
+        Arguments:
+            key (str) : The key. Items with the same key are batched together.
+            item : The item.
+
+        Returns:
+            bool : Whether or not the item was added.
+        """
+        with self._condition:
+            # Handle a full batcher according to the overflow policy.
+            if self._pending >= self.queue_size:
+                if self.overflow_policy == 'drop-newest':
+                    self._dropped += 1
+                    logging.debug(f'{self.name} full, dropping newest item')
+                    return False
+                elif self.overflow_policy == 'drop-oldest':
+                    self._drop_oldest()
+                    logging.debug(f'{self.name} full, dropping oldest item')
+                else:
+                    while self._pending >= self.queue_size and self._running:
+                        self._condition.wait()
+
+            # Add the item to its batch.
+            self._pending += 1
+            batch = self._open.get(key)
+            if batch is None:
+                batch = self._open[key] = (time.monotonic(), [])
+                self._condition.notify_all()
+            batch[1].append(item)
+
+            # A full batch is handed to the thread right away.
+            if len(batch[1]) >= self.max_size:
+                del self._open[key]
+                self._ready.append((key, batch[1], True))
+                self._condition.notify_all()
+            return True
+
+    def stats(self):
+        """
+        Returns a snapshot of the batcher's counters, which can be used to tune the batch size and wait.
+
+        Returns:
+            dict : The queue size, the number of items waiting to be submitted, the number of batches and items
+                   submitted, the number of items dropped, how many of the batches were full (rather than timed out),
+                   the average and largest batch size, and the number of batches submitted at each size.
+        """
+        with self._condition:
+            return {
+                'queue_size': self.queue_size,
+                'pending': self._pending,
+                'batches': self._batches,
+                'items': self._items,
+                'dropped': self._dropped,
+                'full_batches': self._full,
+                'average_batch_size': self._items / self._batches if self._batches else 0.0,
+                'max_batch_size': self._max_batch_size,
+                'batch_sizes': dict(self._batch_sizes),
+            }
+
+    def shutdown(self, wait=True):
+        """
+        Stops the batcher. Batches still open are submitted first, without waiting for them to fill up.
+
+        Arguments:
+            wait (bool) : Whether or not to wait for the thread to finish.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if wait and self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        """
+        The loop run by the batcher's thread.
+        Waits for a batch to fill up or time out, then submits it.
+        """
+        while True:
+            with self._condition:
+                # Wait for a batch to be ready, or for the batcher to be shut down.
+                while not self._ready and self._running:
+                    if self._open:
+                        # The oldest batch times out first.
+                        opened_at, _ = next(iter(self._open.values()))
+                        remaining = opened_at + self.max_wait - time.monotonic()
+                        if remaining <= 0:
+                            self._expire()
+                            continue
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+
+                # Once shut down, whatever is left open goes out as is.
+                if not self._running:
+                    while self._open:
+                        key, (_, items) = self._open.popitem(last=False)
+                        self._ready.append((key, items, False))
+                if not self._ready:
+                    return
+                key, items, full = self._ready.popleft()
+
+                # The batch's items no longer count against the queue size, so wake up anything blocked in add.
+                self._pending -= len(items)
+                self._condition.notify_all()
+
+                # Record the batch's size.
+                self._batches += 1
+                self._items += len(items)
+                self._full += int(full)
+                self._max_batch_size = max(self._max_batch_size, len(items))
+                self._batch_sizes[len(items)] = self._batch_sizes.get(len(items), 0) + 1
+
+            # Submit the batch outside of the lock, making sure an exception doesn't kill the thread.
+            try:
+                self.submit(key, items)
+            except Exception as e:
+                logging.error(f'{self.name} could not submit a batch: {repr(e)}')
+
+    def _expire(self):
+        """
+        Protected method that hands every batch that has waited long enough to the thread. Only called with the lock
+        held.
+        """
+        now = time.monotonic()
+        while self._open:
+            key, (opened_at, items) = next(iter(self._open.items()))
+            if opened_at + self.max_wait > now:
+                return
+            del self._open[key]
+            self._ready.append((key, items, False))
+
+    def _drop_oldest(self):
+        """
+        Protected method that drops the oldest waiting item, from the first batch that is ready to be submitted (or,
+        if there isn't one, the oldest open batch), along with its batch if that leaves it empty. Only called with the
+        lock held.
+        """
+        if self._ready:
+            items = self._ready[0][1]
+            items.pop(0)
+            if not items:
+                self._ready.popleft()
+        else:
+            key, (_, items) = next(iter(self._open.items()))
+            items.pop(0)
+            if not items:
+                del self._open[key]
+        self._pending -= 1
+        self._dropped += 1
@@ -0,0 +1,154 @@
+import paho.mqtt.client as mqtt
+import threading
+import logging
+import random
+import time
+
+
+class ConnectionMonitor:
+
+    def __init__(self, min_backoff_seconds, max_backoff_seconds, name='ConnectionMonitor'):
+        """
+        Initializes the ConnectionMonitor class.
+        Keeps track of a client's connection, and decides when a lost connection should be retried. The wait between
+        attempts doubles with every attempt that doesn't lead to a connection, up to the maximum, and is jittered (it
+        falls anywhere between half of the full wait and the full wait), so that many clients that lost their
+        connection at the same time don't all retry at the same time. The first attempt is made right away.
+
+        Arguments:
+            min_backoff_seconds (int | float) : The wait after the first failed attempt.
+            max_backoff_seconds (int | float) : The longest wait between attempts.
+            name (str) : The name of the connection. Used for logging purposes.
+
+        Raises:
+            ValueError : The minimum wait is not positive, or the maximum is smaller than the minimum.
+        """
+        # Validate the arguments before anything is built.
+        if min_backoff_seconds <= 0 or max_backoff_seconds < min_backoff_seconds:
+            raise ValueError(f'{name} backoff must be positive, and its maximum at least its minimum, got '
+                             f'{min_backoff_seconds} and {max_backoff_seconds}')
+
+        # Set the monitor's configuration.
+        self.min_backoff_seconds = min_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.name = name
+
+        # The connection's state. Reconnect attempts are only counted while disconnected.
+        # The event is set while the connection is up, so that waiting for it doesn't take polling.
+        self._lock = threading.Lock()
+        self._up = threading.Event()
+        self._disconnected_at = None
+        self._attempts = 0
+        self._retry_at = 0.0
+
+        # Counters used by the stats method.
+        self._disconnects = 0
+        self._reconnect_attempts = 0
+        self._total_disconnected = 0.0
+        self._max_disconnected = 0.0
+
+    def connected(self):
+        """
+        Records that the connection is up, which resets the backoff.
+
+        Returns:
+            bool : Whether or not the connection was lost before, i.e. this is a reconnection.
+        """
+        with self._lock:
+            self._attempts = 0
+            self._retry_at = 0.0
+            self._up.set()
+            if self._disconnected_at is None:
+                return False
+
+            # Record how long the connection was down.
+            duration = time.monotonic() - self._disconnected_at
+            self._disconnected_at = None
+            self._total_disconnected += duration
+            self._max_disconnected = max(self._max_disconnected, duration)
+        logging.info(f'{self.name} reconnected after {duration:.3f} seconds')
+        return True
+
+    def disconnected(self):
+        """
+        Records that the connection is down. Has no effect if it was already recorded as down.
+        """
+        with self._lock:
+            self._up.clear()
+            if self._disconnected_at is None:
+                self._disconnected_at = time.monotonic()
+                self._disconnects += 1
+
+    def wait_connected(self, timeout=None):
+        """
+        Waits for the connection to be up. Returns as soon as it is, rather than on the next poll.
+
+        Arguments:
+            timeout (int | float) : The most seconds to wait. Defaults to None, which waits forever.
+
+        Returns:
+            bool : Whether or not the connection is up.
+        """
+        return self._up.wait(timeout)
+
+    def seconds_until_retry(self):
+        """
+        Returns:
+            float : How many seconds are left before the next reconnect attempt is due. 0 if it is due now.
+        """
+        with self._lock:
+            return max(0.0, self._retry_at - time.monotonic())
+
+    def attempt(self):
+        """
+        Records a reconnect attempt, and schedules the next one in case this one doesn't lead to a connection.
+
+        Returns:
+            float : How many seconds the next attempt is scheduled after this one.
+        """
+        with self._lock:
+            backoff = min(self.max_backoff_seconds, self.min_backoff_seconds * 2 ** self._attempts)
+            delay = backoff / 2 + random.uniform(0, backoff / 2)
+            self._attempts += 1
+            self._reconnect_attempts += 1
+            self._retry_at = time.monotonic() + delay
+            return delay
+
+    def reconnect(self, client):
+        """
+        Records a reconnect attempt, and makes it.
+        Acts as a wrapper for paho.mqtt.client.Client.reconnect. The attempt only opens the connection; it counts as
+        connected once the broker accepts it, and connected is called.
+
+        Arguments:
+            client (paho.mqtt.client.Client) : The client to reconnect.
+
+        Returns:
+            bool : Whether or not the connection could be opened.
+        """
+        delay = self.attempt()
+        try:
+            client.reconnect()
+        except (OSError, mqtt.WebsocketConnectionError) as e:
+            logging.warning(f'{self.name} could not reconnect, retrying in {delay:.1f} seconds: {repr(e)}')
+            return False
+        return True
+
+    def stats(self):
+        """
+        Returns a snapshot of the connection's state and counters.
+
+        Returns:
+            dict : Whether or not the connection is up (False before it first connects), how many times it was lost, how many reconnect attempts were
+                   made, and how long it has been down (0 if up), along with the total and longest time it was down.
+        """
+        with self._lock:
+            disconnected_at = self._disconnected_at
+            return {
+                'connected': self._up.is_set(),
+                'disconnects': self._disconnects,
+                'reconnect_attempts': self._reconnect_attempts,
+                'disconnected_seconds': time.monotonic() - disconnected_at if disconnected_at is not None else 0.0,
+                'total_disconnected_seconds': self._total_disconnected,
+                'max_disconnected_seconds': self._max_disconnected,
+            }
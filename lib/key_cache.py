@@ -0,0 +1,86 @@
+from collections import OrderedDict
+import threading
+
+
+class KeyCache:
+
+    def __init__(self, max_entries, name='KeyCache'):
+        """
+        Initializes the KeyCache class.
+        Caches ready-to-use verification keys by DNS name, along with the digest of the TLSA record they were
+        built from. When the TLSA record for a DNS name changes, so does its digest, and the old key is replaced.
+        Once max_entries is reached, the least recently used entry is evicted.
+
+        Arguments:
+            max_entries (int) : The maximum number of DNS names kept in the cache.
+            name (str) : The name of the cache. Used for logging purposes.
+
+        Raises:
+            ValueError : The maximum entry count is not positive.
+        """
+        # Validate the arguments before anything is built.
+        if max_entries < 1:
+            raise ValueError(f'{name} max entries must be at least 1, got {max_entries}')
+
+        # Set the cache's configuration.
+        self.name = name
+        self.max_entries = max_entries
+
+        # The entries map a DNS name to a (record digest, key) tuple, in least to most recently used order.
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters used by the stats method.
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, dns_name, digest, build, *args):
+        """
+        Returns the key for a DNS name and record digest, building (and caching) it if needed.
+
+        Arguments:
+            dns_name (str) : The DNS name the TLSA record belongs to.
+            digest (str) : The digest of the TLSA record the key is built from.
+            build (callable) : Called with *args to build the key on a miss.
+            *args : The arguments passed to build.
+
+        Returns:
+            object : The key.
+        """
+        with self._lock:
+            entry = self._entries.get(dns_name)
+            if entry is not None and entry[0] == digest:
+                self._entries.move_to_end(dns_name)
+                self._hits += 1
+                return entry[1]
+
+            # Either a miss, or the record changed since the key was built.
+            self._misses += 1
+            if entry is not None:
+                self._invalidations += 1
+
+        # Build the key outside of the lock, then store it.
+        key = build(*args)
+        with self._lock:
+            self._entries[dns_name] = (digest, key)
+            self._entries.move_to_end(dns_name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return key
+
+    def stats(self):
+        """
+        Returns a snapshot of the cache's counters.
+
+        Returns:
+            dict : The cache's size, along with its hit, miss, and invalidation counts.
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'invalidations': self._invalidations,
+            }
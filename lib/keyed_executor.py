@@ -0,0 +1,210 @@
+from collections import deque, OrderedDict
+from lib.worker_pool import WorkerPool
+import threading
+import logging
+import time
+
+
+class KeyedExecutor:
+
+    def __init__(self, size, queue_size, overflow_policy='block', name='KeyedExecutor'):
+        """
+        Initializes the KeyedExecutor class.
+        Runs jobs on a fixed number of worker threads, like WorkerPool, except that every job is submitted with a
+        key. Jobs with the same key (e.g. the same DNS name) run one at a time, in the order they were submitted,
+        while jobs with different keys run concurrently. Keys with jobs waiting take turns: a key runs a single job,
+        then goes to the back of the line, so one busy key can't keep the others waiting.
+        The worker threads are not started here; call the start method to do so.
+
+        Arguments:
+            size (int) : The number of worker threads.
+            queue_size (int) : The maximum number of jobs that may be waiting, across every key.
+            overflow_policy (str) : What to do when queue_size jobs are already waiting. One of 'block', 'drop-oldest'
+                                    (which drops the job that has waited longest, whatever its key), or 'drop-newest'.
+            name (str) : The name of the executor. Used for thread names and logging purposes.
+
+        Raises:
+            ValueError : The size or queue size is not positive, or the overflow policy is not recognized.
+        """
+        # Validate the arguments before anything is built.
+        if size < 1:
+            raise ValueError(f'{name} size must be at least 1, got {size}')
+        if queue_size < 1:
+            raise ValueError(f'{name} queue size must be at least 1, got {queue_size}')
+        if overflow_policy not in WorkerPool.OVERFLOW_POLICIES:
+            raise ValueError(f'{name} overflow policy must be one of {WorkerPool.OVERFLOW_POLICIES}, got {overflow_policy}')
+
+        # Set the executor's configuration.
+        self.name = name
+        self.size = size
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+
+        # The jobs waiting on each key, as (sequence number, enqueue time, function, args) tuples. A key stays in the
+        # dict while it has jobs waiting or running. The keys whose turn it is next are kept in order, and a key
+        # is only ever among them while none of its jobs is running. Everything is guarded by the condition.
+        self._keys = {}
+        self._ready = OrderedDict()
+        self._waiting = 0
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._running = False
+
+        # Counters used by the stats method.
+        self._submitted = 0
+        self._completed = 0
+        self._dropped = 0
+        self._dequeued = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._max_key_depth = 0
+
+        # Create (but do not start) the worker threads.
+        self._workers = [threading.Thread(target=self._work, name=f'{name}-{index}', daemon=True) for index in range(size)]
+
+    def start(self):
+        """
+        Starts every worker thread.
+        """
+        self._running = True
+        for worker in self._workers:
+            worker.start()
+        logging.info(f'{self.name} started {self.size} workers with a queue size of {self.queue_size} ({self.overflow_policy}), '
+                     f'ordered by key')
+
+    def submit(self, key, function, *args):
+        """
+        Submits a job, to be run after every job submitted before it with the same key.
+        If queue_size jobs are already waiting, the overflow policy decides whether this call blocks, drops the oldest
+        job, or drops this one.
+
+        Arguments:
+            key (str) : The key. Jobs with the same key are run in order.
+            function (callable) : The function to run on a worker thread.
+            *args : The positional arguments passed to the function.
+
+        Returns:
+            bool : Whether or not the job was accepted.
+        """
+        with self._condition:
+            # Handle a full queue according to the overflow policy.
+            if self._waiting >= self.queue_size:
+                if self.overflow_policy == 'drop-newest':
+                    self._dropped += 1
+                    logging.debug(f'{self.name} queue full, dropping newest job')
+                    return False
+                elif self.overflow_policy == 'drop-oldest':
+                    self._drop_oldest()
+                else:
+                    while self._waiting >= self.queue_size:
+                        self._condition.wait()
+
+            # Queue the job behind the key's other jobs. A key that had none waiting or running takes its turn next.
+            jobs = self._keys.get(key)
+            if jobs is None:
+                jobs = self._keys[key] = deque()
+                self._ready[key] = None
+            jobs.append((self._sequence, time.monotonic(), function, args))
+            self._sequence += 1
+            self._waiting += 1
+            self._submitted += 1
+            self._max_key_depth = max(self._max_key_depth, len(jobs))
+
+            # Wake up a worker.
+            self._condition.notify_all()
+            return True
+
+    def stats(self):
+        """
+        Returns a snapshot of the executor's counters, which can be used to size it under load.
+
+        Returns:
+            dict : The executor's size, queue depth (across every key), the number of keys with jobs waiting or
+                   running, the most jobs seen waiting on a single key, job counts, and queue wait times (in seconds).
+        """
+        with self._condition:
+            return {
+                'workers': self.size,
+                'queue_size': self.queue_size,
+                'queue_depth': self._waiting,
+                'keys': len(self._keys),
+                'max_key_depth': self._max_key_depth,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'dropped': self._dropped,
+                'average_wait_seconds': self._total_wait / self._dequeued if self._dequeued else 0.0,
+                'max_wait_seconds': self._max_wait,
+            }
+
+    def shutdown(self, wait=True):
+        """
+        Stops the executor. Jobs still waiting are finished first.
+
+        Arguments:
+            wait (bool) : Whether or not to wait for the worker threads to finish.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                if worker.is_alive():
+                    worker.join()
+
+    def _work(self):
+        """
+        The loop run by every worker thread.
+        Takes the next key in line, runs its oldest job, then puts the key back in line if it has more waiting.
+        """
+        while True:
+            with self._condition:
+                # Wait for a key to take its turn, or for the executor to be shut down.
+                while not self._ready and self._running:
+                    self._condition.wait()
+                if not self._ready:
+                    return
+
+                # Pull the key's oldest job and record its wait time.
+                key, _ = self._ready.popitem(last=False)
+                jobs = self._keys[key]
+                _, enqueued_at, function, args = jobs.popleft()
+                wait = time.monotonic() - enqueued_at
+                self._waiting -= 1
+                self._dequeued += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+
+                # Let any blocked submitters know there is room.
+                self._condition.notify_all()
+
+            # Run the job outside of the lock, making sure an exception doesn't hold up the key's other jobs.
+            try:
+                function(*args)
+            except Exception as e:
+                logging.error(f'{self.name} job raised an unexpected exception: {repr(e)}')
+
+            with self._condition:
+                self._completed += 1
+
+                # The key goes to the back of the line if it has more waiting. Otherwise, it is done.
+                if jobs:
+                    self._ready[key] = None
+                    self._condition.notify_all()
+                else:
+                    del self._keys[key]
+
+    def _drop_oldest(self):
+        """
+        Protected method that drops the job that has waited longest, whatever its key. Only called with the lock held.
+        """
+        key, jobs = min(((key, jobs) for key, jobs in self._keys.items() if jobs), key=lambda item: item[1][0][0])
+        jobs.popleft()
+        self._waiting -= 1
+        self._dropped += 1
+        logging.debug(f'{self.name} queue full, dropping oldest job')
+
+        # A key left without jobs is done, unless one of its jobs is running, in which case the worker running it
+        # finishes it off.
+        if not jobs and key in self._ready:
+            del self._ready[key]
+            del self._keys[key]
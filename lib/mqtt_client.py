@@ -1,61 +1,87 @@
+from lib.util import environment
+from lib.connection_monitor import ConnectionMonitor
 import paho.mqtt.client as mqtt
 import logging
 
 class MQTTClient:
 
-    def _connect(self, username, password, hostname, port):
+    def _connect(self, username, password, hostname, port, protocol=mqtt.MQTTv311):
         """
         Sets up the connection of the MQTT Client to a MQTT Server.
         Acts somewhat as a wrapper for paho.mqtt.client.Client.connect (which does not actually test the connection, but rather sets it up to be used).
-        After calling this method, self.client will have its attribute set to a paho.mqtt.client.Client instance.
+        After calling this method, self.client will have its attribute set to a paho.mqtt.client.Client instance, and
+        self.monitor to the ConnectionMonitor that tracks its connection and decides when a lost one is retried.
 
         Arguments:
             username (str) : The username of the account making the connection.
             password (str) : The password of the account making the connection.
             hostname (str) : The hostname of the MQTT server.
             port (int) : The port of the MQTT server.
+            protocol (int) : The MQTT protocol version. Defaults to paho.mqtt.client.MQTTv311.
         """
         # Instantiates the client.
-        client = mqtt.Client()
+        client = mqtt.Client(protocol=protocol)
 
         # If the client doesn't already have a client_type attribute, we add one for it and add the connection callback method.
         if not hasattr(client, 'client_type') and hasattr(self, 'client_type'):
             client.client_type = self.client_type
         client.on_connect = MQTTClient.on_connect
+        client.on_disconnect = MQTTClient.on_disconnect
+
+        # Attach the connection monitor, which the callbacks keep up to date.
+        client_type = self.client_type if hasattr(self, 'client_type') else 'MQTTClient'
+        self.monitor = ConnectionMonitor(environment.get('MQTT_RECONNECT_MIN_SECONDS'),
+                                         environment.get('MQTT_RECONNECT_MAX_SECONDS'),
+                                         name=client_type)
+        client.monitor = self.monitor
 
         # Sets the proper protocol, username, password, hostname, and port.
         client.tls_set(tls_version=mqtt.ssl.PROTOCOL_TLS)
         client.username_pw_set(username, password)
 
         # Attempts the connection.
-        # The client.connect method sets the variables in place so that the connection can be instantiated, but doesn't launch.
-        # This is due to the fact that no connection is made until the client is put into a loop.
+        # The client.connect_async method sets the variables in place so that the connection can be instantiated, and
+        # the first attempt is made through the monitor, the same as a reconnect. If the broker can't be reached, the
+        # attempt is retried with backoff by whichever loop runs the client, rather than raising here.
+        # No connection is accepted until the client is put into a loop.
         # This will be done differently based on what type of MQTTClient is being instantiated, so it's not acted upon here.
-        client.connect(hostname, port)
+        client.connect_async(hostname, port)
+        self.monitor.reconnect(client)
 
         # Sets the established client to self.client.
         self.client = client
 
     @staticmethod
-    def on_connect(client, user_data, flags, result_code):
+    def on_connect(client, user_data, flags, result_code, *args):
         """
-        Callback method for initial connection through self.client.
+        Callback method for a connection (or reconnection) through self.client.
         Used as a static method here so that self.client can use it.
-        If any result code other than 0 is received, then the program will exit immediately (critical connection error).
+        If any result code other than 0 is received, the failure is logged, and the broker closes the connection, which
+        is then retried with backoff rather than exiting. Any arguments past result_code, as passed for MQTT v5, are
+        ignored.
 
         Arguments:
             client (paho.mqtt.client.Client) : The client calling this method.
             user_data : The user data for the established connection.
             flags (dict) : The flags raised by this connection.
-            result_code (int) : The result code returned by this connection. Ideally 0.
+            result_code (int | paho.mqtt.reasoncodes.ReasonCode) : The result code returned by this connection.
+                                                                   Ideally 0. MQTT v5 connections return a reason code.
+
+        Returns:
+            bool : Whether or not this was a successful reconnection, after the connection was lost.
         """
         # If the result code is 0, connection was established successfully.
         if result_code == 0:
             logging.info(f'{client.client_type if hasattr(client, "client_type") else "MQTTClient"} connected successfully')
             logging.debug(f'{client.client_type if hasattr(client, "client_type") else "MQTTClient"} connection has flags {flags}')
-            return
+            return client.monitor.connected() if hasattr(client, 'monitor') else False
 
         # Otherwise, connection was unsuccessful.
+        # MQTT v5 reason codes carry their own description.
+        elif hasattr(result_code, 'getName'):
+            logging.critical(f'{client.client_type if hasattr(client, "client_type") else "MQTTClient"} failed to connect, {result_code.getName().lower()}')
+            logging.debug(f'{client.client_type if hasattr(client, "client_type") else "MQTTClient"} connection has flags {flags}')
+
         # Result code values are reported as documented in paho.mqtt.client's docstring.
         elif result_code <= 5:
             fail_reasons = {
@@ -74,5 +100,24 @@ class MQTTClient:
             logging.critical(f'{client.client_type if hasattr(client, "client_type") else "MQTTClient"} could not connect for unknown reason')
             logging.debug(f'{client.client_type if hasattr(client, "client_type") else "MQTTClient"} connection has flags {flags}')
 
-        # Exit with the result_code.
-        exit(result_code)
+        # The connection is down until a retry succeeds.
+        if hasattr(client, 'monitor'):
+            client.monitor.disconnected()
+        return False
+
+    @staticmethod
+    def on_disconnect(client, user_data, result_code, *args):
+        """
+        Callback method for the connection through self.client being lost (or closed).
+        Used as a static method here so that self.client can use it. Any arguments past result_code, as passed by
+        newer paho versions, are ignored.
+
+        Arguments:
+            client (paho.mqtt.client.Client) : The client calling this method.
+            user_data : The user data for the established connection.
+            result_code (int) : The reason the connection was lost. 0 if it was closed on purpose.
+        """
+        if result_code != 0:
+            logging.warning(f'{client.client_type if hasattr(client, "client_type") else "MQTTClient"} lost its connection with result code {result_code}')
+        if hasattr(client, 'monitor'):
+            client.monitor.disconnected()
@@ -1,7 +1,9 @@
 from lib.util import environment
 from lib.mqtt_client import MQTTClient
 from lib.authorization_client import AuthorizationClient
+import paho.mqtt.client as mqtt
 import logging
+import time
 
 class MQTTListener(MQTTClient):
 
@@ -10,7 +12,10 @@ class MQTTListener(MQTTClient):
         Initializes the MQTTListener class.
         All variables needed are pulled from .env.
         Sets up the necessary connection, but does not test.
-        Subscribes to the necessary topics.
+        Subscribes to the necessary topics, and subscribes to them again whenever the connection comes back.
+        If MQTT_LISTENER_SHARE_GROUP is set, the connection uses MQTT v5, and every topic is subscribed to as a shared
+        subscription ($share/<group>/<topic>), so that the broker spreads messages across every listener in the group
+        rather than sending each of them every message.
         """
         # Sets the client_type for MQTTClient inherited methods.
         self.client_type = 'MQTTListener'
@@ -21,38 +26,74 @@ class MQTTListener(MQTTClient):
         mqtt_listener_hostname = environment.get('MQTT_LISTENER_HOSTNAME')
         mqtt_listener_port = environment.get('MQTT_LISTENER_PORT')
 
+        # Shared subscriptions are an MQTT v5 feature.
+        self.share_group = environment.get('MQTT_LISTENER_SHARE_GROUP')
+        protocol = mqtt.MQTTv5 if self.share_group else mqtt.MQTTv311
+
         # Use the inherited _connect method to setup the connection.
         logging.info(f'MQTTListener setting connection to {mqtt_listener_hostname}:{mqtt_listener_port} with username {mqtt_listener_username} and password {mqtt_listener_password}')
         self._connect(mqtt_listener_username,
                       mqtt_listener_password,
                       mqtt_listener_hostname,
-                      mqtt_listener_port)
+                      mqtt_listener_port,
+                      protocol)
 
-        # Set the subscribe and on_message protocols.
+        # Set the connect, subscribe and on_message protocols.
+        self.client.on_connect = self.on_connect
         self.client.on_subscribe = self.on_subscribe
         self.client.on_message = self.on_message
 
-        # Subscribe to relevant topics.
-        for topic in environment.get('MQTT_LISTENER_TOPICS'):
+        # Subscribe to relevant topics, as part of the share group if there is one.
+        self.topics = [f'$share/{self.share_group}/{topic}' if self.share_group else topic
+                       for topic in environment.get('MQTT_LISTENER_TOPICS')]
+        for topic in self.topics:
             self.subscribe(topic)
 
     def begin_listening(self):
         """
         Loops forever (starts the listening loop).
         Required call for actually listening to stuff.
-        Acts as a wrapper for paho.mqtt.client.Client.loop_forever.
-        This is where the __main__ process ends, since loop_forever should never break UNLESS the timeout was achieved.
+        Runs paho.mqtt.client.Client.loop over and over, the way loop_forever would, except that a lost connection
+        is retried with the monitor's jittered backoff, rather than ending the process. Everything the process has
+        built up (caches, workers, connections) is kept across the outage.
         """
         # Log the connection's start.
         logging.info('MQTTListener now connecting...')
 
-        # Start the client loop.
-        self.client.loop_forever(timeout=environment.get('MQTT_CLIENT_CONNECTION_TIMEOUT_SECONDS'))
+        # Run the client loop, waiting out the backoff between reconnect attempts.
+        while True:
+            rc = self.client.loop(timeout=1.0)
+            if rc in (mqtt.MQTT_ERR_NO_CONN, mqtt.MQTT_ERR_CONN_LOST):
+                self.monitor.disconnected()
+                time.sleep(self.monitor.seconds_until_retry())
+                logging.warning('MQTTListener lost its connection, reconnecting')
+                self.monitor.reconnect(self.client)
+
+    def on_connect(self, client, user_data, flags, result_code, *args):
+        """
+        Callback method for a connection (or reconnection) through self.client.
+        Acts as a wrapper for MQTTClient.on_connect. Subscriptions don't survive a lost connection, so after a
+        reconnection, every topic is subscribed to again. Any arguments past result_code, as passed for MQTT v5, are
+        ignored.
+
+        Arguments:
+            client (paho.mqtt.client.Client) : The client calling this method.
+            user_data : The user data for the established connection.
+            flags (dict) : The flags raised by this connection.
+            result_code (int) : The result code returned by this connection. Ideally 0.
+        """
+        if MQTTClient.on_connect(client, user_data, flags, result_code):
+            for topic in self.topics:
+                self.subscribe(topic)
+
+    def stats(self):
+        """
+        Returns a snapshot of the listener's connection.
 
-        # If we EVER make it here, it means that the connection timed out, which is a critical error.
-        # Exit the program accordingly.
-        logging.critical('MQTTListener timed out while connecting')
-        exit(-1)
+        Returns:
+            dict : The ConnectionMonitor.stats of the listener's connection.
+        """
+        return self.monitor.stats()
 
     def subscribe(self, topic, qos=0, options=None, properties=None):
         """
@@ -69,10 +110,11 @@ class MQTTListener(MQTTClient):
         self.client.subscribe(topic, qos, options, properties)
 
     @staticmethod
-    def on_subscribe(client, user_data, mid, granted_qos):
+    def on_subscribe(client, user_data, mid, granted_qos, *args):
         """
         Callback method for subscription through self.client.
-        Used as a static method here so that self.client can use it.
+        Used as a static method here so that self.client can use it. Any arguments past granted_qos, as passed for
+        MQTT v5, are ignored.
 
         Arguments:
             client (paho.mqtt.client.Client) : The client calling this method.
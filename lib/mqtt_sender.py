@@ -1,20 +1,64 @@
 import os
 from lib.util import environment
 from lib.mqtt_client import MQTTClient
+from lib.sender_loop import SenderLoop
+from lib.spool import Spool
+import paho.mqtt.client as mqtt
+from collections import deque
+import threading
+import atexit
 import logging
 import time
 
 class MQTTSender(MQTTClient):
 
-    def __init__(self):
+    def __init__(self, index=0, threaded=True):
         """
         Initializes the MQTTSender class.
         All variables needed are pulled from .env.
         Sets up and tests the necessary connection, then sets the topics.
+        Once the connection is tested, the client is handed to a SenderLoop thread, which writes queued publishes in
+        batches and runs the network loop. Every publish is tracked by its message id until the broker acknowledges it (for QoS 0, until it is written),
+        so that pending, acknowledged, and failed counts, along with publish-to-ack latency, are available from stats.
+        Publishes still in flight when the connection is lost are counted as failed, rather than pending.
+        If MQTT_SENDER_SPOOL_DIRECTORY is set, publishes that can't be sent (the connection is down, or the queue is
+        full) are kept in a Spool on disk instead, and sent in order once they can be. With a QoS above 0, spooled
+        publishes are only removed from the spool once the broker acknowledges them.
+        With threaded set to False, the SenderLoop is not started, and is left to be run by an event loop instead (see
+        AsyncEngine).
+
+        Arguments:
+            index (int) : The sender's position in its MQTTSenderPool. Each sender spools to its own directory.
+                          Defaults to 0.
+            threaded (bool) : Whether or not to start the SenderLoop thread. Defaults to True.
         """
         # Sets the client_type for MQTTClient inherited methods.
         self.client_type = 'MQTTSender'
 
+        # Publishes in flight, mapped from message id to the time they were published, and the message ids
+        # acknowledged from inside the client.publish call currently being made (at most that call's own).
+        # Reentrant, since paho may call on_publish from inside client.publish on the publishing thread.
+        self._inflight = {}
+        self._publishing = False
+        self._acked_early = set()
+        self._inflight_lock = threading.RLock()
+
+        # Publishes that were in flight when the connection was lost, and counted as failed, mapped from message id to
+        # the time they were published. paho sends them again once it reconnects, so they may be acknowledged after
+        # all. Message ids are 16 bit, so this can't grow past 65535 entries.
+        self._abandoned = {}
+
+        # Spooled publishes that were handed to paho but not yet removed from the spool, as message ids in spool
+        # order, and those of them that have been acknowledged.
+        self._spool_inflight = deque()
+        self._spool_acked = set()
+
+        # Counters used by the stats method.
+        self._acked = 0
+        self._failed = 0
+        self._total_ack = 0.0
+        self._max_ack = 0.0
+
         # Copy connection environment variables to variables to be used twice.
         mqtt_sender_username = environment.get('MQTT_SENDER_USERNAME')
         mqtt_sender_password = environment.get('MQTT_SENDER_PASSWORD')
@@ -32,8 +76,9 @@ class MQTTSender(MQTTClient):
         logging.info('MQTTSender now testing connection...')
         self.test_connection()
 
-        # Set the on_publish protocol.
+        # Set the on_publish and on_disconnect protocols.
         self.client.on_publish = self.on_publish
+        self.client.on_disconnect = self.on_disconnect
 
         # Instantiate the topics list, which will keep track of all the topics this sender sends to.
         self.topics = []
@@ -41,50 +86,209 @@ class MQTTSender(MQTTClient):
             self.topics.append(topic)
             logging.info(f'MQTTSender will publish to topic "{topic}"')
 
+        # Set the delivery guarantees. Past the inflight window, paho queues messages instead of sending them.
+        self.qos = environment.get('MQTT_SENDER_QOS')
+        self.max_inflight = environment.get('MQTT_SENDER_MAX_INFLIGHT')
+        self.client.max_inflight_messages_set(self.max_inflight)
+        logging.info(f'MQTTSender will publish with QOS {self.qos} and at most {self.max_inflight} messages in flight')
+
+        # Open the spool, if one is configured. Messages left in it by a previous run are sent first.
+        self.spool = None
+        spool_directory = environment.CONFIG.MQTT_SENDER_SPOOL_DIRECTORY
+        if spool_directory:
+            self.spool = Spool(os.path.join(spool_directory, f'sender-{index}'),
+                               environment.get('MQTT_SENDER_SPOOL_MAX_BYTES'),
+                               environment.get('MQTT_SENDER_SPOOL_SEGMENT_BYTES'),
+                               environment.get('MQTT_SENDER_SPOOL_FSYNC'),
+                               name=f'MQTTSenderSpool-{index}')
+            logging.info(f'MQTTSender will spool to {self.spool.directory} while the broker is unavailable')
+
+            # Make sure buffered appends reach the disk, even if the process exits without shutting the sender down.
+            atexit.register(self.spool.close)
+
+        # Create the thread that owns the client from here on. Publishes are queued for it to write, and with a spool,
+        # publishes that overflow the queue are spooled by it, so that they stay in order.
+        self.loop = SenderLoop(self.client,
+                               self._write,
+                               environment.get('MQTT_SENDER_QUEUE_SIZE'),
+                               environment.get('MQTT_SENDER_BATCH_SIZE'),
+                               drain=self._drain,
+                               monitor=self.monitor,
+                               spill=self._spill if self.spool is not None else None,
+                               name='MQTTSenderLoop')
+
+        # Start the loop, unless an event loop is going to run it.
+        if threaded:
+            self.loop.start()
+
     def test_connection(self):
         """
         Tests the connection set up in the self._connect method.
-        Has innate timeout detection.
+        Has innate timeout detection. Returns as soon as the broker accepts the connection, which the monitor is told
+        about by the on_connect callback. Until then, the client's network loop is run here, and a connection that
+        couldn't be opened is retried with the monitor's backoff. If the broker still isn't reachable by the timeout,
+        the sender is left to keep retrying from its loop, rather than ending the process.
+
+        Returns:
+            bool : Whether or not the connection is up.
 
         Raises:
             AttributeError : self.client has not been instantiated.
         """
-        # In order to test the actual connection, a miniature loop is started to check for a valid connection.
-        self.client.loop_start()
-
-        # This for loop acts as a short circuit to prevent from having to wait the full timeout amount.
-        for second in range(max(1, environment.get('MQTT_CLIENT_CONNECTION_TIMEOUT_SECONDS'))):
-            time.sleep(1)
-            if self.client.is_connected():
-                logging.debug(f'MQTTSender connected after {second} seconds')
-                break
+        timeout = max(1, environment.get('MQTT_CLIENT_CONNECTION_TIMEOUT_SECONDS'))
+        started_at = time.monotonic()
 
-        # Finally, check if client is connected for timeout detection.
-        if not self.client.is_connected():
-            logging.critical('MQTTSender timed out while connecting')
-            exit(-1)
+        # Run the client's loop until it connects, for no longer than the timeout.
+        while not self.monitor.wait_connected(0):
+            remaining = started_at + timeout - time.monotonic()
+            if remaining <= 0:
+                logging.warning(f'MQTTSender could not connect within {timeout} seconds, retrying in the background')
+                return False
+            rc = self.client.loop(timeout=min(remaining, 0.1))
 
-        # Stop the loop.
-        self.client.loop_stop(force=True)
+            # The connection couldn't be opened (or was lost), so retry it once the backoff allows.
+            if rc in (mqtt.MQTT_ERR_NO_CONN, mqtt.MQTT_ERR_CONN_LOST):
+                self.monitor.disconnected()
+                time.sleep(min(self.monitor.seconds_until_retry(), remaining))
+                if not self.monitor.seconds_until_retry():
+                    self.monitor.reconnect(self.client)
+        logging.debug(f'MQTTSender connected after {time.monotonic() - started_at:.3f} seconds')
+        return True
 
-    def publish(self, payload, qos=0, retain=False, properties=None):
+    def publish(self, payload, qos=None, retain=False, properties=None, topics=None):
         """
-        Publishes a message to a predetermined list of topics.
+        Publishes a message to a list of topics, which is the predetermined list unless another one is given.
         Acts as a wrapper for the _publish method.
+        Only queues the message, and does not wait for it to be written or acknowledged.
 
         Arguments:
             payload (bytes): The payload.
-            qos (int): Desired quality of service level. Defaults to 0.
+            qos (int): Desired quality of service level. Defaults to the MQTT_SENDER_QOS .env variable.
             retain (bool): Whether or not this message should be retained.
             properties : Currently unknown.
+            topics (list): The topics to publish to. Defaults to the MQTT_SENDER_TOPICS .env variable.
         """
-        for topic in self.topics:
+        if qos is None:
+            qos = self.qos
+        for topic in self.topics if topics is None else topics:
             self._publish(topic=topic, payload=payload, qos=qos, retain=retain, properties=properties)
 
     def _publish(self, topic, payload, qos=0, retain=False, properties=None):
         """
-        Publishes a message to a topic.
-        Acts as a wrapper for paho.mqtt.client.Client.publish.
+        Queues a message to a topic, to be written by the sender loop.
+
+        Arguments:
+            topic (str): The topic name.
+            payload (bytes): The payload.
+            qos (int): Desired quality of service level. Defaults to 0.
+            retain (bool): Whether or not this message should be retained.
+            properties : Currently unknown.
+
+        Returns:
+            bool : Whether or not the message was queued. False if the outbound queue is full (and, with a spool, so
+                   is the overflow queue that is spooled from).
+        """
+        if self.loop.put(topic, payload, qos, retain, properties):
+            return True
+        logging.debug(f'MQTTSender outbound queue full, dropping message to topic "{topic}"')
+        return False
+
+    def _write(self, topic, payload, qos=0, retain=False, properties=None):
+        """
+        Publishes a message to a topic, and starts tracking it until it is acknowledged.
+        Acts as a wrapper for paho.mqtt.client.Client.publish. Only called on the sender loop's thread.
+        With a spool, the message is spooled instead if the connection is down, or if older messages are still
+        spooled (so that it isn't sent ahead of them), or if paho refuses it.
+
+        Arguments:
+            topic (str): The topic name.
+            payload (bytes): The payload.
+            qos (int): Desired quality of service level. Defaults to 0.
+            retain (bool): Whether or not this message should be retained.
+            properties : Currently unknown.
+        """
+        # Keep the message in order behind anything already spooled, and out of paho's memory while disconnected.
+        if self.spool is not None and (not self.spool.empty() or not self.client.is_connected()):
+            if not self.spool.append(topic, payload, qos, retain):
+                self._count_failure(topic, 'the spool is full')
+            return
+
+        # Publish, spooling the message if paho refuses it.
+        if not self._send(topic, payload, qos, retain, properties):
+            if self.spool is None or not self.spool.append(topic, payload, qos, retain):
+                self._count_failure(topic, 'it was refused')
+
+    def _spill(self, topic, payload, qos=0, retain=False, properties=None):
+        """
+        Protected method that spools a message that overflowed the outbound queue. Only called on the sender loop's
+        thread, after every message queued before it has been written or spilled.
+
+        Arguments:
+            topic (str): The topic name.
+            payload (bytes): The payload.
+            qos (int): Desired quality of service level. Defaults to 0.
+            retain (bool): Whether or not this message should be retained.
+            properties : Currently unknown.
+        """
+        if self.spool.append(topic, payload, qos, retain):
+            logging.debug(f'MQTTSender outbound queue full, spooled message to topic "{topic}"')
+        else:
+            self._count_failure(topic, 'the outbound queue and spool are full')
+
+    def _drain(self):
+        """
+        Protected method that publishes a batch of spooled messages, oldest first, if the connection is up.
+        Only called on the sender loop's thread. Spooled messages are only removed from the spool once the broker
+        has acknowledged them (for QoS 0, once paho has accepted them), so a crash before then sends them again, and
+        no more are published than the inflight window has room for.
+
+        Returns:
+            int : The number of spooled messages published.
+        """
+        if self.spool is None:
+            return 0
+        sent = self._commit_acknowledged()
+        if self.spool.empty() or not self.client.is_connected():
+            return 0
+
+        # Leave room in the inflight window, so that paho doesn't end up queueing the spool in memory.
+        limit = self.loop.batch_size
+        if self.max_inflight:
+            with self._inflight_lock:
+                limit = min(limit, self.max_inflight - len(self._inflight))
+        if limit < 1:
+            return 0
+
+        # Publish the batch, skipping the messages already waiting on an acknowledgement, and stopping at the first
+        # message paho refuses. It stays in the spool for the next pass.
+        published = 0
+        for topic, payload, qos, retain in self.spool.peek(limit, skip=sent):
+            if not self._send(topic, payload, qos, retain, spooled=True):
+                break
+            published += 1
+        self._commit_acknowledged()
+        return published
+
+    def _commit_acknowledged(self):
+        """
+        Protected method that removes the oldest spooled messages handed to paho from the spool, up to the first that
+        hasn't been acknowledged yet. Only called on the sender loop's thread.
+
+        Returns:
+            int : The number of spooled messages still waiting on an acknowledgement.
+        """
+        with self._inflight_lock:
+            acked = 0
+            while self._spool_inflight and self._spool_inflight[0] in self._spool_acked:
+                self._spool_acked.discard(self._spool_inflight.popleft())
+                acked += 1
+            waiting = len(self._spool_inflight)
+        self.spool.commit(acked)
+        return waiting
+
+    def _send(self, topic, payload, qos=0, retain=False, properties=None, spooled=False):
+        """
+        Protected method that hands a message to paho, and tracks it until it is acknowledged.
 
         Arguments:
             topic (str): The topic name.
@@ -92,19 +296,151 @@ class MQTTSender(MQTTClient):
             qos (int): Desired quality of service level. Defaults to 0.
             retain (bool): Whether or not this message should be retained.
             properties : Currently unknown.
+            spooled (bool): Whether or not the message was read from the spool, in which case it is only removed from
+                            the spool once acknowledged (for QoS 0, right away). Defaults to False.
+
+        Returns:
+            bool : Whether or not paho accepted the message.
+        """
+        # Hold the lock across the publish, so that the acknowledgement can't be handled before the message is tracked.
+        with self._inflight_lock:
+            published_at = time.monotonic()
+            self._publishing = True
+            try:
+                message_info = self.client.publish(topic, payload, qos, retain, properties)
+            finally:
+                self._publishing = False
+            acked = message_info.mid in self._acked_early
+            self._acked_early.clear()
+
+            # A message that paho refused outright (e.g. no connection) will never be acknowledged.
+            if message_info.rc != mqtt.MQTT_ERR_SUCCESS:
+                logging.debug(f'MQTTSender could not publish to topic "{topic}", error code {message_info.rc}')
+                return False
+
+            # Unless it was already acknowledged (handled in on_publish), track it until it is. The message id may have
+            # belonged to an abandoned publish, which paho has since let go of.
+            self._abandoned.pop(message_info.mid, None)
+            if not acked:
+                self._inflight[message_info.mid] = published_at
+
+            # Keep spooled messages in the spool until they are acknowledged. QoS 0 messages never are.
+            if spooled:
+                self._spool_inflight.append(message_info.mid)
+                if acked or qos == 0:
+                    self._spool_acked.add(message_info.mid)
+            return True
+
+    def _count_failure(self, topic, reason):
+        """
+        Protected method that counts a message that could not be sent.
+
+        Arguments:
+            topic (str): The topic name.
+            reason (str): Why the message could not be sent. Used for logging purposes.
+        """
+        with self._inflight_lock:
+            self._failed += 1
+        logging.debug(f'MQTTSender failed to publish to topic "{topic}", {reason}')
+
+    def shutdown(self):
+        """
+        Stops the sender loop and disconnects from the broker, then closes the spool, if there is one. Messages still
+        in the outbound queue are not written.
+        """
+        self.loop.stop()
+        self.client.disconnect()
+        if self.spool is not None:
+            self.spool.close()
+
+    def on_publish(self, client, user_data, mid, *args):
+        """
+        Callback method for a message being acknowledged by the broker (or, for QoS 0, written to the socket).
+        Set as self.client's on_publish callback. Any arguments past mid, as passed by newer paho versions, are ignored.
+
+        Arguments:
+            client (paho.mqtt.client.Client) : The client calling this method.
+            user_data : The user data for the established connection.
+            mid (int) : The message id of the acknowledged message.
         """
-        self.client.publish(topic, payload, qos, retain, properties)
+        with self._inflight_lock:
+            published_at = self._inflight.pop(mid, None)
+
+            # Acknowledged from inside client.publish, before _send could start tracking it.
+            if published_at is None and self._publishing:
+                self._acked_early.add(mid)
+                published_at = time.monotonic()
+
+            # Abandoned when the connection was lost, but sent again by paho, and delivered after all.
+            elif published_at is None and mid in self._abandoned:
+                published_at = self._abandoned.pop(mid)
+                self._failed -= 1
+
+            # Any other message id is a spooled message's, which is sent again from the spool instead.
+            elif published_at is None:
+                return
+            latency = time.monotonic() - published_at
+
+            # A spooled message can now be removed from the spool.
+            if mid in self._spool_inflight:
+                self._spool_acked.add(mid)
+
+            # Update the counters.
+            self._acked += 1
+            self._total_ack += latency
+            self._max_ack = max(self._max_ack, latency)
 
-    @staticmethod
-    def on_publish(client, user_data, mid):
+    def on_disconnect(self, client, user_data, result_code, *args):
         """
-        Callback method for receiving a message through self.client.
-        Used as a static method here so that self.client can use it.
-        Currently unused.
+        Callback method for the connection through self.client being lost (or closed).
+        Acts as a wrapper for MQTTClient.on_disconnect. Publishes still waiting on an acknowledgement would otherwise
+        stay pending for as long as the connection is down, so they are counted as failed (and as acknowledged after
+        all, if paho delivers them once it reconnects). Spooled ones are still in the spool, so they are sent from it
+        again instead, once the connection is back.
 
         Arguments:
             client (paho.mqtt.client.Client) : The client calling this method.
             user_data : The user data for the established connection.
-            mid : Currently unknown.
+            result_code (int) : The reason the connection was lost. 0 if it was closed on purpose.
+        """
+        MQTTClient.on_disconnect(client, user_data, result_code, *args)
+        with self._inflight_lock:
+            spooled = set(self._spool_inflight)
+            for mid, published_at in self._inflight.items():
+                if mid not in spooled:
+                    self._abandoned[mid] = published_at
+                    self._failed += 1
+            self._inflight.clear()
+
+            # Remove what was acknowledged from the spool, and start sending the rest from the oldest again.
+            if self.spool is not None:
+                self._commit_acknowledged()
+            self._spool_inflight.clear()
+            self._spool_acked.clear()
+
+    def stats(self):
+        """
+        Returns a snapshot of the sender's delivery counters.
+
+        Returns:
+            dict : The QoS level and inflight window, the number of publishes pending, acknowledged, and failed, and
+                   the average and maximum publish-to-ack latency, with the SenderLoop.stats under 'loop', the
+                   Spool.stats under 'spool' (None without a spool), and the ConnectionMonitor.stats under
+                   'connection'.
         """
-        pass
+        loop_stats = self.loop.stats()
+        spool_stats = self.spool.stats() if self.spool is not None else None
+        connection_stats = self.monitor.stats()
+        with self._inflight_lock:
+            return {
+                'loop': loop_stats,
+                'spool': spool_stats,
+                'connection': connection_stats,
+                'qos': self.qos,
+                'max_inflight': self.max_inflight,
+                'pending': len(self._inflight),
+                'acked': self._acked,
+                'failed': self._failed,
+                'average_ack_seconds': self._total_ack / self._acked if self._acked else 0.0,
+                'max_ack_seconds': self._max_ack,
+            }
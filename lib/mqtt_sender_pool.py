@@ -0,0 +1,101 @@
+from lib.mqtt_sender import MQTTSender
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import threading
+import logging
+import zlib
+
+
+class MQTTSenderPool:
+
+    # The ways publishes can be spread across the pool's connections.
+    DISTRIBUTIONS = ['round-robin', 'hashed']
+
+    def __init__(self, size, distribution='round-robin', threaded=True):
+        """
+        Initializes the MQTTSenderPool class.
+        Opens several MQTTSender connections, and spreads publishes across them, so that outbound throughput isn't
+        capped by a single socket. With the 'hashed' distribution, every publish with the same key (e.g. the source
+        DNS name) goes out on the same connection, which keeps messages from one device in order.
+
+        Arguments:
+            size (int) : The number of sender connections.
+            distribution (str) : How publishes are spread. One of 'round-robin' or 'hashed'. Defaults to 'round-robin'.
+            threaded (bool) : Whether or not each sender starts a SenderLoop thread. Defaults to True.
+
+        Raises:
+            ValueError : The size is not positive, or the distribution is not recognized.
+        """
+        # Validate the arguments before anything is built.
+        if size < 1:
+            raise ValueError(f'MQTTSenderPool size must be at least 1, got {size}')
+        if distribution not in MQTTSenderPool.DISTRIBUTIONS:
+            raise ValueError(f'MQTTSenderPool distribution must be one of {MQTTSenderPool.DISTRIBUTIONS}, got {distribution}')
+
+        # Set the pool's configuration.
+        self.size = size
+        self.distribution = distribution
+
+        # Open the connections all at once, so that startup only waits as long as the slowest one.
+        with ThreadPoolExecutor(max_workers=size, thread_name_prefix='MQTTSenderPool') as executor:
+            self.senders = list(executor.map(MQTTSender, range(size), itertools.repeat(threaded, size)))
+        logging.info(f'MQTTSenderPool opened {size} sender connections ({distribution})')
+
+        # The round-robin counter, and the per-connection publish counts used by the stats method.
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._published = [0] * size
+
+    def publish(self, payload, key=None, qos=None, retain=False, properties=None, topics=None):
+        """
+        Publishes a message on one of the pool's connections.
+        Acts as a wrapper for MQTTSender.publish.
+
+        Arguments:
+            payload (bytes): The payload.
+            key (str): The key used to pick a connection with the 'hashed' distribution, e.g. the source DNS name.
+                       Publishes without a key are spread round-robin. Defaults to None.
+            qos (int): Desired quality of service level. Defaults to the MQTT_SENDER_QOS .env variable.
+            retain (bool): Whether or not this message should be retained.
+            properties : Currently unknown.
+            topics (list): The topics to publish to. Defaults to the MQTT_SENDER_TOPICS .env variable.
+        """
+        # Pick the connection. crc32 is used over hash, since it doesn't change between runs.
+        if self.distribution == 'hashed' and key is not None:
+            index = zlib.crc32(key.encode()) % self.size
+        else:
+            index = next(self._next) % self.size
+
+        # Publish, and count it.
+        self.senders[index].publish(payload, qos, retain, properties, topics)
+        with self._lock:
+            self._published[index] += 1
+
+    def shutdown(self):
+        """
+        Closes every sender connection. Acts as a wrapper for MQTTSender.shutdown.
+        """
+        for sender in self.senders:
+            sender.shutdown()
+
+    def stats(self):
+        """
+        Returns a snapshot of every connection's health and throughput.
+
+        Returns:
+            dict : The pool's size and distribution, along with a list of MQTTSender.stats under 'connections', each
+                   with whether the connection is up and how many messages were published on it.
+        """
+        with self._lock:
+            published = list(self._published)
+        connections = []
+        for index, sender in enumerate(self.senders):
+            connection = sender.stats()
+            connection['connected'] = sender.client.is_connected()
+            connection['published'] = published[index]
+            connections.append(connection)
+        return {
+            'size': self.size,
+            'distribution': self.distribution,
+            'connections': connections,
+        }
@@ -0,0 +1,261 @@
+from lib.connection_monitor import ConnectionMonitor
+import paho.mqtt.client as mqtt
+from collections import deque
+import threading
+import logging
+import asyncio
+import time
+
+
+class SenderLoop(threading.Thread):
+
+    def __init__(self, client, write, queue_size, batch_size, poll_interval=0.05, drain=None, monitor=None,
+                 spill=None, name='SenderLoop'):
+        """
+        Initializer for SenderLoop thread.
+        The only thread that touches its paho client once started. Worker threads put outbound messages on a bounded
+        queue and return right away; this thread writes them to the client in batches, and in between, runs the
+        client's network loop, so that acknowledgements are read, keepalives are sent, and lost connections come back.
+
+        Arguments:
+            client (paho.mqtt.client.Client) : The connected client to run the network loop of.
+            write (callable) : Called on this thread with each queued item's arguments, to write it to the client.
+            queue_size (int) : The maximum number of messages that may be waiting in the queue.
+            batch_size (int) : The maximum number of messages written between two runs of the network loop.
+            poll_interval (int | float) : How many seconds to wait for new messages before running the network loop
+                                          anyway. Defaults to 0.05.
+            drain (callable) : Called on this thread before each flush, to write messages held somewhere other than the
+                               queue (e.g. a spool). Returns how many it wrote. Defaults to None.
+            monitor (ConnectionMonitor) : Decides when a lost connection is retried. Defaults to a new monitor with
+                                          a backoff of 1 to 60 seconds.
+            spill (callable) : Called on this thread with each message's arguments once the queue has overflowed, to
+                               hold it somewhere other than the queue (e.g. a spool) instead of writing it. Messages
+                               that overflow wait in a second queue of the same size, then are spilled in order behind
+                               everything queued before them. Defaults to None, which drops them instead.
+            name (str) : The name of the thread. Used for logging purposes.
+
+        Raises:
+            ValueError : The queue size or batch size is not positive.
+        """
+        # Validate the arguments before anything is built.
+        if queue_size < 1:
+            raise ValueError(f'{name} queue size must be at least 1, got {queue_size}')
+        if batch_size < 1:
+            raise ValueError(f'{name} batch size must be at least 1, got {batch_size}')
+        threading.Thread.__init__(self, name=name, daemon=True)
+
+        # Set the loop's configuration.
+        self.client = client
+        self.write = write
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.drain = drain
+        self.spill = spill
+        self.monitor = monitor if monitor is not None else ConnectionMonitor(1, 60, name=name)
+
+        # The queue holds (enqueue time, args) tuples, and is guarded by the condition. Messages put while it is full
+        # wait in the overflow queue to be spilled.
+        self._queue = deque()
+        self._overflow = deque()
+        self._condition = threading.Condition()
+        self._running = True
+
+        # Called whenever a message is queued, while run_async is waiting for one.
+        self._wakeup = None
+
+        # Counters used by the stats method.
+        self._enqueued = 0
+        self._dropped = 0
+        self._written = 0
+        self._spilled = 0
+        self._flushes = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def put(self, *args):
+        """
+        Puts a message on the outbound queue. Never blocks.
+        If the queue is full and there is a spill callable, the message goes on the overflow queue instead, and is
+        spilled (along with everything queued before it) on the loop's thread.
+
+        Arguments:
+            *args : The arguments the write callable is called with.
+
+        Returns:
+            bool : Whether or not the message was accepted. False if the queue (and overflow queue) is full.
+        """
+        with self._condition:
+            if len(self._queue) < self.queue_size:
+                self._queue.append((time.monotonic(), args))
+            elif self.spill is not None and len(self._overflow) < self.queue_size:
+                self._overflow.append((time.monotonic(), args))
+            else:
+                self._dropped += 1
+                return False
+            self._enqueued += 1
+            self._condition.notify()
+            wakeup = self._wakeup
+        if wakeup is not None:
+            wakeup()
+        return True
+
+    def run(self):
+        """
+        Runs the main loop: drains, flushes a batch, then services the network, until stopped.
+        While there is something to drain, the flush doesn't wait for new messages.
+        """
+        logging.info(f'{self.name} started with a queue size of {self.queue_size} and a batch size of {self.batch_size}')
+        while self._running:
+            drained = self._drain()
+            self.flush(0 if drained else self.poll_interval)
+            self.service()
+
+    async def run_async(self):
+        """
+        Runs the main loop as a coroutine on an asyncio event loop, in place of this thread, until stopped: drains,
+        then flushes batches until there is nothing left, then waits for a new message (or the poll interval, so that
+        draining is retried). The network loop is left to the event loop, which reads and writes the client's socket
+        as it becomes ready (see AsyncMQTTDriver). Between batches, the event loop gets to run everything else.
+        """
+        loop = asyncio.get_running_loop()
+        loop_thread = threading.get_ident()
+        queued = asyncio.Event()
+
+        # Messages may be queued from the loop's thread, or from any other.
+        def wakeup():
+            if threading.get_ident() == loop_thread:
+                queued.set()
+            else:
+                loop.call_soon_threadsafe(queued.set)
+        self._wakeup = wakeup
+
+        logging.info(f'{self.name} started on the event loop with a queue size of {self.queue_size} and a batch size '
+                     f'of {self.batch_size}')
+        try:
+            while self._running:
+                drained = self._drain()
+                flushed = self.flush()
+                if drained or flushed:
+                    await asyncio.sleep(0)
+                    continue
+                queued.clear()
+                try:
+                    await asyncio.wait_for(queued.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._wakeup = None
+
+    def _drain(self):
+        """
+        Protected method that runs the drain callable, if there is one. Errors are logged, so they can't stop the loop.
+
+        Returns:
+            int : The number of messages drained.
+        """
+        if self.drain is None:
+            return 0
+        try:
+            return self.drain()
+        except Exception as e:
+            logging.error(f'{self.name} could not drain messages: {repr(e)}')
+            return 0
+
+    def flush(self, timeout=0):
+        """
+        Writes up to one batch of queued messages to the client.
+        Once the queue has overflowed, every queued message is spilled instead, in order, followed by the overflow.
+
+        Arguments:
+            timeout (int | float) : How many seconds to wait for a message if the queue is empty. Defaults to 0.
+
+        Returns:
+            int : The number of messages written.
+        """
+        # Take a batch off of the queue, waiting a little while if it's empty.
+        with self._condition:
+            if not self._queue and timeout:
+                self._condition.wait(timeout)
+            if self._overflow:
+                batch = list(self._queue) + list(self._overflow)
+                self._queue.clear()
+                self._overflow.clear()
+                handle = self.spill
+            else:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                handle = self.write
+        if not batch:
+            return 0
+
+        # Write (or spill) the batch. A message that fails to write is logged and skipped, so it can't stall the rest.
+        for _, args in batch:
+            try:
+                handle(*args)
+            except Exception as e:
+                logging.error(f'{self.name} could not write a message: {repr(e)}')
+
+        # Record how long the batch waited between being queued and written.
+        written_at = time.monotonic()
+        with self._condition:
+            self._flushes += 1
+            if handle is self.write:
+                self._written += len(batch)
+            else:
+                self._spilled += len(batch)
+            for enqueued_at, _ in batch:
+                latency = written_at - enqueued_at
+                self._total_latency += latency
+                self._max_latency = max(self._max_latency, latency)
+        return len(batch)
+
+    def service(self):
+        """
+        Runs one pass of the client's network loop without blocking.
+        If the connection was lost, it is retried once the monitor's backoff allows. Until then, the loop keeps
+        running, so queued messages are still handed to the write callable.
+
+        Returns:
+            int : The paho result code of the pass.
+        """
+        rc = self.client.loop(timeout=0)
+        if rc in (mqtt.MQTT_ERR_NO_CONN, mqtt.MQTT_ERR_CONN_LOST):
+            self.monitor.disconnected()
+            if not self.monitor.seconds_until_retry():
+                logging.warning(f'{self.name} lost its connection, reconnecting')
+                self.monitor.reconnect(self.client)
+        return rc
+
+    def stop(self):
+        """
+        Stops the loop after its current pass. Messages still in the queue are not written.
+        """
+        self._running = False
+        with self._condition:
+            self._condition.notify_all()
+            wakeup = self._wakeup
+        if wakeup is not None:
+            wakeup()
+
+    def stats(self):
+        """
+        Returns a snapshot of the loop's counters.
+
+        Returns:
+            dict : The queue's size and depth (the overflow queue's included), the number of messages queued,
+                   dropped, written, and spilled, the number of batches flushed, and the average and maximum time (in
+                   seconds) a message waited to be written or spilled.
+        """
+        with self._condition:
+            return {
+                'queue_size': self.queue_size,
+                'queue_depth': len(self._queue) + len(self._overflow),
+                'enqueued': self._enqueued,
+                'dropped': self._dropped,
+                'written': self._written,
+                'spilled': self._spilled,
+                'flushes': self._flushes,
+                'average_flush_latency_seconds': (self._total_latency / (self._written + self._spilled)
+                                                  if self._written + self._spilled else 0.0),
+                'max_flush_latency_seconds': self._max_latency,
+            }
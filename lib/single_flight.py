@@ -0,0 +1,179 @@
+import threading
+import asyncio
+
+
+class SingleFlight:
+
+    def __init__(self, name='SingleFlight'):
+        """
+        Initializes the SingleFlight class.
+        Coalesces concurrent calls that share a key, so that only the first caller (the leader) actually runs the
+        function, and every other caller waits for and receives the leader's result (or exception).
+
+        Arguments:
+            name (str) : The name of the single-flight group. Used for logging purposes.
+        """
+        self.name = name
+
+        # The in-flight calls, keyed by the key they were made with.
+        self._calls = {}
+        self._lock = threading.Lock()
+
+        # Counters used by the stats method.
+        self._leaders = 0
+        self._coalesced = 0
+
+    def do(self, key, function, *args, timeout=None):
+        """
+        Runs a function once for every group of concurrent callers with the same key.
+
+        Arguments:
+            key : The key calls are grouped by.
+            function (callable) : The function to run.
+            *args : The arguments passed to the function.
+            timeout (int | float) : How many seconds a waiting caller waits for the leader. Defaults to forever.
+
+        Returns:
+            object : The value returned by the function.
+
+        Raises:
+            TimeoutError : This caller was waiting on the leader, and the leader did not finish in time.
+            Exception : Whatever the function raised, re-raised in the leader and every waiting caller.
+        """
+        # Either join the call already in flight, or become the leader of a new one.
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = SingleFlightCall()
+                self._calls[key] = call
+                self._leaders += 1
+            else:
+                self._coalesced += 1
+
+        if leader:
+            # Run the function, then let everyone waiting know that it's done.
+            try:
+                call.result = function(*args)
+            except Exception as e:
+                call.exception = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(timeout):
+            raise TimeoutError(f'{self.name} timed out waiting on the in-flight call for {key}')
+
+        # Hand the leader's outcome to this caller.
+        if call.exception is not None:
+            raise call.exception
+        return call.result
+
+    def stats(self):
+        """
+        Returns a snapshot of the group's counters.
+
+        Returns:
+            dict : The number of calls in flight, the number of calls that ran the function, and the number of calls
+                   that were coalesced onto another one.
+        """
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self._leaders,
+                'coalesced': self._coalesced,
+            }
+
+
+class SingleFlightCall:
+
+    def __init__(self):
+        """
+        Initializes the SingleFlightCall class.
+        Holds the outcome of a single in-flight call, along with the event its waiters wait on.
+        """
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class AsyncSingleFlight:
+
+    def __init__(self, name='SingleFlight'):
+        """
+        Initializes the AsyncSingleFlight class.
+        The asyncio counterpart of SingleFlight, for coroutines running on a single event loop. The first caller of a
+        key starts the coroutine as a task, and every caller (the leader included) awaits the same task, so a caller
+        that gives up waiting doesn't cancel the call for the others. Not thread safe; only use it from the loop.
+
+        Arguments:
+            name (str) : The name of the single-flight group. Used for logging purposes.
+        """
+        self.name = name
+
+        # The in-flight tasks, keyed by the key they were started with.
+        self._calls = {}
+
+        # Counters used by the stats method.
+        self._leaders = 0
+        self._coalesced = 0
+
+    async def do(self, key, function, *args, timeout=None):
+        """
+        Runs a coroutine function once for every group of concurrent callers with the same key.
+
+        Arguments:
+            key : The key calls are grouped by.
+            function (coroutine function) : The coroutine function to run.
+            *args : The arguments passed to the function.
+            timeout (int | float) : How many seconds a caller waits for the call. Defaults to forever.
+
+        Returns:
+            object : The value returned by the function.
+
+        Raises:
+            TimeoutError : The call did not finish in time. It keeps running for any other callers.
+            Exception : Whatever the function raised, re-raised in every caller.
+        """
+        # Either join the call already in flight, or become the leader of a new one.
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function(*args))
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self._calls[key] = task
+            self._leaders += 1
+        else:
+            self._coalesced += 1
+
+        # Wait for the call, without cancelling it if this caller gives up.
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f'{self.name} timed out waiting on the in-flight call for {key}')
+
+    def _finish(self, key, task):
+        """
+        Protected method that forgets a finished call, so that the next caller of its key starts a new one.
+        Its exception is retrieved here, so that it isn't reported as unhandled if every caller gave up waiting.
+
+        Arguments:
+            key : The key the call was started with.
+            task (asyncio.Task) : The finished call.
+        """
+        self._calls.pop(key, None)
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        """
+        Returns a snapshot of the group's counters.
+
+        Returns:
+            dict : The number of calls in flight, the number of calls that ran the function, and the number of calls
+                   that were coalesced onto another one.
+        """
+        return {
+            'in_flight': len(self._calls),
+            'leaders': self._leaders,
+            'coalesced': self._coalesced,
+        }
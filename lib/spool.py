@@ -0,0 +1,371 @@
+import threading
+import logging
+import struct
+import time
+import zlib
+import os
+
+
+class Spool:
+
+    # How often segments are fsynced. 'always' after every append, 'interval' at most once per fsync interval, and
+    # 'never' leaves it to the operating system.
+    FSYNC_POLICIES = ['always', 'interval', 'never']
+
+    # Every record starts with the length and crc32 of its body.
+    RECORD_HEADER = struct.Struct('>II')
+
+    # Every body starts with the length of its topic, its QoS, and whether it is retained.
+    BODY_HEADER = struct.Struct('>HB?')
+
+    # The suffix of segment files, and the name of the file the read position is kept in.
+    SEGMENT_SUFFIX = '.seg'
+    CURSOR_FILE = 'cursor'
+
+    def __init__(self, directory, max_bytes, segment_bytes=67108864, fsync='interval', fsync_interval=1.0,
+                 name='Spool'):
+        """
+        Initializes the Spool class.
+        A durable, first in first out queue of outbound messages, kept on disk. Messages are appended, with buffered
+        writes, to numbered segment files, and read back in the order they were appended. Once every message in a
+        segment has been committed, the segment is deleted. The read position is kept in a cursor file, so messages
+        that were spooled but not sent before a restart are sent after it.
+
+        Arguments:
+            directory (str) : The directory the segments are kept in. Created if it doesn't exist.
+            max_bytes (int) : The most bytes the segments may take up on disk. Appends past it are refused.
+            segment_bytes (int) : The size at which a new segment is started. Defaults to 64 MiB.
+            fsync (str) : The fsync policy. One of 'always', 'interval', or 'never'. Defaults to 'interval'.
+            fsync_interval (int | float) : How many seconds may pass between fsyncs, under the 'interval' policy.
+                                           Defaults to 1.0.
+            name (str) : The name of the spool. Used for logging purposes.
+
+        Raises:
+            ValueError : A size is not positive, or the fsync policy is not recognized.
+        """
+        # Validate the arguments before anything is built.
+        if max_bytes < 1 or segment_bytes < 1:
+            raise ValueError(f'{name} sizes must be at least 1, got {max_bytes} and {segment_bytes}')
+        if fsync not in Spool.FSYNC_POLICIES:
+            raise ValueError(f'{name} fsync policy must be one of {Spool.FSYNC_POLICIES}, got {fsync}')
+
+        # Set the spool's configuration.
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.name = name
+
+        # Counters used by the stats method.
+        self._appended = 0
+        self._dropped = 0
+        self._committed = 0
+        self._lock = threading.Lock()
+
+        # Find the segments left over from a previous run, along with where reading stopped.
+        os.makedirs(directory, exist_ok=True)
+        segments = sorted(int(file[:-len(Spool.SEGMENT_SUFFIX)]) for file in os.listdir(directory)
+                          if file.endswith(Spool.SEGMENT_SUFFIX) and file[:-len(Spool.SEGMENT_SUFFIX)].isdigit())
+        self._sizes = {segment: os.path.getsize(self._path(segment)) for segment in segments}
+        self._head, self._offset = self._load_cursor(segments)
+
+        # Anything before the read position was already sent.
+        for segment in segments:
+            if segment < self._head:
+                self._delete(segment)
+        if self._sizes:
+            logging.info(f'{name} recovered {len(self._sizes)} segments from {directory}')
+
+        # Appends always go to a fresh segment, so a write torn by a crash is never appended to.
+        self._tail = max(self._sizes, default=self._head - 1) + 1
+        self._writer = None
+        self._open_tail()
+        if not segments:
+            self._head, self._offset = self._tail, 0
+        self._synced_at = time.monotonic()
+
+        # The records handed out by peek and not yet committed, as (segment, offset, message) tuples with the position
+        # just past each record, and the position reading continues from, so that a peek only reads what it hasn't
+        # already handed out.
+        self._peeked = []
+        self._read = (self._head, self._offset)
+
+    def append(self, topic, payload, qos=0, retain=False):
+        """
+        Appends a message to the spool.
+
+        Arguments:
+            topic (str): The topic name.
+            payload (bytes | str): The payload.
+            qos (int): Desired quality of service level. Defaults to 0.
+            retain (bool): Whether or not this message should be retained.
+
+        Returns:
+            bool : Whether or not the message was spooled. False if the spool is full.
+        """
+        # Build the record outside of the lock.
+        topic = topic.encode()
+        payload = payload.encode() if isinstance(payload, str) else bytes(payload)
+        body = Spool.BODY_HEADER.pack(len(topic), qos, retain) + topic + payload
+        record = Spool.RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+        with self._lock:
+            # Refuse the message if there isn't room for it on disk.
+            if self._disk_bytes() + len(record) > self.max_bytes:
+                self._dropped += 1
+                return False
+
+            # Start a new segment if this one is full, then write the record.
+            if self._sizes[self._tail] and self._sizes[self._tail] + len(record) > self.segment_bytes:
+                self._roll()
+            self._writer.write(record)
+            self._sizes[self._tail] += len(record)
+            self._appended += 1
+            self._sync()
+            return True
+
+    def peek(self, max_records, skip=0):
+        """
+        Reads messages from the front of the spool, without removing them.
+        Calling peek again hands out the same messages, until they are committed. Messages that were already handed
+        out, and are still waiting to be committed, can be skipped. They are kept in memory until then, so only
+        messages that haven't been handed out yet are read from disk.
+
+        Arguments:
+            max_records (int) : The most messages to read.
+            skip (int) : How many messages to skip, counting from the oldest. They can still be committed. Defaults
+                         to 0.
+
+        Returns:
+            list : (topic, payload, qos, retain) tuples, oldest first.
+        """
+        with self._lock:
+            self._writer.flush()
+
+            # Hand out the messages already read, then read on from where the last peek stopped.
+            records = [message for _, _, message in self._peeked[skip:skip + max_records]]
+            segment, offset = self._read
+            while len(records) < max_records:
+                # Move on to the next segment once this one is read through.
+                if offset >= self._sizes[segment]:
+                    if segment == self._tail:
+                        break
+                    segment, offset = min(s for s in self._sizes if s > segment), 0
+                    self._read = (segment, offset)
+                    continue
+
+                # Read the segment from the current position.
+                with open(self._path(segment), 'rb') as reader:
+                    reader.seek(offset)
+                    while len(records) < max_records and offset < self._sizes[segment]:
+                        record = Spool._read_record(reader)
+                        if record is None:
+                            logging.warning(f'{self.name} found a damaged record in segment {segment}, skipping the rest '
+                                            f'of it')
+                            offset = self._sizes[segment]
+                            if not self._peeked:
+                                self._head, self._offset = segment, offset
+                            break
+                        message, length = record
+                        offset += length
+                        if len(self._peeked) >= skip:
+                            records.append(message)
+                        self._peeked.append((segment, offset, message))
+                    self._read = (segment, offset)
+
+                    # The segment still being written to is the last one.
+                    if segment == self._tail and offset >= self._sizes[segment]:
+                        break
+            return records
+
+    def commit(self, count):
+        """
+        Removes messages handed out by peek (skipped ones included) from the front of the spool.
+        The rest of them can still be committed later on.
+
+        Arguments:
+            count (int) : How many of the peeked messages were sent, counting from the oldest.
+        """
+        with self._lock:
+            count = min(count, len(self._peeked))
+            if count < 1:
+                return
+
+            # Move the read position past the committed messages. With nothing left handed out, it catches up with
+            # where reading stopped, past any damaged records that were skipped.
+            self._head, self._offset, _ = self._peeked[count - 1]
+            self._peeked = self._peeked[count:]
+            if not self._peeked:
+                self._head, self._offset = self._read
+            self._committed += count
+
+            # Segments before the read position have been sent in full.
+            for segment in [segment for segment in self._sizes if segment < self._head]:
+                self._delete(segment)
+
+            # Once everything has been sent, start over in a new segment, so the disk space is given back right away.
+            if self._head == self._tail and self._offset >= self._sizes[self._tail]:
+                self._roll()
+                self._delete(self._head)
+                self._head, self._offset = self._tail, 0
+                self._read = (self._head, self._offset)
+            self._save_cursor()
+
+    def empty(self):
+        """
+        Returns:
+            bool : Whether or not every spooled message has been committed.
+        """
+        with self._lock:
+            return self._head == self._tail and self._offset >= self._sizes[self._tail]
+
+    def close(self):
+        """
+        Flushes and fsyncs the segment being written to, then closes it. Closing an already closed spool does nothing.
+        """
+        with self._lock:
+            if self._writer.closed:
+                return
+            self._sync(force=True)
+            self._writer.close()
+
+    def stats(self):
+        """
+        Returns a snapshot of the spool's size and counters.
+
+        Returns:
+            dict : The spool's size limit, its size on disk and number of segments, and the number of messages
+                   appended, dropped for lack of room, and committed.
+        """
+        with self._lock:
+            return {
+                'max_bytes': self.max_bytes,
+                'bytes': self._disk_bytes(),
+                'segments': len(self._sizes),
+                'appended': self._appended,
+                'dropped': self._dropped,
+                'committed': self._committed,
+            }
+
+    def _disk_bytes(self):
+        """
+        Protected method that returns the number of bytes the segments take up on disk, including committed messages
+        whose segment is still being read. Only called with the lock held.
+
+        Returns:
+            int : The number of bytes.
+        """
+        return sum(self._sizes.values())
+
+    def _path(self, segment):
+        """
+        Protected method that returns the path of a segment file.
+
+        Arguments:
+            segment (int) : The segment number.
+
+        Returns:
+            str : The path.
+        """
+        return os.path.join(self.directory, f'{segment:020d}{Spool.SEGMENT_SUFFIX}')
+
+    def _open_tail(self):
+        """
+        Protected method that opens the tail segment for appending.
+        """
+        self._writer = open(self._path(self._tail), 'ab')
+        self._sizes[self._tail] = 0
+
+    def _roll(self):
+        """
+        Protected method that closes the tail segment and starts a new one.
+        """
+        self._sync(force=True)
+        self._writer.close()
+        self._tail += 1
+        self._open_tail()
+
+    def _delete(self, segment):
+        """
+        Protected method that deletes a segment.
+
+        Arguments:
+            segment (int) : The segment number.
+        """
+        self._sizes.pop(segment, None)
+        try:
+            os.remove(self._path(segment))
+        except FileNotFoundError:
+            pass
+
+    def _sync(self, force=False):
+        """
+        Protected method that flushes the tail segment, and fsyncs it if the fsync policy calls for it.
+        Buffered writes are only flushed here under the 'always' and 'interval' policies, or when forced.
+
+        Arguments:
+            force (bool) : Whether to fsync regardless of the policy. Defaults to False.
+        """
+        now = time.monotonic()
+        if force or self.fsync == 'always' or (self.fsync == 'interval' and now - self._synced_at >= self.fsync_interval):
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            self._synced_at = now
+
+    def _load_cursor(self, segments):
+        """
+        Protected method that reads the read position from the cursor file.
+
+        Arguments:
+            segments (list) : The segment numbers found on disk, in order.
+
+        Returns:
+            tuple : The segment and offset reading continues from. The start of the oldest segment if the cursor file
+                    is missing, damaged, or points at a segment that no longer exists.
+        """
+        try:
+            with open(os.path.join(self.directory, Spool.CURSOR_FILE)) as cursor:
+                segment, offset = (int(part) for part in cursor.read().split())
+        except (OSError, ValueError):
+            return (segments[0] if segments else 0), 0
+        if segment in segments:
+            return segment, offset
+        return next((s for s in segments if s > segment), segment), 0
+
+    def _save_cursor(self):
+        """
+        Protected method that writes the read position to the cursor file. The file is replaced rather than
+        rewritten, so a crash leaves either the old position or the new one.
+        """
+        path = os.path.join(self.directory, Spool.CURSOR_FILE)
+        with open(path + '.tmp', 'w') as cursor:
+            cursor.write(f'{self._head} {self._offset}')
+            if self.fsync == 'always':
+                cursor.flush()
+                os.fsync(cursor.fileno())
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _read_record(reader):
+        """
+        Protected method that reads a single record.
+
+        Arguments:
+            reader (file) : The segment file, positioned at the start of the record.
+
+        Returns:
+            tuple | None : The (topic, payload, qos, retain) message and the record's length in bytes, or None if the
+                           record is cut short or its checksum doesn't match.
+        """
+        header = reader.read(Spool.RECORD_HEADER.size)
+        if len(header) < Spool.RECORD_HEADER.size:
+            return None
+        length, checksum = Spool.RECORD_HEADER.unpack(header)
+        body = reader.read(length)
+        if len(body) < length or zlib.crc32(body) != checksum or length < Spool.BODY_HEADER.size:
+            return None
+        topic_length, qos, retain = Spool.BODY_HEADER.unpack_from(body)
+        topic_end = Spool.BODY_HEADER.size + topic_length
+        message = (body[Spool.BODY_HEADER.size:topic_end].decode(), body[topic_end:], qos, retain)
+        return message, Spool.RECORD_HEADER.size + length
@@ -0,0 +1,204 @@
+from lib.util import environment, logger
+from lib.authorization_client import AuthorizationClient
+from lib.worker_pool import WorkerPool
+import threading
+import logging
+import time
+
+
+class StagedPipeline:
+
+    # The stages every message is passed through, in order.
+    STAGES = ['parse', 'resolve', 'verify', 'publish']
+
+    def __init__(self, workers, queue_size, overflow_policy='block', name='StagedPipeline'):
+        """
+        Initializes the StagedPipeline class.
+        An alternative to the single worker pool, enabled with AUTH_ENGINE=staged. Rather than one thread taking a
+        message from start to finish, each message is passed through a stage per step, each with its own worker pool
+        and bounded queue:
+            parse   : parses the message, and checks it against the whitelist (AuthorizationClient.prepare).
+            resolve : looks up the TLSA record for its DNS name (AuthorizationClient.resolve_tlsa_record).
+            verify  : checks its signature (AuthorizationClient.verify_signature_with_timeout).
+            publish : forwards it (AuthorizationClient.forward).
+        So slow DNS only ties up the resolve stage's workers, and each stage can be sized on its own.
+        A full queue blocks the stage before it, so backpressure flows back to the parse stage, whose queue follows
+        the overflow policy. The worker pools are not started here; call the start method to do so.
+
+        Arguments:
+            workers (dict) : The number of worker threads of each stage, keyed by stage name.
+            queue_size (int) : The maximum number of messages that may be waiting in each stage's queue.
+            overflow_policy (str) : What to do when the parse stage's queue is full. One of 'block', 'drop-oldest',
+                                    or 'drop-newest'.
+            name (str) : The name of the pipeline. Used for thread names and logging purposes.
+
+        Raises:
+            ValueError : A stage is missing a worker count, or WorkerPool rejected a stage's configuration.
+        """
+        # Validate the arguments before anything is built.
+        missing = [stage for stage in StagedPipeline.STAGES if stage not in workers]
+        if missing:
+            raise ValueError(f'{name} is missing worker counts for {missing}')
+
+        # Set the pipeline's configuration.
+        self.name = name
+
+        # Create (but do not start) the stages. Only messages coming into the pipeline are ever dropped.
+        self.stages = {
+            stage: WorkerPool(workers[stage], queue_size, overflow_policy if stage == 'parse' else 'block',
+                              name=f'{name}-{stage}')
+            for stage in StagedPipeline.STAGES
+        }
+
+        # Counters used by the stats method.
+        self._lock = threading.Lock()
+        self._rejected = {stage: 0 for stage in StagedPipeline.STAGES[:-1]}
+        self._authorized = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def start(self):
+        """
+        Starts every stage's worker pool.
+        """
+        for stage in self.stages.values():
+            stage.start()
+
+    def submit(self, message):
+        """
+        Submits a message to the parse stage.
+        Depending on the overflow policy, this may block while the stage's queue is full.
+
+        Arguments:
+            message (paho.mqtt.client.MQTTMessage) : The message object.
+
+        Returns:
+            bool : Whether or not the message was accepted into the queue.
+        """
+        return self.stages['parse'].submit(self._parse, message, time.monotonic())
+
+    def stats(self):
+        """
+        Returns a snapshot of every stage's counters, which can be used to find and size the slowest stage.
+
+        Returns:
+            dict : The WorkerPool.stats of each stage (queue depth, queue wait times, and run times) under 'stages',
+                   the number of messages rejected at each stage under 'rejected', the number authorized, and the
+                   average and maximum time (in seconds) an authorized message took to get through the pipeline.
+        """
+        with self._lock:
+            stats = {
+                'rejected': dict(self._rejected),
+                'authorized': self._authorized,
+                'average_latency_seconds': self._total_latency / self._authorized if self._authorized else 0.0,
+                'max_latency_seconds': self._max_latency,
+            }
+        stats['stages'] = {name: stage.stats() for name, stage in self.stages.items()}
+        return stats
+
+    def shutdown(self, wait=True):
+        """
+        Stops the pipeline, a stage at a time, so that every message already in it is finished first.
+
+        Arguments:
+            wait (bool) : Whether or not to wait for the worker threads to finish.
+        """
+        for stage in self.stages.values():
+            stage.shutdown(wait)
+
+    def _parse(self, message, received_at):
+        """
+        Protected method run by the parse stage. Parses a message, and passes it on if it is whitelisted.
+
+        Arguments:
+            message (paho.mqtt.client.MQTTMessage) : The message object.
+            received_at (float) : The time.monotonic value the message was received at.
+        """
+        # If logger not yet in post-setup mode, put it in post-setup mode.
+        if not logger.SETUP_OVER:
+            logger.log_setup_end_header()
+
+        # Log the message.
+        logging.debug(f'Message recieved on {message.topic}: {message.payload}')
+
+        # Parse the message. The timeout (changed in .env) covers both resolving and verifying, from here on.
+        details = {}
+        dns_name, verification_payload, _ = AuthorizationClient.prepare(message, details)
+        if dns_name is None:
+            self._reject('parse')
+            return
+        deadline = time.monotonic() + environment.CONFIG.DNS_TIMEOUT_SECONDS
+        self.stages['resolve'].submit(self._resolve, message, details, dns_name, verification_payload, deadline,
+                                      received_at)
+
+    def _resolve(self, message, details, dns_name, verification_payload, deadline, received_at):
+        """
+        Protected method run by the resolve stage. Looks up the TLSA record for a message's DNS name, and passes the
+        message on if there is one.
+
+        Arguments:
+            message (paho.mqtt.client.MQTTMessage) : The message object.
+            details (dict) : What the parse stage learned about the message, such as its 'dns_name'.
+            dns_name (str) : The message's DNS name.
+            verification_payload (bytes | str) : The payload to verify.
+            deadline (float) : The time.monotonic value the message must be verified by.
+            received_at (float) : The time.monotonic value the message was received at.
+        """
+        tlsa_record = AuthorizationClient.resolve_tlsa_record(dns_name, deadline)
+        if tlsa_record is None:
+            self._reject('resolve')
+            return
+        self.stages['verify'].submit(self._verify, message, details, dns_name, verification_payload, tlsa_record,
+                                     deadline, received_at)
+
+    def _verify(self, message, details, dns_name, verification_payload, tlsa_record, deadline, received_at):
+        """
+        Protected method run by the verify stage. Checks a message's signature, and passes the message on if it is
+        authentic.
+
+        Arguments:
+            message (paho.mqtt.client.MQTTMessage) : The message object.
+            details (dict) : What the parse stage learned about the message, such as its 'dns_name'.
+            dns_name (str) : The message's DNS name.
+            verification_payload (bytes | str) : The payload to verify.
+            tlsa_record (dict) : The TLSA record that the message's signing key is taken from.
+            deadline (float) : The time.monotonic value the message must be verified by.
+            received_at (float) : The time.monotonic value the message was received at.
+        """
+        if not AuthorizationClient.verify_signature_with_timeout(verification_payload, tlsa_record, dns_name,
+                                                                 deadline):
+            self._reject('verify')
+            return
+
+        # Authorized, log message.
+        logging.debug('Message authorized, forwarding to sender')
+        logging.info(f'Authorized message recieved on {message.topic}: {message.payload}')
+        self.stages['publish'].submit(self._publish, message, details, received_at)
+
+    def _publish(self, message, details, received_at):
+        """
+        Protected method run by the publish stage. Forwards an authorized message.
+
+        Arguments:
+            message (paho.mqtt.client.MQTTMessage) : The message object.
+            details (dict) : What the parse stage learned about the message, such as its 'dns_name'.
+            received_at (float) : The time.monotonic value the message was received at.
+        """
+        AuthorizationClient.forward(message, details)
+
+        # Record how long the message took.
+        latency = time.monotonic() - received_at
+        with self._lock:
+            self._authorized += 1
+            self._total_latency += latency
+            self._max_latency = max(self._max_latency, latency)
+
+    def _reject(self, stage):
+        """
+        Protected method that counts a message that went no further than a stage.
+
+        Arguments:
+            stage (str) : The name of the stage.
+        """
+        with self._lock:
+            self._rejected[stage] += 1
@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import threading
+import logging
+import time
+
+
+class StartupTimer:
+
+    def __init__(self, name='Startup'):
+        """
+        Initializes the StartupTimer class.
+        Runs the steps of startup, either in place or in the background so that slow steps (such as connecting to a
+        broker, or spawning processes) overlap, and records how long each one took. Once setup is over, log writes the
+        breakdown out as a single line.
+
+        Arguments:
+            name (str) : The name of the timer. Used for logging purposes, and to name background threads.
+        """
+        self.name = name
+
+        # The executor background steps are run on, created on first use.
+        self._executor = None
+
+        # Every finished step, as (name, start time, duration, whether it ran in the background) tuples.
+        self._lock = threading.Lock()
+        self._steps = []
+        self._started_at = time.monotonic()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times a step run in place, as the body of a with statement.
+
+        Arguments:
+            name (str) : The name of the step.
+        """
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self._record(name, started_at, False)
+
+    def start(self, name, function, *args):
+        """
+        Starts a step in the background, and times it.
+
+        Arguments:
+            name (str) : The name of the step.
+            function (callable) : The step.
+            *args : The arguments the step is called with.
+
+        Returns:
+            concurrent.futures.Future : The step's result. Calling result on it waits for the step, and raises whatever
+                                        it raised (including SystemExit).
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(thread_name_prefix=self.name)
+        return self._executor.submit(self._run, name, function, args)
+
+    def stats(self):
+        """
+        Returns a snapshot of how long each finished step took.
+
+        Returns:
+            dict : The duration of each finished step in seconds, in the order they started, along with the time since
+                   the timer was created under 'total'.
+        """
+        with self._lock:
+            stats = {name: duration for name, _, duration, _ in sorted(self._steps, key=lambda step: step[1])}
+        stats['total'] = time.monotonic() - self._started_at
+        return stats
+
+    def log(self):
+        """
+        Logs the breakdown of every finished step, marking the ones that ran in the background, then lets the
+        background threads go.
+        """
+        with self._lock:
+            steps = sorted(self._steps, key=lambda step: step[1])
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        breakdown = ', '.join(f'{name} {duration:.3f}s{" (background)" if background else ""}'
+                              for name, _, duration, background in steps)
+        logging.info(f'{self.name} took {time.monotonic() - self._started_at:.3f}s: {breakdown}')
+
+    def _run(self, name, function, args):
+        """
+        Protected method that runs a background step, and records how long it took.
+
+        Arguments:
+            name (str) : The name of the step.
+            function (callable) : The step.
+            args (tuple) : The arguments the step is called with.
+
+        Returns:
+            object : Whatever the step returned.
+        """
+        started_at = time.monotonic()
+        try:
+            return function(*args)
+        finally:
+            self._record(name, started_at, True)
+
+    def _record(self, name, started_at, background):
+        """
+        Protected method that records a finished step.
+
+        Arguments:
+            name (str) : The name of the step.
+            started_at (float) : The time.monotonic value the step started at.
+            background (bool) : Whether or not the step ran in the background.
+        """
+        with self._lock:
+            self._steps.append((name, started_at, time.monotonic() - started_at, background))
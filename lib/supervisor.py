@@ -0,0 +1,155 @@
+from multiprocessing.connection import wait
+import multiprocessing
+import threading
+import logging
+import time
+
+
+class Supervisor:
+
+    def __init__(self, size, target, min_restart_seconds=1, max_restart_seconds=60, stable_seconds=60,
+                 name='Supervisor'):
+        """
+        Initializes the Supervisor class.
+        Keeps a fixed number of worker processes running, each of which runs the target with its index. A process
+        that exits is restarted. If it exits again soon after being restarted, the wait before the next restart
+        doubles, up to the maximum, so that a process that can't start doesn't get restarted in a tight loop.
+        The processes are not started here; call the run (or start) method to do so.
+
+        Arguments:
+            size (int) : The number of worker processes.
+            target (function) : The picklable function each process runs. It is passed the process's index.
+            min_restart_seconds (int | float) : The wait before restarting a process that exited soon after starting.
+                                                Defaults to 1.
+            max_restart_seconds (int | float) : The longest wait before restarting a process. Defaults to 60.
+            stable_seconds (int | float) : How long a process has to run for its restart wait to be reset. Defaults
+                                           to 60.
+            name (str) : The name of the supervisor. Used for logging purposes, and to name the processes.
+
+        Raises:
+            ValueError : The size is not positive.
+        """
+        # Validate the size before anything is built.
+        if size < 1:
+            raise ValueError(f'{name} size must be at least 1, got {size}')
+
+        # Set the supervisor's configuration.
+        self.size = size
+        self.target = target
+        self.min_restart_seconds = min_restart_seconds
+        self.max_restart_seconds = max_restart_seconds
+        self.stable_seconds = stable_seconds
+        self.name = name
+
+        # Processes are spawned rather than forked, so that no threads or locks are inherited from this process.
+        # They are not daemonic, since each one starts verifier processes of its own.
+        self.context = multiprocessing.get_context('spawn')
+
+        # The state of each slot: its process, when it was started, when it may be restarted, and its restart wait.
+        self._processes = [None] * size
+        self._started_at = [0.0] * size
+        self._restart_at = [0.0] * size
+        self._restart_wait = [0.0] * size
+        self._restarts = [0] * size
+        self._stopping = threading.Event()
+
+    def start(self):
+        """
+        Starts a process in every slot.
+        """
+        for index in range(self.size):
+            self._start(index)
+        logging.info(f'{self.name} started {self.size} processes')
+
+    def run(self, poll_interval=1.0):
+        """
+        Starts every process, then watches them until stopped, restarting any that exit.
+        Waits on the processes' sentinels, so an exit is noticed right away rather than on the next poll.
+
+        Arguments:
+            poll_interval (int | float) : The most seconds to wait between checks, which is how late a delayed
+                                          restart may be. Defaults to 1.0.
+        """
+        self.start()
+        while not self._stopping.is_set():
+            sentinels = [process.sentinel for process in self._processes if process is not None and process.is_alive()]
+            wait(sentinels, timeout=poll_interval)
+            if not self._stopping.is_set():
+                self.check()
+
+    def check(self):
+        """
+        Restarts every process that has exited, once its restart wait is up.
+
+        Returns:
+            int : The number of processes restarted.
+        """
+        restarted = 0
+        now = time.monotonic()
+        for index, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                continue
+
+            # Note the exit, and work out how long to wait before restarting.
+            if process is not None:
+                process.join()
+                uptime = now - self._started_at[index]
+                if uptime >= self.stable_seconds:
+                    self._restart_wait[index] = 0.0
+                else:
+                    self._restart_wait[index] = min(self.max_restart_seconds,
+                                                    max(self.min_restart_seconds, self._restart_wait[index] * 2))
+                self._restart_at[index] = now + self._restart_wait[index]
+                self._processes[index] = None
+                logging.warning(f'{self.name} process {index} exited with code {process.exitcode} after {uptime:.1f} '
+                                f'seconds, restarting in {self._restart_wait[index]:.1f} seconds')
+
+            # Restart it once the wait is up.
+            if now >= self._restart_at[index]:
+                self._start(index)
+                self._restarts[index] += 1
+                restarted += 1
+        return restarted
+
+    def stop(self, timeout=10):
+        """
+        Stops every process, and stops watching them.
+
+        Arguments:
+            timeout (int | float) : How many seconds to give each process to exit before it is killed. Defaults to 10.
+        """
+        self._stopping.set()
+        processes = [process for process in self._processes if process is not None]
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        logging.info(f'{self.name} stopped {len(processes)} processes')
+
+    def stats(self):
+        """
+        Returns a snapshot of the processes.
+
+        Returns:
+            dict : The number of processes, how many of them are alive, and how many times each one was restarted.
+        """
+        return {
+            'processes': self.size,
+            'alive': sum(1 for process in self._processes if process is not None and process.is_alive()),
+            'restarts': list(self._restarts),
+        }
+
+    def _start(self, index):
+        """
+        Protected method that starts the process in a slot.
+
+        Arguments:
+            index (int) : The slot.
+        """
+        process = self.context.Process(target=self.target, args=(index,), name=f'{self.name}-{index}')
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
@@ -0,0 +1,152 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class TLSACache:
+
+    def __init__(self, max_entries, min_ttl, max_ttl, name='TLSACache'):
+        """
+        Initializes the TLSACache class.
+        Caches TLSA records by DNS name, honoring the record's own TTL (clamped between min_ttl and max_ttl).
+        Once max_entries is reached, the least recently used entry is evicted.
+
+        Arguments:
+            max_entries (int) : The maximum number of DNS names kept in the cache.
+            min_ttl (int) : The minimum number of seconds an entry is kept for, regardless of its DNS TTL.
+            max_ttl (int) : The maximum number of seconds an entry is kept for, regardless of its DNS TTL.
+            name (str) : The name of the cache. Used for logging purposes.
+
+        Raises:
+            ValueError : The maximum entry count is not positive, or the TTL clamps are out of order.
+        """
+        # Validate the arguments before anything is built.
+        if max_entries < 1:
+            raise ValueError(f'{name} max entries must be at least 1, got {max_entries}')
+        if min_ttl < 0 or max_ttl < min_ttl:
+            raise ValueError(f'{name} TTL clamps must satisfy 0 <= min <= max, got {min_ttl} and {max_ttl}')
+
+        # Set the cache's configuration.
+        self.name = name
+        self.max_entries = max_entries
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+
+        # The entries map a DNS name to an (expiry time, record) tuple, in least to most recently used order.
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # The DNS names whose entry has been read since it was last stored, so that only entries still in use are
+        # refreshed ahead of their expiry.
+        self._used = set()
+
+        # Counters used by the stats method.
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, dns_name):
+        """
+        Returns the cached TLSA record for a DNS name, if there is one and it has not expired.
+
+        Arguments:
+            dns_name (str) : The DNS name the record was resolved for.
+
+        Returns:
+            dict | None : The TLSA record, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(dns_name)
+
+            # Missing or expired entries both count as a miss.
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[dns_name]
+                    self._used.discard(dns_name)
+                self._misses += 1
+                return None
+
+            # Mark the entry as the most recently used.
+            self._entries.move_to_end(dns_name)
+            self._used.add(dns_name)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, dns_name, record, ttl):
+        """
+        Adds a TLSA record to the cache, evicting the least recently used entry if the cache is full.
+
+        Arguments:
+            dns_name (str) : The DNS name the record was resolved for.
+            record (dict) : The TLSA record.
+            ttl (int) : The DNS TTL of the record, in seconds. Clamped between min_ttl and max_ttl.
+        """
+        ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+        with self._lock:
+            self._entries[dns_name] = (time.monotonic() + ttl, record)
+            self._entries.move_to_end(dns_name)
+            self._used.discard(dns_name)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._used.discard(evicted)
+                self._evictions += 1
+
+    def time_to_live(self, dns_name):
+        """
+        Returns how many seconds are left before a DNS name's entry expires.
+        Unlike the get method, this does not count as a hit or miss, and does not mark the entry as used.
+
+        Arguments:
+            dns_name (str) : The DNS name to check.
+
+        Returns:
+            float | None : The number of seconds left, or None if the entry is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(dns_name)
+            remaining = entry[0] - time.monotonic() if entry is not None else 0
+            return remaining if remaining > 0 else None
+
+    def expiring(self, within, used_only=False):
+        """
+        Returns every DNS name whose entry has not expired yet, but will within the given number of seconds.
+
+        Arguments:
+            within (int | float) : The number of seconds to look ahead.
+            used_only (bool) : Whether or not to leave out entries that haven't been read (by the get method) since
+                               they were last stored. Defaults to False.
+
+        Returns:
+            list : The DNS names that are about to expire.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [dns_name for dns_name, (expires_at, _) in self._entries.items()
+                    if now < expires_at <= now + within and (not used_only or dns_name in self._used)]
+
+    def invalidate(self, dns_name):
+        """
+        Removes a DNS name from the cache, if it is there.
+
+        Arguments:
+            dns_name (str) : The DNS name to remove.
+        """
+        with self._lock:
+            self._entries.pop(dns_name, None)
+            self._used.discard(dns_name)
+
+    def stats(self):
+        """
+        Returns a snapshot of the cache's counters.
+
+        Returns:
+            dict : The cache's size, along with its hit, miss, and eviction counts.
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
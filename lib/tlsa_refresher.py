@@ -0,0 +1,104 @@
+from lib.worker_pool import WorkerPool
+from threading import Thread
+from time import sleep
+import threading
+import logging
+
+
+class TLSARefresher(Thread):
+
+    def __init__(self, dns_names, tlsa_cache, negative_tlsa_cache, refresh, concurrency, refresh_ahead, interval=1):
+        """
+        Initializer for TLSARefresher thread.
+        Keeps the TLSA cache warm, so that verification does not have to block on DNS. On its first pass, every
+        DNS name given is fetched, and from then on, entries are re-fetched shortly before their TTL runs out.
+        Other cached names (such as those matched by a wildcard rule) are only re-fetched if they have been read since
+        they were last stored, so names that have gone quiet are left to expire.
+        Names that are in the negative cache are left alone until their negative entry expires.
+
+        Arguments:
+            dns_names (list) : The DNS names to keep warm (usually, the whitelist).
+            tlsa_cache (TLSACache) : The cache of resolved TLSA records.
+            negative_tlsa_cache (TLSACache) : The cache of failed TLSA lookups.
+            refresh (callable) : Called with a DNS name to resolve it and store the outcome in the caches.
+            concurrency (int) : The maximum number of refreshes run at the same time.
+            refresh_ahead (int | float) : How many seconds before expiry an entry gets refreshed.
+            interval (int | float) : How many seconds to sleep between passes. Defaults to 1.
+        """
+        Thread.__init__(self, name='TLSARefresher', daemon=True)
+
+        # Set the refresher's configuration.
+        self.dns_names = list(dns_names)
+        self._names = set(self.dns_names)
+        self.tlsa_cache = tlsa_cache
+        self.negative_tlsa_cache = negative_tlsa_cache
+        self.refresh = refresh
+        self.refresh_ahead = refresh_ahead
+        self.interval = interval
+
+        # The refreshes themselves are run on their own small pool, which caps how many run at once. A name is never
+        # queued twice, so its queue holds every name that can be due at once: the names given, plus the cache.
+        self.pool = WorkerPool(concurrency, len(self.dns_names) + tlsa_cache.max_entries, 'drop-newest',
+                               name='TLSARefresher')
+
+        # DNS names that have a refresh queued or running, so that they are not submitted twice.
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def run(self):
+        """
+        Runs the main refresher loop.
+        """
+        self.pool.start()
+        while True:
+            self.refresh_due()
+            sleep(self.interval)
+
+    def refresh_due(self):
+        """
+        Submits a refresh for every DNS name given that is missing from the cache or about to expire, and for every
+        other cached name that is about to expire and has been read since it was last stored.
+
+        Returns:
+            int : The number of refreshes submitted.
+        """
+        # Names given that aren't cached yet or are about to expire, plus anything else in the cache that is about to
+        # expire and still in use.
+        due = [dns_name for dns_name in self.dns_names if self.tlsa_cache.time_to_live(dns_name) is None]
+        due += [dns_name for dns_name in self.tlsa_cache.expiring(self.refresh_ahead) if dns_name in self._names]
+        due += [dns_name for dns_name in self.tlsa_cache.expiring(self.refresh_ahead, used_only=True)
+                if dns_name not in self._names]
+
+        submitted = 0
+        for dns_name in due:
+            # Leave recently failed names alone, and don't submit a name twice.
+            if self.negative_tlsa_cache.time_to_live(dns_name) is not None:
+                continue
+            with self._lock:
+                if dns_name in self._pending:
+                    continue
+                self._pending.add(dns_name)
+
+            # Submit the refresh. If the pool's queue is full, it'll be picked up again on the next pass.
+            if self.pool.submit(self._refresh, dns_name):
+                submitted += 1
+            else:
+                with self._lock:
+                    self._pending.discard(dns_name)
+
+        if submitted:
+            logging.debug(f'TLSARefresher submitted {submitted} refreshes')
+        return submitted
+
+    def _refresh(self, dns_name):
+        """
+        Refreshes a single DNS name, then marks it as no longer pending.
+
+        Arguments:
+            dns_name (str) : The DNS name to refresh.
+        """
+        try:
+            self.refresh(dns_name)
+        finally:
+            with self._lock:
+                self._pending.discard(dns_name)
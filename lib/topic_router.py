@@ -0,0 +1,134 @@
+from lib.whitelist import Whitelist
+from lib.util import forwarding
+import paho.mqtt.client as mqtt
+import threading
+import string
+
+
+class TopicRouter:
+
+    # The separator between the parts of a routing rule.
+    RULE_SEPARATOR = '|'
+
+    # The fields a destination template may use.
+    TEMPLATE_FIELDS = {'dns_name', 'source_topic'}
+
+    def __init__(self, rules, default_topics, default_mode='jws', max_cached_routes=10000):
+        """
+        Initializes the TopicRouter class.
+        Decides which topics an authorized message is forwarded to, based on the topic it came in on and the DNS name
+        it was signed by. Each rule is written as 'source topic filter|DNS name pattern|destination template', e.g.
+        'sensors/#|*._device.fleet.example.com|verified/{dns_name}'. The source topic filter may use the MQTT + and #
+        wildcards, the DNS name pattern is either * or anything the Whitelist accepts, and the destination template may
+        use {dns_name} and {source_topic}. A rule may end with a fourth part naming the forward mode its destination is
+        sent in (see lib.util.forwarding), e.g. '...|verified/{dns_name}|payload+zlib'. A message is forwarded to the
+        destination of every rule it matches. Messages that match no rule are forwarded to the default topics.
+        Rules are compiled once, here, and the destinations for each (source topic, DNS name) pair are cached, so
+        routing a message from a pair that has been seen before is a single dictionary lookup.
+
+        Arguments:
+            rules (list) : The routing rules. Blank rules are skipped.
+            default_topics (list) : The topics used for messages that match no rule.
+            default_mode (str) : The forward mode of the default topics, and of rules that don't name one.
+                                 Defaults to 'jws'.
+            max_cached_routes (int) : The maximum number of (source topic, DNS name) pairs kept in the cache.
+                                      Defaults to 10000.
+
+        Raises:
+            ValueError : A rule is malformed, its template uses an unknown field or an MQTT wildcard, or a forward mode
+                         is not recognized.
+        """
+        # Compile the rules into (source topic filter, DNS name matcher, template, forward mode) tuples.
+        self.default_mode = forwarding.validate(default_mode)
+        self._rules = [TopicRouter._compile(rule, default_mode) for rule in rules if rule.strip()]
+        self.default_topics = tuple(default_topics)
+        self._default_routes = ((self.default_mode, self.default_topics),)
+        self.max_cached_routes = max_cached_routes
+
+        # The cache of resolved destinations, keyed by (source topic, DNS name).
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def route(self, source_topic, dns_name):
+        """
+        Returns the topics a message should be forwarded to, grouped by the forward mode they are sent in.
+
+        Arguments:
+            source_topic (str) : The topic the message came in on.
+            dns_name (str) : The DNS name the message was signed by.
+
+        Returns:
+            tuple : (forward mode, destination topics) pairs, in rule order. A topic appears at most once, in the
+                    mode of the first rule that produced it.
+        """
+        # Most messages come from a pair that has already been routed.
+        key = (source_topic, dns_name)
+        destinations = self._routes.get(key)
+        if destinations is not None:
+            return destinations
+
+        # Otherwise, run through the rules once, grouping the destinations by mode, and cache the result.
+        groups = {}
+        seen = set()
+        for topic_filter, dns_names, template, mode in self._rules:
+            if mqtt.topic_matches_sub(topic_filter, source_topic) and (dns_names is None or dns_name in dns_names):
+                destination = template.format(dns_name=dns_name, source_topic=source_topic)
+                if destination not in seen:
+                    seen.add(destination)
+                    groups.setdefault(mode, []).append(destination)
+        destinations = tuple((mode, tuple(topics)) for mode, topics in groups.items()) or self._default_routes
+
+        # Keep the cache bounded by forgetting the oldest pair.
+        with self._lock:
+            if len(self._routes) >= self.max_cached_routes:
+                self._routes.pop(next(iter(self._routes)), None)
+            self._routes[key] = destinations
+        return destinations
+
+    def stats(self):
+        """
+        Returns a snapshot of the router's size.
+
+        Returns:
+            dict : The number of rules, and the number of cached (source topic, DNS name) pairs.
+        """
+        return {
+            'rules': len(self._rules),
+            'cached_routes': len(self._routes),
+        }
+
+    @staticmethod
+    def _compile(rule, default_mode):
+        """
+        Compiles a single routing rule.
+
+        Arguments:
+            rule (str) : The rule, as 'source topic filter|DNS name pattern|destination template[|forward mode]'.
+            default_mode (str) : The forward mode used if the rule doesn't name one.
+
+        Returns:
+            tuple : The source topic filter, the DNS name matcher (a Whitelist, or None to match every name), the
+                    destination template, and the forward mode.
+
+        Raises:
+            ValueError : The rule is malformed, its template uses an unknown field or an MQTT wildcard, or its forward
+                         mode is not recognized.
+        """
+        # Split the rule into its parts. The forward mode is optional.
+        parts = [part.strip() for part in rule.split(TopicRouter.RULE_SEPARATOR)]
+        if len(parts) not in (3, 4) or not all(parts):
+            raise ValueError(f'Routing rule "{rule}" must be written as "source topic|DNS name pattern|destination" '
+                             f'or "source topic|DNS name pattern|destination|forward mode"')
+        topic_filter, dns_name_pattern, template = parts[:3]
+        mode = forwarding.validate(parts[3] if len(parts) == 4 else default_mode)
+
+        # Check the template's fields, and make sure it can't produce a wildcard topic.
+        fields = {field for _, field, _, _ in string.Formatter().parse(template) if field is not None}
+        if not fields.issubset(TopicRouter.TEMPLATE_FIELDS):
+            raise ValueError(f'Routing rule "{rule}" may only use the fields {sorted(TopicRouter.TEMPLATE_FIELDS)}')
+        if '+' in template or '#' in template:
+            raise ValueError(f'Routing rule "{rule}" has a wildcard in its destination')
+
+        # Build the DNS name matcher.
+        dns_names = None if dns_name_pattern == '*' else Whitelist([dns_name_pattern])
+        return topic_filter, dns_names, template, mode
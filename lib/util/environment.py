@@ -1,4 +1,6 @@
 from lib.util.exceptions import UndefinedVariableError
+from lib.whitelist import Whitelist
+from collections import namedtuple
 import os
 
 # List of variables we should expect to see in every .env file.
@@ -19,9 +21,87 @@ EXPECTED_DOTENV_TYPES = {
     'MQTT_SENDER_TOPICS': list,
     'MQTT_CLIENT_CONNECTION_TIMEOUT_SECONDS': int,
     'DNS_WHITELIST': list,
-    'DNS_TIMEOUT_SECONDS': int
+    'DNS_TIMEOUT_SECONDS': int,
+    'AUTH_WORKER_COUNT': int,
+    'AUTH_QUEUE_SIZE': int,
+    'VERIFIER_PROCESS_COUNT': int,
+    'TLSA_CACHE_MAX_ENTRIES': int,
+    'TLSA_CACHE_MIN_TTL_SECONDS': int,
+    'TLSA_CACHE_MAX_TTL_SECONDS': int,
+    'TLSA_NEGATIVE_CACHE_TTL_SECONDS': int,
+    'TLSA_REFRESH_CONCURRENCY': int,
+    'TLSA_REFRESH_AHEAD_SECONDS': int,
+    'KEY_CACHE_MAX_ENTRIES': int,
+    'MAX_PAYLOAD_BYTES': int,
+    'MAX_PROTECTED_HEADER_BYTES': int,
+    'MQTT_SENDER_QOS': int,
+    'MQTT_SENDER_MAX_INFLIGHT': int,
+    'MQTT_SENDER_QUEUE_SIZE': int,
+    'MQTT_SENDER_BATCH_SIZE': int,
+    'MQTT_SENDER_CONNECTIONS': int,
+    'MQTT_SENDER_ROUTES': list,
+    'MQTT_SENDER_SPOOL_MAX_BYTES': int,
+    'MQTT_SENDER_SPOOL_SEGMENT_BYTES': int,
+    'MQTT_RECONNECT_MIN_SECONDS': int,
+    'MQTT_RECONNECT_MAX_SECONDS': int,
+    'LISTENER_PROCESS_COUNT': int,
+    'ASYNC_MAX_IN_FLIGHT': int,
+    'AUTH_STAGE_PARSE_WORKERS': int,
+    'AUTH_STAGE_RESOLVE_WORKERS': int,
+    'AUTH_STAGE_VERIFY_WORKERS': int,
+    'AUTH_STAGE_PUBLISH_WORKERS': int,
+    'AUTH_BATCH_MAX_SIZE': int,
+    'AUTH_BATCH_MAX_WAIT_MS': int
+}
+# Optional variables, mapped to the default value used when they are left out of the .env file.
+OPTIONAL_DOTENV_VARS = {
+    'AUTH_WORKER_COUNT': '16',
+    'AUTH_QUEUE_SIZE': '1000',
+    'AUTH_QUEUE_OVERFLOW_POLICY': 'block',
+    'VERIFIER_PROCESS_COUNT': '4',
+    'TLSA_CACHE_MAX_ENTRIES': '10000',
+    'TLSA_CACHE_MIN_TTL_SECONDS': '30',
+    'TLSA_CACHE_MAX_TTL_SECONDS': '3600',
+    'TLSA_NEGATIVE_CACHE_TTL_SECONDS': '30',
+    'TLSA_REFRESH_CONCURRENCY': '4',
+    'TLSA_REFRESH_AHEAD_SECONDS': '10',
+    'KEY_CACHE_MAX_ENTRIES': '10000',
+    'MAX_PAYLOAD_BYTES': '262144',
+    'MAX_PROTECTED_HEADER_BYTES': '8192',
+    'MQTT_SENDER_QOS': '0',
+    'MQTT_SENDER_MAX_INFLIGHT': '20',
+    'MQTT_SENDER_QUEUE_SIZE': '10000',
+    'MQTT_SENDER_BATCH_SIZE': '64',
+    'MQTT_SENDER_CONNECTIONS': '1',
+    'MQTT_SENDER_DISTRIBUTION': 'round-robin',
+    'MQTT_SENDER_ROUTES': '',
+    'MQTT_SENDER_FORWARD_MODE': 'jws',
+    'MQTT_SENDER_SPOOL_DIRECTORY': '',
+    'MQTT_SENDER_SPOOL_MAX_BYTES': '1073741824',
+    'MQTT_SENDER_SPOOL_SEGMENT_BYTES': '67108864',
+    'MQTT_SENDER_SPOOL_FSYNC': 'interval',
+    'MQTT_RECONNECT_MIN_SECONDS': '1',
+    'MQTT_RECONNECT_MAX_SECONDS': '60',
+    'LISTENER_PROCESS_COUNT': '1',
+    'MQTT_LISTENER_SHARE_GROUP': '',
+    'AUTH_ENGINE': 'threaded',
+    'ASYNC_MAX_IN_FLIGHT': '1000',
+    'AUTH_STAGE_PARSE_WORKERS': '2',
+    'AUTH_STAGE_RESOLVE_WORKERS': '4',
+    'AUTH_STAGE_VERIFY_WORKERS': '4',
+    'AUTH_STAGE_PUBLISH_WORKERS': '2',
+    'AUTH_ORDER_KEY': '',
+    'AUTH_BATCH_MAX_SIZE': '1',
+    'AUTH_BATCH_MAX_WAIT_MS': '5'
+}
+# List variables that are compiled into something other than a tuple, along with what they are compiled into.
+COMPILED_DOTENV_VARS = {
+    'DNS_WHITELIST': Whitelist
 }
 
+# The compiled, read-only configuration. Set by load_dotenv, and read by the per-message code with attribute access.
+CONFIG = None
+
 
 def load_dotenv():
     """
@@ -50,6 +130,10 @@ def load_dotenv():
     # Detect any non-str data types.
     # List is excluded from this check, as the only way to derive lists in .env is to split them by comma.
     for var_name in EXPECTED_DOTENV_TYPES:
+        # Optional variables that were left out fall back to their defaults, so there is nothing to check.
+        if var_name not in os.environ.keys():
+            continue
+
         # Bool detection (written as 0 or 1 in .env file, for simplicity) and integer protection are packaged together.
         if EXPECTED_DOTENV_TYPES[var_name] is bool or EXPECTED_DOTENV_TYPES[var_name] is int:
             try:
@@ -57,12 +141,38 @@ def load_dotenv():
             except ValueError:
                 raise InvalidDotenvFileError(f'Variable {var_name} is not of type {EXPECTED_DOTENV_TYPES[var_name]}')
 
+    # Finally, compile the configuration so that it does not have to be parsed again.
+    global CONFIG
+    CONFIG = compile_config()
+
+
+def compile_config():
+    """
+    Compiles every .env variable into a single immutable object.
+    Every value is already converted to its type, lists are converted to tuples (or whatever COMPILED_DOTENV_VARS
+    says, e.g. a Whitelist), and values are read with attribute access, e.g. CONFIG.DNS_WHITELIST.
+
+    Returns:
+        Config : A namedtuple with one field per .env variable.
+    """
+    # Get every variable, including the defaults of optional ones.
+    variable_names = EXPECTED_DOTENV_VARS + [name for name in OPTIONAL_DOTENV_VARS if name not in EXPECTED_DOTENV_VARS]
+    values = {}
+    for variable_name in variable_names:
+        value = get(variable_name)
+        if isinstance(value, list):
+            value = COMPILED_DOTENV_VARS.get(variable_name, tuple)(value)
+        values[variable_name] = value
+
+    # Build the namedtuple, which can't be changed after the fact.
+    return namedtuple('Config', variable_names)(**values)
+
 
 def get(variable_name):
     """
     Returns a variable declared in the .env file.
     Acts as a semi-wrapper for os.environ, with minor differences.
-    Will only return values declared in the .env file.
+    Will only return values declared in the .env file, or the default value of an optional variable.
 
     Arguments:
         variable_name (str) : The name of the desired variable.
@@ -74,18 +184,24 @@ def get(variable_name):
         UndefinedVariableError: The variable name provided is not one that is provided in the .env file.
     """
     # Check to make sure the variable name is a valid one.
-    if variable_name not in EXPECTED_DOTENV_VARS:
+    if variable_name not in EXPECTED_DOTENV_VARS and variable_name not in OPTIONAL_DOTENV_VARS:
         raise UndefinedVariableError(f'{variable_name} is not a valid .env variable')
 
+    # Grab the raw string value, falling back to the default if an optional variable is not set.
+    if variable_name in os.environ or variable_name not in OPTIONAL_DOTENV_VARS:
+        var_str = os.environ[variable_name]
+    else:
+        var_str = OPTIONAL_DOTENV_VARS[variable_name]
+
     # If variable type is str, simply return it.
     if variable_name not in EXPECTED_DOTENV_TYPES:
-        return os.environ[variable_name]
+        return var_str
 
     # If variable type is list, return the string value split by ','.
     if EXPECTED_DOTENV_TYPES[variable_name] is list:
-        return os.environ[variable_name].split(',')
+        return var_str.split(',')
 
     # If variable type is other (integer or boolean), first get the integer value.
-    var_int = int(os.environ[variable_name])
+    var_int = int(var_str)
     # Return it straight if int, otherwise typecast it to bool.
     return var_int if EXPECTED_DOTENV_TYPES[variable_name] is int else bool(var_int)
\ No newline at end of file
@@ -0,0 +1,68 @@
+from lib.util import jws
+import zlib
+
+# zstandard is an optional compression backend. If it isn't installed, the 'payload+zstd' mode can't be used.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# The forms an authorized message may be forwarded in. 'jws' forwards the message as it was received, and the
+# 'payload' modes forward only its decoded payload, optionally compressed.
+FORWARD_MODES = ['jws', 'payload', 'payload+zlib', 'payload+zstd']
+
+# The markers compressed payloads are prefixed with, so that consumers can tell how to decompress them.
+CONTENT_TYPE_MARKERS = {
+    'payload+zlib': b'zlib:',
+    'payload+zstd': b'zstd:',
+}
+
+
+def validate(mode):
+    """
+    Checks that a forward mode is recognized, and that its compression backend is installed.
+
+    Arguments:
+        mode (str) : The forward mode.
+
+    Returns:
+        str : The forward mode.
+
+    Raises:
+        ValueError : The mode is not recognized, or it needs zstandard and zstandard isn't installed.
+    """
+    if mode not in FORWARD_MODES:
+        raise ValueError(f'Forward mode must be one of {FORWARD_MODES}, got {mode}')
+    if mode == 'payload+zstd' and zstandard is None:
+        raise ValueError('Forward mode payload+zstd requires the zstandard package')
+    return mode
+
+
+def encode(mode, message_payload, payload_segment):
+    """
+    Builds the payload an authorized message is forwarded with.
+
+    Arguments:
+        mode (str) : The forward mode. Must have been validated.
+        message_payload (bytes) : The message, as it was received.
+        payload_segment (bytes | memoryview | str | None) : The message's base64url encoded JWS payload, or None if
+                                                            it wasn't found (e.g. the payload is unencoded), in which
+                                                            case the message is forwarded as it was received.
+
+    Returns:
+        bytes : The forwarded payload.
+
+    Raises:
+        binascii.Error : The payload segment is not valid base64url.
+    """
+    # The full message is forwarded as it is.
+    if mode == 'jws' or payload_segment is None:
+        return message_payload
+
+    # Otherwise, strip the envelope, and compress what is left if asked to.
+    payload = jws.base64url_decode(payload_segment)
+    if mode == 'payload+zlib':
+        return CONTENT_TYPE_MARKERS[mode] + zlib.compress(payload)
+    if mode == 'payload+zstd':
+        return CONTENT_TYPE_MARKERS[mode] + zstandard.ZstdCompressor().compress(payload)
+    return payload
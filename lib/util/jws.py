@@ -0,0 +1,136 @@
+import base64
+import json
+import re
+
+# orjson is an optional, faster JSON backend. If it isn't installed, the standard library's json module is used.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The JSON backend in use, for logging and benchmarking purposes.
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+# The characters a base64url encoded segment is made of. Used to tell a compact header apart from JSON.
+BASE64URL_SEGMENT = re.compile(rb'[A-Za-z0-9_-]+')
+
+# The "protected" member of a JSON serialization, as written when its value has no escapes (base64 never does).
+PROTECTED_MEMBER = re.compile(rb'"protected"\s*:\s*"([^"\\]*)"')
+
+# The members a flattened JWS JSON serialization may have while still being convertible to compact form.
+COMPACT_MEMBERS = {'protected', 'payload', 'signature'}
+
+
+def loads(data):
+    """
+    Parses a JSON document using the fastest backend available.
+    orjson's decode error is a subclass of json.JSONDecodeError, so callers only ever need to catch the latter.
+
+    Arguments:
+        data (bytes | str) : The JSON document.
+
+    Returns:
+        object : The parsed document.
+
+    Raises:
+        json.JSONDecodeError : The document is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def to_compact(message_payload_json, protected_json):
+    """
+    Converts an already parsed, flattened JWS JSON serialization into its compact form (header.payload.signature).
+    The compact form carries the same base64url segments, so it verifies the same way, but the verifier only has to
+    split it on dots rather than parse the whole message as JSON again.
+
+    Arguments:
+        message_payload_json (dict) : The parsed message.
+        protected_json (dict) : The parsed protected header.
+
+    Returns:
+        str | None : The compact serialization, or None if the message can't be expressed in compact form
+                     (e.g. it has an unprotected header, or an unencoded payload).
+    """
+    # Compact form has no room for unprotected headers, multiple signatures, or unencoded payloads.
+    if not COMPACT_MEMBERS.issuperset(message_payload_json) or protected_json.get('b64', True) is not True:
+        return None
+
+    # Every segment has to be a string for the dots to be unambiguous.
+    segments = [message_payload_json.get(member) for member in ('protected', 'payload', 'signature')]
+    if not all(isinstance(segment, str) for segment in segments):
+        return None
+    return '.'.join(segments)
+
+
+def split_compact(data):
+    """
+    Locates the segments of a compact JWS serialization (header.payload.signature) without copying them.
+    Only the dots are searched for, and each segment is returned as a memoryview slice of the original bytes.
+
+    Arguments:
+        data (bytes | str) : The message. Strings are encoded first, which does copy them.
+
+    Returns:
+        tuple | None : The header, payload, and signature segments as memoryviews, or None if the message is not in
+                       compact form (e.g. it is JSON).
+    """
+    # Memoryviews need bytes. MQTT payloads already are.
+    if isinstance(data, str):
+        data = data.encode()
+
+    # JSON messages almost always start with a brace, which a compact header never does.
+    if data[:1] == b'{':
+        return None
+
+    # The header has to be base64url, which also rules out any other JSON.
+    first = data.find(b'.')
+    view = memoryview(data)
+    if first < 1 or not BASE64URL_SEGMENT.fullmatch(view[:first]):
+        return None
+
+    # There must be exactly two dots. The payload is scanned once (by find), and never copied.
+    second = data.find(b'.', first + 1)
+    if second < 0 or data.find(b'.', second + 1) >= 0:
+        return None
+    return view[:first], view[first + 1:second], view[second + 1:]
+
+
+def find_protected(data):
+    """
+    Locates the (still encoded) value of the "protected" member of a JSON serialization without parsing it, so that its
+    size can be checked before the whole message is parsed. Only the first such member is found, and a value written
+    with escapes is not found at all, so the parsed message must still be checked too.
+
+    Arguments:
+        data (bytes | str) : The message. Strings are encoded first, which does copy them.
+
+    Returns:
+        memoryview | None : The member's value, as a memoryview slice of the original bytes, or None if it wasn't found.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    match = PROTECTED_MEMBER.search(data)
+    if match is None:
+        return None
+    return memoryview(data)[match.start(1):match.end(1)]
+
+
+def base64url_decode(segment):
+    """
+    Decodes a base64url segment, which JWS writes without padding.
+
+    Arguments:
+        segment (bytes | memoryview | str) : The segment.
+
+    Returns:
+        bytes : The decoded segment.
+
+    Raises:
+        binascii.Error : The segment is not valid base64url.
+    """
+    if isinstance(segment, str):
+        segment = segment.encode()
+    return base64.urlsafe_b64decode(bytes(segment) + b'=' * (-len(segment) % 4))
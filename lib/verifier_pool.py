@@ -0,0 +1,252 @@
+import multiprocessing
+import threading
+import os
+import logging
+import queue
+import time
+
+
+class VerifierPool:
+
+    def __init__(self, size, name='VerifierPool'):
+        """
+        Initializes the VerifierPool class.
+        The pool keeps a fixed number of long-lived verifier processes, each of which imports the verification
+        libraries once and then runs jobs until it is shut down.
+        The processes are not started here; call the start method to do so.
+
+        Arguments:
+            size (int) : The number of verifier processes.
+            name (str) : The name of the pool. Used for logging purposes.
+
+        Raises:
+            ValueError : The size is not positive.
+        """
+        # Validate the size before anything is built.
+        if size < 1:
+            raise ValueError(f'{name} size must be at least 1, got {size}')
+
+        # Set the pool's configuration.
+        self.name = name
+        self.size = size
+
+        # Processes are spawned rather than forked, so that no threads or locks are inherited from the main process.
+        self.context = multiprocessing.get_context('spawn')
+
+        # Idle workers wait in this queue until a job checks them out.
+        self._idle = queue.Queue()
+
+        # Counters used by the stats method.
+        self._lock = threading.Lock()
+        self._jobs = 0
+        self._timeouts = 0
+        self._recycled = 0
+
+    def start(self):
+        """
+        Spawns every verifier process in the pool.
+        """
+        for _ in range(self.size):
+            self._idle.put(VerifierWorker(self.context))
+        logging.info(f'{self.name} started {self.size} verifier processes')
+
+    def run(self, target, args, timeout):
+        """
+        Runs a job on one of the verifier processes, with timeout.
+        The target must be a picklable function that takes a result queue as its first argument, and puts exactly
+        one value in it. If the job does not finish before the timeout, the process running it is terminated and
+        replaced with a fresh one.
+
+        Arguments:
+            target (function) : The function run in the verifier process.
+            args (tuple) : The arguments passed to the target, after the result queue.
+            timeout (int | float) : The number of seconds the job (including waiting for an idle process) may take.
+
+        Returns:
+            bool | None, object : Whether or not the job finished in time (or None if no verifier process became idle
+                                  in time, so the job never started), combined with the value the target put in the queue.
+        """
+        # The deadline is wall clock time, so the verifier process can check it too.
+        deadline = time.time() + timeout
+        with self._lock:
+            self._jobs += 1
+
+        # Check out an idle worker, replacing it first if it has died since its last job.
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            logging.debug(f'{self.name} had no idle verifier process before the timeout')
+            self._count_timeout()
+            return None, None
+        if not worker.is_alive():
+            logging.debug(f'{self.name} verifier process {worker.pid} died, replacing it')
+            worker = self._replace(worker)
+
+        # Hand the job off and wait for the result.
+        worker.job_queue.put((target, args, deadline))
+        try:
+            result = worker.result_queue.get(timeout=max(0, deadline - time.time()))
+        except queue.Empty:
+            # The job hung past its timeout, so recycle the process.
+            logging.debug(f'{self.name} verifier process {worker.pid} timed out, recycling it')
+            self._count_timeout()
+            self._idle.put(self._replace(worker))
+            return False, None
+
+        # Finished in time, return the worker to the idle queue.
+        self._idle.put(worker)
+        return True, result
+
+    def stats(self):
+        """
+        Returns a snapshot of the pool's counters.
+
+        Returns:
+            dict : The pool's size, the number of idle processes, and its job, timeout, and recycle counts.
+        """
+        with self._lock:
+            return {
+                'processes': self.size,
+                'idle': self._idle.qsize(),
+                'jobs': self._jobs,
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+            }
+
+    def shutdown(self, timeout=1):
+        """
+        Stops every idle verifier process in the pool, and waits for them to exit. Processes still running a job are
+        left to exit on their own once this process does (see VerifierWorker.loop).
+
+        Arguments:
+            timeout (int | float) : How many seconds to give each process to exit before it is terminated. Defaults
+                                    to 1.
+        """
+        workers = []
+        while True:
+            try:
+                workers.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            worker.join(timeout)
+
+    def _count_timeout(self):
+        """
+        Increments the timeout counter.
+        """
+        with self._lock:
+            self._timeouts += 1
+
+    def _replace(self, worker):
+        """
+        Terminates a worker and returns a freshly spawned one in its place.
+
+        Arguments:
+            worker (VerifierWorker) : The worker to terminate.
+
+        Returns:
+            VerifierWorker : The replacement worker.
+        """
+        worker.terminate()
+        with self._lock:
+            self._recycled += 1
+        return VerifierWorker(self.context)
+
+
+class VerifierWorker:
+
+    def __init__(self, context):
+        """
+        Initializes the VerifierWorker class.
+        Spawns a verifier process, along with the dedicated queues used to talk to it.
+
+        Arguments:
+            context (multiprocessing.context.SpawnContext) : The context the process and queues are created from.
+        """
+        self.job_queue = context.Queue()
+        self.result_queue = context.Queue()
+        self.process = context.Process(target=VerifierWorker.loop,
+                                       args=(self.job_queue, self.result_queue, os.getpid()),
+                                       daemon=True)
+        self.process.start()
+
+    @property
+    def pid(self):
+        """
+        The process id of the verifier process.
+        """
+        return self.process.pid
+
+    def is_alive(self):
+        """
+        Returns whether or not the verifier process is still running.
+        """
+        return self.process.is_alive()
+
+    def stop(self):
+        """
+        Asks the verifier process to exit once it is done with its current job.
+        Waits for the request to be written to the process, so that it isn't lost if this process exits right after.
+        """
+        self.job_queue.put(None)
+        self.job_queue.close()
+        self.job_queue.join_thread()
+
+    def join(self, timeout):
+        """
+        Waits for the verifier process to exit, and terminates it if it hasn't in time.
+
+        Arguments:
+            timeout (int | float) : How many seconds to wait.
+        """
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+    def terminate(self):
+        """
+        Terminates the verifier process immediately.
+        """
+        self.process.terminate()
+
+    @staticmethod
+    def loop(job_queue, result_queue, parent_pid=None, poll_interval=1.0):
+        """
+        The loop run inside every verifier process.
+        Imports the verification libraries once, then runs jobs until a None job is received, or until the process
+        that started it has exited (e.g. it was killed before it could stop the pool).
+        Jobs that are already past their deadline are skipped, and None is put in the result queue instead.
+
+        Arguments:
+            job_queue (context.Queue) : The queue jobs are received on, as (target, args, deadline) tuples.
+            result_queue (context.Queue) : The queue results are put in.
+            parent_pid (int) : The process id of the process that started this one. Defaults to None, which never
+                               exits on its own.
+            poll_interval (int | float) : How many seconds to wait for a job between checks on the parent process.
+                                          Defaults to 1.0.
+        """
+        # Pre-warm the process by importing everything verification needs up front.
+        import lib.authorization_client
+
+        # Run jobs until told to stop, or until the parent is gone (this process is then adopted by another).
+        while True:
+            try:
+                job = job_queue.get(timeout=poll_interval)
+            except queue.Empty:
+                if parent_pid is not None and os.getppid() != parent_pid:
+                    return
+                continue
+            if job is None:
+                return
+            target, args, deadline = job
+
+            # Nobody is waiting on an expired job anymore, so skip it.
+            if time.time() > deadline:
+                result_queue.put(None)
+                continue
+
+            target(result_queue, *args)
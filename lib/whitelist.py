@@ -0,0 +1,119 @@
+class Whitelist:
+
+    # Prefix that marks an entry as a wildcard rule rather than an exact DNS name.
+    WILDCARD_PREFIX = '*.'
+
+    # Trie key used to mark a wildcard rule. Labels are always strings, so this never collides with one.
+    _WILDCARD = 0
+
+    def __init__(self, entries=()):
+        """
+        Initializes the Whitelist class.
+        An entry is either an exact name (ksu._device.example.com), or a wildcard rule (*._device.example.com)
+        that matches every name below the zone, however many labels deep. The zone itself is not matched.
+        Exact names are kept in a set, and wildcard rules are compiled into a trie keyed by label, from the top level
+        domain down, so that checking a name takes one step per label no matter how many entries the whitelist has.
+        Names are compared case-insensitively, and a trailing dot is ignored.
+
+        Arguments:
+            entries (iterable) : The exact names and wildcard rules to allow.
+
+        Raises:
+            ValueError : An entry is empty, or has a wildcard anywhere other than its first label.
+        """
+        # The exact names, and the root of the wildcard trie. Every trie node is a dict of label to child node.
+        self._exact_names = set()
+        self._root = {}
+        self._wildcards = 0
+
+        # Add every entry, skipping blanks left over from splitting the .env value.
+        for entry in entries:
+            if entry.strip():
+                self.add(entry)
+
+    def add(self, entry):
+        """
+        Adds a single exact name or wildcard rule to the whitelist.
+
+        Arguments:
+            entry (str) : The exact name or wildcard rule.
+
+        Raises:
+            ValueError : The entry is empty, or has a wildcard anywhere other than its first label.
+        """
+        # Work out whether this is a wildcard rule, and strip the wildcard off if so.
+        name = Whitelist._normalize(entry)
+        wildcard = name.startswith(Whitelist.WILDCARD_PREFIX)
+        if wildcard:
+            name = name[len(Whitelist.WILDCARD_PREFIX):]
+        if not name or '*' in name:
+            raise ValueError(f'Invalid whitelist entry "{entry}"')
+
+        # Exact names go straight into the set.
+        if not wildcard:
+            self._exact_names.add(name)
+            return
+
+        # Wildcard rules walk (and build) the trie from the top level domain down, then mark the last node.
+        node = self._root
+        for label in reversed(name.split('.')):
+            node = node.setdefault(label, {})
+        if Whitelist._WILDCARD not in node:
+            node[Whitelist._WILDCARD] = True
+            self._wildcards += 1
+
+    def exact_names(self):
+        """
+        Returns the exact names in the whitelist. Wildcard rules are left out, since they can't be looked up.
+
+        Returns:
+            list : The exact names, normalized and sorted.
+        """
+        return sorted(self._exact_names)
+
+    def __contains__(self, dns_name):
+        """
+        Checks whether a DNS name is allowed, either by name or by a wildcard rule.
+
+        Arguments:
+            dns_name (str) : The DNS name to check.
+
+        Returns:
+            bool : True if the name is allowed, False otherwise.
+        """
+        # Exact names are a single set lookup.
+        dns_name = Whitelist._normalize(dns_name)
+        if dns_name in self._exact_names:
+            return True
+
+        # Otherwise, walk the trie from the top level domain down. A wildcard only matches if there are labels left.
+        node = self._root
+        for label in reversed(dns_name.split('.')):
+            if Whitelist._WILDCARD in node:
+                return True
+            node = node.get(label)
+            if node is None:
+                return False
+        return False
+
+    def __len__(self):
+        """
+        Returns the number of entries in the whitelist.
+
+        Returns:
+            int : The number of exact names plus the number of wildcard rules.
+        """
+        return len(self._exact_names) + self._wildcards
+
+    @staticmethod
+    def _normalize(dns_name):
+        """
+        Normalizes a DNS name for comparison.
+
+        Arguments:
+            dns_name (str) : The DNS name.
+
+        Returns:
+            str : The name, stripped of whitespace and any trailing dot, in lowercase.
+        """
+        return dns_name.strip().rstrip('.').lower()
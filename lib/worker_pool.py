@@ -0,0 +1,172 @@
+from collections import deque
+import threading
+import logging
+import time
+
+
+class WorkerPool:
+
+    # The overflow policies that decide what happens when a job is submitted to a full queue.
+    OVERFLOW_POLICIES = ['block', 'drop-oldest', 'drop-newest']
+
+    def __init__(self, size, queue_size, overflow_policy='block', name='WorkerPool'):
+        """
+        Initializes the WorkerPool class.
+        Creates a fixed number of worker threads that pull jobs off of a bounded queue.
+        The worker threads are not started here; call the start method to do so.
+
+        Arguments:
+            size (int) : The number of worker threads.
+            queue_size (int) : The maximum number of jobs that may be waiting in the queue.
+            overflow_policy (str) : What to do when the queue is full. One of 'block', 'drop-oldest', or 'drop-newest'.
+            name (str) : The name of the pool. Used for thread names and logging purposes.
+
+        Raises:
+            ValueError : The size or queue size is not positive, or the overflow policy is not recognized.
+        """
+        # Validate the arguments before anything is built.
+        if size < 1:
+            raise ValueError(f'{name} size must be at least 1, got {size}')
+        if queue_size < 1:
+            raise ValueError(f'{name} queue size must be at least 1, got {queue_size}')
+        if overflow_policy not in WorkerPool.OVERFLOW_POLICIES:
+            raise ValueError(f'{name} overflow policy must be one of {WorkerPool.OVERFLOW_POLICIES}, got {overflow_policy}')
+
+        # Set the pool's configuration.
+        self.name = name
+        self.size = size
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+
+        # The queue holds (enqueue time, function, args, kwargs) tuples, and is guarded by the condition.
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._running = False
+
+        # Counters used by the stats method.
+        self._submitted = 0
+        self._completed = 0
+        self._dropped = 0
+        self._dequeued = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+        self._max_run = 0.0
+
+        # Create (but do not start) the worker threads.
+        self._workers = [threading.Thread(target=self._work, name=f'{name}-{index}', daemon=True) for index in range(size)]
+
+    def start(self):
+        """
+        Starts every worker thread in the pool.
+        """
+        self._running = True
+        for worker in self._workers:
+            worker.start()
+        logging.info(f'{self.name} started {self.size} workers with a queue size of {self.queue_size} ({self.overflow_policy})')
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Submits a job to the pool.
+        If the queue is full, the overflow policy decides whether this call blocks, drops the oldest job, or drops this one.
+
+        Arguments:
+            function (callable) : The function to run on a worker thread.
+            *args : The positional arguments passed to the function.
+            **kwargs : The keyword arguments passed to the function.
+
+        Returns:
+            bool : Whether or not the job was accepted into the queue.
+        """
+        with self._condition:
+            # Handle a full queue according to the overflow policy.
+            if len(self._queue) >= self.queue_size:
+                if self.overflow_policy == 'drop-newest':
+                    self._dropped += 1
+                    logging.debug(f'{self.name} queue full, dropping newest job')
+                    return False
+                elif self.overflow_policy == 'drop-oldest':
+                    self._queue.popleft()
+                    self._dropped += 1
+                    logging.debug(f'{self.name} queue full, dropping oldest job')
+                else:
+                    while len(self._queue) >= self.queue_size:
+                        self._condition.wait()
+
+            # Add the job and wake up a worker.
+            self._queue.append((time.monotonic(), function, args, kwargs))
+            self._submitted += 1
+            self._condition.notify_all()
+            return True
+
+    def stats(self):
+        """
+        Returns a snapshot of the pool's counters, which can be used to size the pool under load.
+
+        Returns:
+            dict : The pool's size, queue depth, job counts, queue wait times, and job run times (in seconds).
+        """
+        with self._condition:
+            return {
+                'workers': self.size,
+                'queue_size': self.queue_size,
+                'queue_depth': len(self._queue),
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'dropped': self._dropped,
+                'average_wait_seconds': self._total_wait / self._dequeued if self._dequeued else 0.0,
+                'max_wait_seconds': self._max_wait,
+                'average_run_seconds': self._total_run / self._completed if self._completed else 0.0,
+                'max_run_seconds': self._max_run,
+            }
+
+    def shutdown(self, wait=True):
+        """
+        Stops the pool. Jobs still waiting in the queue are finished first.
+
+        Arguments:
+            wait (bool) : Whether or not to wait for the worker threads to finish.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                if worker.is_alive():
+                    worker.join()
+
+    def _work(self):
+        """
+        The loop run by every worker thread.
+        Pulls a job off the queue, records how long it waited, then runs it and records how long it ran.
+        """
+        while True:
+            with self._condition:
+                # Wait for a job, or for the pool to be shut down.
+                while not self._queue and self._running:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+
+                # Pull the job and record its wait time.
+                enqueued_at, function, args, kwargs = self._queue.popleft()
+                wait = time.monotonic() - enqueued_at
+                self._dequeued += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+
+                # Let any blocked submitters know there is room.
+                self._condition.notify_all()
+
+            # Run the job outside of the lock, making sure an exception doesn't kill the worker.
+            started_at = time.monotonic()
+            try:
+                function(*args, **kwargs)
+            except Exception as e:
+                logging.error(f'{self.name} job raised an unexpected exception: {repr(e)}')
+            run = time.monotonic() - started_at
+
+            with self._condition:
+                self._completed += 1
+                self._total_run += run
+                self._max_run = max(self._max_run, run)
@@ -1,6 +1,14 @@
-# Only run in main.
-if __name__ == '__main__':
+import os
+
+
+def setup(process_index=None):
+    """
+    Launches the logger and loads the .env variables.
+    Run once in every process, since spawned processes don't inherit either.
 
+    Arguments:
+        process_index (int) : The index of this process under the Supervisor, or None if it isn't supervised.
+    """
     # First things first, launch the logger.
     from lib.util import logger
     logger.basic_setup()
@@ -9,27 +17,122 @@ if __name__ == '__main__':
     from lib.util import environment
     environment.load_dotenv()
 
+    # Each supervised process spools to a directory of its own, so the configuration is compiled again to match.
+    spool_directory = environment.get('MQTT_SENDER_SPOOL_DIRECTORY')
+    if process_index is not None and spool_directory:
+        os.environ['MQTT_SENDER_SPOOL_DIRECTORY'] = os.path.join(spool_directory, f'process-{process_index}')
+        environment.CONFIG = environment.compile_config()
+
     # If debug mode is enabled, change the logging level.
     if environment.get('DEBUG'):
         logger.enable_debug_mode()
 
+
+def run():
+    """
+    Sets up the listener, authorizer, and sender, then listens until the process ends.
+    """
+    from lib.util import logger
+
     # Log the setup 'begin' line.
     logger.log_setup_start_header()
 
-    # Import the AuthorizationClient.
-    from lib.authorization_client import AuthorizationClient
-    # Initialize the AuthorizationClient (which will, in turn, instantiate the MQTTSender).
-    AuthorizationClient.initialize()
+    # Start the timer that the rest of setup is broken down by.
+    from lib.startup_timer import StartupTimer
+    timer = StartupTimer()
 
-    # Import the MQTTListener.
+    # Import the AuthorizationClient and the MQTTListener.
+    from lib.authorization_client import AuthorizationClient
     from lib.mqtt_listener import MQTTListener
-    # Instantiate listener.
-    listener = MQTTListener()
+    # Start connecting the listener in the background. Messages aren't read until the listening loop begins.
+    listener = timer.start('listener connection', MQTTListener)
+    # Initialize the AuthorizationClient (which will, in turn, instantiate the MQTTSender) in the meantime.
+    AuthorizationClient.initialize(timer)
+    # Wait for the listener.
+    with timer.stage('waiting on listener connection'):
+        listener = listener.result()
 
     # Instantiate the watchdog, passing along the AuthorizationClient and MQTTListener.
     from lib.watchdog import Watchdog
     watchdog = Watchdog()
     watchdog.start()
 
-    # Begin the listening loop.
-    listener.begin_listening()
+    # Log how long each step of setup took.
+    timer.log()
+
+    # Begin the listening loop, on the event loop if the asyncio engine is enabled.
+    if AuthorizationClient.engine is not None:
+        AuthorizationClient.engine.run(listener)
+    else:
+        listener.begin_listening()
+
+
+def stop(signal_number=None, frame=None):
+    """
+    Shuts down the AuthorizationClient's pools, verifier processes, and sender connections, then ends the process.
+    The SIGTERM handler of every process started by the Supervisor, which stops them with SIGTERM.
+
+    Arguments:
+        signal_number (int) : The signal received. Unused.
+        frame (frame) : The frame the signal interrupted. Unused.
+    """
+    from lib.authorization_client import AuthorizationClient
+    AuthorizationClient.shutdown()
+
+    # The watchdog thread never exits, so the process is ended without waiting on it.
+    os._exit(0)
+
+
+def run_supervised(process_index):
+    """
+    The entry point of every process started by the Supervisor.
+    Shuts everything down when the Supervisor stops the process, so that no verifier processes are left behind.
+
+    Arguments:
+        process_index (int) : The index of this process.
+    """
+    import signal
+    signal.signal(signal.SIGTERM, stop)
+    setup(process_index)
+    run()
+
+
+def supervise(process_count):
+    """
+    Starts several listener processes in one shared subscription group, and restarts any that exit, until this
+    process is told to stop.
+
+    Arguments:
+        process_count (int) : The number of listener processes.
+    """
+    from lib.util import environment
+    from lib.supervisor import Supervisor
+    import logging
+    import signal
+
+    # Without a share group, every process would receive (and forward) every message.
+    if not environment.get('MQTT_LISTENER_SHARE_GROUP'):
+        logging.critical('LISTENER_PROCESS_COUNT is above 1, but MQTT_LISTENER_SHARE_GROUP is not set')
+        exit(-1)
+
+    # Stop the processes along with this one.
+    supervisor = Supervisor(process_count, run_supervised, name='ListenerSupervisor')
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: supervisor.stop())
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        supervisor.stop()
+
+
+# Only run in main.
+if __name__ == '__main__':
+
+    # Set up logging and the .env variables.
+    setup()
+
+    # Run a single listener in this process, or supervise several.
+    from lib.util import environment
+    if environment.get('LISTENER_PROCESS_COUNT') > 1:
+        supervise(environment.get('LISTENER_PROCESS_COUNT'))
+    else:
+        run()
@@ -0,0 +1,56 @@
+from unittest import TestCase
+from lib.admission_control import AdmissionControl
+
+
+class TestAdmissionControl(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.admission_control.AdmissionControl.__init__.invalid"""
+        with self.assertRaises(ValueError):
+            AdmissionControl(-1, 0)
+        with self.assertRaises(ValueError):
+            AdmissionControl(0, -1)
+
+
+    def test_admit_payload(self):
+        """lib.admission_control.AdmissionControl.admit_payload"""
+        # Create thing with a 10 byte payload limit
+        admission = AdmissionControl(10, 0)
+
+        # Run the method at, and just past, the limit
+        at_limit = admission.admit_payload(b'x' * 10)
+        past_limit = admission.admit_payload(b'x' * 11)
+
+        # Run assertions
+        self.assertTrue(at_limit)
+        self.assertFalse(past_limit)
+        self.assertEqual(admission.stats()['rejected_payloads'], 1)
+        self.assertEqual(admission.stats()['rejected_protected_headers'], 0)
+
+
+    def test_admit_protected_header(self):
+        """lib.admission_control.AdmissionControl.admit_protected_header"""
+        # Create thing with a 4 byte protected header limit
+        admission = AdmissionControl(0, 4)
+
+        # Run the method at, and just past, the limit
+        at_limit = admission.admit_protected_header(memoryview(b'eyJh'))
+        past_limit = admission.admit_protected_header('eyJhb')
+
+        # Run assertions
+        self.assertTrue(at_limit)
+        self.assertFalse(past_limit)
+        self.assertEqual(admission.stats()['rejected_protected_headers'], 1)
+
+
+    def test_unlimited(self):
+        """lib.admission_control.AdmissionControl.unlimited"""
+        # Create thing with both limits disabled
+        admission = AdmissionControl()
+
+        # Run assertions
+        self.assertTrue(admission.admit_payload(b'x' * 1000000))
+        self.assertTrue(admission.admit_protected_header(b'x' * 1000000))
+        self.assertEqual(admission.stats(), {'max_payload_bytes': 0, 'max_protected_header_bytes': 0,
+                                             'rejected_payloads': 0, 'rejected_protected_headers': 0})
@@ -0,0 +1,260 @@
+from unittest import mock, TestCase
+from unittest.mock import MagicMock, AsyncMock
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from lib.async_engine import AsyncEngine
+from lib.authorization_client import AuthorizationClient
+from lib.admission_control import AdmissionControl
+from lib.single_flight import AsyncSingleFlight
+from lib.tlsa_cache import TLSACache
+import concurrent.futures
+import threading
+import warnings
+import asyncio
+import time
+import gc
+
+
+def create_engine(max_in_flight=10):
+    """Creates an AsyncEngine whose signatures are checked on a thread, rather than a process."""
+    AuthorizationClient.tlsa_cache = TLSACache(10, 1, 3600)
+    AuthorizationClient.negative_tlsa_cache = TLSACache(10, 30, 30)
+    AuthorizationClient.tlsa_flights = AsyncSingleFlight()
+    AuthorizationClient.admission = AdmissionControl()
+    engine = AsyncEngine(max_in_flight, 1)
+    engine.executor.shutdown()
+    engine.executor = ThreadPoolExecutor(1)
+    return engine
+
+
+class TestAsyncEngine(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.async_engine.AsyncEngine.__init__.invalid"""
+        with self.assertRaises(ValueError):
+            AsyncEngine(0, 1)
+        with self.assertRaises(ValueError):
+            AsyncEngine(1, 0)
+
+
+    @mock.patch("lib.util.environment.CONFIG")
+    @mock.patch("lib.authorization_client.AuthorizationClient.verify_signature")
+    def test_verify(self, m_vs, m_c):
+        """lib.async_engine.AsyncEngine.verify"""
+        # Create thing, with a cached record and a signature that checks out
+        m_c.DNS_TIMEOUT_SECONDS = 5
+        m_vs.return_value = True
+        engine = create_engine()
+        AuthorizationClient.tlsa_cache.put('dns_name', {'ttl': 60}, 60)
+
+        # Run the method
+        result = engine.loop.run_until_complete(engine.verify(b'payload', 'dns_name'))
+
+        # Run assertions
+        self.assertTrue(result)
+        m_vs.assert_called_once_with(b'payload', {'ttl': 60})
+        engine.loop.close()
+
+
+    @mock.patch("logging.debug")
+    @mock.patch("lib.util.environment.CONFIG")
+    @mock.patch("lib.authorization_client.AuthorizationClient.verify_signature")
+    def test_verify_no_record(self, m_vs, m_c, m_ld):
+        """lib.async_engine.AsyncEngine.verify.no_record"""
+        # Create thing, whose lookup fails
+        m_c.DNS_TIMEOUT_SECONDS = 5
+        engine = create_engine()
+        engine.resolver.lookup = AsyncMock(return_value=(None, 'TLSAError()'))
+
+        # Run the method
+        result = engine.loop.run_until_complete(engine.verify(b'payload', 'dns_name'))
+
+        # Run assertions, the signature isn't checked
+        self.assertFalse(result)
+        m_vs.assert_not_called()
+        engine.loop.close()
+
+
+    @mock.patch("logging.debug")
+    @mock.patch("lib.util.environment.CONFIG")
+    def test_verify_timeout(self, m_c, m_ld):
+        """lib.async_engine.AsyncEngine.verify.timeout"""
+        # Create thing, whose signature check never gets a process before the timeout
+        m_c.DNS_TIMEOUT_SECONDS = 0.05
+        engine = create_engine()
+        AuthorizationClient.tlsa_cache.put('dns_name', {'ttl': 60}, 60)
+        executor = engine.executor
+        future = concurrent.futures.Future()
+        engine.executor = MagicMock(submit=MagicMock(return_value=future))
+        waiting = engine.executor
+
+        # Run the method
+        result = engine.loop.run_until_complete(engine.verify(b'payload', 'dns_name'))
+
+        # Run assertions, the check is cancelled, and the executor is kept
+        self.assertFalse(result)
+        self.assertTrue(future.cancelled())
+        self.assertIs(engine.executor, waiting)
+        self.assertEqual((engine.stats()['timeouts'], engine.stats()['recycled']), (1, 0))
+        executor.shutdown()
+        engine.loop.close()
+
+
+    @mock.patch("logging.debug")
+    @mock.patch("lib.util.environment.CONFIG")
+    def test_verify_timeout_hung(self, m_c, m_ld):
+        """lib.async_engine.AsyncEngine.verify.timeout_hung"""
+        # Create thing, whose signature check starts running on a process but never finishes
+        m_c.DNS_TIMEOUT_SECONDS = 0.05
+        engine = create_engine()
+        AuthorizationClient.tlsa_cache.put('dns_name', {'ttl': 60}, 60)
+        replacement = engine.executor
+        future = concurrent.futures.Future()
+        future.set_running_or_notify_cancel()
+        process = MagicMock()
+        hung = engine.executor = MagicMock(submit=MagicMock(return_value=future), _processes={1234: process})
+
+        # Run the method, then give the other checks on the hung executor time to finish
+        with mock.patch("lib.async_engine.AsyncEngine._create_executor", return_value=replacement):
+            result = engine.loop.run_until_complete(engine.verify(b'payload', 'dns_name'))
+        process.terminate.assert_not_called()
+        engine.loop.run_until_complete(asyncio.sleep(0.1))
+
+        # Run assertions, the executor is replaced, and its hung process is terminated
+        self.assertFalse(result)
+        self.assertIs(engine.executor, replacement)
+        hung.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+        process.terminate.assert_called_once()
+        self.assertEqual((engine.stats()['timeouts'], engine.stats()['recycled']), (1, 1))
+        replacement.shutdown()
+        engine.loop.close()
+
+
+    @mock.patch("logging.error")
+    @mock.patch("lib.util.environment.CONFIG")
+    def test_verify_broken_executor(self, m_c, m_le):
+        """lib.async_engine.AsyncEngine.verify.broken_executor"""
+        # Create thing, whose executor lost a process
+        m_c.DNS_TIMEOUT_SECONDS = 5
+        engine = create_engine()
+        AuthorizationClient.tlsa_cache.put('dns_name', {'ttl': 60}, 60)
+        replacement = engine.executor
+        broken = engine.executor = MagicMock(submit=MagicMock(side_effect=BrokenProcessPool()))
+
+        # Run the method for two checks at once, both of which fail on the broken executor
+        async def verify_twice():
+            return await asyncio.gather(engine.verify(b'payload', 'dns_name'), engine.verify(b'payload', 'dns_name'))
+        with mock.patch("lib.async_engine.AsyncEngine._create_executor", return_value=replacement) as m_ce:
+            results = engine.loop.run_until_complete(verify_twice())
+
+        # Run assertions, the executor is only replaced once, and the broken one is shut down
+        self.assertEqual(results, [False, False])
+        m_ce.assert_called_once()
+        self.assertIs(engine.executor, replacement)
+        broken.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+        self.assertEqual(engine.stats()['recycled'], 1)
+        engine.loop.close()
+
+
+    @mock.patch("logging.info")
+    @mock.patch("logging.debug")
+    @mock.patch("lib.util.logger.SETUP_OVER", True)
+    @mock.patch("lib.authorization_client.AuthorizationClient.forward")
+    @mock.patch("lib.authorization_client.AuthorizationClient.prepare")
+    def test_on_message(self, m_p, m_f, m_ld, m_li):
+        """lib.async_engine.AsyncEngine.on_message"""
+        # Create thing with room for two messages in flight, where only messages from jerry are authorized
+        engine = create_engine(max_in_flight=2)
+        engine.listener_driver = MagicMock()
+        m_p.side_effect = lambda message, details: ('jerry' if message.topic == 'jerry' else None, b'payload', None)
+        release = asyncio.Event()
+        async def verify(message_payload, dns_name):
+            await release.wait()
+            return True
+        engine.verify = verify
+
+        # Run the method for three messages, the last of which is oversized
+        AuthorizationClient.admission = AdmissionControl(10, 10)
+        async def run():
+            engine.on_message(None, None, MagicMock(topic='jerry', payload=b'one'))
+            engine.on_message(None, None, MagicMock(topic='tom', payload=b'two'))
+            engine.on_message(None, None, MagicMock(topic='jerry', payload=b'far too large'))
+            self.assertEqual(engine.stats()['in_flight'], 2)
+            engine.listener_driver.pause.assert_called_once()
+            release.set()
+            while engine.stats()['in_flight']:
+                await asyncio.sleep(0)
+        engine.loop.run_until_complete(run())
+
+        # Run assertions, reading resumes once there's room, and only the authorized message is forwarded
+        engine.listener_driver.resume.assert_called()
+        m_f.assert_called_once()
+        self.assertEqual(m_f.call_args[0][0].topic, 'jerry')
+        stats = engine.stats()
+        self.assertEqual((stats['received'], stats['dropped'], stats['completed'], stats['authorized']), (3, 1, 2, 1))
+        self.assertEqual((stats['max_in_flight_seen'], stats['pauses']), (2, 1))
+        engine.loop.close()
+
+
+    @mock.patch("logging.error")
+    @mock.patch("lib.util.logger.SETUP_OVER", True)
+    @mock.patch("lib.authorization_client.AuthorizationClient.prepare")
+    def test_handle_error(self, m_p, m_le):
+        """lib.async_engine.AsyncEngine.handle.error"""
+        # Create thing, whose parsing raises
+        engine = create_engine()
+        m_p.side_effect = RuntimeError('unexpected')
+
+        # Run the method
+        engine.loop.run_until_complete(engine.handle(MagicMock(topic='jerry'), time.monotonic()))
+
+        # Run assertions, the error is logged rather than raised
+        m_le.assert_called_once()
+        self.assertEqual(engine.stats()['failed'], 1)
+        engine.loop.close()
+
+
+    @mock.patch("lib.util.environment.CONFIG")
+    def test_refresh_tlsa_record(self, m_c):
+        """lib.async_engine.AsyncEngine.refresh_tlsa_record"""
+        # Create thing, whose lookup succeeds, and run its loop on another thread
+        m_c.DNS_TIMEOUT_SECONDS = 5
+        engine = create_engine()
+        engine.resolver.lookup = AsyncMock(return_value=({'ttl': 60}, None))
+        thread = threading.Thread(target=engine.loop.run_forever)
+        thread.start()
+
+        # Run the method, as the TLSARefresher would
+        try:
+            tlsa_record = engine.refresh_tlsa_record('dns_name')
+        finally:
+            engine.loop.call_soon_threadsafe(engine.loop.stop)
+            thread.join(5)
+
+        # Run assertions
+        self.assertEqual(tlsa_record, {'ttl': 60})
+        self.assertEqual(AuthorizationClient.tlsa_cache.get('dns_name'), {'ttl': 60})
+        engine.loop.close()
+
+
+    @mock.patch("logging.debug")
+    @mock.patch("lib.util.environment.CONFIG")
+    def test_refresh_tlsa_record_timeout(self, m_c, m_ld):
+        """lib.async_engine.AsyncEngine.refresh_tlsa_record.timeout"""
+        # Create thing, whose loop isn't running
+        m_c.DNS_TIMEOUT_SECONDS = 0.01
+        engine = create_engine()
+        engine.resolver.refresh = MagicMock(wraps=engine.resolver.refresh)
+
+        # Run the method, then close the loop without ever running it
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            tlsa_record = engine.refresh_tlsa_record('dns_name')
+            engine.loop.close()
+            gc.collect()
+
+        # Run assertions, no coroutine was created, so none was left behind
+        self.assertIsNone(tlsa_record)
+        engine.resolver.refresh.assert_not_called()
+        self.assertEqual([str(warning.message) for warning in caught if 'never awaited' in str(warning.message)], [])
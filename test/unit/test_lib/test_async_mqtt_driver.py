@@ -0,0 +1,151 @@
+from unittest import mock, TestCase
+from unittest.mock import MagicMock
+from lib.async_mqtt_driver import AsyncMQTTDriver
+from lib.connection_monitor import ConnectionMonitor
+import paho.mqtt.client as mqtt
+import threading
+import asyncio
+import socket
+
+
+class TestAsyncMQTTDriver(TestCase):
+
+
+    def setUp(self):
+        """Creates a connected pair of sockets, one of which stands in for the client's."""
+        self.client_socket, self.broker_socket = socket.socketpair()
+
+
+    def tearDown(self):
+        """Closes the sockets."""
+        self.client_socket.close()
+        self.broker_socket.close()
+
+
+    def test_attach_read_write(self):
+        """lib.async_mqtt_driver.AsyncMQTTDriver.attach.read_write"""
+        # Create thing, whose client already has a socket with something left to write
+        client = MagicMock(want_write=MagicMock(return_value=True), socket=MagicMock(return_value=self.client_socket))
+        driver = AsyncMQTTDriver(client, ConnectionMonitor(1, 60))
+
+        # Run the method, then have the broker send something
+        async def run():
+            driver.attach()
+            self.broker_socket.send(b'\x20')
+            while not client.loop_read.called or not client.loop_write.called:
+                await asyncio.sleep(0.001)
+            driver._close(self.client_socket)
+        asyncio.run(asyncio.wait_for(run(), 5))
+
+        # Run assertions
+        self.assertEqual(client.on_socket_open, driver._on_socket_open)
+        self.assertEqual(client.on_socket_register_write, driver._on_socket_register_write)
+        self.assertGreaterEqual(driver.stats()['reads'], 1)
+        self.assertGreaterEqual(driver.stats()['writes'], 1)
+
+
+    def test_pause_resume(self):
+        """lib.async_mqtt_driver.AsyncMQTTDriver.pause_resume"""
+        # Create thing
+        client = MagicMock(want_write=MagicMock(return_value=False), socket=MagicMock(return_value=self.client_socket))
+        driver = AsyncMQTTDriver(client, ConnectionMonitor(1, 60))
+
+        # Run the method, pausing before the broker sends something, and resuming after
+        async def run():
+            driver.attach()
+            driver.pause()
+            self.broker_socket.send(b'\x20')
+            await asyncio.sleep(0.05)
+            self.assertFalse(client.loop_read.called)
+            self.assertTrue(driver.stats()['paused'])
+            driver.resume()
+            while not client.loop_read.called:
+                await asyncio.sleep(0.001)
+            driver._close(self.client_socket)
+        asyncio.run(asyncio.wait_for(run(), 5))
+
+        # Run assertions
+        self.assertFalse(driver.stats()['paused'])
+
+
+    def test_socket_callbacks_other_thread(self):
+        """lib.async_mqtt_driver.AsyncMQTTDriver.socket_callbacks.other_thread"""
+        # Create thing, whose client has no socket yet
+        client = MagicMock(socket=MagicMock(return_value=None))
+        driver = AsyncMQTTDriver(client, ConnectionMonitor(1, 60))
+
+        # Run the method, opening the socket from another thread as a reconnect would
+        async def run():
+            driver.attach()
+            thread = threading.Thread(target=driver._on_socket_open, args=(client, None, self.client_socket))
+            thread.start()
+            thread.join(5)
+            await asyncio.sleep(0.01)
+            self.assertEqual(driver._fileno, self.client_socket.fileno())
+            self.broker_socket.send(b'\x20')
+            while not client.loop_read.called:
+                await asyncio.sleep(0.001)
+            driver._on_socket_close(client, None, self.client_socket)
+        asyncio.run(asyncio.wait_for(run(), 5))
+
+        # Run assertions
+        self.assertIsNone(driver._fileno)
+
+
+    @mock.patch("logging.warning")
+    def test_run_reconnect(self, m_lw):
+        """lib.async_mqtt_driver.AsyncMQTTDriver.run.reconnect"""
+        # Create thing, whose client has lost its connection, and whose reconnect cancels the test
+        client = MagicMock(socket=MagicMock(return_value=None))
+        client.loop_misc.return_value = mqtt.MQTT_ERR_NO_CONN
+        driver = AsyncMQTTDriver(client, ConnectionMonitor(1, 60))
+        reconnected = threading.Event()
+        client.reconnect.side_effect = lambda: reconnected.set()
+
+        # Run the method until the reconnect is made
+        async def run():
+            driver.attach()
+            task = asyncio.ensure_future(driver.run())
+            while not reconnected.is_set():
+                await asyncio.sleep(0.001)
+            task.cancel()
+        asyncio.run(asyncio.wait_for(run(), 5))
+
+        # Run assertions, the first attempt is made right away
+        client.reconnect.assert_called_once()
+        self.assertEqual(driver.monitor.stats()['reconnect_attempts'], 1)
+        self.assertFalse(driver.monitor.stats()['connected'])
+
+
+    @mock.patch("logging.debug")
+    def test_run_long_pause(self, m_ld):
+        """lib.async_mqtt_driver.AsyncMQTTDriver.run.long_pause"""
+        # Create thing, with a pause that is cut short well before it could outlast the keepalive
+        client = MagicMock(want_write=MagicMock(return_value=False), socket=MagicMock(return_value=self.client_socket),
+                           keepalive=60)
+        client.loop_misc.return_value = mqtt.MQTT_ERR_SUCCESS
+        driver = AsyncMQTTDriver(client, ConnectionMonitor(1, 60), misc_interval=0.01, max_pause=0.05)
+        default = AsyncMQTTDriver(client, ConnectionMonitor(1, 60))
+
+        # Run the method, pausing before the broker sends its answer to a keepalive
+        async def run():
+            driver.attach()
+            task = asyncio.ensure_future(driver.run())
+            driver.pause()
+            self.broker_socket.send(b'\xd0\x00')
+            await asyncio.sleep(0.02)
+            self.assertFalse(client.loop_read.called)
+            while not client.loop_read.called:
+                await asyncio.sleep(0.001)
+
+            # Pausing again right away does nothing, so the answer can be read
+            driver.pause()
+            self.assertFalse(driver.stats()['paused'])
+            task.cancel()
+            driver._close(self.client_socket)
+        asyncio.run(asyncio.wait_for(run(), 5))
+
+        # Run assertions
+        self.assertEqual(default.max_pause, 30)
+        self.assertEqual(driver.stats()['forced_resumes'], 1)
+        client.loop_misc.assert_called()
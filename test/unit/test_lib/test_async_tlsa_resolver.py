@@ -0,0 +1,173 @@
+from unittest import mock, TestCase
+from unittest.mock import AsyncMock
+from dane_discovery.exceptions import TLSAError
+from lib.async_tlsa_resolver import AsyncTLSAResolver
+from lib.single_flight import AsyncSingleFlight
+from lib.tlsa_cache import TLSACache
+import dns.message
+import dns.rrset
+import dns.flags
+import asyncio
+import hashlib
+import time
+
+
+def create_resolver():
+    """Creates an AsyncTLSAResolver with empty caches."""
+    return AsyncTLSAResolver(TLSACache(10, 1, 3600), TLSACache(10, 30, 30), AsyncSingleFlight(), nameserver='192.0.2.53')
+
+
+def create_response(dns_name, records, authenticated=True):
+    """Creates a DNS response to a TLSA query, with one TLSA record per string given."""
+    response = dns.message.make_response(dns.message.make_query(dns_name, 'TLSA', want_dnssec=True))
+    response.answer.append(dns.rrset.from_text(dns_name, 300, 'IN', 'TLSA', *records))
+    if authenticated:
+        response.flags |= dns.flags.AD
+    return response
+
+
+class TestAsyncTLSAResolver(TestCase):
+
+
+    @mock.patch("logging.debug")
+    def test_resolve_cached(self, m_ld):
+        """lib.async_tlsa_resolver.AsyncTLSAResolver.resolve.cached"""
+        # Create thing, with a cached record
+        resolver = create_resolver()
+        resolver.tlsa_cache.put('dns_name', {'ttl': 60}, 60)
+        resolver.lookup = AsyncMock()
+
+        # Run the method
+        tlsa_record = asyncio.run(resolver.resolve('dns_name', time.monotonic() + 10))
+
+        # Run assertions
+        self.assertEqual(tlsa_record, {'ttl': 60})
+        resolver.lookup.assert_not_called()
+
+
+    def test_resolve_miss_coalesced(self):
+        """lib.async_tlsa_resolver.AsyncTLSAResolver.resolve.miss_coalesced"""
+        # Create thing, whose lookup succeeds
+        resolver = create_resolver()
+        resolver.lookup = AsyncMock(return_value=({'ttl': 60}, None))
+
+        # Run the method three times at once
+        async def run():
+            deadline = time.monotonic() + 10
+            return await asyncio.gather(*[resolver.resolve('dns_name', deadline) for _ in range(3)])
+        tlsa_records = asyncio.run(run())
+
+        # Run assertions, the record was only looked up once, and is cached
+        self.assertEqual(tlsa_records, [{'ttl': 60}] * 3)
+        resolver.lookup.assert_called_once_with('dns_name')
+        self.assertEqual(resolver.flights.stats()['coalesced'], 2)
+        self.assertEqual(resolver.tlsa_cache.get('dns_name'), {'ttl': 60})
+
+
+    @mock.patch("logging.debug")
+    def test_resolve_tlsa_failure(self, m_ld):
+        """lib.async_tlsa_resolver.AsyncTLSAResolver.resolve.tlsa_failure"""
+        # Create thing, whose lookup fails
+        resolver = create_resolver()
+        resolver.lookup = AsyncMock(return_value=(None, 'TLSAError()'))
+
+        # Run the method twice
+        first = asyncio.run(resolver.resolve('dns_name', time.monotonic() + 10))
+        second = asyncio.run(resolver.resolve('dns_name', time.monotonic() + 10))
+
+        # Run assertions, the second one is rejected by the negative cache
+        self.assertIsNone(first)
+        self.assertIsNone(second)
+        resolver.lookup.assert_called_once()
+        self.assertEqual(resolver.negative_tlsa_cache.get('dns_name'), 'TLSAError()')
+
+
+    @mock.patch("logging.debug")
+    def test_resolve_timeout(self, m_ld):
+        """lib.async_tlsa_resolver.AsyncTLSAResolver.resolve.timeout"""
+        # Create thing, whose lookup never finishes
+        resolver = create_resolver()
+        async def lookup(dns_name):
+            await asyncio.sleep(60)
+        resolver.lookup = lookup
+
+        # Run the method
+        tlsa_record = asyncio.run(resolver.resolve('dns_name', time.monotonic() + 0.01))
+
+        # Run assertions
+        self.assertIsNone(tlsa_record)
+        self.assertEqual(resolver.negative_tlsa_cache.get('dns_name'), 'timeout')
+
+
+    @mock.patch("dane_discovery.dane.DANE.authenticate_tlsa")
+    @mock.patch("dane_discovery.pki.PKI.validate_certificate_association")
+    @mock.patch("dns.asyncquery.tls", new_callable=AsyncMock)
+    def test_lookup_dnssec(self, m_t, m_vca, m_at):
+        """lib.async_tlsa_resolver.AsyncTLSAResolver.lookup.dnssec"""
+        # Set return value for the query, where only the second record carries an entity certificate
+        m_t.return_value = create_response('dns_name.', ['3 1 1 abcd', '3 0 0 ABCD'])
+
+        # Run the method
+        tlsa_record, failure_reason = asyncio.run(create_resolver().lookup('dns_name.'))
+
+        # Run assertions, records delivered with DNSSEC aren't authenticated any further
+        self.assertIsNone(failure_reason)
+        self.assertEqual(m_t.call_args[0][1], '192.0.2.53')
+        self.assertEqual((tlsa_record['name'], tlsa_record['ttl']), ('dns_name.', 300))
+        self.assertEqual((tlsa_record['certificate_usage'], tlsa_record['matching_type']), (3, 0))
+        self.assertEqual(tlsa_record['certificate_association'], 'abcd')
+        self.assertEqual((tlsa_record['dnssec'], tlsa_record['tls']), (True, True))
+        self.assertEqual(tlsa_record['certificate_digest'], hashlib.sha256(b'abcd').hexdigest())
+        m_at.assert_not_called()
+
+
+    @mock.patch("dane_discovery.dane.DANE.authenticate_tlsa")
+    @mock.patch("dane_discovery.pki.PKI.validate_certificate_association")
+    @mock.patch("dns.asyncquery.udp_with_fallback", new_callable=AsyncMock)
+    @mock.patch("dns.asyncquery.tls", new_callable=AsyncMock)
+    def test_lookup_pkix_cd(self, m_t, m_uwf, m_vca, m_at):
+        """lib.async_tlsa_resolver.AsyncTLSAResolver.lookup.pkix_cd"""
+        # Set the nameserver to refuse TLS, and the answer to come without DNSSEC
+        m_t.side_effect = ConnectionRefusedError()
+        m_uwf.return_value = (create_response('dns_name.', ['4 0 0 ABCD'], authenticated=False), False)
+
+        # Run the method
+        tlsa_record, failure_reason = asyncio.run(create_resolver().lookup('dns_name.'))
+
+        # Run assertions, the record is authenticated with PKIX-CD
+        self.assertIsNone(failure_reason)
+        self.assertEqual((tlsa_record['dnssec'], tlsa_record['tls'], tlsa_record['tcp']), (False, False, False))
+        m_at.assert_called_once_with('dns_name.', tlsa_record)
+
+
+    @mock.patch("logging.debug")
+    @mock.patch("dane_discovery.dane.DANE.authenticate_tlsa")
+    @mock.patch("dane_discovery.pki.PKI.validate_certificate_association")
+    @mock.patch("dns.asyncquery.tls", new_callable=AsyncMock)
+    def test_lookup_fail_authentication(self, m_t, m_vca, m_at, m_ld):
+        """lib.async_tlsa_resolver.AsyncTLSAResolver.lookup.fail_authentication"""
+        # Set the answer to come without DNSSEC, and fail authentication
+        m_t.return_value = create_response('dns_name.', ['3 0 0 ABCD'], authenticated=False)
+        m_at.side_effect = TLSAError('3 identity represented without DNSSEC, unable to validate.')
+
+        # Run the method
+        tlsa_record, failure_reason = asyncio.run(create_resolver().lookup('dns_name.'))
+
+        # Run assertions
+        self.assertIsNone(tlsa_record)
+        self.assertIn('TLSAError', failure_reason)
+
+
+    @mock.patch("logging.debug")
+    @mock.patch("dns.asyncquery.tls", new_callable=AsyncMock)
+    def test_lookup_fail_no_records(self, m_t, m_ld):
+        """lib.async_tlsa_resolver.AsyncTLSAResolver.lookup.fail_no_records"""
+        # Set return value for the query, without any answers
+        m_t.return_value = dns.message.make_response(dns.message.make_query('dns_name.', 'TLSA'))
+
+        # Run the method
+        tlsa_record, failure_reason = asyncio.run(create_resolver().lookup('dns_name.'))
+
+        # Run assertions
+        self.assertIsNone(tlsa_record)
+        self.assertIn('No TLSA records', failure_reason)
@@ -1,47 +1,43 @@
 from unittest import mock, TestCase
 from unittest.mock import MagicMock
 from lib.authorization_client import AuthorizationClient
-from lib.mqtt_sender import MQTTSender
+from lib.mqtt_sender_pool import MQTTSenderPool
+from lib.worker_pool import WorkerPool
+from lib.keyed_executor import KeyedExecutor
+from lib.verifier_pool import VerifierPool
+from lib.tlsa_cache import TLSACache
+from lib.single_flight import SingleFlight
+from lib.tlsa_refresher import TLSARefresher
+from lib.whitelist import Whitelist
+from lib.admission_control import AdmissionControl
+from lib.topic_router import TopicRouter
 from lib.util import logger
 from json import JSONDecodeError
 from dane_discovery.exceptions import TLSAError
+from jwcrypto.jws import JWS, InvalidJWSSignature
+from jwcrypto.jwk import JWK
 from binascii import Error as ASCIIError
+import threading
+import hashlib
+import json
+import time
+import os
 
 
 class TestAuthorizationClient(TestCase):
 
 
-    @mock.patch("threading.Thread.__init__")
-    def test_init(self, m_i):
-        """lib.authorization_client.AuthorizationClient.__init__"""
-        # Set return value to None so as to not cause errors
-        m_i.return_value = None
-
-        # Run the method
-        auth_client = AuthorizationClient('my time')
-
-        # Run assertions
-        self.assertEqual(auth_client.message, 'my time')
-        m_i.assert_called()
-
-
-    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("lib.util.logger.log_setup_end_header")
     @mock.patch("lib.authorization_client.AuthorizationClient.authorized")
-    @mock.patch("lib.authorization_client.AuthorizationClient.__init__")
-    def test_run_fail_auth(self, m_i, m_a, m_lseh, m_eg):
+    def test_run_fail_auth(self, m_a, m_lseh, m_c):
         """lib.authorization_client.AuthorizationClient.run.fail_auth"""
-        # Set return value for environment.get and AuthorizationClient.authorized
-        m_eg.return_value = True
+        # Set the compiled config and return value for AuthorizationClient.authorized
+        m_c.DISABLE_SENDER = True
         m_a.return_value = False, None
 
-        # Create thing
-        m_i.return_value = None
-        auth_client = AuthorizationClient('fake_message')
-
-        # Create mock paho message and attach to auth client
+        # Create mock paho message
         mock_paho_message = MagicMock(topic='test_topic', payload='unrealistically_readable_payload')
-        auth_client.message = mock_paho_message
 
         # Create mock listener with publish mock and attach to AuthorizationClient
         publish = MagicMock()
@@ -49,30 +45,23 @@ class TestAuthorizationClient(TestCase):
         AuthorizationClient.sender = sender
 
         # Run method
-        auth_client.run()
+        AuthorizationClient.run(mock_paho_message)
 
         # Run assertions
-        m_a.assert_called_with(mock_paho_message)
-        m_eg.assert_not_called()
+        m_a.assert_called_with(mock_paho_message, {})
         publish.assert_not_called()
 
-    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("lib.util.logger.log_setup_end_header")
     @mock.patch("lib.authorization_client.AuthorizationClient.authorized")
-    @mock.patch("lib.authorization_client.AuthorizationClient.__init__")
-    def test_run_pass_auth_no_send(self, m_i, m_a, m_lseh, m_eg):
+    def test_run_pass_auth_no_send(self, m_a, m_lseh, m_c):
         """lib.authorization_client.AuthorizationClient.run.pass_auth.no_send"""
-        # Set return value for environment.get and AuthorizationClient.authorized
-        m_eg.return_value = True
+        # Set the compiled config and return value for AuthorizationClient.authorized
+        m_c.DISABLE_SENDER = True
         m_a.return_value = True, None
 
-        # Create thing
-        m_i.return_value = None
-        auth_client = AuthorizationClient('fake_message')
-
-        # Create MockPahoMessage and attach to auth client
+        # Create MockPahoMessage
         mock_paho_message = MagicMock(topic='test_topic', payload='unrealistically_readable_payload')
-        auth_client.message = mock_paho_message
 
         # Create mock listener with publish mock and attach to AuthorizationClient
         publish = MagicMock()
@@ -80,47 +69,77 @@ class TestAuthorizationClient(TestCase):
         AuthorizationClient.sender = sender
 
         # Run method
-        auth_client.run()
+        AuthorizationClient.run(mock_paho_message)
 
         # Run assertions
-        m_a.assert_called_with(mock_paho_message)
-        m_eg.assert_called_with('DISABLE_SENDER')
+        m_a.assert_called_with(mock_paho_message, {})
         publish.assert_not_called()
 
-    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("lib.util.logger.log_setup_end_header")
     @mock.patch("lib.authorization_client.AuthorizationClient.authorized")
-    @mock.patch("lib.authorization_client.AuthorizationClient.__init__")
-    def test_run_pass_auth_yes_send(self, m_i, m_a, m_lseh, m_eg):
+    def test_run_pass_auth_yes_send(self, m_a, m_lseh, m_c):
         """lib.authorization_client.AuthorizationClient.run.pass_auth.yes_send"""
-        # Set return value for environment.get and AuthorizationClient.authorized
-        m_eg.return_value = False
+        # Set the compiled config and return value for AuthorizationClient.authorized
+        m_c.DISABLE_SENDER = False
         m_a.return_value = True, None
 
-        # Create thing
-        m_i.return_value = None
-        auth_client = AuthorizationClient('fake_message')
-
-        # Create MockPahoMessage and attach to auth client
+        # Create MockPahoMessage
         mock_paho_message = MagicMock(topic='test_topic', payload='unrealistically_readable_payload')
-        auth_client.message = mock_paho_message
 
         # Create mock listener with publish mock and attach to AuthorizationClient
         publish = MagicMock()
         sender = MagicMock(publish=publish)
         AuthorizationClient.sender = sender
 
+        # Create mock router that routes to a single topic and attach to AuthorizationClient
+        AuthorizationClient.router = MagicMock(route=MagicMock(return_value=(('jws', ('verified',)),)))
+
         # Run method
-        auth_client.run()
+        AuthorizationClient.run(mock_paho_message)
 
         # Run assertions
-        m_a.assert_called_with(mock_paho_message)
-        m_eg.assert_called_with('DISABLE_SENDER')
-        publish.assert_called_with(mock_paho_message.payload)
+        m_a.assert_called_with(mock_paho_message, {})
+        AuthorizationClient.router.route.assert_called_with('test_topic', None)
+        publish.assert_called_with(mock_paho_message.payload, key=None, topics=('verified',))
+
+
+    @mock.patch("lib.util.environment.CONFIG")
+    @mock.patch("lib.util.logger.log_setup_end_header")
+    @mock.patch("lib.authorization_client.AuthorizationClient.authorized")
+    def test_run_pass_auth_forward_modes(self, m_a, m_lseh, m_c):
+        """lib.authorization_client.AuthorizationClient.run.pass_auth.forward_modes"""
+        # Set the compiled config, and have AuthorizationClient.authorized fill in the details it learns
+        m_c.DISABLE_SENDER = False
+        def authorized(message, details):
+            details.update(dns_name='jerry', payload_segment=memoryview(b'cGF5'))
+            return True, None
+        m_a.side_effect = authorized
+
+        # Create mock paho message
+        mock_paho_message = MagicMock(topic='test_topic', payload=b'eyJ4NXUiOiAiamVycnkifQ.cGF5.c2ln')
+
+        # Create mock sender, and a mock router that strips the envelope for one topic, and attach to AuthorizationClient
+        AuthorizationClient.sender = MagicMock()
+        AuthorizationClient.router = MagicMock(route=MagicMock(return_value=(('payload', ('plain',)),
+                                                                             ('jws', ('verified', 'audit')))))
 
+        # Run method
+        AuthorizationClient.run(mock_paho_message)
 
+        # Run assertions
+        AuthorizationClient.sender.publish.assert_has_calls([
+            mock.call(b'pay', key='jerry', topics=('plain',)),
+            mock.call(b'eyJ4NXUiOiAiamVycnkifQ.cGF5.c2ln', key='jerry', topics=('verified', 'audit')),
+        ])
+
+
+    @mock.patch.dict(os.environ, {'DNS_WHITELIST': 'ksu._device.example.com', 'MQTT_SENDER_TOPICS': 'verified'})
+    @mock.patch("lib.tlsa_refresher.TLSARefresher.start")
+    @mock.patch("lib.verifier_pool.VerifierPool.start")
+    @mock.patch("lib.worker_pool.WorkerPool.start")
     @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
-    def test_initialize_no_attr(self, m_i):
+    def test_initialize_no_attr(self, m_i, m_ps, m_vps, m_trs):
         """lib.authorization_client.AuthorizationClient.no_attr"""
         # Set return value to None so as to not cause errors
         m_i.return_value = None
@@ -137,11 +156,26 @@ class TestAuthorizationClient(TestCase):
 
         # Run assertions
         m_i.assert_called()
-        self.assertIsInstance(AuthorizationClient.sender, MQTTSender)
-
-
+        m_ps.assert_called_once()
+        m_vps.assert_called_once()
+        m_trs.assert_called_once()
+        self.assertIsInstance(AuthorizationClient.sender, MQTTSenderPool)
+        self.assertIsInstance(AuthorizationClient.pool, WorkerPool)
+        self.assertIsInstance(AuthorizationClient.verifier_pool, VerifierPool)
+        self.assertIsInstance(AuthorizationClient.tlsa_cache, TLSACache)
+        self.assertIsInstance(AuthorizationClient.negative_tlsa_cache, TLSACache)
+        self.assertIsInstance(AuthorizationClient.tlsa_flights, SingleFlight)
+        self.assertIsInstance(AuthorizationClient.tlsa_refresher, TLSARefresher)
+        self.assertIsInstance(AuthorizationClient.admission, AdmissionControl)
+        self.assertIsInstance(AuthorizationClient.router, TopicRouter)
+
+
+    @mock.patch.dict(os.environ, {'DNS_WHITELIST': 'ksu._device.example.com', 'MQTT_SENDER_TOPICS': 'verified'})
+    @mock.patch("lib.tlsa_refresher.TLSARefresher.start")
+    @mock.patch("lib.verifier_pool.VerifierPool.start")
+    @mock.patch("lib.worker_pool.WorkerPool.start")
     @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
-    def test_initialize_attr_false(self, m_i):
+    def test_initialize_attr_false(self, m_i, m_ps, m_vps, m_trs):
         """lib.authorization_client.AuthorizationClient.attr_false"""
         # Set return value to None so as to not cause errors
         m_i.return_value = None
@@ -157,11 +191,26 @@ class TestAuthorizationClient(TestCase):
 
         # Run assertions
         m_i.assert_called()
-        self.assertIsInstance(AuthorizationClient.sender, MQTTSender)
-
-
+        m_ps.assert_called_once()
+        m_vps.assert_called_once()
+        m_trs.assert_called_once()
+        self.assertIsInstance(AuthorizationClient.sender, MQTTSenderPool)
+        self.assertIsInstance(AuthorizationClient.pool, WorkerPool)
+        self.assertIsInstance(AuthorizationClient.verifier_pool, VerifierPool)
+        self.assertIsInstance(AuthorizationClient.tlsa_cache, TLSACache)
+        self.assertIsInstance(AuthorizationClient.negative_tlsa_cache, TLSACache)
+        self.assertIsInstance(AuthorizationClient.tlsa_flights, SingleFlight)
+        self.assertIsInstance(AuthorizationClient.tlsa_refresher, TLSARefresher)
+        self.assertIsInstance(AuthorizationClient.admission, AdmissionControl)
+        self.assertIsInstance(AuthorizationClient.router, TopicRouter)
+
+
+    @mock.patch.dict(os.environ, {'DNS_WHITELIST': 'ksu._device.example.com', 'MQTT_SENDER_TOPICS': 'verified'})
+    @mock.patch("lib.tlsa_refresher.TLSARefresher.start")
+    @mock.patch("lib.verifier_pool.VerifierPool.start")
+    @mock.patch("lib.worker_pool.WorkerPool.start")
     @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
-    def test_initialize_attr_true(self, m_i):
+    def test_initialize_attr_true(self, m_i, m_ps, m_vps, m_trs):
         """lib.authorization_client.AuthorizationClient.attr_true"""
         # Set return value to None so as to not cause errors
         m_i.return_value = None
@@ -177,31 +226,65 @@ class TestAuthorizationClient(TestCase):
 
         # Run assertions
         m_i.assert_not_called()
+        m_ps.assert_not_called()
+        m_vps.assert_not_called()
+        m_trs.assert_not_called()
         self.assertFalse(hasattr(AuthorizationClient, 'sender'))
 
 
-    @mock.patch("lib.authorization_client.AuthorizationClient.__init__")
-    @mock.patch("lib.authorization_client.AuthorizationClient.start")
-    def test_handle_message(self, m_s, m_i):
+    def test_handle_message(self):
         """lib.authorization_client.AuthorizationClient.handle_message"""
-        # Set return value to None so as to not cause errors
-        m_i.return_value = None
+        # Create mock pool with submit mock and attach to AuthorizationClient
+        submit = MagicMock(return_value=True)
+        AuthorizationClient.pool = MagicMock(submit=submit)
 
         # Run the method
-        AuthorizationClient.handle_message('DOOR STUCK')
+        message = MagicMock(payload=b'DOOR STUCK')
+        AuthorizationClient.handle_message(message)
 
         # Run assertions
-        m_i.assert_called_with('DOOR STUCK')
-        m_s.assert_called()
+        submit.assert_called_once_with(AuthorizationClient.run, message)
+
+
+    @mock.patch("logging.debug")
+    def test_handle_message_dropped(self, m_d):
+        """lib.authorization_client.AuthorizationClient.handle_message.dropped"""
+        # Create mock pool that rejects the job and attach to AuthorizationClient
+        submit = MagicMock(return_value=False)
+        AuthorizationClient.pool = MagicMock(submit=submit)
+
+        # Run the method
+        AuthorizationClient.handle_message(MagicMock(topic='full/topic'))
+
+        # Run assertions
+        submit.assert_called_once()
+        m_d.assert_called_with('Message recieved on full/topic was dropped, worker pool queue is full')
+
+
+    @mock.patch("logging.debug")
+    def test_handle_message_oversized(self, m_d):
+        """lib.authorization_client.AuthorizationClient.handle_message.oversized"""
+        # Create mock pool and attach it, along with a 16 byte payload limit, to AuthorizationClient
+        submit = MagicMock(return_value=True)
+        AuthorizationClient.pool = MagicMock(submit=submit)
+        AuthorizationClient.admission = AdmissionControl(16, 0)
+
+        # Run the method
+        AuthorizationClient.handle_message(MagicMock(topic='big/topic', payload=b'x' * 17))
+        AuthorizationClient.admission = AdmissionControl()
+
+        # Run assertions
+        submit.assert_not_called()
+        m_d.assert_called_with('Message recieved on big/topic was dropped, payload is 17 bytes')
 
 
     @mock.patch("json.JSONDecodeError.__init__")
-    @mock.patch("json.loads")
+    @mock.patch("lib.util.jws.loads")
     @mock.patch("base64.b64decode")
     @mock.patch("dane_jwe_jws.util.Util.get_name_from_dns_uri")
-    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
-    def test_authorized_message_not_json(self, m_vawt, m_eg, m_gnfdi, m_b64d, m_jl, m_i):
+    def test_authorized_message_not_json(self, m_vawt, m_c, m_gnfdi, m_b64d, m_jl, m_i):
         """lib.authorization_client.AuthorizationClient.authorized.message_not_json"""
         # Set return value to None so as to not cause errors
         m_i.return_value = None
@@ -240,18 +323,16 @@ class TestAuthorizationClient(TestCase):
         m_b64d.assert_not_called()
         # util.get_name_from_dns_uri assertions
         m_gnfdi.assert_not_called()
-        # environment.get assertions
-        m_eg.assert_not_called()
         # AuthorizationClient.verify_authentication_with_timeout assertions
         m_vawt.assert_not_called()
 
 
-    @mock.patch("json.loads")
+    @mock.patch("lib.util.jws.loads")
     @mock.patch("base64.b64decode")
     @mock.patch("dane_jwe_jws.util.Util.get_name_from_dns_uri")
-    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
-    def test_authorized_message_missing_protected(self, m_vawt, m_eg, m_gnfdi, m_b64d, m_jl):
+    def test_authorized_message_missing_protected(self, m_vawt, m_c, m_gnfdi, m_b64d, m_jl):
         """lib.authorization_client.AuthorizationClient.authorized.message_missing_protected"""
         # Set side effect for json.loads
         json_loads_called_with = []
@@ -290,18 +371,16 @@ class TestAuthorizationClient(TestCase):
         m_b64d.assert_not_called()
         # util.get_name_from_dns_uri assertions
         m_gnfdi.assert_not_called()
-        # environment.get assertions
-        m_eg.assert_not_called()
         # AuthorizationClient.verify_authentication_with_timeout assertions
         m_vawt.assert_not_called()
 
 
-    @mock.patch("json.loads")
+    @mock.patch("lib.util.jws.loads")
     @mock.patch("base64.b64decode")
     @mock.patch("dane_jwe_jws.util.Util.get_name_from_dns_uri")
-    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
-    def test_authorized_protected_not_b64(self, m_vawt, m_eg, m_gnfdi, m_b64d, m_jl):
+    def test_authorized_protected_not_b64(self, m_vawt, m_c, m_gnfdi, m_b64d, m_jl):
         """lib.authorization_client.AuthorizationClient.authorized.protected_not_b64"""
         # Set side effect for json.loads
         json_loads_called_with = []
@@ -340,19 +419,17 @@ class TestAuthorizationClient(TestCase):
         m_b64d.assert_called_with('asdfghjkl!@#$%^&*()_+-= surely this isnt base64 right oh wait it doesnt matter lol')
         # util.get_name_from_dns_uri assertions
         m_gnfdi.assert_not_called()
-        # environment.get assertions
-        m_eg.assert_not_called()
         # AuthorizationClient.verify_authentication_with_timeout assertions
         m_vawt.assert_not_called()
 
 
     @mock.patch("json.JSONDecodeError.__init__")
-    @mock.patch("json.loads")
+    @mock.patch("lib.util.jws.loads")
     @mock.patch("base64.b64decode")
     @mock.patch("dane_jwe_jws.util.Util.get_name_from_dns_uri")
-    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
-    def test_authorized_protected_not_dict(self, m_vawt, m_eg, m_gnfdi, m_b64d, m_jl, m_i):
+    def test_authorized_protected_not_dict(self, m_vawt, m_c, m_gnfdi, m_b64d, m_jl, m_i):
         """lib.authorization_client.AuthorizationClient.authorized.protected_not_dict"""
         # Set return value to None so as to not cause errors
         m_i.return_value = None
@@ -393,18 +470,16 @@ class TestAuthorizationClient(TestCase):
         m_b64d.assert_called_with('now it is base64 :) <- well not ACTUALLY but you get it')
         # util.get_name_from_dns_uri assertions
         m_gnfdi.assert_not_called()
-        # environment.get assertions
-        m_eg.assert_not_called()
         # AuthorizationClient.verify_authentication_with_timeout assertions
         m_vawt.assert_not_called()
 
 
-    @mock.patch("json.loads")
+    @mock.patch("lib.util.jws.loads")
     @mock.patch("base64.b64decode")
     @mock.patch("dane_jwe_jws.util.Util.get_name_from_dns_uri")
-    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
-    def test_authorized_protected_missing_x5u(self, m_vawt, m_eg, m_gnfdi, m_b64d, m_jl):
+    def test_authorized_protected_missing_x5u(self, m_vawt, m_c, m_gnfdi, m_b64d, m_jl):
         """lib.authorization_client.AuthorizationClient.authorized.protected_missing_x5u"""
         # Set side effect for json.loads
         json_loads_called_with = []
@@ -439,18 +514,16 @@ class TestAuthorizationClient(TestCase):
         m_b64d.assert_called_with('now it is base64 :) <- well not ACTUALLY but you get it')
         # util.get_name_from_dns_uri assertions
         m_gnfdi.assert_not_called()
-        # environment.get assertions
-        m_eg.assert_not_called()
         # AuthorizationClient.verify_authentication_with_timeout assertions
         m_vawt.assert_not_called()
 
 
-    @mock.patch("json.loads")
+    @mock.patch("lib.util.jws.loads")
     @mock.patch("base64.b64decode")
     @mock.patch("dane_jwe_jws.util.Util.get_name_from_dns_uri")
-    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
-    def test_authorized_x5u_formatted_wrong(self, m_vawt, m_eg, m_gnfdi, m_b64d, m_jl):
+    def test_authorized_x5u_formatted_wrong(self, m_vawt, m_c, m_gnfdi, m_b64d, m_jl):
         """lib.authorization_client.AuthorizationClient.authorized.x5u_formatted_wrong"""
         # Set side effect for json.loads
         json_loads_called_with = []
@@ -485,18 +558,16 @@ class TestAuthorizationClient(TestCase):
         m_b64d.assert_called_with('now it is base64 :) <- well not ACTUALLY but you get it')
         # util.get_name_from_dns_uri assertions
         m_gnfdi.assert_called_with('this line is really long')
-        # environment.get assertions
-        m_eg.assert_not_called()
         # AuthorizationClient.verify_authentication_with_timeout assertions
         m_vawt.assert_not_called()
 
 
-    @mock.patch("json.loads")
+    @mock.patch("lib.util.jws.loads")
     @mock.patch("base64.b64decode")
     @mock.patch("dane_jwe_jws.util.Util.get_name_from_dns_uri")
-    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
-    def test_authorized_dns_name_not_whitelisted(self, m_vawt, m_eg, m_gnfdi, m_b64d, m_jl):
+    def test_authorized_dns_name_not_whitelisted(self, m_vawt, m_c, m_gnfdi, m_b64d, m_jl):
         """lib.authorization_client.AuthorizationClient.authorized.dns_name_not_whitelisted"""
         # Set side effect for json.loads
         json_loads_called_with = []
@@ -505,10 +576,10 @@ class TestAuthorizationClient(TestCase):
             return {'protected': 'now it is base64 :) <- well not ACTUALLY but you get it'} if len(json_loads_called_with) == 1 else {'x5u': 'this line is really long'}
         m_jl.side_effect = json_loads_side_effect
 
-        # Set return value for base64.b64decode, util.get_name_from_dns_uri, and environment.get
+        # Set return value for base64.b64decode, util.get_name_from_dns_uri, and the compiled config
         m_b64d.return_value = 'Pretend this is a dict. shhh!'
         m_gnfdi.return_value = 'WHAT you gotta be kidding me whaddya mean im not on the list'
-        m_eg.return_value = ['sorry pal youre not on the list']
+        m_c.DNS_WHITELIST = Whitelist(['sorry pal youre not on the list'])
 
         # Create the starter message
         starter_message = MagicMock(payload='unusually readable payload')
@@ -528,18 +599,16 @@ class TestAuthorizationClient(TestCase):
         m_b64d.assert_called_with('now it is base64 :) <- well not ACTUALLY but you get it')
         # util.get_name_from_dns_uri assertions
         m_gnfdi.assert_called_with('this line is really long')
-        # environment.get assertions
-        m_eg.assert_called_with("DNS_WHITELIST")
         # AuthorizationClient.verify_authentication_with_timeout assertions
         m_vawt.assert_not_called()
 
 
-    @mock.patch("json.loads")
+    @mock.patch("lib.util.jws.loads")
     @mock.patch("base64.b64decode")
     @mock.patch("dane_jwe_jws.util.Util.get_name_from_dns_uri")
-    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
-    def test_authorized_not_verified(self, m_vawt, m_eg, m_gnfdi, m_b64d, m_jl):
+    def test_authorized_not_verified(self, m_vawt, m_c, m_gnfdi, m_b64d, m_jl):
         """lib.authorization_client.AuthorizationClient.authorized.not_verified"""
         # Set side effect for json.loads
         json_loads_called_with = []
@@ -548,10 +617,10 @@ class TestAuthorizationClient(TestCase):
             return {'protected': 'now it is base64 :) <- well not ACTUALLY but you get it'} if len(json_loads_called_with) == 1 else {'x5u': 'this line is really long'}
         m_jl.side_effect = json_loads_side_effect
 
-        # Set return value for base64.b64decode, util.get_name_from_dns_uri, environment.get, and AuthorizationClient.verify_authentication_with_timeout
+        # Set return value for base64.b64decode, util.get_name_from_dns_uri, the compiled config, and AuthorizationClient.verify_authentication_with_timeout
         m_b64d.return_value = 'Pretend this is a dict. shhh!'
         m_gnfdi.return_value = 'jerry'
-        m_eg.return_value = ['OH WAIT YOU ARE ON THE LIST', 'jerry', 'right this way sir have a nice time']
+        m_c.DNS_WHITELIST = Whitelist(['OH WAIT YOU ARE ON THE LIST', 'jerry', 'right this way sir have a nice time'])
         m_vawt.return_value = False
 
         # Create the starter message
@@ -572,18 +641,16 @@ class TestAuthorizationClient(TestCase):
         m_b64d.assert_called_with('now it is base64 :) <- well not ACTUALLY but you get it')
         # util.get_name_from_dns_uri assertions
         m_gnfdi.assert_called_with('this line is really long')
-        # environment.get assertions
-        m_eg.assert_called_with("DNS_WHITELIST")
         # AuthorizationClient.verify_authentication_with_timeout assertions
         m_vawt.assert_called_with('unusually readable payload', 'jerry')
 
 
-    @mock.patch("json.loads")
+    @mock.patch("lib.util.jws.loads")
     @mock.patch("base64.b64decode")
     @mock.patch("dane_jwe_jws.util.Util.get_name_from_dns_uri")
-    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
-    def test_authorized_passed_everything(self, m_vawt, m_eg, m_gnfdi, m_b64d, m_jl):
+    def test_authorized_passed_everything(self, m_vawt, m_c, m_gnfdi, m_b64d, m_jl):
         """lib.authorization_client.AuthorizationClient.authorized.passed_everything"""
         # Set side effect for json.loads
         json_loads_called_with = []
@@ -592,10 +659,10 @@ class TestAuthorizationClient(TestCase):
             return {'protected': 'now it is base64 :) <- well not ACTUALLY but you get it'} if len(json_loads_called_with) == 1 else {'x5u': 'this line is really long'}
         m_jl.side_effect = json_loads_side_effect
 
-        # Set return value for base64.b64decode, util.get_name_from_dns_uri, environment.get, and AuthorizationClient.verify_authentication_with_timeout
+        # Set return value for base64.b64decode, util.get_name_from_dns_uri, the compiled config, and AuthorizationClient.verify_authentication_with_timeout
         m_b64d.return_value = 'Pretend this is a dict. shhh!'
         m_gnfdi.return_value = 'jerry'
-        m_eg.return_value = ['OH WAIT YOU ARE ON THE LIST', 'jerry', 'right this way sir have a nice time']
+        m_c.DNS_WHITELIST = Whitelist(['OH WAIT YOU ARE ON THE LIST', 'jerry', 'right this way sir have a nice time'])
         m_vawt.return_value = True
 
         # Create the starter message
@@ -616,162 +683,1095 @@ class TestAuthorizationClient(TestCase):
         m_b64d.assert_called_with('now it is base64 :) <- well not ACTUALLY but you get it')
         # util.get_name_from_dns_uri assertions
         m_gnfdi.assert_called_with('this line is really long')
-        # environment.get assertions
-        m_eg.assert_called_with("DNS_WHITELIST")
         # AuthorizationClient.verify_authentication_with_timeout assertions
         m_vawt.assert_called_with('unusually readable payload', 'jerry')
 
 
-    @mock.patch("lib.util.environment.get")
-    @mock.patch("multiprocessing.get_context")
+    @mock.patch("dane_jwe_jws.util.Util.get_name_from_dns_uri")
+    @mock.patch("lib.util.environment.CONFIG")
+    @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
+    def test_authorized_compact_handoff(self, m_vawt, m_c, m_gnfdi):
+        """lib.authorization_client.AuthorizationClient.authorized.compact_handoff"""
+        # Set return values for util.get_name_from_dns_uri, the compiled config, and verify_authentication_with_timeout
+        m_gnfdi.return_value = 'jerry'
+        m_c.DNS_WHITELIST = Whitelist(['jerry'])
+        m_vawt.return_value = True
+
+        # Create a flattened JWS message (the protected header is {"x5u": "jerry"})
+        protected = 'eyJ4NXUiOiAiamVycnkifQ=='
+        starter_message = MagicMock(payload=json.dumps({'protected': protected, 'payload': 'cGF5', 'signature': 'c2ln'}))
+
+        # Run the method
+        authorized, exception = AuthorizationClient.authorized(starter_message)
+
+        # Run assertions
+        self.assertTrue(authorized)
+        self.assertIsNone(exception)
+        m_gnfdi.assert_called_with('jerry')
+        m_vawt.assert_called_with(f'{protected}.cGF5.c2ln', 'jerry')
+
+
+    @mock.patch("dane_jwe_jws.util.Util.get_name_from_dns_uri")
+    @mock.patch("lib.util.environment.CONFIG")
+    @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
+    def test_authorized_compact(self, m_vawt, m_c, m_gnfdi):
+        """lib.authorization_client.AuthorizationClient.authorized.compact"""
+        # Set return values for util.get_name_from_dns_uri, the compiled config, and verify_authentication_with_timeout
+        m_gnfdi.return_value = 'jerry'
+        m_c.DNS_WHITELIST = Whitelist(['jerry'])
+        m_vawt.return_value = True
+
+        # Create a compact JWS message (the protected header is {"x5u": "jerry"}, without padding)
+        starter_message = MagicMock(payload=b'eyJ4NXUiOiAiamVycnkifQ.cGF5.c2ln')
+
+        # Run the method
+        details = {}
+        authorized, exception = AuthorizationClient.authorized(starter_message, details)
+
+        # Run assertions
+        self.assertTrue(authorized)
+        self.assertIsNone(exception)
+        self.assertEqual(details, {'dns_name': 'jerry', 'payload_segment': b'cGF5'})
+        m_gnfdi.assert_called_with('jerry')
+        m_vawt.assert_called_with(b'eyJ4NXUiOiAiamVycnkifQ.cGF5.c2ln', 'jerry')
+
+
+    @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
+    def test_authorized_compact_protected_not_b64(self, m_vawt):
+        """lib.authorization_client.AuthorizationClient.authorized.compact_protected_not_b64"""
+        # Create a compact JWS message whose header is one character short of valid base64url
+        starter_message = MagicMock(payload=b'eyJ4N.cGF5.c2ln')
+
+        # Run the method
+        authorized, exception = AuthorizationClient.authorized(starter_message)
+
+        # Run assertions
+        self.assertFalse(authorized)
+        self.assertIsInstance(exception, ASCIIError)
+        m_vawt.assert_not_called()
+
+
+    @mock.patch("lib.util.jws.base64url_decode")
+    @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
+    def test_authorized_protected_oversized(self, m_vawt, m_b64ud):
+        """lib.authorization_client.AuthorizationClient.authorized.protected_oversized"""
+        # Set a 16 byte protected header limit
+        AuthorizationClient.admission = AdmissionControl(0, 16)
+
+        # Run the method with a compact JWS message whose header is 20 bytes
+        authorized, exception = AuthorizationClient.authorized(MagicMock(payload=b'eyJ4NXUiOiAiamVycnki.cGF5.c2ln'))
+        AuthorizationClient.admission = AdmissionControl()
+
+        # Run assertions
+        self.assertFalse(authorized)
+        self.assertIsNone(exception)
+        m_b64ud.assert_not_called()
+        m_vawt.assert_not_called()
+
+
+    @mock.patch("lib.util.jws.loads")
+    @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
+    def test_authorized_json_protected_oversized(self, m_vawt, m_jl):
+        """lib.authorization_client.AuthorizationClient.authorized.json_protected_oversized"""
+        # Set a 16 byte protected header limit
+        AuthorizationClient.admission = AdmissionControl(0, 16)
+
+        # Run the method with a JSON message whose protected header is 24 bytes
+        payload = b'{"payload": "cGF5", "protected": "eyJ4NXUiOiAiamVycnkifQ==", "signature": "c2ln"}'
+        authorized, exception = AuthorizationClient.authorized(MagicMock(payload=payload))
+        stats = AuthorizationClient.admission.stats()
+        AuthorizationClient.admission = AdmissionControl()
+
+        # Run assertions, the message is rejected without being parsed
+        self.assertFalse(authorized)
+        self.assertIsNone(exception)
+        self.assertEqual(stats['rejected_protected_headers'], 1)
+        m_jl.assert_not_called()
+        m_vawt.assert_not_called()
+
+
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("threading.get_ident")
-    def test_verify_authentication_with_timeout_timeout(self, m_gi, m_gc, m_eg):
+    @mock.patch("lib.authorization_client.AuthorizationClient.resolve_tlsa_record")
+    def test_verify_authentication_with_timeout_timeout(self, m_rtr, m_gi, m_c):
         """lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout.timeout"""
-        # Set up complicated multiprocessing mocking for each function call
-        queue_get_mock = MagicMock(return_value='what')
-        queue_mock = MagicMock(get=queue_get_mock)
-        process_start_mock = MagicMock()
-        process_join_mock = MagicMock()
-        process_terminate_mock = MagicMock()
-        process_is_alive_mock = MagicMock(return_value=True)
-        process_mock = MagicMock(start=process_start_mock, join=process_join_mock, is_alive=process_is_alive_mock, terminate=process_terminate_mock)
-        mock_multiprocessing_context = MockMultiprocessingContext(queue_mock, process_mock)
-        m_gc.return_value = mock_multiprocessing_context
-
-        # Mock environment.get and threading.get_ident
-        m_eg.return_value = 10
+        # Create mock verifier pool whose job times out and attach to AuthorizationClient
+        run_mock = MagicMock(return_value=(False, None))
+        AuthorizationClient.verifier_pool = MagicMock(run=run_mock)
+
+        # Mock the compiled config, threading.get_ident, and AuthorizationClient.resolve_tlsa_record
+        m_c.DNS_TIMEOUT_SECONDS = 10
         m_gi.return_value = 300
+        m_rtr.return_value = {'ttl': 60}
 
         # Run the method.
         verified = AuthorizationClient.verify_authentication_with_timeout('unusually readable payload', 'dns_name')
 
         # Run assertions
-        m_gc.assert_called_with('spawn')
-        self.assertEqual(len(mock_multiprocessing_context.queue_called_with), 1)
-        self.assertEqual(len(mock_multiprocessing_context.process_called_with), 1)
-        self.assertEqual(mock_multiprocessing_context.process_called_with[0], {'target': AuthorizationClient._authorize, 'args': (queue_mock, 'unusually readable payload', 300)})
-        process_start_mock.assert_called()
-        process_join_mock.assert_called_with(10)
-        process_is_alive_mock.assert_called()
-        process_terminate_mock.assert_called()
-        queue_get_mock.assert_not_called()
+        self.assertEqual(m_rtr.call_args[0][0], 'dns_name')
+        self.assertEqual(run_mock.call_args[0][:2], (AuthorizationClient._authorize, ('unusually readable payload', {'ttl': 60}, 300)))
+        self.assertTrue(0 < run_mock.call_args[0][2] <= 10)
         self.assertFalse(verified)
 
 
-    @mock.patch("lib.util.environment.get")
-    @mock.patch("multiprocessing.get_context")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("threading.get_ident")
-    def test_verify_authentication_with_timeout_success(self, m_gi, m_gc, m_eg):
+    @mock.patch("lib.authorization_client.AuthorizationClient.resolve_tlsa_record")
+    def test_verify_authentication_with_timeout_success(self, m_rtr, m_gi, m_c):
         """lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout.success"""
-        # Set up complicated multiprocessing mocking for each function call
-        queue_get_mock = MagicMock(return_value='what')
-        queue_mock = MagicMock(get=queue_get_mock)
-        process_start_mock = MagicMock()
-        process_join_mock = MagicMock()
-        process_terminate_mock = MagicMock()
-        process_is_alive_mock = MagicMock(return_value=False)
-        process_mock = MagicMock(start=process_start_mock, join=process_join_mock, is_alive=process_is_alive_mock, terminate=process_terminate_mock)
-        mock_multiprocessing_context = MockMultiprocessingContext(queue_mock, process_mock)
-        m_gc.return_value = mock_multiprocessing_context
-
-        # Mock environment.get and threading.get_ident
-        m_eg.return_value = 10
+        # Create mock verifier pool whose job finishes and attach to AuthorizationClient
+        run_mock = MagicMock(return_value=(True, True))
+        AuthorizationClient.verifier_pool = MagicMock(run=run_mock)
+
+        # Mock the compiled config, threading.get_ident, and AuthorizationClient.resolve_tlsa_record
+        m_c.DNS_TIMEOUT_SECONDS = 10
+        m_gi.return_value = 300
+        m_rtr.return_value = {'ttl': 60}
+
+        # Run the method.
+        verified = AuthorizationClient.verify_authentication_with_timeout('unusually readable payload', 'dns_name')
+
+        # Run assertions
+        self.assertEqual(run_mock.call_args[0][:2], (AuthorizationClient._authorize, ('unusually readable payload', {'ttl': 60}, 300)))
+        self.assertTrue(verified)
+
+
+    @mock.patch("lib.util.environment.CONFIG")
+    @mock.patch("threading.get_ident")
+    @mock.patch("lib.authorization_client.AuthorizationClient.resolve_tlsa_record")
+    def test_verify_authentication_with_timeout_skipped(self, m_rtr, m_gi, m_c):
+        """lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout.skipped"""
+        # Create mock verifier pool whose job was skipped for being past its deadline
+        run_mock = MagicMock(return_value=(True, None))
+        AuthorizationClient.verifier_pool = MagicMock(run=run_mock)
+
+        # Mock the compiled config, threading.get_ident, and AuthorizationClient.resolve_tlsa_record
+        m_c.DNS_TIMEOUT_SECONDS = 10
         m_gi.return_value = 300
+        m_rtr.return_value = {'ttl': 60}
 
         # Run the method.
         verified = AuthorizationClient.verify_authentication_with_timeout('unusually readable payload', 'dns_name')
 
         # Run assertions
-        m_gc.assert_called_with('spawn')
-        self.assertEqual(len(mock_multiprocessing_context.queue_called_with), 1)
-        self.assertEqual(len(mock_multiprocessing_context.process_called_with), 1)
-        self.assertEqual(mock_multiprocessing_context.process_called_with[0], {'target': AuthorizationClient._authorize, 'args': (queue_mock, 'unusually readable payload', 300)})
-        process_start_mock.assert_called()
-        process_join_mock.assert_called_with(10)
-        process_is_alive_mock.assert_called()
-        process_terminate_mock.assert_not_called()
-        queue_get_mock.assert_called()
-        self.assertEqual(verified, 'what')
+        self.assertIs(verified, False)
+
+
+    @mock.patch("lib.util.environment.CONFIG")
+    @mock.patch("lib.authorization_client.AuthorizationClient.resolve_tlsa_record")
+    def test_verify_authentication_with_timeout_no_record(self, m_rtr, m_c):
+        """lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout.no_record"""
+        # Create mock verifier pool and attach to AuthorizationClient
+        run_mock = MagicMock()
+        AuthorizationClient.verifier_pool = MagicMock(run=run_mock)
+
+        # Mock the compiled config and AuthorizationClient.resolve_tlsa_record
+        m_c.DNS_TIMEOUT_SECONDS = 10
+        m_rtr.return_value = None
+
+        # Run the method.
+        verified = AuthorizationClient.verify_authentication_with_timeout('unusually readable payload', 'dns_name')
+
+        # Run assertions
+        run_mock.assert_not_called()
+        self.assertFalse(verified)
+
+
+    @mock.patch("threading.get_ident")
+    def test_resolve_tlsa_record_cached(self, m_gi):
+        """lib.authorization_client.AuthorizationClient.resolve_tlsa_record.cached"""
+        # Create a cache holding the record, and a mock verifier pool
+        AuthorizationClient.tlsa_cache = TLSACache(10, 0, 100)
+        AuthorizationClient.tlsa_cache.put('dns_name', {'ttl': 60}, 60)
+        run_mock = MagicMock()
+        AuthorizationClient.verifier_pool = MagicMock(run=run_mock)
+
+        # Run the method.
+        tlsa_record = AuthorizationClient.resolve_tlsa_record('dns_name', time.monotonic() + 10)
+
+        # Run assertions
+        self.assertEqual(tlsa_record, {'ttl': 60})
+        run_mock.assert_not_called()
+        self.assertEqual(AuthorizationClient.tlsa_cache.stats()['hits'], 1)
+
+
+    @mock.patch("threading.get_ident")
+    def test_resolve_tlsa_record_miss(self, m_gi):
+        """lib.authorization_client.AuthorizationClient.resolve_tlsa_record.miss"""
+        # Create an empty cache, and a mock verifier pool that resolves the record
+        AuthorizationClient.tlsa_cache = TLSACache(10, 0, 100)
+        AuthorizationClient.negative_tlsa_cache = TLSACache(10, 30, 30)
+        AuthorizationClient.tlsa_flights = SingleFlight()
+        run_mock = MagicMock(return_value=(True, ({'ttl': 60}, None)))
+        AuthorizationClient.verifier_pool = MagicMock(run=run_mock)
+        m_gi.return_value = 300
+
+        # Run the method.
+        tlsa_record = AuthorizationClient.resolve_tlsa_record('dns_name', time.monotonic() + 10)
+
+        # Run assertions
+        self.assertEqual(tlsa_record, {'ttl': 60})
+        self.assertEqual(run_mock.call_args[0][:2], (AuthorizationClient._resolve, ('dns_name', 300)))
+        self.assertEqual(AuthorizationClient.tlsa_cache.get('dns_name'), {'ttl': 60})
+
+
+    @mock.patch("threading.get_ident")
+    def test_resolve_tlsa_record_timeout(self, m_gi):
+        """lib.authorization_client.AuthorizationClient.resolve_tlsa_record.timeout"""
+        # Create empty caches, and a mock verifier pool that times out
+        AuthorizationClient.tlsa_cache = TLSACache(10, 0, 100)
+        AuthorizationClient.negative_tlsa_cache = TLSACache(10, 30, 30)
+        AuthorizationClient.tlsa_flights = SingleFlight()
+        run_mock = MagicMock(return_value=(False, None))
+        AuthorizationClient.verifier_pool = MagicMock(run=run_mock)
+
+        # Run the method twice.
+        first_tlsa_record = AuthorizationClient.resolve_tlsa_record('dns_name', time.monotonic() + 10)
+        second_tlsa_record = AuthorizationClient.resolve_tlsa_record('dns_name', time.monotonic() + 10)
+
+        # Run assertions
+        self.assertIsNone(first_tlsa_record)
+        self.assertIsNone(second_tlsa_record)
+        run_mock.assert_called_once()
+        self.assertEqual(AuthorizationClient.tlsa_cache.stats()['entries'], 0)
+        self.assertEqual(AuthorizationClient.negative_tlsa_cache.get('dns_name'), 'timeout')
+
+
+    def test_resolve_tlsa_record_coalesced(self):
+        """lib.authorization_client.AuthorizationClient.resolve_tlsa_record.coalesced"""
+        # Create empty caches, and a mock verifier pool whose lookup blocks until released
+        AuthorizationClient.tlsa_cache = TLSACache(10, 0, 100)
+        AuthorizationClient.negative_tlsa_cache = TLSACache(10, 30, 30)
+        AuthorizationClient.tlsa_flights = SingleFlight()
+        release = threading.Event()
+        def run_side_effect(*args, **kwargs):
+            release.wait(5)
+            return True, ({'ttl': 60}, None)
+        run_mock = MagicMock(side_effect=run_side_effect)
+        AuthorizationClient.verifier_pool = MagicMock(run=run_mock)
+
+        # Run the method from several threads at once, then release the lookup once they are all waiting.
+        results = []
+        def resolve():
+            results.append(AuthorizationClient.resolve_tlsa_record('dns_name', time.monotonic() + 10))
+        threads = [threading.Thread(target=resolve) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while AuthorizationClient.tlsa_flights.stats()['coalesced'] < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        # Run assertions
+        run_mock.assert_called_once()
+        self.assertEqual(results, [{'ttl': 60}] * 5)
+
+
+    @mock.patch("lib.util.environment.CONFIG")
+    @mock.patch("threading.get_ident")
+    def test_refresh_tlsa_record(self, m_gi, m_c):
+        """lib.authorization_client.AuthorizationClient.refresh_tlsa_record"""
+        # Create caches that already hold the record, and a mock verifier pool that resolves a newer one
+        AuthorizationClient.tlsa_cache = TLSACache(10, 0, 100)
+        AuthorizationClient.tlsa_cache.put('dns_name', {'ttl': 5}, 5)
+        AuthorizationClient.negative_tlsa_cache = TLSACache(10, 30, 30)
+        AuthorizationClient.tlsa_flights = SingleFlight()
+        run_mock = MagicMock(return_value=(True, ({'ttl': 60}, None)))
+        AuthorizationClient.verifier_pool = MagicMock(run=run_mock)
+        m_c.DNS_TIMEOUT_SECONDS = 10
+
+        # Run the method.
+        tlsa_record = AuthorizationClient.refresh_tlsa_record('dns_name')
+
+        # Run assertions
+        run_mock.assert_called_once()
+        self.assertEqual(tlsa_record, {'ttl': 60})
+        self.assertEqual(AuthorizationClient.tlsa_cache.get('dns_name'), {'ttl': 60})
+
+
+    @mock.patch("threading.get_ident")
+    def test_resolve_tlsa_record_pool_busy(self, m_gi):
+        """lib.authorization_client.AuthorizationClient.resolve_tlsa_record.pool_busy"""
+        # Create empty caches, and a mock verifier pool that never had an idle process
+        AuthorizationClient.tlsa_cache = TLSACache(10, 0, 100)
+        AuthorizationClient.negative_tlsa_cache = TLSACache(10, 30, 30)
+        AuthorizationClient.tlsa_flights = SingleFlight()
+        run_mock = MagicMock(return_value=(None, None))
+        AuthorizationClient.verifier_pool = MagicMock(run=run_mock)
+
+        # Run the method.
+        tlsa_record = AuthorizationClient.resolve_tlsa_record('dns_name', time.monotonic() + 10)
+
+        # Run assertions
+        self.assertIsNone(tlsa_record)
+        self.assertEqual(AuthorizationClient.negative_tlsa_cache.stats()['entries'], 0)
+
+
+    @mock.patch("threading.get_ident")
+    def test_resolve_tlsa_record_tlsa_failure(self, m_gi):
+        """lib.authorization_client.AuthorizationClient.resolve_tlsa_record.tlsa_failure"""
+        # Create empty caches, and a mock verifier pool whose lookup fails with a TLSA failure
+        AuthorizationClient.tlsa_cache = TLSACache(10, 0, 100)
+        AuthorizationClient.negative_tlsa_cache = TLSACache(10, 30, 30)
+        AuthorizationClient.tlsa_flights = SingleFlight()
+        run_mock = MagicMock(return_value=(True, (None, "TLSAError('No TLSA records for dns_name')")))
+        AuthorizationClient.verifier_pool = MagicMock(run=run_mock)
+
+        # Run the method twice.
+        first_tlsa_record = AuthorizationClient.resolve_tlsa_record('dns_name', time.monotonic() + 10)
+        second_tlsa_record = AuthorizationClient.resolve_tlsa_record('dns_name', time.monotonic() + 10)
+
+        # Run assertions
+        self.assertIsNone(first_tlsa_record)
+        self.assertIsNone(second_tlsa_record)
+        run_mock.assert_called_once()
+        self.assertEqual(AuthorizationClient.negative_tlsa_cache.stats()['hits'], 1)
+
 
+    @mock.patch("threading.get_ident")
+    def test_resolve_tlsa_record_unexpected_failure(self, m_gi):
+        """lib.authorization_client.AuthorizationClient.resolve_tlsa_record.unexpected_failure"""
+        # Create empty caches, and a mock verifier pool whose lookup fails unexpectedly
+        AuthorizationClient.tlsa_cache = TLSACache(10, 0, 100)
+        AuthorizationClient.negative_tlsa_cache = TLSACache(10, 30, 30)
+        AuthorizationClient.tlsa_flights = SingleFlight()
+        run_mock = MagicMock(return_value=(True, (None, None)))
+        AuthorizationClient.verifier_pool = MagicMock(run=run_mock)
 
-    @mock.patch("dane_jwe_jws.authentication.Authentication.verify")
+        # Run the method.
+        tlsa_record = AuthorizationClient.resolve_tlsa_record('dns_name', time.monotonic() + 10)
+
+        # Run assertions
+        self.assertIsNone(tlsa_record)
+        self.assertEqual(AuthorizationClient.negative_tlsa_cache.stats()['entries'], 0)
+
+
+    @mock.patch("dane_discovery.dane.DANE.authenticate_tlsa")
+    @mock.patch("dane_discovery.dane.DANE.get_tlsa_records")
     @mock.patch("lib.util.logger.log_outside_main_process")
-    def test_authorize_pass(self, m_lomp, m_v):
+    def test_resolve_pass(self, m_lomp, m_gtr, m_at):
+        """lib.authorization_client.AuthorizationClient._resolve.pass"""
+        # Set return value for DANE.get_tlsa_records, where only the second record carries an entity certificate
+        m_gtr.return_value = [{'matching_type': 1, 'certificate_usage': 3},
+                              {'matching_type': 0, 'certificate_usage': 3, 'certificate_association': 'abcd'}]
+
+        # Create mock for queue
+        queue_put_mock = MagicMock()
+        queue_mock = MagicMock(put=queue_put_mock)
+
+        # Run the method.
+        AuthorizationClient._resolve(queue_mock, 'dns_name', 3)
+
+        # Run assertions
+        m_gtr.assert_called_with('dns_name')
+        tlsa_record = {'matching_type': 0, 'certificate_usage': 3, 'certificate_association': 'abcd',
+                       'certificate_digest': hashlib.sha256(b'abcd').hexdigest()}
+        m_at.assert_called_with('dns_name', tlsa_record)
+        queue_put_mock.assert_called_with((tlsa_record, None))
+
+
+    @mock.patch("dane_discovery.dane.DANE.authenticate_tlsa")
+    @mock.patch("dane_discovery.dane.DANE.get_tlsa_records")
+    @mock.patch("lib.util.logger.log_outside_main_process")
+    def test_resolve_fail_no_entity(self, m_lomp, m_gtr, m_at):
+        """lib.authorization_client.AuthorizationClient._resolve.fail_no_entity"""
+        # Set return value for DANE.get_tlsa_records, without any entity certificates
+        m_gtr.return_value = [{'matching_type': 1, 'certificate_usage': 3}]
+
+        # Create mock for queue
+        queue_put_mock = MagicMock()
+        queue_mock = MagicMock(put=queue_put_mock)
+
+        # Run the method.
+        AuthorizationClient._resolve(queue_mock, 'dns_name', 3)
+
+        # Run assertions
+        m_at.assert_not_called()
+        self.assertIsNone(queue_put_mock.call_args[0][0][0])
+        self.assertIn('TLSAError', queue_put_mock.call_args[0][0][1])
+
+
+    @mock.patch("dane_discovery.dane.DANE.authenticate_tlsa")
+    @mock.patch("dane_discovery.dane.DANE.get_tlsa_records")
+    @mock.patch("lib.util.logger.log_outside_main_process")
+    def test_resolve_fail_tlsa(self, m_lomp, m_gtr, m_at):
+        """lib.authorization_client.AuthorizationClient._resolve.fail_tlsa"""
+        # Set side effect for DANE.get_tlsa_records
+        m_gtr.side_effect = TLSAError('No TLSA records for dns_name')
+
+        # Create mock for queue
+        queue_put_mock = MagicMock()
+        queue_mock = MagicMock(put=queue_put_mock)
+
+        # Run the method.
+        AuthorizationClient._resolve(queue_mock, 'dns_name', 3)
+
+        # Run assertions
+        m_at.assert_not_called()
+        self.assertIsNone(queue_put_mock.call_args[0][0][0])
+        self.assertIn('TLSAError', queue_put_mock.call_args[0][0][1])
+
+
+    @mock.patch("dane_discovery.dane.DANE.authenticate_tlsa")
+    @mock.patch("dane_discovery.dane.DANE.get_tlsa_records")
+    @mock.patch("lib.util.logger.log_outside_main_process")
+    def test_resolve_fail_authentication(self, m_lomp, m_gtr, m_at):
+        """lib.authorization_client.AuthorizationClient._resolve.fail_authentication"""
+        # Set return value for DANE.get_tlsa_records and side effect for DANE.authenticate_tlsa
+        m_gtr.return_value = [{'matching_type': 0, 'certificate_usage': 3}]
+        m_at.side_effect = ValueError('no DNSSEC')
+
+        # Create mock for queue
+        queue_put_mock = MagicMock()
+        queue_mock = MagicMock(put=queue_put_mock)
+
+        # Run the method.
+        AuthorizationClient._resolve(queue_mock, 'dns_name', 3)
+
+        # Run assertions
+        self.assertIsNone(queue_put_mock.call_args[0][0][0])
+        self.assertIn('TLSAError', queue_put_mock.call_args[0][0][1])
+
+
+    @mock.patch("dane_discovery.dane.DANE.authenticate_tlsa")
+    @mock.patch("dane_discovery.dane.DANE.get_tlsa_records")
+    @mock.patch("lib.util.logger.log_outside_main_process")
+    def test_resolve_fail_unexpected(self, m_lomp, m_gtr, m_at):
+        """lib.authorization_client.AuthorizationClient._resolve.fail_unexpected"""
+        # Set side effect for DANE.get_tlsa_records
+        m_gtr.side_effect = Exception()
+
+        # Create mock for queue
+        queue_put_mock = MagicMock()
+        queue_mock = MagicMock(put=queue_put_mock)
+
+        # Run the method.
+        AuthorizationClient._resolve(queue_mock, 'dns_name', 3)
+
+        # Run assertions
+        queue_put_mock.assert_called_with((None, None))
+
+
+    @mock.patch("lib.authorization_client.AuthorizationClient._verify_signature")
+    @mock.patch("lib.util.logger.log_outside_main_process")
+    def test_authorize_pass(self, m_lomp, m_vs):
         """lib.authorization_client.AuthorizationClient._authorize.pass"""
         # Create mock for queue
         queue_put_mock = MagicMock()
         queue_mock = MagicMock(put=queue_put_mock)
 
         # Run the method.
-        AuthorizationClient._authorize(queue_mock, 'unusually readable payload', 3)
+        AuthorizationClient._authorize(queue_mock, 'unusually readable payload', {'ttl': 60}, 3)
 
         # Run assertions
-        m_v.assert_called_with('unusually readable payload')
+        m_vs.assert_called_with('unusually readable payload', {'ttl': 60})
         queue_put_mock.assert_called_with(True)
 
 
-    @mock.patch("dane_discovery.exceptions.TLSAError.__init__")
-    @mock.patch("dane_jwe_jws.authentication.Authentication.verify")
+    @mock.patch("lib.authorization_client.AuthorizationClient._verify_signature")
     @mock.patch("lib.util.logger.log_outside_main_process")
-    def test_authorize_fail_tlsa(self, m_lomp, m_v, m_i):
-        """lib.authorization_client.AuthorizationClient._authorize.fail_tlsa"""
-        # Set return value to None so as to not cause errors
-        m_i.return_value = None
-
-        # Set side effect for Authentication.verify
-        def authentication_verify_side_effect(*args, **kwargs):
-            raise TLSAError()
-        m_v.side_effect = authentication_verify_side_effect
+    def test_authorize_fail_signature(self, m_lomp, m_vs):
+        """lib.authorization_client.AuthorizationClient._authorize.fail_signature"""
+        # Set side effect for AuthorizationClient._verify_signature
+        m_vs.side_effect = InvalidJWSSignature()
 
         # Create mock for queue
         queue_put_mock = MagicMock()
         queue_mock = MagicMock(put=queue_put_mock)
 
         # Run the method.
-        AuthorizationClient._authorize(queue_mock, 'unusually readable payload', 3)
+        AuthorizationClient._authorize(queue_mock, 'unusually readable payload', {'ttl': 60}, 3)
 
         # Run assertions
-        m_v.assert_called_with('unusually readable payload')
+        m_vs.assert_called_with('unusually readable payload', {'ttl': 60})
         queue_put_mock.assert_called_with(False)
 
 
-    @mock.patch("dane_discovery.exceptions.TLSAError.__init__")
-    @mock.patch("dane_jwe_jws.authentication.Authentication.verify")
+    @mock.patch("lib.authorization_client.AuthorizationClient._verify_signature")
     @mock.patch("lib.util.logger.log_outside_main_process")
-    def test_authorize_fail_unexpected(self, m_lomp, m_v, m_i):
+    def test_authorize_fail_unexpected(self, m_lomp, m_vs):
         """lib.authorization_client.AuthorizationClient._authorize.fail_unexpected"""
-        # Set return value to None so as to not cause errors
-        m_i.return_value = None
-
-        # Set side effect for Authentication.verify
-        def authentication_verify_side_effect(*args, **kwargs):
-            raise Exception()
-        m_v.side_effect = authentication_verify_side_effect
+        # Set side effect for AuthorizationClient._verify_signature
+        m_vs.side_effect = Exception()
 
         # Create mock for queue
         queue_put_mock = MagicMock()
         queue_mock = MagicMock(put=queue_put_mock)
 
         # Run the method.
-        AuthorizationClient._authorize(queue_mock, 'unusually readable payload', 3)
+        AuthorizationClient._authorize(queue_mock, 'unusually readable payload', {'ttl': 60}, 3)
 
         # Run assertions
-        m_v.assert_called_with('unusually readable payload')
+        m_vs.assert_called_with('unusually readable payload', {'ttl': 60})
         queue_put_mock.assert_called_with(False)
 
 
-class MockMultiprocessingContext:
+    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.authorization_client.AuthorizationClient._build_key")
+    @mock.patch("lib.authorization_client.JWS")
+    def test_verify_signature_key_cached(self, m_jws, m_bk, m_eg):
+        """lib.authorization_client.AuthorizationClient._verify_signature.key_cached"""
+        # Make sure the key cache gets created fresh, and set return values for environment.get and _build_key
+        AuthorizationClient.key_cache = None
+        m_eg.return_value = 10
+        m_bk.return_value = 'the key'
+        jws_token = MagicMock()
+        m_jws.return_value = jws_token
+        tlsa_record = {'name': 'dns_name.', 'certificate_digest': 'digest1'}
+
+        # Run the method twice with the same record
+        AuthorizationClient._verify_signature('payload one', tlsa_record)
+        AuthorizationClient._verify_signature('payload two', tlsa_record)
+
+        # Run assertions
+        m_eg.assert_called_once_with('KEY_CACHE_MAX_ENTRIES')
+        m_bk.assert_called_once_with(tlsa_record)
+        self.assertEqual(jws_token.deserialize.call_args_list, [mock.call('payload one'), mock.call('payload two')])
+        jws_token.verify.assert_called_with('the key')
+
+        # Run again with a changed record, which should rebuild the key
+        changed_record = {'name': 'dns_name.', 'certificate_digest': 'digest2'}
+        AuthorizationClient._verify_signature('payload three', changed_record)
+        m_bk.assert_called_with(changed_record)
+        self.assertEqual(m_bk.call_count, 2)
+        self.assertEqual(AuthorizationClient.key_cache.stats()['invalidations'], 1)
+        AuthorizationClient.key_cache = None
+
+
+    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.authorization_client.AuthorizationClient._build_key")
+    def test_verify_signature_compact_bytes(self, m_bk, m_eg):
+        """lib.authorization_client.AuthorizationClient._verify_signature.compact_bytes"""
+        # Make sure the key cache gets created fresh, and sign a compact message with a real key
+        AuthorizationClient.key_cache = None
+        m_eg.return_value = 10
+        key = JWK.generate(kty='EC', crv='P-256')
+        m_bk.return_value = key
+        jws_token = JWS(b'sensor data')
+        jws_token.add_signature(key, None, json.dumps({'alg': 'ES256'}))
+        message_payload = jws_token.serialize(compact=True).encode()
+
+        # Run the method with a good signature, then with a tampered one
+        AuthorizationClient._verify_signature(message_payload, {'name': 'dns_name.', 'certificate_digest': 'digest'})
+        with self.assertRaises(InvalidJWSSignature):
+            AuthorizationClient._verify_signature(message_payload[:-4] + b'AAAA',
+                                                  {'name': 'dns_name.', 'certificate_digest': 'digest'})
+        AuthorizationClient.key_cache = None
+
+
+    @mock.patch("lib.authorization_client.AuthorizationClient._verify_signature")
+    def test_verify_signature(self, m_vs):
+        """lib.authorization_client.AuthorizationClient.verify_signature"""
+        # Set side effect for AuthorizationClient._verify_signature, which only fails the second time
+        m_vs.side_effect = [None, InvalidJWSSignature()]
+
+        # Run the method twice, and run assertions
+        self.assertTrue(AuthorizationClient.verify_signature('payload', {'name': 'dns_name.'}))
+        self.assertFalse(AuthorizationClient.verify_signature('payload', {'name': 'dns_name.'}))
+        m_vs.assert_called_with('payload', {'name': 'dns_name.'})
+
+
+    @mock.patch("dane_jwe_jws.util.Util.get_name_from_dns_uri")
+    @mock.patch("lib.util.environment.CONFIG")
+    def test_prepare(self, m_c, m_gnfdi):
+        """lib.authorization_client.AuthorizationClient.prepare"""
+        # Set return values for util.get_name_from_dns_uri and the compiled config
+        m_gnfdi.return_value = 'jerry'
+        m_c.DNS_WHITELIST = Whitelist(['jerry'])
+
+        # Run the method for a compact JWS message (the protected header is {"x5u": "jerry"}), and for one that isn't
+        details = {}
+        prepared = AuthorizationClient.prepare(MagicMock(payload=b'eyJ4NXUiOiAiamVycnkifQ.cGF5.c2ln'), details)
+        dns_name, verification_payload, exception = AuthorizationClient.prepare(MagicMock(payload='not json'))
+
+        # Run assertions, nothing is verified
+        self.assertEqual(prepared, ('jerry', b'eyJ4NXUiOiAiamVycnkifQ.cGF5.c2ln', None))
+        self.assertEqual(details, {'dns_name': 'jerry', 'payload_segment': b'cGF5'})
+        self.assertEqual((dns_name, verification_payload), (None, None))
+        self.assertIsInstance(exception, JSONDecodeError)
+
+
+    @mock.patch.dict(os.environ, {'DNS_WHITELIST': 'ksu._device.example.com', 'MQTT_SENDER_TOPICS': 'verified',
+                                  'AUTH_ENGINE': 'asyncio'})
+    @mock.patch("lib.async_engine.AsyncEngine.__init__")
+    @mock.patch("lib.tlsa_refresher.TLSARefresher.start")
+    @mock.patch("lib.verifier_pool.VerifierPool.start")
+    @mock.patch("lib.worker_pool.WorkerPool.start")
+    @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
+    def test_initialize_asyncio(self, m_i, m_ps, m_vps, m_trs, m_aei):
+        """lib.authorization_client.AuthorizationClient.initialize.asyncio"""
+        # Set return values to None so as to not cause errors
+        m_i.return_value = None
+        m_aei.return_value = None
+
+        # Make sure that AuthorizationClient is not initialized, and has no pools
+        AuthorizationClient.initialized = False
+        AuthorizationClient.pool = None
+        AuthorizationClient.verifier_pool = None
+
+        # Run the method
+        try:
+            AuthorizationClient.initialize()
+            engine = AuthorizationClient.engine
+        finally:
+            AuthorizationClient.engine = None
+
+        # Run assertions, the senders run without loops of their own, and the pools are left to the engine
+        from lib.async_engine import AsyncEngine
+        from lib.single_flight import AsyncSingleFlight
+        m_i.assert_called_with(0, False)
+        m_ps.assert_not_called()
+        m_vps.assert_not_called()
+        m_aei.assert_called_once_with(1000, mock.ANY)
+        self.assertIsInstance(engine, AsyncEngine)
+        self.assertIsNone(AuthorizationClient.pool)
+        self.assertIsNone(AuthorizationClient.verifier_pool)
+        self.assertIsInstance(AuthorizationClient.tlsa_flights, AsyncSingleFlight)
+        self.assertEqual(AuthorizationClient.tlsa_refresher.refresh, engine.refresh_tlsa_record)
+
+
+    def test_handle_message_staged(self):
+        """lib.authorization_client.AuthorizationClient.handle_message.staged"""
+        # Create mock pipeline with submit mock and attach to AuthorizationClient
+        submit = MagicMock(return_value=True)
+        AuthorizationClient.pool = MagicMock()
+        AuthorizationClient.pipeline = MagicMock(submit=submit)
+
+        # Run the method
+        message = MagicMock(payload=b'DOOR STUCK')
+        try:
+            AuthorizationClient.handle_message(message)
+        finally:
+            AuthorizationClient.pipeline = None
+
+        # Run assertions, the message goes to the pipeline rather than the pool
+        submit.assert_called_once_with(message)
+        AuthorizationClient.pool.submit.assert_not_called()
+
+
+    @mock.patch("threading.get_ident")
+    def test_resolve_tlsa_record_resolver_pool(self, m_gi):
+        """lib.authorization_client.AuthorizationClient.resolve_tlsa_record.resolver_pool"""
+        # Create an empty cache, and mock verifier and resolver pools, the latter of which resolves the record
+        AuthorizationClient.tlsa_cache = TLSACache(10, 0, 100)
+        AuthorizationClient.negative_tlsa_cache = TLSACache(10, 30, 30)
+        AuthorizationClient.tlsa_flights = SingleFlight()
+        AuthorizationClient.verifier_pool = MagicMock()
+        AuthorizationClient.resolver_pool = MagicMock(run=MagicMock(return_value=(True, ({'ttl': 60}, None))))
+        m_gi.return_value = 300
+
+        # Run the method.
+        try:
+            tlsa_record = AuthorizationClient.resolve_tlsa_record('dns_name', time.monotonic() + 10)
+            run_mock = AuthorizationClient.resolver_pool.run
+        finally:
+            AuthorizationClient.resolver_pool = None
+
+        # Run assertions, the verifier pool is left to signature checks
+        self.assertEqual(tlsa_record, {'ttl': 60})
+        self.assertEqual(run_mock.call_args[0][:2], (AuthorizationClient._resolve, ('dns_name', 300)))
+        AuthorizationClient.verifier_pool.run.assert_not_called()
+
+
+    @mock.patch.dict(os.environ, {'DNS_WHITELIST': 'ksu._device.example.com', 'MQTT_SENDER_TOPICS': 'verified',
+                                  'AUTH_ENGINE': 'staged', 'AUTH_STAGE_RESOLVE_WORKERS': '8'})
+    @mock.patch("lib.staged_pipeline.StagedPipeline.start")
+    @mock.patch("lib.tlsa_refresher.TLSARefresher.start")
+    @mock.patch("lib.verifier_pool.VerifierPool.start")
+    @mock.patch("lib.worker_pool.WorkerPool.start")
+    @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
+    def test_initialize_staged(self, m_i, m_ps, m_vps, m_trs, m_sps):
+        """lib.authorization_client.AuthorizationClient.initialize.staged"""
+        # Set return value to None so as to not cause errors
+        m_i.return_value = None
+
+        # Make sure that AuthorizationClient is not initialized, and has no pools
+        AuthorizationClient.initialized = False
+        AuthorizationClient.pool = None
+
+        # Run the method
+        try:
+            AuthorizationClient.initialize()
+            pipeline = AuthorizationClient.pipeline
+            resolver_pool = AuthorizationClient.resolver_pool
+        finally:
+            AuthorizationClient.pipeline = None
+            AuthorizationClient.resolver_pool = None
+
+        # Run assertions, each stage is sized on its own, and TLSA records are looked up on processes of their own
+        from lib.staged_pipeline import StagedPipeline
+        m_sps.assert_called_once()
+        self.assertIsInstance(pipeline, StagedPipeline)
+        self.assertEqual({name: stage.size for name, stage in pipeline.stages.items()},
+                         {'parse': 2, 'resolve': 8, 'verify': 4, 'publish': 2})
+        self.assertIsNone(AuthorizationClient.pool)
+        self.assertIsInstance(resolver_pool, VerifierPool)
+        self.assertEqual(resolver_pool.size, 8)
+        self.assertEqual(m_vps.call_count, 2)
+
+
+    def test_handle_message_ordered_topic(self):
+        """lib.authorization_client.AuthorizationClient.handle_message.ordered_topic"""
+        # Create mock keyed executor and attach to AuthorizationClient, keeping messages in order by topic
+        submit = MagicMock(return_value=True)
+        AuthorizationClient.pool = MagicMock(submit=submit)
+        AuthorizationClient.order_key = 'topic'
+
+        # Run the method
+        message = MagicMock(topic='sensors/jerry', payload=b'DOOR STUCK')
+        try:
+            AuthorizationClient.handle_message(message)
+        finally:
+            AuthorizationClient.order_key = None
+
+        # Run assertions
+        submit.assert_called_once_with('sensors/jerry', AuthorizationClient.run, message)
+
+
+    @mock.patch.dict(os.environ, {'DNS_WHITELIST': 'ksu._device.example.com', 'MQTT_SENDER_TOPICS': 'verified',
+                                  'AUTH_ORDER_KEY': 'topic', 'MQTT_SENDER_CONNECTIONS': '4',
+                                  'MQTT_SENDER_DISTRIBUTION': 'round-robin'})
+    @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
+    def test_initialize_ordered_round_robin(self, m_i):
+        """lib.authorization_client.AuthorizationClient.initialize.ordered_round_robin"""
+        # Make sure that AuthorizationClient is not initialized
+        AuthorizationClient.initialized = False
+
+        # Run the method, and run assertions, since messages spread round-robin across connections can't stay in
+        # order, and no connection was opened
+        with self.assertRaises(ValueError):
+            AuthorizationClient.initialize()
+        m_i.assert_not_called()
+        self.assertIsNone(AuthorizationClient.order_key)
+
+
+    @mock.patch("lib.util.environment.CONFIG")
+    def test_forward_ordered_topic(self, m_c):
+        """lib.authorization_client.AuthorizationClient.forward.ordered_topic"""
+        # Set the compiled config, and attach a mock sender and router to AuthorizationClient
+        m_c.DISABLE_SENDER = False
+        AuthorizationClient.sender = MagicMock()
+        AuthorizationClient.router = MagicMock(route=MagicMock(return_value=(('jws', ('verified',)),)))
+        AuthorizationClient.order_key = 'topic'
+
+        # Run the method
+        message = MagicMock(topic='sensors/jerry', payload=b'DOOR STUCK')
+        try:
+            AuthorizationClient.forward(message, {'dns_name': 'jerry'})
+        finally:
+            AuthorizationClient.order_key = None
+
+        # Run assertions, the message is kept on its source topic's connection
+        AuthorizationClient.sender.publish.assert_called_once_with(b'DOOR STUCK', key='sensors/jerry',
+                                                                   topics=('verified',))
+
+
+    def test_handle_message_ordered_dns_name(self):
+        """lib.authorization_client.AuthorizationClient.handle_message.ordered_dns_name"""
+        # Create mock parser and keyed executor and attach to AuthorizationClient, keeping messages in order by DNS name
+        AuthorizationClient.parser = MagicMock(submit=MagicMock(return_value=True))
+        AuthorizationClient.pool = MagicMock()
+        AuthorizationClient.order_key = 'dns_name'
+
+        # Run the method
+        message = MagicMock(topic='sensors', payload=b'DOOR STUCK')
+        try:
+            AuthorizationClient.handle_message(message)
+            parser = AuthorizationClient.parser
+        finally:
+            AuthorizationClient.order_key = None
+            AuthorizationClient.parser = None
+
+        # Run assertions, the message is left to the parser rather than parsed on the listener's thread
+        parser.submit.assert_called_once_with(AuthorizationClient._parse_ordered, message)
+        AuthorizationClient.pool.submit.assert_not_called()
+
+
+    @mock.patch("logging.debug")
+    @mock.patch("lib.util.logger.SETUP_OVER", True)
+    @mock.patch("lib.authorization_client.AuthorizationClient.prepare")
+    def test_parse_ordered(self, m_p, m_ld):
+        """lib.authorization_client.AuthorizationClient._parse_ordered"""
+        # Set return values for prepare, which only whitelists the first message
+        m_p.side_effect = [('jerry', b'compact', None), (None, None, None)]
+
+        # Create mock keyed executor and attach to AuthorizationClient
+        submit = MagicMock(return_value=True)
+        AuthorizationClient.pool = MagicMock(submit=submit)
+
+        # Run the method twice
+        message = MagicMock(topic='sensors', payload=b'DOOR STUCK')
+        AuthorizationClient._parse_ordered(message)
+        AuthorizationClient._parse_ordered(MagicMock(topic='sensors', payload=b'NOT WHITELISTED'))
+
+        # Run assertions, the message is queued with what was parsed, and the other never is
+        m_p.assert_called_with(mock.ANY, {})
+        self.assertEqual(m_p.call_count, 2)
+        submit.assert_called_once_with('jerry', AuthorizationClient.deliver, message, {}, b'compact')
+
+
+    @mock.patch("logging.info")
+    @mock.patch("logging.debug")
+    @mock.patch("lib.authorization_client.AuthorizationClient.forward")
+    @mock.patch("lib.authorization_client.AuthorizationClient.verify_authentication_with_timeout")
+    def test_deliver(self, m_vawt, m_f, m_ld, m_li):
+        """lib.authorization_client.AuthorizationClient.deliver"""
+        # Set return value for verify_authentication_with_timeout, which only passes the first time
+        m_vawt.side_effect = [True, False]
+
+        # Run the method twice
+        message = MagicMock(topic='sensors', payload=b'DOOR STUCK')
+        AuthorizationClient.deliver(message, {'dns_name': 'jerry'}, b'compact')
+        AuthorizationClient.deliver(message, {'dns_name': 'jerry'}, b'compact')
+
+        # Run assertions, only the authorized one is forwarded
+        m_vawt.assert_called_with(b'compact', 'jerry')
+        m_f.assert_called_once_with(message, {'dns_name': 'jerry'})
+
+
+    @mock.patch.dict(os.environ, {'DNS_WHITELIST': 'ksu._device.example.com', 'MQTT_SENDER_TOPICS': 'verified',
+                                  'AUTH_ORDER_KEY': 'dns_name'})
+    @mock.patch("lib.keyed_executor.KeyedExecutor.start")
+    @mock.patch("lib.tlsa_refresher.TLSARefresher.start")
+    @mock.patch("lib.verifier_pool.VerifierPool.start")
+    @mock.patch("lib.worker_pool.WorkerPool.start")
+    @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
+    def test_initialize_ordered(self, m_i, m_ps, m_vps, m_trs, m_kes):
+        """lib.authorization_client.AuthorizationClient.initialize.ordered"""
+        # Set return value to None so as to not cause errors
+        m_i.return_value = None
+
+        # Make sure that AuthorizationClient is not initialized
+        AuthorizationClient.initialized = False
+
+        # Run the method
+        try:
+            AuthorizationClient.initialize()
+            order_key = AuthorizationClient.order_key
+            parser = AuthorizationClient.parser
+        finally:
+            AuthorizationClient.order_key = None
+            AuthorizationClient.parser = None
+
+        # Run assertions, messages are parsed on a single thread so they stay in order
+        m_kes.assert_called_once()
+        self.assertIsInstance(AuthorizationClient.pool, KeyedExecutor)
+        self.assertEqual(order_key, 'dns_name')
+        self.assertIsInstance(parser, WorkerPool)
+        self.assertEqual(parser.size, 1)
+        m_ps.assert_called_once()
+
+
+    @mock.patch.dict(os.environ, {'DNS_WHITELIST': 'ksu._device.example.com', 'MQTT_SENDER_TOPICS': 'verified',
+                                  'AUTH_ORDER_KEY': 'device'})
+    @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
+    def test_initialize_ordered_invalid(self, m_i):
+        """lib.authorization_client.AuthorizationClient.initialize.ordered_invalid"""
+        # Set return value to None so as to not cause errors
+        m_i.return_value = None
+
+        # Make sure that AuthorizationClient is not initialized
+        AuthorizationClient.initialized = False
+
+        # Run the method, and run assertions
+        with self.assertRaises(ValueError):
+            AuthorizationClient.initialize()
+        self.assertIsNone(AuthorizationClient.order_key)
+
+
+    @mock.patch("lib.util.logger.SETUP_OVER", True)
+    @mock.patch("logging.debug")
+    @mock.patch("lib.authorization_client.AuthorizationClient.authorized")
+    @mock.patch("lib.authorization_client.AuthorizationClient.prepare")
+    def test_run_batched(self, m_p, m_a, m_ld):
+        """lib.authorization_client.AuthorizationClient.run.batched"""
+        # Set return values for prepare, which only whitelists the first message
+        m_p.side_effect = [('jerry', b'compact', None), (None, None, None)]
+        AuthorizationClient.batcher = MagicMock()
+
+        # Run the method twice
+        message = MagicMock(topic='sensors', payload=b'DOOR STUCK')
+        try:
+            AuthorizationClient.run(message)
+            AuthorizationClient.run(MagicMock(topic='sensors', payload=b'NOT WHITELISTED'))
+            batcher = AuthorizationClient.batcher
+        finally:
+            AuthorizationClient.batcher = None
+
+        # Run assertions, the message is added to its DNS name's batch rather than verified
+        batcher.add.assert_called_once_with('jerry', (message, {}, b'compact'))
+        m_a.assert_not_called()
+
+
+    @mock.patch("logging.info")
+    @mock.patch("logging.debug")
+    @mock.patch("lib.util.environment.CONFIG")
+    @mock.patch("lib.authorization_client.AuthorizationClient.forward")
+    @mock.patch("lib.authorization_client.AuthorizationClient.resolve_tlsa_record")
+    def test_deliver_batch(self, m_rtr, m_f, m_c, m_ld, m_li):
+        """lib.authorization_client.AuthorizationClient.deliver_batch"""
+        # Set return values for resolve_tlsa_record and the verifier pool, where the second message fails
+        m_c.DNS_TIMEOUT_SECONDS = 5
+        m_rtr.return_value = {'name': 'jerry.'}
+        AuthorizationClient.verifier_pool = MagicMock(run=MagicMock(return_value=(True, [True, False, True])))
+
+        # Run the method
+        batch = [(MagicMock(topic=f'sensors/{index}'), {'dns_name': 'jerry'}, f'payload {index}') for index in range(3)]
+        AuthorizationClient.deliver_batch('jerry', batch)
+
+        # Run assertions, the record is resolved and the signatures are checked once for the whole batch
+        m_rtr.assert_called_once_with('jerry', mock.ANY)
+        run_args = AuthorizationClient.verifier_pool.run.call_args[0]
+        self.assertEqual(run_args[:2], (AuthorizationClient._authorize_batch,
+                                        (['payload 0', 'payload 1', 'payload 2'], {'name': 'jerry.'}, mock.ANY)))
+        self.assertEqual(m_f.call_args_list, [mock.call(batch[0][0], batch[0][1]), mock.call(batch[2][0], batch[2][1])])
+
+
+    @mock.patch("logging.debug")
+    @mock.patch("lib.util.environment.CONFIG")
+    @mock.patch("lib.authorization_client.AuthorizationClient.forward")
+    @mock.patch("lib.authorization_client.AuthorizationClient.resolve_tlsa_record")
+    def test_deliver_batch_timeout(self, m_rtr, m_f, m_c, m_ld):
+        """lib.authorization_client.AuthorizationClient.deliver_batch.timeout"""
+        # Set return values for resolve_tlsa_record and the verifier pool, which times out
+        m_c.DNS_TIMEOUT_SECONDS = 5
+        m_rtr.return_value = {'name': 'jerry.'}
+        AuthorizationClient.verifier_pool = MagicMock(run=MagicMock(return_value=(False, None)))
+
+        # Run the method
+        AuthorizationClient.deliver_batch('jerry', [(MagicMock(), {'dns_name': 'jerry'}, 'payload')])
+
+        # Run assertions
+        m_f.assert_not_called()
+
+
+    @mock.patch("logging.debug")
+    @mock.patch("lib.util.logger.log_outside_main_process")
+    @mock.patch("lib.authorization_client.AuthorizationClient._verify_signature")
+    def test_authorize_batch(self, m_vs, m_lomp, m_ld):
+        """lib.authorization_client.AuthorizationClient._authorize_batch"""
+        # Set side effect for AuthorizationClient._verify_signature, where the second and third messages fail
+        m_vs.side_effect = [None, InvalidJWSSignature(), RuntimeError('unexpected'), None]
+
+        # Run the method
+        queue = MagicMock()
+        AuthorizationClient._authorize_batch(queue, ['one', 'two', 'three', 'four'], {'name': 'jerry.'}, 300)
+
+        # Run assertions
+        queue.put.assert_called_once_with([True, False, False, True])
+        self.assertEqual(m_vs.call_count, 4)
+
+
+    def test_submit_batch(self):
+        """lib.authorization_client.AuthorizationClient._submit_batch"""
+        # Create mock pool and attach to AuthorizationClient
+        AuthorizationClient.pool = MagicMock(submit=MagicMock(return_value=True))
+
+        # Run the method, without and with messages kept in order by DNS name
+        AuthorizationClient._submit_batch('jerry', ['batch'])
+        AuthorizationClient.order_key = 'dns_name'
+        try:
+            AuthorizationClient._submit_batch('jerry', ['batch'])
+        finally:
+            AuthorizationClient.order_key = None
+
+        # Run assertions
+        self.assertEqual(AuthorizationClient.pool.submit.call_args_list, [
+            mock.call(AuthorizationClient.deliver_batch, 'jerry', ['batch']),
+            mock.call('jerry', AuthorizationClient.deliver_batch, 'jerry', ['batch']),
+        ])
+
+
+    @mock.patch.dict(os.environ, {'DNS_WHITELIST': 'ksu._device.example.com', 'MQTT_SENDER_TOPICS': 'verified',
+                                  'AUTH_BATCH_MAX_SIZE': '32', 'AUTH_BATCH_MAX_WAIT_MS': '20'})
+    @mock.patch("lib.batcher.Batcher.start")
+    @mock.patch("lib.tlsa_refresher.TLSARefresher.start")
+    @mock.patch("lib.verifier_pool.VerifierPool.start")
+    @mock.patch("lib.worker_pool.WorkerPool.start")
+    @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
+    def test_initialize_batched(self, m_i, m_ps, m_vps, m_trs, m_bs):
+        """lib.authorization_client.AuthorizationClient.initialize.batched"""
+        # Set return value to None so as to not cause errors
+        m_i.return_value = None
+
+        # Make sure that AuthorizationClient is not initialized
+        AuthorizationClient.initialized = False
+
+        # Run the method
+        try:
+            AuthorizationClient.initialize()
+            batcher = AuthorizationClient.batcher
+        finally:
+            AuthorizationClient.batcher = None
+
+        # Run assertions
+        m_bs.assert_called_once()
+        self.assertEqual((batcher.max_size, batcher.max_wait), (32, 0.02))
+        self.assertEqual(batcher.submit, AuthorizationClient._submit_batch)
+
+
+    @mock.patch.dict(os.environ, {'DNS_WHITELIST': 'ksu._device.example.com', 'MQTT_SENDER_TOPICS': 'verified',
+                                  'AUTH_ENGINE': 'staged'})
+    @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
+    def test_initialize_staged_unsupported(self, m_i):
+        """lib.authorization_client.AuthorizationClient.initialize.staged_unsupported"""
+        # Make sure that AuthorizationClient is not initialized
+        AuthorizationClient.initialized = False
+
+        # Run the method with ordering, then batching, and run assertions, since the pipeline can't honor either
+        for name, value in [('AUTH_ORDER_KEY', 'dns_name'), ('AUTH_BATCH_MAX_SIZE', '32')]:
+            with mock.patch.dict(os.environ, {name: value}), self.assertRaises(ValueError):
+                AuthorizationClient.initialize()
+        m_i.assert_not_called()
+        self.assertIsNone(AuthorizationClient.pipeline)
+
+
+    @mock.patch.dict(os.environ, {'DNS_WHITELIST': 'ksu._device.example.com', 'MQTT_SENDER_TOPICS': 'verified',
+                                  'AUTH_ENGINE': 'asyncio'})
+    @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
+    def test_initialize_asyncio_unsupported(self, m_i):
+        """lib.authorization_client.AuthorizationClient.initialize.asyncio_unsupported"""
+        # Make sure that AuthorizationClient is not initialized
+        AuthorizationClient.initialized = False
+
+        # Run the method with ordering, then batching, and run assertions, since the engine can't honor either
+        for name, value in [('AUTH_ORDER_KEY', 'topic'), ('AUTH_BATCH_MAX_SIZE', '32')]:
+            with mock.patch.dict(os.environ, {name: value}), self.assertRaises(ValueError):
+                AuthorizationClient.initialize()
+        m_i.assert_not_called()
+        self.assertIsNone(AuthorizationClient.engine)
+
+
+    @mock.patch.dict(os.environ, {'DNS_WHITELIST': 'ksu._device.example.com', 'MQTT_SENDER_TOPICS': 'verified',
+                                  'AUTH_BATCH_MAX_SIZE': '32', 'AUTH_ORDER_KEY': 'topic'})
+    @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
+    def test_initialize_batched_invalid(self, m_i):
+        """lib.authorization_client.AuthorizationClient.initialize.batched_invalid"""
+        # Set return value to None so as to not cause errors
+        m_i.return_value = None
+
+        # Make sure that AuthorizationClient is not initialized
+        AuthorizationClient.initialized = False
+
+        # Run the method, and run assertions, since batches can't be kept in order by topic
+        with self.assertRaises(ValueError):
+            AuthorizationClient.initialize()
+        self.assertIsNone(AuthorizationClient.batcher)
+
 
-    def __init__(self, queue_mock, process_mock):
-        self.queue_mock = queue_mock
-        self.process_mock = process_mock
-        self.queue_called_with = []
-        self.process_called_with = []
+    @mock.patch("logging.info")
+    def test_shutdown(self, m_li):
+        """lib.authorization_client.AuthorizationClient.shutdown"""
+        # Create mock pools and sender and attach to AuthorizationClient, as initialize would for the threaded engine
+        pool, verifier_pool, sender = MagicMock(), MagicMock(), MagicMock()
+        with mock.patch.multiple(AuthorizationClient, pool=pool, verifier_pool=verifier_pool, sender=sender,
+                                 parser=None, batcher=None, pipeline=None, resolver_pool=None, engine=None):
 
-    def Queue(self, **kwargs):
-        self.queue_called_with.append(kwargs)
-        return self.queue_mock
+            # Run the method
+            AuthorizationClient.shutdown()
 
-    def Process(self, **kwargs):
-        self.process_called_with.append(kwargs)
-        return self.process_mock
\ No newline at end of file
+        # Run assertions, everything that was started is stopped
+        pool.shutdown.assert_called_once_with(wait=False)
+        verifier_pool.shutdown.assert_called_once()
+        sender.shutdown.assert_called_once()
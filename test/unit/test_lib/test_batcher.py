@@ -0,0 +1,154 @@
+from unittest import mock, TestCase
+from unittest.mock import MagicMock
+from lib.batcher import Batcher
+import threading
+import time
+
+
+class TestBatcher(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.batcher.Batcher.__init__.invalid"""
+        # Run the method with each invalid argument
+        with self.assertRaises(ValueError):
+            Batcher(0, 1, print, 10)
+        with self.assertRaises(ValueError):
+            Batcher(1, -1, print, 10)
+        with self.assertRaises(ValueError):
+            Batcher(1, 1, print, 0)
+        with self.assertRaises(ValueError):
+            Batcher(1, 1, print, 10, 'drop-everything')
+
+
+    @mock.patch("logging.info")
+    def test_add_full(self, m_li):
+        """lib.batcher.Batcher.add.full"""
+        # Create and start the batcher, with a wait long enough that only full batches go out
+        submitted = []
+        batcher = Batcher(3, 60, lambda key, items: submitted.append((key, items)), 10)
+        batcher.start()
+
+        # Run the method for two keys, one of which fills up
+        for item in range(3):
+            batcher.add('jerry', item)
+        batcher.add('tom', 'alone')
+        while not submitted:
+            time.sleep(0.001)
+
+        # Run assertions, the other key's batch is still open
+        self.assertEqual(submitted, [('jerry', [0, 1, 2])])
+        self.assertEqual(batcher.stats()['pending'], 1)
+
+        # Shut down, which submits what is left open
+        batcher.shutdown()
+        self.assertEqual(submitted, [('jerry', [0, 1, 2]), ('tom', ['alone'])])
+        stats = batcher.stats()
+        self.assertEqual((stats['batches'], stats['items'], stats['full_batches']), (2, 4, 1))
+        self.assertEqual((stats['average_batch_size'], stats['max_batch_size']), (2.0, 3))
+        self.assertEqual(stats['batch_sizes'], {3: 1, 1: 1})
+
+
+    @mock.patch("logging.info")
+    def test_add_timed_out(self, m_li):
+        """lib.batcher.Batcher.add.timed_out"""
+        # Create and start the batcher, with batches too large to ever fill up
+        submitted = threading.Event()
+        batches = []
+        def submit(key, items):
+            batches.append((key, items))
+            submitted.set()
+        batcher = Batcher(100, 0.01, submit, 10)
+        batcher.start()
+
+        # Run the method
+        batcher.add('jerry', 'one')
+        batcher.add('jerry', 'two')
+
+        # Run assertions, the batch goes out once it has waited long enough
+        self.assertTrue(submitted.wait(5))
+        batcher.shutdown()
+        self.assertEqual(batches, [('jerry', ['one', 'two'])])
+        self.assertEqual(batcher.stats()['full_batches'], 0)
+
+
+    @mock.patch("logging.error")
+    @mock.patch("logging.info")
+    def test_run_submit_exception(self, m_li, m_le):
+        """lib.batcher.Batcher._run.submit_exception"""
+        # Create and start the batcher, whose first submit raises
+        submit = MagicMock(side_effect=[RuntimeError('whoops'), None])
+        batcher = Batcher(1, 60, submit, 10)
+        batcher.start()
+
+        # Run the method twice
+        batcher.add('jerry', 'one')
+        batcher.add('jerry', 'two')
+        batcher.shutdown()
+
+        # Run assertions, the thread carried on
+        m_le.assert_called_once()
+        submit.assert_called_with('jerry', ['two'])
+
+
+    @mock.patch("logging.debug")
+    def test_add_overflow_drop_newest(self, m_ld):
+        """lib.batcher.Batcher.add.overflow_drop_newest"""
+        # Create thing, without starting it, so nothing is submitted
+        batcher = Batcher(2, 60, print, 3, 'drop-newest')
+
+        # Run the method past the queue size
+        added = [batcher.add('jerry', 1), batcher.add('jerry', 2), batcher.add('tom', 3), batcher.add('tom', 4)]
+
+        # Run assertions, the last item is dropped
+        self.assertEqual(added, [True, True, True, False])
+        self.assertEqual(list(batcher._ready), [('jerry', [1, 2], True)])
+        self.assertEqual(batcher._open['tom'][1], [3])
+        self.assertEqual((batcher.stats()['pending'], batcher.stats()['dropped']), (3, 1))
+
+
+    @mock.patch("logging.debug")
+    def test_add_overflow_drop_oldest(self, m_ld):
+        """lib.batcher.Batcher.add.overflow_drop_oldest"""
+        # Create thing, without starting it, so nothing is submitted
+        batcher = Batcher(2, 60, print, 3, 'drop-oldest')
+
+        # Run the method past the queue size, twice
+        for key, item in [('jerry', 1), ('jerry', 2), ('tom', 3), ('tom', 4), ('tom', 5)]:
+            self.assertTrue(batcher.add(key, item))
+
+        # Run assertions, the oldest items are dropped, along with the batch they emptied
+        self.assertEqual(list(batcher._ready), [('tom', [3, 4], True)])
+        self.assertEqual(batcher._open['tom'][1], [5])
+        self.assertEqual((batcher.stats()['pending'], batcher.stats()['dropped']), (3, 2))
+
+
+    @mock.patch("logging.info")
+    def test_add_overflow_block(self, m_li):
+        """lib.batcher.Batcher.add.overflow_block"""
+        # Create and start the batcher, whose submit holds up the thread until released
+        release = threading.Event()
+        batches = []
+        def submit(key, items):
+            release.wait(5)
+            batches.append((key, items))
+        batcher = Batcher(1, 60, submit, 2, 'block')
+        batcher.start()
+
+        # Run the method past the queue size on another thread, once the first batch is being submitted
+        batcher.add('jerry', 1)
+        batcher.add('jerry', 2)
+        batcher.add('jerry', 3)
+        adder = threading.Thread(target=batcher.add, args=('jerry', 4))
+        adder.start()
+
+        # Run assertions, the add blocks until a batch is submitted
+        adder.join(0.1)
+        self.assertTrue(adder.is_alive())
+        self.assertEqual(batcher.stats()['pending'], 2)
+        release.set()
+        adder.join(5)
+        self.assertFalse(adder.is_alive())
+        batcher.shutdown()
+        self.assertEqual(batches, [('jerry', [1]), ('jerry', [2]), ('jerry', [3]), ('jerry', [4])])
+        self.assertEqual(batcher.stats()['dropped'], 0)
@@ -0,0 +1,118 @@
+from unittest import mock, TestCase
+from unittest.mock import MagicMock
+from lib.connection_monitor import ConnectionMonitor
+import threading
+
+
+class TestConnectionMonitor(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.connection_monitor.ConnectionMonitor.__init__.invalid"""
+        with self.assertRaises(ValueError):
+            ConnectionMonitor(0, 60)
+        with self.assertRaises(ValueError):
+            ConnectionMonitor(10, 5)
+
+
+    @mock.patch("random.uniform")
+    @mock.patch("time.monotonic")
+    def test_attempt_backoff(self, m_m, m_u):
+        """lib.connection_monitor.ConnectionMonitor.attempt.backoff"""
+        # Create thing, and have the jitter always add its full half
+        monitor = ConnectionMonitor(1, 10)
+        m_m.return_value = 1000
+        m_u.side_effect = lambda low, high: high
+
+        # Run the method five times, then once more after connecting
+        delays = [monitor.attempt() for _ in range(5)]
+        monitor.connected()
+        reset = monitor.attempt()
+
+        # Run assertions, the wait doubles up to the maximum
+        self.assertEqual(delays, [1, 2, 4, 8, 10])
+        self.assertEqual(reset, 1)
+        self.assertEqual(monitor.seconds_until_retry(), 1)
+
+
+    @mock.patch("random.uniform")
+    def test_attempt_jitter(self, m_u):
+        """lib.connection_monitor.ConnectionMonitor.attempt.jitter"""
+        # Create thing, and have the jitter add nothing
+        monitor = ConnectionMonitor(4, 60)
+        m_u.return_value = 0
+
+        # Run the method
+        delay = monitor.attempt()
+
+        # Run assertions, the wait is never less than half
+        self.assertEqual(delay, 2)
+        m_u.assert_called_with(0, 2)
+
+
+    @mock.patch("logging.info")
+    @mock.patch("time.monotonic")
+    def test_connected_after_disconnect(self, m_m, m_li):
+        """lib.connection_monitor.ConnectionMonitor.connected.after_disconnect"""
+        # Create thing
+        monitor = ConnectionMonitor(1, 60)
+
+        # Run the methods, with two outages of 3 and 1 seconds
+        m_m.return_value = 1000
+        first = monitor.connected()
+        monitor.disconnected()
+        m_m.return_value = 1002
+        monitor.disconnected()
+        ongoing = monitor.stats()
+        m_m.return_value = 1003
+        second = monitor.connected()
+        monitor.disconnected()
+        m_m.return_value = 1004
+        monitor.connected()
+
+        # Run assertions
+        self.assertFalse(first)
+        self.assertTrue(second)
+        self.assertFalse(ongoing['connected'])
+        self.assertEqual(ongoing['disconnected_seconds'], 2)
+        self.assertEqual(monitor.stats(), {'connected': True, 'disconnects': 2, 'reconnect_attempts': 0,
+                                           'disconnected_seconds': 0.0, 'total_disconnected_seconds': 4,
+                                           'max_disconnected_seconds': 3})
+
+
+    @mock.patch("logging.info")
+    def test_wait_connected(self, m_li):
+        """lib.connection_monitor.ConnectionMonitor.wait_connected"""
+        # Create thing
+        monitor = ConnectionMonitor(1, 60)
+
+        # Run the method before connecting, once the connection is up from another thread, and once it is lost
+        before = monitor.wait_connected(0)
+        threading.Timer(0.01, monitor.connected).start()
+        up = monitor.wait_connected(5)
+        monitor.disconnected()
+        lost = monitor.wait_connected(0)
+
+        # Run assertions
+        self.assertFalse(before)
+        self.assertTrue(up)
+        self.assertFalse(lost)
+
+
+    @mock.patch("logging.warning")
+    def test_reconnect(self, m_lw):
+        """lib.connection_monitor.ConnectionMonitor.reconnect"""
+        # Create thing, and a client that can't connect the first time
+        monitor = ConnectionMonitor(1, 60)
+        client = MagicMock()
+        client.reconnect.side_effect = [ConnectionRefusedError(), None]
+
+        # Run the method twice
+        failed = monitor.reconnect(client)
+        opened = monitor.reconnect(client)
+
+        # Run assertions
+        self.assertFalse(failed)
+        self.assertTrue(opened)
+        m_lw.assert_called_once()
+        self.assertEqual(monitor.stats()['reconnect_attempts'], 2)
@@ -0,0 +1,68 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+from lib.key_cache import KeyCache
+
+
+class TestKeyCache(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.key_cache.KeyCache.__init__.invalid"""
+        with self.assertRaises(ValueError):
+            KeyCache(0)
+
+
+    def test_get_builds_once(self):
+        """lib.key_cache.KeyCache.get.builds_once"""
+        # Create thing and a mock build function
+        cache = KeyCache(10)
+        build = MagicMock(return_value='key')
+
+        # Run the method twice
+        first = cache.get('device.example.com', 'digest', build, 'record')
+        second = cache.get('device.example.com', 'digest', build, 'record')
+
+        # Run assertions
+        self.assertEqual((first, second), ('key', 'key'))
+        build.assert_called_once_with('record')
+        self.assertEqual(cache.stats(), {'entries': 1, 'max_entries': 10, 'hits': 1, 'misses': 1, 'invalidations': 0})
+
+
+    def test_get_record_changed(self):
+        """lib.key_cache.KeyCache.get.record_changed"""
+        # Create thing and a build function that returns a different key per record
+        cache = KeyCache(10)
+        build = MagicMock(side_effect=lambda record: f'key for {record}')
+
+        # Run the method with the old record, then the new one
+        old = cache.get('device.example.com', 'old digest', build, 'old record')
+        new = cache.get('device.example.com', 'new digest', build, 'new record')
+        again = cache.get('device.example.com', 'new digest', build, 'new record')
+
+        # Run assertions
+        self.assertEqual(old, 'key for old record')
+        self.assertEqual(new, 'key for new record')
+        self.assertEqual(again, 'key for new record')
+        self.assertEqual(build.call_count, 2)
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertEqual(cache.stats()['invalidations'], 1)
+
+
+    def test_get_lru_eviction(self):
+        """lib.key_cache.KeyCache.get.lru_eviction"""
+        # Create thing that holds two entries
+        cache = KeyCache(2)
+        build = MagicMock(side_effect=lambda name: name)
+        cache.get('a', 'digest', build, 'a')
+        cache.get('b', 'digest', build, 'b')
+
+        # Use 'a' so that 'b' becomes the least recently used, then add a third entry
+        cache.get('a', 'digest', build, 'a')
+        cache.get('c', 'digest', build, 'c')
+
+        # Run assertions, 'b' has to be built again but 'a' does not
+        build.reset_mock()
+        cache.get('a', 'digest', build, 'a')
+        build.assert_not_called()
+        cache.get('b', 'digest', build, 'b')
+        build.assert_called_once_with('b')
@@ -0,0 +1,153 @@
+from unittest import mock, TestCase
+from lib.keyed_executor import KeyedExecutor
+import threading
+import random
+import time
+
+
+class TestKeyedExecutor(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.keyed_executor.KeyedExecutor.__init__.invalid"""
+        # Run the method with each invalid argument
+        with self.assertRaises(ValueError):
+            KeyedExecutor(0, 10)
+        with self.assertRaises(ValueError):
+            KeyedExecutor(1, 0)
+        with self.assertRaises(ValueError):
+            KeyedExecutor(1, 10, 'drop-everything')
+
+
+    def test_submit_ordered_by_key(self):
+        """lib.keyed_executor.KeyedExecutor.submit.ordered_by_key"""
+        # Create and start the executor
+        executor = KeyedExecutor(8, 1000)
+        executor.start()
+
+        # Submit jobs for a handful of keys, each of which takes a random amount of time
+        results = {key: [] for key in 'abcd'}
+        def job(key, value):
+            time.sleep(random.random() / 1000)
+            results[key].append(value)
+        for value in range(50):
+            for key in 'abcd':
+                self.assertTrue(executor.submit(key, job, key, value))
+
+        # Shut down, which finishes every waiting job
+        executor.shutdown()
+
+        # Run assertions, every key's jobs ran in the order they were submitted
+        for key in 'abcd':
+            self.assertEqual(results[key], list(range(50)))
+        stats = executor.stats()
+        self.assertEqual((stats['submitted'], stats['completed'], stats['dropped']), (200, 200, 0))
+        self.assertEqual((stats['queue_depth'], stats['keys']), (0, 0))
+
+
+    def test_submit_keys_concurrent(self):
+        """lib.keyed_executor.KeyedExecutor.submit.keys_concurrent"""
+        # Create and start the executor
+        executor = KeyedExecutor(2, 10)
+        executor.start()
+
+        # Submit a job that blocks, another with the same key, and one with a different key
+        release = threading.Event()
+        done = []
+        executor.submit('slow', release.wait, 5)
+        executor.submit('slow', done.append, 'slow')
+        finished = threading.Event()
+        executor.submit('fast', finished.set)
+
+        # Run assertions, the other key isn't held up, but the blocked key's next job is
+        self.assertTrue(finished.wait(5))
+        self.assertEqual(done, [])
+        self.assertEqual(executor.stats()['queue_depth'], 1)
+        release.set()
+        executor.shutdown()
+        self.assertEqual(done, ['slow'])
+
+
+    @mock.patch("logging.debug")
+    def test_submit_drop_newest(self, m_ld):
+        """lib.keyed_executor.KeyedExecutor.submit.drop_newest"""
+        # Create the executor, but don't start it so the queue fills up
+        executor = KeyedExecutor(1, 2, 'drop-newest')
+
+        # Run the method
+        accepted = [executor.submit(key, print, key) for key in 'abcd']
+
+        # Run assertions
+        self.assertEqual(accepted, [True, True, False, False])
+        self.assertEqual(executor.stats()['queue_depth'], 2)
+        self.assertEqual(executor.stats()['dropped'], 2)
+
+
+    @mock.patch("logging.debug")
+    def test_submit_drop_oldest(self, m_ld):
+        """lib.keyed_executor.KeyedExecutor.submit.drop_oldest"""
+        # Create the executor, but don't start it so the queue fills up
+        executor = KeyedExecutor(1, 3, 'drop-oldest')
+
+        # Run the method, where the oldest jobs belong to different keys
+        results = []
+        for key, value in [('a', 1), ('b', 2), ('a', 3), ('c', 4), ('d', 5)]:
+            self.assertTrue(executor.submit(key, results.append, value))
+
+        # Run assertions, the key that was left without jobs is gone
+        self.assertEqual(executor.stats()['dropped'], 2)
+        self.assertEqual(executor.stats()['keys'], 3)
+        self.assertNotIn('b', executor._keys)
+
+        # Run the rest, which keeps each key's order
+        executor.start()
+        executor.shutdown()
+        self.assertEqual(results, [3, 4, 5])
+
+
+    def test_submit_block(self):
+        """lib.keyed_executor.KeyedExecutor.submit.block"""
+        # Create and start the executor with a single worker, which is kept busy
+        executor = KeyedExecutor(1, 1, 'block')
+        executor.start()
+        release = threading.Event()
+        executor.submit('a', release.wait, 5)
+        while executor.stats()['queue_depth']:
+            time.sleep(0.001)
+        executor.submit('b', print, 'waiting')
+
+        # Submit another job from a separate thread, which should block
+        submitter = threading.Thread(target=executor.submit, args=('c', print, 'blocked'))
+        submitter.start()
+        submitter.join(0.1)
+        self.assertTrue(submitter.is_alive())
+
+        # Let the worker go, which should unblock the submitter
+        release.set()
+        submitter.join(1)
+        executor.shutdown()
+
+        # Run assertions
+        self.assertFalse(submitter.is_alive())
+        self.assertEqual(executor.stats()['completed'], 3)
+
+
+    @mock.patch("logging.error")
+    def test_work_exception(self, m_e):
+        """lib.keyed_executor.KeyedExecutor._work.exception"""
+        # Create and start the executor
+        executor = KeyedExecutor(1, 10)
+        executor.start()
+
+        # Submit a job that raises, then one with the same key that doesn't
+        def bad_job():
+            raise RuntimeError('whoops')
+        results = []
+        executor.submit('a', bad_job)
+        executor.submit('a', results.append, 'still alive')
+        executor.shutdown()
+
+        # Run assertions
+        m_e.assert_called_once()
+        self.assertEqual(results, ['still alive'])
+        self.assertEqual(executor.stats()['completed'], 2)
@@ -2,6 +2,10 @@ from unittest import mock, TestCase
 from unittest.mock import MagicMock
 from lib.mqtt_client import MQTTClient
 from lib import mqtt_client
+from lib.connection_monitor import ConnectionMonitor
+from paho.mqtt.reasoncodes import ReasonCode
+from paho.mqtt.packettypes import PacketTypes
+import paho.mqtt.client as mqtt
 
 
 class TestMQTTClient(TestCase):
@@ -13,8 +17,8 @@ class TestMQTTClient(TestCase):
         # Mocking the client part
         client_tls_set_mock = MagicMock()
         client_username_pw_set_mock = MagicMock()
-        client_connect_mock = MagicMock()
-        client_mock = MagicMock(tls_set=client_tls_set_mock, username_pw_set=client_username_pw_set_mock, connect=client_connect_mock)
+        client_connect_async_mock = MagicMock()
+        client_mock = MagicMock(tls_set=client_tls_set_mock, username_pw_set=client_username_pw_set_mock, connect_async=client_connect_async_mock)
         m_mqtt = MockPahoMQTT(client_mock)
         mqtt_client.mqtt = m_mqtt
 
@@ -24,10 +28,34 @@ class TestMQTTClient(TestCase):
 
         # Run assertions
         self.assertEqual(client_mock.on_connect, MQTTClient.on_connect)
+        self.assertEqual(client_mock.on_disconnect, MQTTClient.on_disconnect)
+        self.assertIs(client_mock.monitor, client.monitor)
         client_tls_set_mock.assert_called_with(tls_version='protocol_tls')
         client_username_pw_set_mock.assert_called_with('user', 'pass')
-        client_connect_mock.assert_called_with('192.168.0.256', '400')
+        client_connect_async_mock.assert_called_with('192.168.0.256', '400')
+        client_mock.reconnect.assert_called_once_with()
+        client_mock.connect.assert_not_called()
         self.assertEqual(client.client, client_mock)
+        self.assertEqual(m_mqtt.client_kwargs, {'protocol': mqtt.MQTTv311})
+
+
+    @mock.patch("logging.warning")
+    def test_connect_unreachable(self, m_lw):
+        """lib.mqtt_client.MQTTClient._connect.unreachable"""
+        # Mocking the client part, whose broker can't be reached
+        client_mock = MagicMock()
+        client_mock.reconnect.side_effect = ConnectionRefusedError()
+        mqtt_client.mqtt = MockPahoMQTT(client_mock)
+
+        # Run the method, which doesn't raise
+        client = MQTTClient()
+        client._connect('user', 'pass', '192.168.0.256', '400')
+
+        # Run assertions, the attempt is left to be retried with backoff
+        self.assertEqual(client.client, client_mock)
+        self.assertEqual(client.monitor.stats()['reconnect_attempts'], 1)
+        self.assertGreater(client.monitor.seconds_until_retry(), 0)
+        m_lw.assert_called_once()
 
 
     @mock.patch("logging.debug")
@@ -41,11 +69,60 @@ class TestMQTTClient(TestCase):
     @mock.patch("logging.debug")
     @mock.patch("logging.critical")
     def test_on_connect_resultcode_nonzero(self, m_c, m_d):
-        """lib.mqtt_client.MQTTClient.on_connect.resultcode_zero"""
-        # Run in a for loop to test a lot of values that are decidedly not 0, and see if it causes an exit.
+        """lib.mqtt_client.MQTTClient.on_connect.resultcode_nonzero"""
+        # Run in a for loop to test a lot of values that are decidedly not 0, and make sure none of them exit.
         for i in range(1, 100):
-            with self.assertRaises(SystemExit):
-                MQTTClient.on_connect(MagicMock(), {}, {}, i)
+            client = MagicMock()
+            self.assertFalse(MQTTClient.on_connect(client, {}, {}, i))
+            client.monitor.disconnected.assert_called_once()
+
+
+    @mock.patch("logging.debug")
+    @mock.patch("logging.critical")
+    def test_on_connect_reasoncode_failure(self, m_c, m_d):
+        """lib.mqtt_client.MQTTClient.on_connect.reasoncode_failure"""
+        # Run with an MQTT v5 reason code, along with its properties
+        client = MagicMock(client_type='MQTTListener')
+        connected = MQTTClient.on_connect(client, {}, {}, ReasonCode(PacketTypes.CONNACK, 'Not authorized'), None)
+
+        # Run assertions
+        self.assertFalse(connected)
+        m_c.assert_called_with('MQTTListener failed to connect, not authorized')
+        client.monitor.disconnected.assert_called_once()
+
+
+    @mock.patch("logging.info")
+    @mock.patch("logging.debug")
+    def test_on_connect_reconnected(self, m_d, m_i):
+        """lib.mqtt_client.MQTTClient.on_connect.reconnected"""
+        # Create a client whose connection was lost
+        client = MagicMock(monitor=ConnectionMonitor(1, 60))
+        client.monitor.disconnected()
+
+        # Run the method twice
+        reconnected = MQTTClient.on_connect(client, {}, {}, 0)
+        connected_again = MQTTClient.on_connect(client, {}, {}, 0)
+
+        # Run assertions
+        self.assertTrue(reconnected)
+        self.assertFalse(connected_again)
+        self.assertTrue(client.monitor.stats()['connected'])
+
+
+    @mock.patch("logging.warning")
+    def test_on_disconnect(self, m_w):
+        """lib.mqtt_client.MQTTClient.on_disconnect"""
+        # Create a client
+        client = MagicMock(monitor=ConnectionMonitor(1, 60))
+
+        # Run the method, twice for the same outage
+        MQTTClient.on_disconnect(client, {}, 7)
+        MQTTClient.on_disconnect(client, {}, 7)
+
+        # Run assertions
+        m_w.assert_called()
+        self.assertEqual(client.monitor.stats()['disconnects'], 1)
+        self.assertFalse(client.monitor.stats()['connected'])
 
 
 class MockPahoMQTT:
@@ -55,5 +132,6 @@ class MockPahoMQTT:
         self.mock_client = client
         self.ssl = MagicMock(PROTOCOL_TLS='protocol_tls')
 
-    def Client(self):
+    def Client(self, **kwargs):
+        self.client_kwargs = kwargs
         return self.mock_client
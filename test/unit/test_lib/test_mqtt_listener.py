@@ -1,6 +1,8 @@
 from unittest import mock, TestCase
 from unittest.mock import MagicMock
 from lib.mqtt_listener import MQTTListener
+from lib.connection_monitor import ConnectionMonitor
+import paho.mqtt.client as mqtt
 
 
 class TestMQTTListener(TestCase):
@@ -12,7 +14,7 @@ class TestMQTTListener(TestCase):
     def test_init(self, m_s, m_c, m_eg):
         """lib.mqtt_listener.MQTTListener.__init__"""
         # Side effect method for environment.get
-        environ_vars = ['HELLO', 'WHERE', 'IS', 'CARMEN SANDIEGO', ['IM IN', 'A MEETING', 'RIGHT NOW LOL']]
+        environ_vars = ['HELLO', 'WHERE', 'IS', 'CARMEN SANDIEGO', '', ['IM IN', 'A MEETING', 'RIGHT NOW LOL']]
         def environment_get_side_effect(*args, **kwargs):
             var = environ_vars[0]
             environ_vars.remove(var)
@@ -34,32 +36,83 @@ class TestMQTTListener(TestCase):
 
         # Run assertions
         self.assertEqual(sender.client_type, 'MQTTListener')
-        m_c.assert_called_with('HELLO', 'WHERE', 'IS', 'CARMEN SANDIEGO')
+        m_c.assert_called_with('HELLO', 'WHERE', 'IS', 'CARMEN SANDIEGO', mqtt.MQTTv311)
         self.assertEqual(subscribe_called_with, [('IM IN',), ('A MEETING',), ('RIGHT NOW LOL',)])
 
 
-    @mock.patch("lib.mqtt_listener.MQTTListener.__init__")
     @mock.patch("lib.util.environment.get")
-    def test_begin_listening(self, m_eg, m_i):
-        """lib.mqtt_listener.MQTTListener.subscribe"""
+    @mock.patch("lib.mqtt_client.MQTTClient._connect")
+    @mock.patch("lib.mqtt_listener.MQTTListener.subscribe")
+    def test_init_shared(self, m_s, m_c, m_eg):
+        """lib.mqtt_listener.MQTTListener.__init__.shared"""
+        # Side effect method for environment.get, with a share group set
+        environ_vars = ['HELLO', 'WHERE', 'IS', 'CARMEN SANDIEGO', 'wolfmail', ['IM IN', 'A/MEETING/#']]
+        def environment_get_side_effect(*args, **kwargs):
+            var = environ_vars[0]
+            environ_vars.remove(var)
+            return var
+        m_eg.side_effect = environment_get_side_effect
+
+        # Create a MagicMock object to act as MQTTListener.client
+        MQTTListener.client = MagicMock()
+
+        # Run the method
+        listener = MQTTListener()
+
+        # Run assertions, the connection uses MQTT v5 and every topic is shared
+        m_c.assert_called_with('HELLO', 'WHERE', 'IS', 'CARMEN SANDIEGO', mqtt.MQTTv5)
+        self.assertEqual(listener.topics, ['$share/wolfmail/IM IN', '$share/wolfmail/A/MEETING/#'])
+        self.assertEqual(m_s.call_args_list, [mock.call('$share/wolfmail/IM IN'), mock.call('$share/wolfmail/A/MEETING/#')])
+
+
+    @mock.patch("lib.mqtt_listener.MQTTListener.__init__")
+    @mock.patch("time.sleep")
+    @mock.patch("logging.warning")
+    def test_begin_listening(self, m_lw, m_ts, m_i):
+        """lib.mqtt_listener.MQTTListener.begin_listening"""
         # Create thing
         m_i.return_value = None
         listener = MQTTListener()
+        listener.monitor = ConnectionMonitor(1, 60)
 
-        # Create mock paho client with loop_forever mock and attach to listener
-        loop_forever_mock = MagicMock()
-        paho_client_mock = MagicMock(loop_forever=loop_forever_mock)
+        # Create mock paho client that loses its connection twice, then stops the test, and attach to listener
+        paho_client_mock = MagicMock()
+        paho_client_mock.loop.side_effect = [mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_CONN_LOST, mqtt.MQTT_ERR_NO_CONN,
+                                             KeyboardInterrupt()]
+        paho_client_mock.reconnect.side_effect = [ConnectionRefusedError(), None]
         listener.client = paho_client_mock
 
-        # Set return_value for environment.get
-        m_eg.return_value = 'im so tired. its 4 am on saturday'
-
         # Run method
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(KeyboardInterrupt):
             listener.begin_listening()
 
+        # Run assertions, the first attempt is made right away, and the second after a backoff of 0.5 to 1 seconds
+        self.assertEqual(paho_client_mock.reconnect.call_count, 2)
+        self.assertEqual(m_ts.call_args_list[0], mock.call(0.0))
+        self.assertTrue(0.5 <= m_ts.call_args_list[1][0][0] <= 1)
+        self.assertEqual(listener.stats()['reconnect_attempts'], 2)
+
+
+    @mock.patch("lib.mqtt_listener.MQTTListener.__init__")
+    @mock.patch("lib.mqtt_listener.MQTTListener.subscribe")
+    @mock.patch("logging.info")
+    def test_on_connect_reconnected(self, m_li, m_s, m_i):
+        """lib.mqtt_listener.MQTTListener.on_connect.reconnected"""
+        # Create thing, whose connection was lost
+        m_i.return_value = None
+        listener = MQTTListener()
+        listener.topics = ['doors', 'sensors/#']
+        client = MagicMock(monitor=ConnectionMonitor(1, 60))
+
+        # Run method for the first connection, then for a reconnection
+        listener.on_connect(client, None, {}, 0)
+        first_subscriptions = m_s.call_count
+        client.monitor.disconnected()
+        listener.on_connect(client, None, {}, 0)
+
         # Run assertions
-        loop_forever_mock.assert_called_with(timeout='im so tired. its 4 am on saturday')
+        self.assertEqual(first_subscriptions, 0)
+        self.assertEqual(m_s.call_args_list, [mock.call('doors'), mock.call('sensors/#')])
 
 
     @mock.patch("lib.mqtt_listener.MQTTListener.__init__")
@@ -1,18 +1,25 @@
 from unittest import mock, TestCase
 from unittest.mock import MagicMock
 from lib.mqtt_sender import MQTTSender
+from lib.connection_monitor import ConnectionMonitor
+import paho.mqtt.client as mqtt
+import tempfile
+import os
 
 
 class TestMQTTSender(TestCase):
 
 
+    @mock.patch("lib.sender_loop.SenderLoop.start")
+    @mock.patch("lib.util.environment.CONFIG")
     @mock.patch("lib.util.environment.get")
     @mock.patch("lib.mqtt_client.MQTTClient._connect")
     @mock.patch("lib.mqtt_sender.MQTTSender.test_connection")
-    def test_init(self, m_tc, m_c, m_eg):
+    def test_init(self, m_tc, m_c, m_eg, m_ec, m_sls):
         """lib.mqtt_sender.MQTTSender.__init__"""
-        # Side effect method for environment.get
-        environ_vars = ['HELLO', 'WHERE', 'IS', 'CARMEN SANDIEGO', ['IM IN', 'A MEETING', 'RIGHT NOW LOL']]
+        # Side effect method for environment.get, and a configuration without a spool
+        environ_vars = ['HELLO', 'WHERE', 'IS', 'CARMEN SANDIEGO', ['IM IN', 'A MEETING', 'RIGHT NOW LOL'], 1, 20, 100, 10]
+        m_ec.MQTT_SENDER_SPOOL_DIRECTORY = ''
         def environment_get_side_effect(*args, **kwargs):
             var = environ_vars[0]
             environ_vars.remove(var)
@@ -22,6 +29,7 @@ class TestMQTTSender(TestCase):
         # Create a MagicMock object to act as MQTTSender.client
         client = MagicMock()
         MQTTSender.client = client
+        MQTTSender.monitor = MagicMock()
 
         # Run the method
         sender = MQTTSender()
@@ -31,60 +39,103 @@ class TestMQTTSender(TestCase):
         m_c.assert_called_with('HELLO', 'WHERE', 'IS', 'CARMEN SANDIEGO')
         m_tc.assert_called_once()
         self.assertEqual(sender.topics, ['IM IN', 'A MEETING', 'RIGHT NOW LOL'])
+        self.assertEqual(sender.qos, 1)
+        client.max_inflight_messages_set.assert_called_with(20)
+        self.assertEqual(sender.loop.queue_size, 100)
+        self.assertEqual(sender.loop.batch_size, 10)
+        self.assertIsNone(sender.spool)
+        self.assertIs(sender.loop.monitor, MQTTSender.monitor)
+        m_sls.assert_called_once()
 
 
     @mock.patch("lib.util.environment.get")
     @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
     @mock.patch("time.sleep")
-    def test_test_connection_pass(self, m_ts, m_i, m_eg):
+    @mock.patch("logging.debug")
+    def test_test_connection_pass(self, m_ld, m_ts, m_i, m_eg):
         """lib.mqtt_sender.MQTTSender.test_connection.pass"""
         # Set return value for environment.get
-        sleep_count = 100
-        m_eg.return_value = sleep_count
+        m_eg.return_value = 100
 
         # Create thing
         m_i.return_value = None
         sender = MQTTSender()
+        sender.monitor = ConnectionMonitor(1, 60)
 
-        # Create mock paho client
-        paho_client_mock = MockPahoClient(True)
+        # Create mock paho client, whose loop connects right away
+        paho_client_mock = MagicMock()
+        def loop(timeout):
+            sender.monitor.connected()
+            return mqtt.MQTT_ERR_SUCCESS
+        paho_client_mock.loop.side_effect = loop
         sender.client = paho_client_mock
 
         # Run the method
-        sender.test_connection()
+        connected = sender.test_connection()
 
-        # Run assertions
-        self.assertEqual(paho_client_mock.loop_start_call_count, 1)
-        self.assertTrue(paho_client_mock.is_connected_call_count < sleep_count)
-        self.assertEqual(paho_client_mock.loop_stop_call_count, 1)
+        # Run assertions, making sure the connection wasn't polled for
+        self.assertTrue(connected)
+        paho_client_mock.loop.assert_called_once()
+        paho_client_mock.reconnect.assert_not_called()
+        m_ts.assert_not_called()
 
 
     @mock.patch("lib.util.environment.get")
     @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
-    @mock.patch("time.sleep")
-    @mock.patch("logging.critical")
-    def test_test_connection_timeout(self, m_lc, m_ts, m_i, m_eg):
-        """lib.mqtt_sender.MQTTSender.test_connection.timeout"""
+    @mock.patch("logging.warning")
+    def test_test_connection_retry(self, m_lw, m_i, m_eg):
+        """lib.mqtt_sender.MQTTSender.test_connection.retry"""
         # Set return value for environment.get
-        sleep_count = 100
-        m_eg.return_value = sleep_count
+        m_eg.return_value = 5
 
-        # Create thing
+        # Create thing, whose first attempt to connect couldn't open the connection
         m_i.return_value = None
         sender = MQTTSender()
+        sender.monitor = ConnectionMonitor(0.01, 0.01)
+        sender.monitor.attempt()
 
-        # Create mock paho client
-        paho_client_mock = MockPahoClient(False)
+        # Create mock paho client, which connects once it is reconnected
+        paho_client_mock = MagicMock()
+        paho_client_mock.loop.side_effect = lambda timeout: (mqtt.MQTT_ERR_SUCCESS if paho_client_mock.reconnect.called
+                                                             else mqtt.MQTT_ERR_NO_CONN)
+        paho_client_mock.reconnect.side_effect = sender.monitor.connected
         sender.client = paho_client_mock
 
         # Run the method
-        with self.assertRaises(SystemExit):
-            sender.test_connection()
+        connected = sender.test_connection()
 
-        # Run assertions
-        self.assertEqual(paho_client_mock.loop_start_call_count, 1)
-        self.assertTrue(paho_client_mock.is_connected_call_count > sleep_count)
-        self.assertEqual(paho_client_mock.loop_stop_call_count, 0)
+        # Run assertions, the attempt was retried after the backoff
+        self.assertTrue(connected)
+        paho_client_mock.reconnect.assert_called_once()
+        self.assertEqual(sender.monitor.stats()['reconnect_attempts'], 2)
+
+
+    @mock.patch("lib.util.environment.get")
+    @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
+    @mock.patch("logging.warning")
+    def test_test_connection_timeout(self, m_lw, m_i, m_eg):
+        """lib.mqtt_sender.MQTTSender.test_connection.timeout"""
+        # Set return value for environment.get
+        m_eg.return_value = 1
+
+        # Create thing, whose connection never comes up
+        m_i.return_value = None
+        sender = MQTTSender()
+        sender.monitor = ConnectionMonitor(60, 60)
+        sender.monitor.attempt()
+
+        # Create mock paho client, which never connects
+        paho_client_mock = MagicMock()
+        paho_client_mock.loop.return_value = mqtt.MQTT_ERR_NO_CONN
+        sender.client = paho_client_mock
+
+        # Run the method, which doesn't exit
+        connected = sender.test_connection()
+
+        # Run assertions, the next attempt is left to the sender loop
+        self.assertFalse(connected)
+        paho_client_mock.reconnect.assert_not_called()
+        m_lw.assert_called_once()
 
 
     @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
@@ -113,21 +164,325 @@ class TestMQTTSender(TestCase):
         self.assertEqual(publish_called_with[2], {'topic': 'learn', 'payload': 'message', 'qos': 10, 'retain': True, 'properties': {'property': 'smooth'}})
 
 
-class MockPahoClient:
+    @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
+    @mock.patch("lib.mqtt_sender.MQTTSender._publish")
+    def test_publish_default_qos(self, m_p, m_i):
+        """lib.mqtt_sender.MQTTSender.publish.default_qos"""
+        # Create thing
+        m_i.return_value = None
+        sender = MQTTSender()
+        sender.topics = ['watch']
+        sender.qos = 2
+
+        # Run the method
+        sender.publish('message')
+
+        # Run assertions
+        m_p.assert_called_with(topic='watch', payload='message', qos=2, retain=False, properties=None)
+
+
+    @mock.patch("lib.mqtt_sender.MQTTSender.__init__")
+    @mock.patch("lib.mqtt_sender.MQTTSender._publish")
+    def test_publish_topics(self, m_p, m_i):
+        """lib.mqtt_sender.MQTTSender.publish.topics"""
+        # Create thing
+        m_i.return_value = None
+        sender = MQTTSender()
+        sender.topics = ['watch', 'and', 'learn']
+        sender.qos = 0
+
+        # Run the method with routed topics
+        sender.publish('message', topics=('verified/device',))
+
+        # Run assertions
+        m_p.assert_called_once_with(topic='verified/device', payload='message', qos=0, retain=False, properties=None)
+
+
+    @mock.patch("time.monotonic")
+    def test__write_acked(self, m_m):
+        """lib.mqtt_sender.MQTTSender._write.acked"""
+        # Create thing, whose client gives out message id 7
+        sender = create_sender()
+        sender.client.publish.return_value = MagicMock(rc=0, mid=7)
+
+        # Run the method at time 1000, then acknowledge the message at time 1000.25
+        m_m.return_value = 1000
+        sender._write('topic', 'message', 1)
+        pending = sender.stats()['pending']
+        m_m.return_value = 1000.25
+        sender.on_publish(sender.client, None, 7)
+
+        # Run assertions
+        sender.client.publish.assert_called_with('topic', 'message', 1, False, None)
+        self.assertEqual(pending, 1)
+        stats = sender.stats()
+        del stats['loop']
+        del stats['connection']
+        self.assertEqual(stats, {'spool': None, 'qos': 1, 'max_inflight': 20, 'pending': 0, 'acked': 1, 'failed': 0,
+                                 'average_ack_seconds': 0.25, 'max_ack_seconds': 0.25})
+
+
+    def test__publish_queued(self):
+        """lib.mqtt_sender.MQTTSender._publish.queued"""
+        # Create thing with an outbound queue that holds one message
+        sender = create_sender(queue_size=1)
+
+        # Run the method twice
+        queued = sender._publish('topic', 'message', 1)
+        dropped = sender._publish('topic', 'message two', 1)
+
+        # Run assertions, making sure nothing was written from this thread
+        self.assertTrue(queued)
+        self.assertFalse(dropped)
+        sender.client.publish.assert_not_called()
+        self.assertEqual(sender.stats()['loop']['queue_depth'], 1)
+        self.assertEqual(sender.stats()['loop']['dropped'], 1)
+
+
+    def test__write_acked_early(self):
+        """lib.mqtt_sender.MQTTSender._write.acked_early"""
+        # Create thing, whose client acknowledges message id 7 from inside publish (as paho can for QoS 0)
+        sender = create_sender()
+        def publish_side_effect(*args, **kwargs):
+            sender.on_publish(sender.client, None, 7)
+            return MagicMock(rc=0, mid=7)
+        sender.client.publish.side_effect = publish_side_effect
+
+        # Run the method
+        sender._write('topic', 'message', 0)
+
+        # Run assertions
+        self.assertEqual(sender.stats()['pending'], 0)
+        self.assertEqual(sender.stats()['acked'], 1)
+        self.assertEqual(sender._acked_early, set())
+
+
+    @mock.patch("logging.warning")
+    def test_on_disconnect(self, m_lw):
+        """lib.mqtt_sender.MQTTSender.on_disconnect"""
+        # Create thing with two messages in flight
+        sender = create_sender()
+        sender.client.publish.side_effect = [MagicMock(rc=0, mid=7), MagicMock(rc=0, mid=8)]
+        sender._write('topic', 'message', 1)
+        sender._write('topic', 'message two', 1)
+
+        # Run the method, then have paho deliver one of them once it reconnects, and acknowledge an unknown message id
+        sender.on_disconnect(sender.client, None, 7)
+        stats = sender.stats()
+        sender.on_publish(sender.client, None, 8)
+        sender.on_publish(sender.client, None, 9)
+
+        # Run assertions, both are failed rather than pending, until one of them is delivered after all
+        self.assertEqual((stats['pending'], stats['failed']), (0, 2))
+        self.assertEqual((sender.stats()['acked'], sender.stats()['failed']), (1, 1))
+        self.assertEqual(list(sender._abandoned), [7])
+        self.assertFalse(sender.monitor.stats()['connected'])
+
+
+    def test__write_acked_early_bounded(self):
+        """lib.mqtt_sender.MQTTSender._write.acked_early_bounded"""
+        # Create thing, whose client acknowledges a message id that isn't the one it gives out
+        sender = create_sender()
+        def publish_side_effect(*args, **kwargs):
+            sender.on_publish(sender.client, None, 99)
+            return MagicMock(rc=0, mid=7)
+        sender.client.publish.side_effect = publish_side_effect
+
+        # Run the method
+        sender._write('topic', 'message', 1)
+
+        # Run assertions, nothing is left behind for a later publish to find
+        self.assertEqual(sender._acked_early, set())
+        self.assertEqual(sender.stats()['pending'], 1)
+
+
+    def test__write_failed(self):
+        """lib.mqtt_sender.MQTTSender._write.failed"""
+        # Create thing, whose client has no connection
+        sender = create_sender()
+        sender.client.publish.return_value = MagicMock(rc=4, mid=7)
+
+        # Run the method
+        sender._write('topic', 'message', 1)
+
+        # Run assertions
+        self.assertEqual(sender.stats()['pending'], 0)
+        self.assertEqual(sender.stats()['failed'], 1)
+
+
+    def test__write_spooled_while_disconnected(self):
+        """lib.mqtt_sender.MQTTSender._write.spooled_while_disconnected"""
+        with tempfile.TemporaryDirectory() as directory:
+            # Create thing with a spool, whose client has no connection
+            sender = create_sender(spool_directory=directory)
+            sender.client.is_connected.return_value = False
+
+            # Run the method
+            sender._write('topic', b'message', 1)
+
+            # Run assertions, making sure nothing was handed to paho
+            sender.client.publish.assert_not_called()
+            self.assertEqual(sender.stats()['spool']['appended'], 1)
+            self.assertEqual(sender.stats()['failed'], 0)
+            sender.spool.close()
+
+
+    def test__drain(self):
+        """lib.mqtt_sender.MQTTSender._drain"""
+        with tempfile.TemporaryDirectory() as directory:
+            # Create thing with a spool holding three messages, whose client refuses the third publish
+            sender = create_sender(spool_directory=directory)
+            for index in range(3):
+                sender.spool.append('topic', f'message {index}'.encode(), 1)
+            sender.client.is_connected.return_value = True
+            sender.client.publish.side_effect = [MagicMock(rc=0, mid=1), MagicMock(rc=0, mid=2), MagicMock(rc=4, mid=3)]
+
+            # Run the method
+            drained = sender._drain()
+
+            # Run assertions, nothing leaves the spool until it is acknowledged
+            self.assertEqual(drained, 2)
+            self.assertEqual(sender.client.publish.call_args_list, [mock.call('topic', b'message 0', 1, False, None),
+                                                                    mock.call('topic', b'message 1', 1, False, None),
+                                                                    mock.call('topic', b'message 2', 1, False, None)])
+            self.assertEqual(sender.stats()['pending'], 2)
+            self.assertEqual(sender.stats()['spool']['committed'], 0)
+
+            # Acknowledge the second message only, then run the method again, newer messages wait behind the spool
+            sender.on_publish(sender.client, None, 2)
+            sender.client.publish.side_effect = [MagicMock(rc=0, mid=3), MagicMock(rc=0, mid=4)]
+            sender._write('topic', b'message 3', 1)
+            drained = sender._drain()
+
+            # Run assertions, the messages waiting on an acknowledgement aren't sent again, and the first one holds
+            # up the second
+            self.assertEqual(drained, 2)
+            self.assertEqual(sender.client.publish.call_args_list[-2:], [mock.call('topic', b'message 2', 1, False, None),
+                                                                         mock.call('topic', b'message 3', 1, False, None)])
+            self.assertEqual(sender.stats()['spool']['committed'], 0)
+
+            # Acknowledge the rest, which empties the spool
+            for mid in (1, 3, 4):
+                sender.on_publish(sender.client, None, mid)
+            self.assertEqual(sender._drain(), 0)
+            self.assertEqual(sender.stats()['spool']['committed'], 4)
+            self.assertTrue(sender.spool.empty())
+            sender.spool.close()
+
+
+    @mock.patch("logging.warning")
+    def test_on_disconnect_spooled(self, m_lw):
+        """lib.mqtt_sender.MQTTSender.on_disconnect.spooled"""
+        with tempfile.TemporaryDirectory() as directory:
+            # Create thing with a spool holding two messages, both handed to paho, and only the first acknowledged
+            sender = create_sender(spool_directory=directory)
+            for index in range(2):
+                sender.spool.append('topic', f'message {index}'.encode(), 1)
+            sender.client.is_connected.return_value = True
+            sender.client.publish.side_effect = [MagicMock(rc=0, mid=1), MagicMock(rc=0, mid=2), MagicMock(rc=0, mid=3)]
+            sender._drain()
+            sender.on_publish(sender.client, None, 1)
+
+            # Run the method, then drain again once reconnected
+            sender.on_disconnect(sender.client, None, 7)
+            stats = sender.stats()
+            drained = sender._drain()
+
+            # Run assertions, the unacknowledged message is sent from the spool again, rather than failed
+            self.assertEqual((stats['pending'], stats['failed']), (0, 0))
+            self.assertEqual(stats['spool']['committed'], 1)
+            self.assertEqual(drained, 1)
+            self.assertEqual(sender.client.publish.call_args, mock.call('topic', b'message 1', 1, False, None))
+            self.assertEqual(sender._abandoned, {})
+            sender.spool.close()
+
+
+    def test__drain_qos_0(self):
+        """lib.mqtt_sender.MQTTSender._drain.qos_0"""
+        with tempfile.TemporaryDirectory() as directory:
+            # Create thing with a spool holding two QoS 0 messages
+            sender = create_sender(qos=0, spool_directory=directory)
+            for index in range(2):
+                sender.spool.append('topic', f'message {index}'.encode(), 0)
+            sender.client.is_connected.return_value = True
+            sender.client.publish.side_effect = [MagicMock(rc=0, mid=1), MagicMock(rc=0, mid=2)]
+
+            # Run the method
+            drained = sender._drain()
+
+            # Run assertions, they are never acknowledged, so they leave the spool right away
+            self.assertEqual(drained, 2)
+            self.assertTrue(sender.spool.empty())
+            sender.spool.close()
+
+
+    def test__publish_overflow_spooled_in_order(self):
+        """lib.mqtt_sender.MQTTSender._publish.overflow_spooled_in_order"""
+        with tempfile.TemporaryDirectory() as directory:
+            # Create thing with a spool, and an outbound queue that holds two messages
+            sender = create_sender(queue_size=2, spool_directory=directory)
+            sender.client.is_connected.return_value = True
+
+            # Run the method until the queue overflows
+            accepted = [sender._publish('topic', f'message {index}'.encode(), 1) for index in range(4)]
+
+            # Run assertions, nothing was spooled from this thread
+            self.assertEqual(accepted, [True, True, True, True])
+            self.assertTrue(sender.spool.empty())
+
+            # Flush on the loop's thread, which spools everything queued in the order it was published
+            sender.loop.flush()
+            sender.client.publish.assert_not_called()
+            self.assertEqual(sender.spool.peek(10), [('topic', f'message {index}'.encode(), 1, False)
+                                                     for index in range(4)])
+            self.assertEqual(sender.stats()['loop']['spilled'], 4)
+            sender.spool.close()
+
+
+    def test_shutdown(self):
+        """lib.mqtt_sender.MQTTSender.shutdown"""
+        with tempfile.TemporaryDirectory() as directory:
+            # Create thing with a spool holding a message that hasn't been flushed to disk yet
+            sender = create_sender(spool_directory=directory)
+            sender.spool.append('topic', b'message 0', 1)
+            sender.loop.stop = MagicMock()
+
+            # Run the method, then shut down again, as the atexit hook would
+            sender.shutdown()
+            sender.spool.close()
+
+            # Run assertions, the loop is stopped, and the spool is closed with the message on disk
+            sender.loop.stop.assert_called_once()
+            sender.client.disconnect.assert_called_once()
+            self.assertTrue(sender.spool._writer.closed)
+            self.assertEqual(sender.spool.stats()['bytes'], sum(os.path.getsize(os.path.join(sender.spool.directory, file))
+                                                               for file in os.listdir(sender.spool.directory)
+                                                               if file.endswith('.seg')))
+
 
-    def __init__(self, connected_val):
-        """Sets variables used to keep track of method call counts."""
-        self.loop_start_call_count = 0
-        self.is_connected_call_count = 0
-        self.loop_stop_call_count = 0
-        self.connected_val = connected_val
+def create_sender(qos=1, max_inflight=20, queue_size=100, spool_directory=''):
+    """
+    Creates an MQTTSender with a mock paho client, without connecting to anything or starting its sender loop.
 
-    def loop_start(self, *args, **kwargs):
-        self.loop_start_call_count += 1
+    Arguments:
+        qos (int) : The sender's QoS level. Defaults to 1.
+        max_inflight (int) : The sender's inflight window. Defaults to 20.
+        queue_size (int) : The sender's outbound queue size. Defaults to 100.
+        spool_directory (str) : The directory the sender spools to. Defaults to '', which disables the spool.
 
-    def is_connected(self, *args, **kwargs):
-        self.is_connected_call_count += 1
-        return self.connected_val
+    Returns:
+        MQTTSender : The sender.
+    """
+    environ_vars = {'MQTT_SENDER_TOPICS': ['topic'], 'MQTT_SENDER_QOS': qos, 'MQTT_SENDER_MAX_INFLIGHT': max_inflight,
+                    'MQTT_SENDER_QUEUE_SIZE': queue_size, 'MQTT_SENDER_BATCH_SIZE': 10,
+                    'MQTT_SENDER_SPOOL_DIRECTORY': spool_directory, 'MQTT_SENDER_SPOOL_MAX_BYTES': 1048576,
+                    'MQTT_SENDER_SPOOL_SEGMENT_BYTES': 65536, 'MQTT_SENDER_SPOOL_FSYNC': 'never'}
+    with mock.patch("lib.util.environment.get", side_effect=lambda name: environ_vars.get(name, 'value')), \
+            mock.patch("lib.util.environment.CONFIG", MagicMock(MQTT_SENDER_SPOOL_DIRECTORY=spool_directory)), \
+            mock.patch("lib.mqtt_client.MQTTClient._connect"), \
+            mock.patch("lib.sender_loop.SenderLoop.start"), \
+            mock.patch("lib.mqtt_sender.MQTTSender.test_connection"):
+        MQTTSender.client = MagicMock()
+        MQTTSender.monitor = ConnectionMonitor(1, 60)
+        return MQTTSender()
 
-    def loop_stop(self, *args, **kwargs):
-        self.loop_stop_call_count += 1
@@ -0,0 +1,72 @@
+from unittest import mock, TestCase
+from unittest.mock import MagicMock
+from lib.mqtt_sender_pool import MQTTSenderPool
+
+
+class TestMQTTSenderPool(TestCase):
+
+
+    @mock.patch("lib.mqtt_sender_pool.MQTTSender")
+    def test_init_invalid(self, m_s):
+        """lib.mqtt_sender_pool.MQTTSenderPool.__init__.invalid"""
+        with self.assertRaises(ValueError):
+            MQTTSenderPool(0)
+        with self.assertRaises(ValueError):
+            MQTTSenderPool(2, 'random')
+        m_s.assert_not_called()
+
+
+    @mock.patch("lib.mqtt_sender_pool.MQTTSender")
+    def test_publish_round_robin(self, m_s):
+        """lib.mqtt_sender_pool.MQTTSenderPool.publish.round_robin"""
+        # Create thing with three mock senders
+        m_s.side_effect = lambda index, threaded: MagicMock()
+        pool = MQTTSenderPool(3)
+
+        # Run the method four times, with the same key
+        for index in range(4):
+            pool.publish(f'message {index}', key='device._device.example.com')
+
+        # Run assertions
+        self.assertEqual([sender.publish.call_count for sender in pool.senders], [2, 1, 1])
+        pool.senders[0].publish.assert_called_with('message 3', None, False, None, None)
+
+
+    @mock.patch("lib.mqtt_sender_pool.MQTTSender")
+    def test_publish_hashed(self, m_s):
+        """lib.mqtt_sender_pool.MQTTSenderPool.publish.hashed"""
+        # Create thing with four mock senders
+        m_s.side_effect = lambda index, threaded: MagicMock()
+        pool = MQTTSenderPool(4, 'hashed')
+
+        # Run the method several times for each of two keys
+        for index in range(3):
+            pool.publish(f'message {index}', key='a._device.example.com')
+            pool.publish(f'message {index}', key='b._device.example.com')
+
+        # Run assertions, making sure each key stayed on a single connection
+        counts = [sender.publish.call_count for sender in pool.senders]
+        self.assertEqual(sum(counts), 6)
+        self.assertTrue(all(count in (0, 3, 6) for count in counts))
+
+
+    @mock.patch("lib.mqtt_sender_pool.MQTTSender")
+    def test_stats(self, m_s):
+        """lib.mqtt_sender_pool.MQTTSenderPool.stats"""
+        # Create thing with two mock senders, the second of which is disconnected
+        m_s.side_effect = lambda index, threaded: MagicMock(stats=MagicMock(return_value={'acked': 0}))
+        pool = MQTTSenderPool(2)
+        pool.senders[0].client.is_connected.return_value = True
+        pool.senders[1].client.is_connected.return_value = False
+        pool.publish('message')
+
+        # Run the method
+        stats = pool.stats()
+
+        # Run assertions
+        self.assertEqual(stats, {
+            'size': 2,
+            'distribution': 'round-robin',
+            'connections': [{'acked': 0, 'connected': True, 'published': 1},
+                            {'acked': 0, 'connected': False, 'published': 0}],
+        })
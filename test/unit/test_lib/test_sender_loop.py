@@ -0,0 +1,207 @@
+from unittest import mock, TestCase
+from unittest.mock import MagicMock
+from lib.sender_loop import SenderLoop
+import paho.mqtt.client as mqtt
+import threading
+import asyncio
+
+
+class TestSenderLoop(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.sender_loop.SenderLoop.__init__.invalid"""
+        with self.assertRaises(ValueError):
+            SenderLoop(MagicMock(), MagicMock(), 0, 10)
+        with self.assertRaises(ValueError):
+            SenderLoop(MagicMock(), MagicMock(), 10, 0)
+
+
+    def test_put_full(self):
+        """lib.sender_loop.SenderLoop.put.full"""
+        # Create thing with a queue that holds two messages
+        loop = SenderLoop(MagicMock(), MagicMock(), 2, 10)
+
+        # Run the method three times
+        accepted = [loop.put('topic', index) for index in range(3)]
+
+        # Run assertions
+        self.assertEqual(accepted, [True, True, False])
+        self.assertEqual(loop.stats()['queue_depth'], 2)
+        self.assertEqual(loop.stats()['dropped'], 1)
+
+
+    def test_put_overflow_spilled(self):
+        """lib.sender_loop.SenderLoop.put.overflow_spilled"""
+        # Create thing with a queue that holds two messages, and a spill callable
+        write = MagicMock()
+        spill = MagicMock()
+        loop = SenderLoop(MagicMock(), write, 2, 10, spill=spill)
+
+        # Run the method five times, which overflows the queue, then the overflow queue
+        accepted = [loop.put('topic', index) for index in range(5)]
+        flushed = loop.flush()
+
+        # Run assertions, everything accepted is spilled in order, and nothing is written
+        self.assertEqual(accepted, [True, True, True, True, False])
+        self.assertEqual(flushed, 4)
+        write.assert_not_called()
+        self.assertEqual(spill.call_args_list, [mock.call('topic', index) for index in range(4)])
+        self.assertEqual((loop.stats()['spilled'], loop.stats()['dropped']), (4, 1))
+
+        # Once the overflow is spilled, messages are written again
+        loop.put('topic', 5)
+        loop.flush()
+        write.assert_called_once_with('topic', 5)
+
+
+    @mock.patch("time.monotonic")
+    def test_flush_batch(self, m_m):
+        """lib.sender_loop.SenderLoop.flush.batch"""
+        # Create thing with a batch size of two, and queue three messages at time 1000
+        write = MagicMock()
+        loop = SenderLoop(MagicMock(), write, 10, 2)
+        m_m.return_value = 1000
+        for index in range(3):
+            loop.put('topic', index)
+
+        # Run the method at time 1000.5, three times
+        m_m.return_value = 1000.5
+        first = loop.flush()
+        second = loop.flush()
+        third = loop.flush()
+
+        # Run assertions
+        self.assertEqual((first, second, third), (2, 1, 0))
+        self.assertEqual(write.call_args_list, [mock.call('topic', 0), mock.call('topic', 1), mock.call('topic', 2)])
+        self.assertEqual(loop.stats()['flushes'], 2)
+        self.assertEqual(loop.stats()['written'], 3)
+        self.assertEqual(loop.stats()['average_flush_latency_seconds'], 0.5)
+
+
+    @mock.patch("logging.error")
+    def test_flush_write_error(self, m_le):
+        """lib.sender_loop.SenderLoop.flush.write_error"""
+        # Create thing whose first write raises
+        write = MagicMock(side_effect=[ValueError('bad qos'), None])
+        loop = SenderLoop(MagicMock(), write, 10, 10)
+        loop.put('topic', 0)
+        loop.put('topic', 1)
+
+        # Run the method
+        written = loop.flush()
+
+        # Run assertions
+        self.assertEqual(written, 2)
+        self.assertEqual(write.call_count, 2)
+        m_le.assert_called_once()
+
+
+    @mock.patch("time.sleep")
+    @mock.patch("logging.warning")
+    def test_service_reconnect(self, m_lw, m_ts):
+        """lib.sender_loop.SenderLoop.service.reconnect"""
+        # Create thing whose client has lost its connection, and can't get it back
+        client = MagicMock()
+        client.loop.return_value = mqtt.MQTT_ERR_CONN_LOST
+        client.reconnect.side_effect = ConnectionRefusedError()
+        loop = SenderLoop(client, MagicMock(), 10, 10)
+
+        # Run the method twice, the second time before the backoff is up
+        rc = loop.service()
+        loop.service()
+
+        # Run assertions, making sure the loop never blocked
+        self.assertEqual(rc, mqtt.MQTT_ERR_CONN_LOST)
+        client.loop.assert_called_with(timeout=0)
+        client.reconnect.assert_called_once()
+        m_ts.assert_not_called()
+        self.assertEqual(loop.monitor.stats()['disconnects'], 1)
+        self.assertEqual(loop.monitor.stats()['reconnect_attempts'], 1)
+
+
+    def test_run_and_stop(self):
+        """lib.sender_loop.SenderLoop.run_and_stop"""
+        # Create thing whose client is connected, and queue a message
+        client = MagicMock()
+        client.loop.return_value = mqtt.MQTT_ERR_SUCCESS
+        written = threading.Event()
+        loop = SenderLoop(client, lambda *args: written.set(), 10, 10, poll_interval=0.01)
+        loop.put('topic', 'message')
+
+        # Run the thread until the message is written, then stop it
+        loop.start()
+        self.assertTrue(written.wait(5))
+        loop.stop()
+        loop.join(5)
+
+        # Run assertions
+        self.assertFalse(loop.is_alive())
+        client.loop.assert_called()
+
+
+    def test_run_drain(self):
+        """lib.sender_loop.SenderLoop.run.drain"""
+        # Create thing, whose drain stops the loop on its second pass, and whose flush records its timeout
+        loop = SenderLoop(MagicMock(), MagicMock(), 10, 10, poll_interval=5)
+        drained = [3, 0]
+        def drain_side_effect():
+            if len(drained) == 1:
+                loop.stop()
+            return drained.pop(0)
+        loop.drain = drain_side_effect
+        loop.flush = MagicMock(return_value=0)
+        loop.service = MagicMock()
+
+        # Run the method
+        loop.run()
+
+        # Run assertions, the flush doesn't wait while there is something to drain
+        self.assertEqual(loop.flush.call_args_list, [mock.call(0), mock.call(5)])
+
+
+    @mock.patch("logging.error")
+    def test_run_drain_error(self, m_le):
+        """lib.sender_loop.SenderLoop.run.drain_error"""
+        # Create thing, whose drain raises and stops the loop
+        loop = SenderLoop(MagicMock(), MagicMock(), 10, 10, poll_interval=5)
+        def drain_side_effect():
+            loop.stop()
+            raise OSError('disk full')
+        loop.drain = drain_side_effect
+        loop.flush = MagicMock(return_value=0)
+        loop.service = MagicMock()
+
+        # Run the method
+        loop.run()
+
+        # Run assertions
+        m_le.assert_called_once()
+        loop.flush.assert_called_once_with(5)
+
+
+
+    def test_run_async(self):
+        """lib.sender_loop.SenderLoop.run_async"""
+        # Create thing, whose writes are recorded
+        written = []
+        loop = SenderLoop(MagicMock(), lambda *args: written.append(args), 10, 2, poll_interval=5)
+        loop.put('topic', 'queued before')
+
+        # Run the method, queueing a message from another thread while it waits, then stopping it
+        async def run():
+            task = asyncio.ensure_future(loop.run_async())
+            await asyncio.sleep(0.01)
+            thread = threading.Thread(target=loop.put, args=('topic', 'queued while waiting'))
+            thread.start()
+            thread.join(5)
+            while len(written) < 2:
+                await asyncio.sleep(0.001)
+            loop.stop()
+            await asyncio.wait_for(task, 5)
+        asyncio.run(run())
+
+        # Run assertions, the network loop is left to the event loop
+        self.assertEqual(written, [('topic', 'queued before'), ('topic', 'queued while waiting')])
+        loop.client.loop.assert_not_called()
+        self.assertIsNone(loop._wakeup)
@@ -0,0 +1,186 @@
+from unittest import TestCase
+from lib.single_flight import SingleFlight, AsyncSingleFlight
+import threading
+import asyncio
+import time
+
+
+class TestSingleFlight(TestCase):
+
+
+    def test_do_single_caller(self):
+        """lib.single_flight.SingleFlight.do.single_caller"""
+        # Create thing
+        flights = SingleFlight()
+
+        # Run the method
+        result = flights.do('key', lambda a, b: a + b, 1, 2)
+
+        # Run assertions
+        self.assertEqual(result, 3)
+        self.assertEqual(flights.stats(), {'in_flight': 0, 'leaders': 1, 'coalesced': 0})
+
+
+    def test_do_coalesced(self):
+        """lib.single_flight.SingleFlight.do.coalesced"""
+        # Create thing, and a function that blocks until released
+        flights = SingleFlight()
+        release = threading.Event()
+        calls = []
+        def function(value):
+            calls.append(value)
+            release.wait(5)
+            return value * 2
+
+        # Run the method from several threads, releasing once every follower is waiting
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do('key', function, 21))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while flights.stats()['coalesced'] < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        # Run assertions
+        self.assertEqual(calls, [21])
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(flights.stats(), {'in_flight': 0, 'leaders': 1, 'coalesced': 4})
+
+
+    def test_do_exception_shared(self):
+        """lib.single_flight.SingleFlight.do.exception_shared"""
+        # Create thing, and a function that raises once released
+        flights = SingleFlight()
+        release = threading.Event()
+        def function():
+            release.wait(5)
+            raise KeyError('nope')
+
+        # Run the method from two threads
+        errors = []
+        def call():
+            try:
+                flights.do('key', function)
+            except KeyError as e:
+                errors.append(e)
+        threads = [threading.Thread(target=call) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        while flights.stats()['coalesced'] < 1:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        # Run assertions
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+
+
+    def test_do_follower_timeout(self):
+        """lib.single_flight.SingleFlight.do.follower_timeout"""
+        # Create thing, and a leader that blocks until released
+        flights = SingleFlight()
+        release = threading.Event()
+        leader = threading.Thread(target=flights.do, args=('key', release.wait, 5))
+        leader.start()
+        while flights.stats()['in_flight'] < 1:
+            time.sleep(0.001)
+
+        # Run the method as a follower with a short timeout
+        with self.assertRaises(TimeoutError):
+            flights.do('key', release.wait, 5, timeout=0.01)
+
+        # Clean up
+        release.set()
+        leader.join(5)
+        self.assertEqual(flights.stats()['in_flight'], 0)
+
+
+    def test_do_different_keys(self):
+        """lib.single_flight.SingleFlight.do.different_keys"""
+        # Create thing
+        flights = SingleFlight()
+
+        # Run the method with two different keys
+        first = flights.do('a', str.upper, 'a')
+        second = flights.do('b', str.upper, 'b')
+
+        # Run assertions
+        self.assertEqual((first, second), ('A', 'B'))
+        self.assertEqual(flights.stats()['leaders'], 2)
+
+
+
+class TestAsyncSingleFlight(TestCase):
+
+
+    def test_do_coalesced(self):
+        """lib.single_flight.AsyncSingleFlight.do.coalesced"""
+        # Create thing, and a coroutine function that waits until released
+        flights = AsyncSingleFlight()
+        calls = []
+        async def function(value, release):
+            calls.append(value)
+            await release.wait()
+            return value * 2
+
+        # Run the method from several coroutines, releasing once every follower is waiting
+        async def run():
+            release = asyncio.Event()
+            callers = [asyncio.ensure_future(flights.do('key', function, 21, release)) for _ in range(5)]
+            await asyncio.sleep(0)
+            self.assertEqual(flights.stats(), {'in_flight': 1, 'leaders': 1, 'coalesced': 4})
+            release.set()
+            return await asyncio.gather(*callers)
+        results = asyncio.run(run())
+
+        # Run assertions
+        self.assertEqual(calls, [21])
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(flights.stats(), {'in_flight': 0, 'leaders': 1, 'coalesced': 4})
+
+
+    def test_do_timeout(self):
+        """lib.single_flight.AsyncSingleFlight.do.timeout"""
+        # Create thing, and a coroutine function that waits until released
+        flights = AsyncSingleFlight()
+        async def function(release):
+            await release.wait()
+            return 'done'
+
+        # Run the method with a short timeout, then again without one while the call is still in flight
+        async def run():
+            release = asyncio.Event()
+            with self.assertRaises(TimeoutError):
+                await flights.do('key', function, release, timeout=0.01)
+            follower = asyncio.ensure_future(flights.do('key', function, release))
+            await asyncio.sleep(0)
+            release.set()
+            return await follower
+        result = asyncio.run(run())
+
+        # Run assertions, the call kept running for the second caller
+        self.assertEqual(result, 'done')
+        self.assertEqual(flights.stats(), {'in_flight': 0, 'leaders': 1, 'coalesced': 1})
+
+
+    def test_do_exception_shared(self):
+        """lib.single_flight.AsyncSingleFlight.do.exception_shared"""
+        # Create thing, and a coroutine function that raises
+        flights = AsyncSingleFlight()
+        async def function():
+            await asyncio.sleep(0)
+            raise KeyError('nope')
+
+        # Run the method from two coroutines
+        async def run():
+            return await asyncio.gather(flights.do('key', function), flights.do('key', function),
+                                        return_exceptions=True)
+        errors = asyncio.run(run())
+
+        # Run assertions
+        self.assertIsInstance(errors[0], KeyError)
+        self.assertIs(errors[0], errors[1])
@@ -0,0 +1,171 @@
+from unittest import mock, TestCase
+from lib.spool import Spool
+import tempfile
+import os
+
+
+class TestSpool(TestCase):
+
+
+    def setUp(self):
+        """Creates the directory each spool is kept in."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+
+    def test_init_invalid(self):
+        """lib.spool.Spool.__init__.invalid"""
+        with self.assertRaises(ValueError):
+            Spool(self.directory.name, 0)
+        with self.assertRaises(ValueError):
+            Spool(self.directory.name, 1024, fsync='sometimes')
+
+
+    def test_append_peek_commit(self):
+        """lib.spool.Spool.append_peek_commit"""
+        # Create thing
+        spool = Spool(self.directory.name, 1048576, fsync='always')
+
+        # Run the methods, peeking twice before committing part of the peek
+        for index in range(3):
+            spool.append(f'topic/{index}', f'message {index}'.encode(), 1, index == 2)
+        first = spool.peek(2)
+        second = spool.peek(2)
+        spool.commit(1)
+        third = spool.peek(10)
+
+        # Run assertions
+        self.assertEqual(first, [('topic/0', b'message 0', 1, False), ('topic/1', b'message 1', 1, False)])
+        self.assertEqual(second, first)
+        self.assertEqual(third, [('topic/1', b'message 1', 1, False), ('topic/2', b'message 2', 1, True)])
+        self.assertFalse(spool.empty())
+
+        # Commit the rest, which gives the disk space back
+        spool.commit(2)
+        self.assertTrue(spool.empty())
+        self.assertEqual(spool.peek(10), [])
+        self.assertEqual(spool.stats(), {'max_bytes': 1048576, 'bytes': 0, 'segments': 1, 'appended': 3, 'dropped': 0,
+                                         'committed': 3})
+        spool.close()
+
+
+    def test_peek_skip(self):
+        """lib.spool.Spool.peek.skip"""
+        # Create thing holding three messages
+        spool = Spool(self.directory.name, 1048576, fsync='never')
+        for index in range(3):
+            spool.append('topic', f'message {index}'.encode())
+
+        # Run the method, skipping the first message, then commit across two calls
+        first = spool.peek(1)
+        second = spool.peek(10, skip=1)
+        spool.commit(1)
+        spool.commit(1)
+
+        # Run assertions, the skipped message can still be committed, along with the rest of the peek
+        self.assertEqual(first, [('topic', b'message 0', 0, False)])
+        self.assertEqual(second, [('topic', b'message 1', 0, False), ('topic', b'message 2', 0, False)])
+        self.assertEqual(spool.peek(10), [('topic', b'message 2', 0, False)])
+        spool.close()
+
+
+    def test_peek_read_once(self):
+        """lib.spool.Spool.peek.read_once"""
+        # Create thing holding three messages
+        spool = Spool(self.directory.name, 1048576, fsync='never')
+        for index in range(3):
+            spool.append('topic', f'message {index}'.encode())
+
+        # Run the method twice, skipping what the first call handed out, and count the records read from disk
+        with mock.patch("lib.spool.Spool._read_record", wraps=Spool._read_record) as m_rr:
+            first = spool.peek(2)
+            second = spool.peek(10, skip=2)
+            again = spool.peek(10)
+
+        # Run assertions, every record is read from disk once, and handed out again from memory
+        self.assertEqual([payload for _, payload, _, _ in first], [b'message 0', b'message 1'])
+        self.assertEqual(second, [('topic', b'message 2', 0, False)])
+        self.assertEqual([payload for _, payload, _, _ in again], [b'message 0', b'message 1', b'message 2'])
+        self.assertEqual(m_rr.call_count, 3)
+
+        # Committing everything starts over in a new segment, which is read from its start
+        spool.commit(3)
+        spool.append('topic', b'message 3')
+        self.assertEqual(spool.peek(10), [('topic', b'message 3', 0, False)])
+        spool.close()
+
+
+    def test_append_segments(self):
+        """lib.spool.Spool.append.segments"""
+        # Create thing whose segments hold two messages each
+        spool = Spool(self.directory.name, 1048576, segment_bytes=60, fsync='never')
+
+        # Run the method, then read through the first two segments
+        for index in range(5):
+            spool.append('topic', f'message {index}'.encode())
+        segments = spool.stats()['segments']
+        records = spool.peek(4)
+        spool.commit(4)
+
+        # Run assertions
+        self.assertEqual(segments, 3)
+        self.assertEqual([payload for _, payload, _, _ in records], [f'message {index}'.encode() for index in range(4)])
+        self.assertEqual(spool.stats()['segments'], 2)
+        self.assertEqual(spool.peek(10), [('topic', b'message 4', 0, False)])
+        spool.close()
+
+
+    def test_append_full(self):
+        """lib.spool.Spool.append.full"""
+        # Create thing with room for a single message
+        spool = Spool(self.directory.name, 40)
+
+        # Run the method twice
+        spooled = spool.append('topic', b'message 0')
+        dropped = spool.append('topic', b'message 1')
+
+        # Run assertions
+        self.assertTrue(spooled)
+        self.assertFalse(dropped)
+        self.assertEqual(spool.stats()['dropped'], 1)
+        spool.close()
+
+
+    def test_init_recovered(self):
+        """lib.spool.Spool.__init__.recovered"""
+        # Create thing, spool three messages and send one of them, then close it as if the process stopped
+        spool = Spool(self.directory.name, 1048576)
+        for index in range(3):
+            spool.append('topic', f'message {index}'.encode())
+        spool.peek(1)
+        spool.commit(1)
+        spool.close()
+
+        # Run the method, reopening the spool and adding another message
+        recovered = Spool(self.directory.name, 1048576)
+        recovered.append('topic', b'message 3')
+
+        # Run assertions, the unsent messages come first, in order
+        self.assertEqual([payload for _, payload, _, _ in recovered.peek(10)],
+                         [b'message 1', b'message 2', b'message 3'])
+        recovered.close()
+
+
+    def test_peek_damaged(self):
+        """lib.spool.Spool.peek.damaged"""
+        # Create thing with a message, and tear off the end of it as a crash would
+        spool = Spool(self.directory.name, 1048576)
+        spool.append('topic', b'message 0')
+        spool.close()
+        path = spool._path(0)
+        with open(path, 'r+b') as segment:
+            segment.truncate(os.path.getsize(path) - 2)
+
+        # Run the method after reopening the spool, and adding another message
+        recovered = Spool(self.directory.name, 1048576)
+        recovered.append('topic', b'message 1')
+        records = recovered.peek(10)
+
+        # Run assertions, the torn message is skipped
+        self.assertEqual(records, [('topic', b'message 1', 0, False)])
+        recovered.close()
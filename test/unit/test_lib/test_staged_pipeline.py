@@ -0,0 +1,102 @@
+from unittest import mock, TestCase
+from unittest.mock import MagicMock
+from lib.staged_pipeline import StagedPipeline
+import threading
+
+
+def create_pipeline(queue_size=10, overflow_policy='block'):
+    """Creates a StagedPipeline with one worker per stage."""
+    return StagedPipeline({stage: 1 for stage in StagedPipeline.STAGES}, queue_size, overflow_policy)
+
+
+class TestStagedPipeline(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.staged_pipeline.StagedPipeline.__init__.invalid"""
+        # Run the method with a missing stage, then with a stage without workers
+        with self.assertRaises(ValueError):
+            StagedPipeline({'parse': 1, 'resolve': 1, 'verify': 1}, 10)
+        with self.assertRaises(ValueError):
+            StagedPipeline({'parse': 1, 'resolve': 0, 'verify': 1, 'publish': 1}, 10)
+
+
+    def test_init_overflow_policy(self):
+        """lib.staged_pipeline.StagedPipeline.__init__.overflow_policy"""
+        # Create thing
+        pipeline = StagedPipeline({'parse': 1, 'resolve': 8, 'verify': 4, 'publish': 2}, 10, 'drop-newest')
+
+        # Run assertions, only the parse stage drops messages, and each stage has its own workers
+        self.assertEqual([stage.overflow_policy for stage in pipeline.stages.values()],
+                         ['drop-newest', 'block', 'block', 'block'])
+        self.assertEqual([stage.size for stage in pipeline.stages.values()], [1, 8, 4, 2])
+
+
+    @mock.patch("logging.info")
+    @mock.patch("logging.debug")
+    @mock.patch("lib.util.logger.SETUP_OVER", True)
+    @mock.patch("lib.util.environment.CONFIG")
+    @mock.patch("lib.authorization_client.AuthorizationClient.forward")
+    @mock.patch("lib.authorization_client.AuthorizationClient.verify_signature_with_timeout")
+    @mock.patch("lib.authorization_client.AuthorizationClient.resolve_tlsa_record")
+    @mock.patch("lib.authorization_client.AuthorizationClient.prepare")
+    def test_submit(self, m_p, m_rtr, m_vswt, m_f, m_c, m_ld, m_li):
+        """lib.staged_pipeline.StagedPipeline.submit"""
+        # Set side effects, so that each message gets one stage further than the one before it
+        m_c.DNS_TIMEOUT_SECONDS = 5
+        def prepare(message, details):
+            if message.topic == 'parse':
+                return None, None, ValueError()
+            details['dns_name'] = message.topic
+            return message.topic, message.payload, None
+        m_p.side_effect = prepare
+        m_rtr.side_effect = lambda dns_name, deadline: None if dns_name == 'resolve' else {'name': dns_name}
+        m_vswt.side_effect = lambda payload, tlsa_record, dns_name, deadline: dns_name != 'verify'
+
+        # Run the method for each message, then drain the pipeline
+        pipeline = create_pipeline()
+        pipeline.start()
+        for topic in ['parse', 'resolve', 'verify', 'publish']:
+            self.assertTrue(pipeline.submit(MagicMock(topic=topic, payload=b'payload')))
+        pipeline.shutdown()
+
+        # Run assertions
+        m_rtr.assert_has_calls([mock.call('resolve', mock.ANY), mock.call('verify', mock.ANY),
+                                mock.call('publish', mock.ANY)])
+        m_vswt.assert_called_with(b'payload', {'name': 'publish'}, 'publish', mock.ANY)
+        m_f.assert_called_once()
+        self.assertEqual(m_f.call_args[0][0].topic, 'publish')
+        self.assertEqual(m_f.call_args[0][1], {'dns_name': 'publish'})
+        stats = pipeline.stats()
+        self.assertEqual(stats['rejected'], {'parse': 1, 'resolve': 1, 'verify': 1})
+        self.assertEqual(stats['authorized'], 1)
+        self.assertEqual([stage['completed'] for stage in stats['stages'].values()], [4, 3, 2, 1])
+
+
+    @mock.patch("logging.debug")
+    @mock.patch("lib.util.logger.SETUP_OVER", True)
+    @mock.patch("lib.util.environment.CONFIG")
+    @mock.patch("lib.authorization_client.AuthorizationClient.resolve_tlsa_record")
+    @mock.patch("lib.authorization_client.AuthorizationClient.prepare")
+    def test_submit_slow_resolve(self, m_p, m_rtr, m_c, m_ld):
+        """lib.staged_pipeline.StagedPipeline.submit.slow_resolve"""
+        # Set the resolve stage to hang until released
+        m_c.DNS_TIMEOUT_SECONDS = 5
+        m_p.return_value = ('jerry', b'payload', None)
+        release = threading.Event()
+        m_rtr.side_effect = lambda dns_name, deadline: release.wait(5) and None
+
+        # Run the method for more messages than the resolve stage can take
+        pipeline = create_pipeline(queue_size=2)
+        pipeline.start()
+        for _ in range(3):
+            pipeline.submit(MagicMock(topic='jerry', payload=b'payload'))
+        parsed = threading.Event()
+        pipeline.stages['parse'].submit(parsed.set)
+
+        # Run assertions, parsing carries on while the resolve stage is stuck
+        self.assertTrue(parsed.wait(5))
+        self.assertEqual(pipeline.stats()['stages']['resolve']['queue_depth'], 2)
+        release.set()
+        pipeline.shutdown()
+        self.assertEqual(pipeline.stats()['rejected']['resolve'], 3)
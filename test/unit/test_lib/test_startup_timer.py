@@ -0,0 +1,74 @@
+from unittest import mock, TestCase
+from lib.startup_timer import StartupTimer
+import threading
+
+
+class TestStartupTimer(TestCase):
+
+
+    @mock.patch("time.monotonic")
+    def test_stage(self, m_m):
+        """lib.startup_timer.StartupTimer.stage"""
+        # Create thing at time 1000
+        m_m.return_value = 1000
+        timer = StartupTimer()
+
+        # Run the method for a step that takes half a second, and one that raises
+        with timer.stage('environment'):
+            m_m.return_value = 1000.5
+        with self.assertRaises(ValueError):
+            with timer.stage('broken'):
+                m_m.return_value = 1001
+                raise ValueError()
+
+        # Run assertions
+        self.assertEqual(timer.stats(), {'environment': 0.5, 'broken': 0.5, 'total': 1})
+
+
+    def test_start(self):
+        """lib.startup_timer.StartupTimer.start"""
+        # Create thing
+        timer = StartupTimer()
+
+        # Run the method for two steps that can only finish if they run at the same time
+        barrier = threading.Barrier(2, timeout=5)
+        first = timer.start('first', lambda value: barrier.wait() is not None and value, 'one')
+        second = timer.start('second', lambda value: barrier.wait() is not None and value, 'two')
+
+        # Run assertions
+        self.assertEqual((first.result(5), second.result(5)), ('one', 'two'))
+        self.assertEqual(set(timer.stats()), {'first', 'second', 'total'})
+
+
+    def test_start_exit(self):
+        """lib.startup_timer.StartupTimer.start.exit"""
+        # Create thing
+        timer = StartupTimer()
+
+        # Run the method for a step that exits, as a connection that times out does
+        future = timer.start('connection', exit, -1)
+
+        # Run assertions, the exit reaches whoever waits on the step
+        with self.assertRaises(SystemExit):
+            future.result(5)
+        self.assertIn('connection', timer.stats())
+
+
+    @mock.patch("logging.info")
+    def test_log(self, m_li):
+        """lib.startup_timer.StartupTimer.log"""
+        # Create thing, and run a step in place and one in the background
+        timer = StartupTimer()
+        with timer.stage('environment'):
+            pass
+        timer.start('listener connection', lambda: None).result(5)
+
+        # Run the method
+        timer.log()
+
+        # Run assertions
+        message = m_li.call_args[0][0]
+        self.assertTrue(message.startswith('Startup took '))
+        self.assertIn('environment', message)
+        self.assertIn('listener connection', message)
+        self.assertIn('(background)', message)
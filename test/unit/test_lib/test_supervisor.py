@@ -0,0 +1,188 @@
+from unittest import mock, TestCase
+from unittest.mock import MagicMock
+from lib.supervisor import Supervisor
+import tempfile
+import signal
+import time
+import os
+
+
+def create_supervisor(size, **kwargs):
+    """Creates a Supervisor whose processes are MagicMocks, and returns it along with the list of processes made."""
+    supervisor = Supervisor(size, print, **kwargs)
+    processes = []
+    def process_side_effect(*args, **kwargs):
+        process = MagicMock(exitcode=None)
+        process.is_alive.return_value = True
+        processes.append(process)
+        return process
+    supervisor.context = MagicMock()
+    supervisor.context.Process.side_effect = process_side_effect
+    return supervisor, processes
+
+
+def run_with_verifiers(index):
+    """Starts verifier processes the way a supervised process does, writes out their ids, then waits to be stopped."""
+    import main
+    from lib.authorization_client import AuthorizationClient
+    from lib.verifier_pool import VerifierPool
+    signal.signal(signal.SIGTERM, main.stop)
+    AuthorizationClient.verifier_pool = VerifierPool(2)
+    AuthorizationClient.verifier_pool.start()
+    pid_file = os.environ['TEST_VERIFIER_PID_FILE']
+    with open(f'{pid_file}.tmp', 'w') as file:
+        file.write(' '.join(str(worker.pid) for worker in list(AuthorizationClient.verifier_pool._idle.queue)))
+    os.replace(f'{pid_file}.tmp', pid_file)
+    while True:
+        time.sleep(1)
+
+
+def process_exists(pid):
+    """Returns whether or not a process with the given id is still running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+class TestSupervisor(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.supervisor.Supervisor.__init__.invalid"""
+        with self.assertRaises(ValueError):
+            Supervisor(0, print)
+
+
+    @mock.patch("logging.info")
+    def test_start(self, m_li):
+        """lib.supervisor.Supervisor.start"""
+        # Create thing
+        supervisor, processes = create_supervisor(3)
+
+        # Run the method
+        supervisor.start()
+
+        # Run assertions, every process is started with its index
+        self.assertEqual(len(processes), 3)
+        for process in processes:
+            process.start.assert_called_once()
+        self.assertEqual([call.kwargs['args'] for call in supervisor.context.Process.call_args_list], [(0,), (1,), (2,)])
+        self.assertEqual(supervisor.stats(), {'processes': 3, 'alive': 3, 'restarts': [0, 0, 0]})
+
+
+    @mock.patch("time.monotonic")
+    @mock.patch("logging.warning")
+    @mock.patch("logging.info")
+    def test_check_backoff(self, m_li, m_lw, m_m):
+        """lib.supervisor.Supervisor.check.backoff"""
+        # Create thing, and start it at time 1000
+        m_m.return_value = 1000
+        supervisor, processes = create_supervisor(2, min_restart_seconds=1, max_restart_seconds=3, stable_seconds=60)
+        supervisor.start()
+
+        # The first process exits right away, so it is restarted after the minimum wait
+        processes[0].is_alive.return_value = False
+        self.assertEqual(supervisor.check(), 0)
+        m_m.return_value = 1001
+        self.assertEqual(supervisor.check(), 1)
+
+        # It exits right away again, twice, so the wait doubles up to the maximum
+        processes[2].is_alive.return_value = False
+        supervisor.check()
+        m_m.return_value = 1002.9
+        self.assertEqual(supervisor.check(), 0)
+        m_m.return_value = 1003
+        self.assertEqual(supervisor.check(), 1)
+        processes[3].is_alive.return_value = False
+        supervisor.check()
+        m_m.return_value = 1005.9
+        self.assertEqual(supervisor.check(), 0)
+        m_m.return_value = 1006
+        self.assertEqual(supervisor.check(), 1)
+
+        # Run assertions, the second process was left alone
+        self.assertEqual(len(processes), 5)
+        self.assertEqual(supervisor.stats(), {'processes': 2, 'alive': 2, 'restarts': [3, 0]})
+
+
+    @mock.patch("time.monotonic")
+    @mock.patch("logging.warning")
+    @mock.patch("logging.info")
+    def test_check_stable(self, m_li, m_lw, m_m):
+        """lib.supervisor.Supervisor.check.stable"""
+        # Create thing, and start it at time 1000
+        m_m.return_value = 1000
+        supervisor, processes = create_supervisor(1, min_restart_seconds=1, stable_seconds=60)
+        supervisor.start()
+
+        # The process exits after running for longer than the stable time, so it is restarted right away
+        m_m.return_value = 1100
+        processes[0].is_alive.return_value = False
+        processes[0].exitcode = 1
+
+        # Run method and assertions
+        self.assertEqual(supervisor.check(), 1)
+        processes[0].join.assert_called_once()
+        self.assertEqual(supervisor.stats()['restarts'], [1])
+
+
+    @mock.patch("logging.info")
+    def test_stop(self, m_li):
+        """lib.supervisor.Supervisor.stop"""
+        # Create thing, with one process that exits when terminated, and one that has to be killed
+        supervisor, processes = create_supervisor(2)
+        supervisor.start()
+        processes[0].is_alive.return_value = False
+
+        # Run the method
+        supervisor.stop(timeout=1)
+
+        # Run assertions
+        for process in processes:
+            process.terminate.assert_called_once()
+            process.join.assert_any_call(1)
+        processes[0].kill.assert_not_called()
+        processes[1].kill.assert_called_once()
+
+
+    @mock.patch("lib.supervisor.wait")
+    @mock.patch("logging.info")
+    def test_run(self, m_li, m_w):
+        """lib.supervisor.Supervisor.run"""
+        # Create thing, which is stopped while waiting on its processes
+        supervisor, processes = create_supervisor(2)
+        m_w.side_effect = lambda sentinels, timeout: supervisor.stop()
+
+        # Run the method
+        supervisor.run(poll_interval=0.5)
+
+        # Run assertions
+        m_w.assert_called_once_with([processes[0].sentinel, processes[1].sentinel], timeout=0.5)
+        self.assertEqual(len(processes), 2)
+
+
+    @mock.patch("logging.info")
+    def test_stop_leaves_no_verifiers(self, m_li):
+        """lib.supervisor.Supervisor.stop.leaves_no_verifiers"""
+        with tempfile.TemporaryDirectory() as directory:
+            # Create thing, with a real process that starts verifier processes of its own
+            pid_file = os.path.join(directory, 'verifiers')
+            with mock.patch.dict(os.environ, {'TEST_VERIFIER_PID_FILE': pid_file}):
+                supervisor = Supervisor(1, run_with_verifiers)
+                supervisor.start()
+            deadline = time.monotonic() + 60
+            while not os.path.exists(pid_file) and time.monotonic() < deadline:
+                time.sleep(0.1)
+            with open(pid_file) as file:
+                pids = [int(pid) for pid in file.read().split()]
+
+            # Run the method
+            supervisor.stop()
+
+            # Run assertions, the process exited on its own, and took its verifier processes with it
+            self.assertEqual(supervisor._processes[0].exitcode, 0)
+            self.assertEqual(len(pids), 2)
+            for pid in pids:
+                self.assertFalse(process_exists(pid))
@@ -0,0 +1,158 @@
+from unittest import mock, TestCase
+from lib.tlsa_cache import TLSACache
+
+
+class TestTLSACache(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.tlsa_cache.TLSACache.__init__.invalid"""
+        with self.assertRaises(ValueError):
+            TLSACache(0, 10, 100)
+        with self.assertRaises(ValueError):
+            TLSACache(10, -1, 100)
+        with self.assertRaises(ValueError):
+            TLSACache(10, 100, 10)
+
+
+    def test_get_hit_and_miss(self):
+        """lib.tlsa_cache.TLSACache.get.hit_and_miss"""
+        # Create thing and add a record
+        cache = TLSACache(10, 0, 100)
+        cache.put('device.example.com', {'ttl': 60}, 60)
+
+        # Run the method
+        hit = cache.get('device.example.com')
+        miss = cache.get('other.example.com')
+
+        # Run assertions
+        self.assertEqual(hit, {'ttl': 60})
+        self.assertIsNone(miss)
+        self.assertEqual(cache.stats(), {'entries': 1, 'max_entries': 10, 'hits': 1, 'misses': 1, 'evictions': 0})
+
+
+    @mock.patch("time.monotonic")
+    def test_get_expired(self, m_m):
+        """lib.tlsa_cache.TLSACache.get.expired"""
+        # Create thing and add a record at time 1000
+        m_m.return_value = 1000
+        cache = TLSACache(10, 0, 100)
+        cache.put('device.example.com', {'ttl': 60}, 60)
+
+        # Run the method just before and just after it expires
+        m_m.return_value = 1059
+        before = cache.get('device.example.com')
+        m_m.return_value = 1060
+        after = cache.get('device.example.com')
+
+        # Run assertions
+        self.assertEqual(before, {'ttl': 60})
+        self.assertIsNone(after)
+        self.assertEqual(cache.stats()['entries'], 0)
+
+
+    @mock.patch("time.monotonic")
+    def test_put_ttl_clamped(self, m_m):
+        """lib.tlsa_cache.TLSACache.put.ttl_clamped"""
+        # Create thing with clamps of 30 and 300 seconds
+        m_m.return_value = 1000
+        cache = TLSACache(10, 30, 300)
+
+        # Run the method with a TTL below the minimum and one above the maximum
+        cache.put('short.example.com', {}, 1)
+        cache.put('long.example.com', {}, 86400)
+
+        # Run assertions
+        self.assertEqual(cache._entries['short.example.com'][0], 1030)
+        self.assertEqual(cache._entries['long.example.com'][0], 1300)
+
+
+    def test_put_lru_eviction(self):
+        """lib.tlsa_cache.TLSACache.put.lru_eviction"""
+        # Create thing that holds two entries
+        cache = TLSACache(2, 0, 100)
+        cache.put('a', {'name': 'a'}, 60)
+        cache.put('b', {'name': 'b'}, 60)
+
+        # Use 'a' so that 'b' becomes the least recently used, then add a third entry
+        cache.get('a')
+        cache.put('c', {'name': 'c'}, 60)
+
+        # Run assertions
+        self.assertEqual(cache.get('a'), {'name': 'a'})
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), {'name': 'c'})
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+    def test_invalidate(self):
+        """lib.tlsa_cache.TLSACache.invalidate"""
+        # Create thing and add a record
+        cache = TLSACache(10, 0, 100)
+        cache.put('device.example.com', {'ttl': 60}, 60)
+
+        # Run the method (twice, to make sure a missing name is fine)
+        cache.invalidate('device.example.com')
+        cache.invalidate('device.example.com')
+
+        # Run assertions
+        self.assertIsNone(cache.get('device.example.com'))
+
+
+    @mock.patch("time.monotonic")
+    def test_time_to_live(self, m_m):
+        """lib.tlsa_cache.TLSACache.time_to_live"""
+        # Create thing and add a record at time 1000
+        m_m.return_value = 1000
+        cache = TLSACache(10, 0, 100)
+        cache.put('device.example.com', {'ttl': 60}, 60)
+
+        # Run the method before expiry, after expiry, and for a missing name
+        m_m.return_value = 1045
+        before = cache.time_to_live('device.example.com')
+        m_m.return_value = 1060
+        after = cache.time_to_live('device.example.com')
+        missing = cache.time_to_live('other.example.com')
+
+        # Run assertions, making sure the counters were left alone
+        self.assertEqual(before, 15)
+        self.assertIsNone(after)
+        self.assertIsNone(missing)
+        self.assertEqual(cache.stats()['hits'], 0)
+        self.assertEqual(cache.stats()['misses'], 0)
+
+
+    @mock.patch("time.monotonic")
+    def test_expiring(self, m_m):
+        """lib.tlsa_cache.TLSACache.expiring"""
+        # Create thing and add records expiring at different times
+        m_m.return_value = 1000
+        cache = TLSACache(10, 0, 1000)
+        cache.put('expired', {}, 1)
+        cache.put('soon', {}, 20)
+        cache.put('later', {}, 500)
+
+        # Run the method
+        m_m.return_value = 1010
+        expiring = cache.expiring(15)
+
+        # Run assertions
+        self.assertEqual(expiring, ['soon'])
+
+
+    @mock.patch("time.monotonic")
+    def test_expiring_used_only(self, m_m):
+        """lib.tlsa_cache.TLSACache.expiring.used_only"""
+        # Create thing and add two records expiring soon, one of which is read
+        m_m.return_value = 1000
+        cache = TLSACache(10, 0, 1000)
+        cache.put('read', {}, 20)
+        cache.put('unread', {}, 20)
+        cache.get('read')
+
+        # Run the method
+        m_m.return_value = 1010
+        expiring = cache.expiring(15, used_only=True)
+
+        # Run assertions
+        self.assertEqual(expiring, ['read'])
@@ -0,0 +1,133 @@
+from unittest import mock, TestCase
+from unittest.mock import MagicMock
+from lib.tlsa_refresher import TLSARefresher
+from lib.tlsa_cache import TLSACache
+import threading
+
+
+class TestTLSARefresher(TestCase):
+
+
+    def test_refresh_due_startup(self):
+        """lib.tlsa_refresher.TLSARefresher.refresh_due.startup"""
+        # Create thing with an empty cache, and a refresh function that fills it
+        tlsa_cache = TLSACache(10, 0, 100)
+        refreshed = []
+        lock = threading.Lock()
+        def refresh(dns_name):
+            with lock:
+                refreshed.append(dns_name)
+            tlsa_cache.put(dns_name, {'ttl': 60}, 60)
+        refresher = TLSARefresher(['a', 'b', 'c'], tlsa_cache, TLSACache(10, 30, 30), refresh, 2, 10)
+        refresher.pool.start()
+
+        # Run the method
+        submitted = refresher.refresh_due()
+        refresher.pool.shutdown()
+
+        # Run assertions
+        self.assertEqual(submitted, 3)
+        self.assertEqual(sorted(refreshed), ['a', 'b', 'c'])
+        self.assertEqual(refresher._pending, set())
+
+        # A second pass has nothing to do, since everything is cached and nowhere near expiry
+        self.assertEqual(refresher.refresh_due(), 0)
+
+
+    @mock.patch("time.monotonic")
+    def test_refresh_due_expiring(self, m_m):
+        """lib.tlsa_refresher.TLSARefresher.refresh_due.expiring"""
+        # Create thing with a cache holding one entry that expires soon and one that doesn't
+        m_m.return_value = 1000
+        tlsa_cache = TLSACache(10, 0, 1000)
+        tlsa_cache.put('soon', {}, 5)
+        tlsa_cache.put('later', {}, 500)
+        refresher = TLSARefresher(['soon', 'later'], tlsa_cache, TLSACache(10, 30, 30), MagicMock(), 1, 10)
+        refresher.pool = MagicMock(submit=MagicMock(return_value=True))
+
+        # Run the method
+        submitted = refresher.refresh_due()
+
+        # Run assertions
+        self.assertEqual(submitted, 1)
+        refresher.pool.submit.assert_called_once_with(refresher._refresh, 'soon')
+
+
+    def test_refresh_due_skips_negative_and_pending(self):
+        """lib.tlsa_refresher.TLSARefresher.refresh_due.skips_negative_and_pending"""
+        # Create thing where one name failed recently and another is already pending
+        negative_tlsa_cache = TLSACache(10, 30, 30)
+        negative_tlsa_cache.put('broken', 'timeout', 30)
+        refresher = TLSARefresher(['broken', 'busy', 'fine'], TLSACache(10, 0, 100), negative_tlsa_cache, MagicMock(), 1, 10)
+        refresher._pending.add('busy')
+        refresher.pool = MagicMock(submit=MagicMock(return_value=True))
+
+        # Run the method
+        submitted = refresher.refresh_due()
+
+        # Run assertions
+        self.assertEqual(submitted, 1)
+        refresher.pool.submit.assert_called_once_with(refresher._refresh, 'fine')
+
+
+    def test_refresh_due_queue_full(self):
+        """lib.tlsa_refresher.TLSARefresher.refresh_due.queue_full"""
+        # Create thing whose pool rejects every job
+        refresher = TLSARefresher(['a'], TLSACache(10, 0, 100), TLSACache(10, 30, 30), MagicMock(), 1, 10)
+        refresher.pool = MagicMock(submit=MagicMock(return_value=False))
+
+        # Run the method
+        submitted = refresher.refresh_due()
+
+        # Run assertions, the name should not be stuck as pending
+        self.assertEqual(submitted, 0)
+        self.assertEqual(refresher._pending, set())
+
+
+    def test_refresh_exception(self):
+        """lib.tlsa_refresher.TLSARefresher._refresh.exception"""
+        # Create thing with a refresh function that raises
+        refresh = MagicMock(side_effect=RuntimeError('dns is down'))
+        refresher = TLSARefresher(['a'], TLSACache(10, 0, 100), TLSACache(10, 30, 30), refresh, 1, 10)
+        refresher._pending.add('a')
+
+        # Run the method
+        with self.assertRaises(RuntimeError):
+            refresher._refresh('a')
+
+        # Run assertions
+        self.assertEqual(refresher._pending, set())
+
+
+    @mock.patch("time.monotonic")
+    def test_refresh_due_wildcard_cold(self, m_m):
+        """lib.tlsa_refresher.TLSARefresher.refresh_due.wildcard_cold"""
+        # Create thing for a whitelist with only a wildcard rule, whose cache holds two names it matched, both of
+        # which expire soon, but only one of which has been read since it was stored
+        m_m.return_value = 1000
+        tlsa_cache = TLSACache(10, 0, 1000)
+        tlsa_cache.put('hot._device.example.com', {}, 5)
+        tlsa_cache.put('cold._device.example.com', {}, 5)
+        tlsa_cache.get('hot._device.example.com')
+        refresher = TLSARefresher([], tlsa_cache, TLSACache(10, 30, 30), MagicMock(), 1, 10)
+        refresher.pool = MagicMock(submit=MagicMock(return_value=True))
+
+        # Run the method
+        submitted = refresher.refresh_due()
+
+        # Run assertions, the cold name is left to expire
+        self.assertEqual(submitted, 1)
+        refresher.pool.submit.assert_called_once_with(refresher._refresh, 'hot._device.example.com')
+
+        # Once refreshed, the name has to be read again before it is refreshed again
+        tlsa_cache.put('hot._device.example.com', {}, 5)
+        self.assertEqual(tlsa_cache.expiring(10, used_only=True), [])
+
+
+    def test_init_queue_size(self):
+        """lib.tlsa_refresher.TLSARefresher.__init__.queue_size"""
+        # Create thing for a whitelist with a single rule
+        refresher = TLSARefresher(['a'], TLSACache(50, 0, 100), TLSACache(10, 30, 30), MagicMock(), 1, 10)
+
+        # Run assertions, every name that can be due fits in the queue
+        self.assertEqual(refresher.pool.queue_size, 51)
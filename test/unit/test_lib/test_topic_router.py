@@ -0,0 +1,74 @@
+from unittest import TestCase
+from lib.topic_router import TopicRouter
+
+
+class TestTopicRouter(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.topic_router.TopicRouter.__init__.invalid"""
+        with self.assertRaises(ValueError):
+            TopicRouter(['sensors/#|verified/{dns_name}'], [])
+        with self.assertRaises(ValueError):
+            TopicRouter(['sensors/#|*|verified/{device}'], [])
+        with self.assertRaises(ValueError):
+            TopicRouter(['sensors/#|*|verified/#'], [])
+        with self.assertRaises(ValueError):
+            TopicRouter(['sensors/#|*|verified|envelope'], [])
+        with self.assertRaises(ValueError):
+            TopicRouter([], [], default_mode='envelope')
+
+
+    def test_route(self):
+        """lib.topic_router.TopicRouter.route"""
+        # Create thing with a rule per device class, a catch-all audit rule, and a blank entry
+        router = TopicRouter(['sensors/+/temp|*._device.fleet.example.com|verified/{dns_name}',
+                              'sensors/#|ksu._device.example.com|campus/{source_topic}',
+                              'sensors/#|*|audit',
+                              ''], ['default'])
+
+        # Run the method
+        fleet = router.route('sensors/1/temp', 'a._device.fleet.example.com')
+        campus = router.route('sensors/2/humidity', 'ksu._device.example.com')
+        other = router.route('sensors/3/temp', 'b._device.example.com')
+        unmatched = router.route('doors/1', 'a._device.fleet.example.com')
+
+        # Run assertions
+        self.assertEqual(fleet, (('jws', ('verified/a._device.fleet.example.com', 'audit')),))
+        self.assertEqual(campus, (('jws', ('campus/sensors/2/humidity', 'audit')),))
+        self.assertEqual(other, (('jws', ('audit',)),))
+        self.assertEqual(unmatched, (('jws', ('default',)),))
+        self.assertEqual(router.stats(), {'rules': 3, 'cached_routes': 4})
+
+
+    def test_route_modes(self):
+        """lib.topic_router.TopicRouter.route.modes"""
+        # Create thing that strips the envelope for two destinations, and keeps it for the audit log and the default
+        router = TopicRouter(['sensors/#|*|plain/{dns_name}|payload',
+                              'sensors/#|*|packed/{dns_name}|payload+zlib',
+                              'sensors/#|*|audit',
+                              'sensors/#|*|plain/{dns_name}|jws'], ['default'], default_mode='jws')
+
+        # Run the method
+        routes = router.route('sensors/1', 'a')
+        unmatched = router.route('doors/1', 'a')
+
+        # Run assertions, the repeated destination keeps the mode of the first rule that produced it
+        self.assertEqual(routes, (('payload', ('plain/a',)), ('payload+zlib', ('packed/a',)), ('jws', ('audit',))))
+        self.assertEqual(unmatched, (('jws', ('default',)),))
+
+
+    def test_route_cached(self):
+        """lib.topic_router.TopicRouter.route.cached"""
+        # Create thing that caches at most two pairs
+        router = TopicRouter(['#|*|verified/{dns_name}'], [], max_cached_routes=2)
+
+        # Run the method for three pairs, then the first pair again
+        first = router.route('a', 'one')
+        router.route('b', 'two')
+        router.route('c', 'three')
+        again = router.route('a', 'one')
+
+        # Run assertions
+        self.assertEqual(first, again)
+        self.assertEqual(router.stats()['cached_routes'], 2)
@@ -13,6 +13,14 @@ class TestEnvironment(TestCase):
         'MOCK4': '1',
         'MOCK5': '0',
     }
+    OS_ENVIRON_MOCK_OPTIONAL = {
+        'MOCK1': 'oh yeah!',
+        'MOCK2': 'option1,option2,option3',
+        'MOCK3': '123',
+        'MOCK4': '1',
+        'MOCK5': '0',
+        'MOCK6': '7',
+    }
     OS_ENVIRON_MOCK_MISSINGONE = {
         'MOCK1': 'oh yeah!',
         'MOCK2': 'option1,option2,option3',
@@ -46,7 +54,11 @@ class TestEnvironment(TestCase):
             'MOCK2': list,
             'MOCK3': int,
             'MOCK4': bool,
-            'MOCK5': bool
+            'MOCK5': bool,
+            'MOCK6': int
+        }
+        environment.OPTIONAL_DOTENV_VARS = {
+            'MOCK6': '42'
         }
 
 
@@ -95,6 +107,7 @@ class TestEnvironment(TestCase):
 
         # Run assertions
         m_ld.assert_called()
+        self.assertEqual(environment.CONFIG.MOCK3, 123)
 
 
     @mock.patch('os.path.exists')
@@ -185,3 +198,52 @@ class TestEnvironment(TestCase):
         # Run the get method
         with self.assertRaises(UndefinedVariableError):
             environment.get('FAKE_MOCK')
+
+
+    @mock.patch.object(os, 'environ', OS_ENVIRON_MOCK)
+    def test_get_optional_default(self):
+        """lib.util.environment.get.optional.default"""
+        # Run the get method
+        get_val = environment.get('MOCK6')
+
+        # Run assertions
+        self.assertEqual(get_val, 42)
+
+
+    @mock.patch.object(os, 'environ', OS_ENVIRON_MOCK_OPTIONAL)
+    def test_get_optional_set(self):
+        """lib.util.environment.get.optional.set"""
+        # Run the get method
+        get_val = environment.get('MOCK6')
+
+        # Run assertions
+        self.assertEqual(get_val, 7)
+
+
+    @mock.patch.object(os, 'environ', OS_ENVIRON_MOCK)
+    def test_compile_config(self):
+        """lib.util.environment.compile_config"""
+        # Run the compile_config method
+        config = environment.compile_config()
+
+        # Run assertions
+        self.assertEqual(config.MOCK1, 'oh yeah!')
+        self.assertEqual(config.MOCK2, ('option1', 'option2', 'option3'))
+        self.assertEqual(config.MOCK3, 123)
+        self.assertIs(config.MOCK4, True)
+        self.assertIs(config.MOCK5, False)
+        self.assertEqual(config.MOCK6, 42)
+        with self.assertRaises(AttributeError):
+            config.MOCK3 = 456
+
+
+    @mock.patch.object(os, 'environ', OS_ENVIRON_MOCK)
+    @mock.patch.object(environment, 'COMPILED_DOTENV_VARS', {'MOCK2': frozenset})
+    def test_compile_config_compiled(self):
+        """lib.util.environment.compile_config.compiled"""
+        # Run the compile_config method
+        config = environment.compile_config()
+
+        # Run assertions
+        self.assertEqual(config.MOCK2, frozenset(['option1', 'option2', 'option3']))
+        self.assertIn('option2', config.MOCK2)
@@ -0,0 +1,56 @@
+from unittest import mock, TestCase
+from lib.util import forwarding
+import zlib
+
+
+class TestForwarding(TestCase):
+
+
+    def test_validate(self):
+        """lib.util.forwarding.validate"""
+        # Run the method, and run assertions
+        self.assertEqual(forwarding.validate('payload+zlib'), 'payload+zlib')
+        with self.assertRaises(ValueError):
+            forwarding.validate('envelope')
+
+
+    @mock.patch("lib.util.forwarding.zstandard", None)
+    def test_validate_no_zstandard(self):
+        """lib.util.forwarding.validate.no_zstandard"""
+        # Run the method, and run assertions
+        with self.assertRaises(ValueError):
+            forwarding.validate('payload+zstd')
+
+
+    def test_encode(self):
+        """lib.util.forwarding.encode"""
+        # Create things, 'eyJ0ZW1wIjogNzJ9' is the base64url encoding of '{"temp": 72}'
+        message = b'{"protected": "abc", "payload": "eyJ0ZW1wIjogNzJ9", "signature": "def"}'
+        segment = memoryview(b'eyJ0ZW1wIjogNzJ9')
+
+        # Run the method
+        full = forwarding.encode('jws', message, segment)
+        payload = forwarding.encode('payload', message, segment)
+        packed = forwarding.encode('payload+zlib', message, segment)
+        unencoded = forwarding.encode('payload', message, None)
+
+        # Run assertions
+        self.assertIs(full, message)
+        self.assertEqual(payload, b'{"temp": 72}')
+        self.assertEqual(packed[:5], b'zlib:')
+        self.assertEqual(zlib.decompress(packed[5:]), b'{"temp": 72}')
+        self.assertIs(unencoded, message)
+
+
+    @mock.patch("lib.util.forwarding.zstandard")
+    def test_encode_zstd(self, m_z):
+        """lib.util.forwarding.encode.zstd"""
+        # Set up mocks
+        m_z.ZstdCompressor.return_value.compress.return_value = b'compressed'
+
+        # Run the method
+        packed = forwarding.encode('payload+zstd', b'message', 'eyJ0ZW1wIjogNzJ9')
+
+        # Run assertions
+        m_z.ZstdCompressor.return_value.compress.assert_called_with(b'{"temp": 72}')
+        self.assertEqual(packed, b'zstd:compressed')
@@ -0,0 +1,105 @@
+from unittest import mock, TestCase
+from json import JSONDecodeError
+from lib.util import jws
+
+
+class TestJWS(TestCase):
+
+
+    def test_loads(self):
+        """lib.util.jws.loads"""
+        # Run the method
+        loaded = jws.loads(b'{"protected": "abc"}')
+
+        # Run assertions
+        self.assertEqual(loaded, {'protected': 'abc'})
+
+
+    @mock.patch("lib.util.jws.orjson", None)
+    def test_loads_no_orjson(self):
+        """lib.util.jws.loads.no_orjson"""
+        # Run the method
+        loaded = jws.loads(b'{"protected": "abc"}')
+
+        # Run assertions
+        self.assertEqual(loaded, {'protected': 'abc'})
+
+
+    def test_loads_invalid(self):
+        """lib.util.jws.loads.invalid"""
+        # Run the method, with both backends
+        with self.assertRaises(JSONDecodeError):
+            jws.loads(b'not json')
+        with mock.patch("lib.util.jws.orjson", None):
+            with self.assertRaises(JSONDecodeError):
+                jws.loads(b'not json')
+
+
+    def test_to_compact(self):
+        """lib.util.jws.to_compact"""
+        # Run the method
+        compact = jws.to_compact({'protected': 'aGVhZA', 'payload': 'Ym9keQ', 'signature': 'c2ln'}, {'alg': 'ES256'})
+
+        # Run assertions
+        self.assertEqual(compact, 'aGVhZA.Ym9keQ.c2ln')
+
+
+    def test_to_compact_not_possible(self):
+        """lib.util.jws.to_compact.not_possible"""
+        # Run the method on an unprotected header, an unencoded payload, and a missing signature
+        unprotected = jws.to_compact({'protected': 'aGVhZA', 'header': {}, 'payload': 'Ym9keQ', 'signature': 'c2ln'}, {})
+        unencoded = jws.to_compact({'protected': 'aGVhZA', 'payload': 'body', 'signature': 'c2ln'}, {'b64': False})
+        unsigned = jws.to_compact({'protected': 'aGVhZA', 'payload': 'Ym9keQ'}, {})
+
+        # Run assertions
+        self.assertIsNone(unprotected)
+        self.assertIsNone(unencoded)
+        self.assertIsNone(unsigned)
+
+
+    def test_split_compact(self):
+        """lib.util.jws.split_compact"""
+        # Run the method
+        data = b'aGVhZA.Ym9keQ.c2ln'
+        header, payload, signature = jws.split_compact(data)
+
+        # Run assertions, making sure the segments are views of the original bytes
+        self.assertEqual((bytes(header), bytes(payload), bytes(signature)), (b'aGVhZA', b'Ym9keQ', b'c2ln'))
+        self.assertIs(payload.obj, data)
+
+
+    def test_split_compact_not_compact(self):
+        """lib.util.jws.split_compact.not_compact"""
+        # Run assertions on JSON, too few dots, too many dots, a non-base64url header, and an empty header
+        self.assertIsNone(jws.split_compact(b'{"protected": "a.b.c"}'))
+        self.assertIsNone(jws.split_compact(b'aGVhZA.Ym9keQ'))
+        self.assertIsNone(jws.split_compact(b'aGVhZA.Ym9keQ.c2ln.c2ln'))
+        self.assertIsNone(jws.split_compact(b' [1, 2].Ym9keQ.c2ln'))
+        self.assertIsNone(jws.split_compact(b'.Ym9keQ.c2ln'))
+
+
+    def test_find_protected(self):
+        """lib.util.jws.find_protected"""
+        # Run the method
+        data = b'{"payload": "cGF5", "protected" : "eyJ4NXUiOiAiamVycnkifQ==", "signature": "c2ln"}'
+        protected = jws.find_protected(data)
+
+        # Run assertions, making sure the value is a view of the original bytes
+        self.assertEqual(bytes(protected), b'eyJ4NXUiOiAiamVycnkifQ==')
+        self.assertIs(protected.obj, data)
+        self.assertEqual(bytes(jws.find_protected('{"protected":"aGVhZA"}')), b'aGVhZA')
+
+
+    def test_find_protected_not_found(self):
+        """lib.util.jws.find_protected.not_found"""
+        # Run assertions on a missing member, a value that isn't a string, and a value written with escapes
+        self.assertIsNone(jws.find_protected(b'{"payload": "cGF5"}'))
+        self.assertIsNone(jws.find_protected(b'{"protected": {"x5u": "jerry"}}'))
+        self.assertIsNone(jws.find_protected(b'{"protected": "aGVh\\u005a"}'))
+
+
+    def test_base64url_decode(self):
+        """lib.util.jws.base64url_decode"""
+        # Run assertions on unpadded and url-safe input
+        self.assertEqual(jws.base64url_decode(memoryview(b'eyJhIjoxfQ')), b'{"a":1}')
+        self.assertEqual(jws.base64url_decode('-_8'), b'\xfb\xff')
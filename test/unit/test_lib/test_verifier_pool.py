@@ -0,0 +1,181 @@
+from unittest import mock, TestCase
+from unittest.mock import MagicMock
+from lib.verifier_pool import VerifierPool, VerifierWorker
+import queue
+import time
+
+
+class TestVerifierPool(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.verifier_pool.VerifierPool.__init__.invalid"""
+        with self.assertRaises(ValueError):
+            VerifierPool(0)
+
+
+    @mock.patch("lib.verifier_pool.VerifierWorker")
+    def test_start(self, m_vw):
+        """lib.verifier_pool.VerifierPool.start"""
+        # Create thing
+        pool = VerifierPool(3)
+
+        # Run the method
+        pool.start()
+
+        # Run assertions
+        self.assertEqual(m_vw.call_count, 3)
+        self.assertEqual(pool.stats()['idle'], 3)
+
+
+    def test_run_success(self):
+        """lib.verifier_pool.VerifierPool.run.success"""
+        # Create thing with a single mock worker that answers immediately
+        pool = VerifierPool(1)
+        worker = MockVerifierWorker('verified!')
+        pool._idle.put(worker)
+
+        # Run the method
+        finished, result = pool.run('target', ('payload', 3), 10)
+
+        # Run assertions
+        self.assertTrue(finished)
+        self.assertEqual(result, 'verified!')
+        self.assertEqual(worker.jobs[0][:2], ('target', ('payload', 3)))
+        self.assertFalse(worker.terminated)
+        self.assertEqual(pool.stats(), {'processes': 1, 'idle': 1, 'jobs': 1, 'timeouts': 0, 'recycled': 0})
+
+
+    @mock.patch("lib.verifier_pool.VerifierWorker")
+    def test_run_timeout(self, m_vw):
+        """lib.verifier_pool.VerifierPool.run.timeout"""
+        # Create thing with a single mock worker that never answers
+        pool = VerifierPool(1)
+        worker = MockVerifierWorker(None, answers=False)
+        pool._idle.put(worker)
+        replacement = MagicMock()
+        m_vw.return_value = replacement
+
+        # Run the method
+        finished, result = pool.run('target', ('payload', 3), 0.05)
+
+        # Run assertions
+        self.assertFalse(finished)
+        self.assertIsNone(result)
+        self.assertTrue(worker.terminated)
+        self.assertIs(pool._idle.get_nowait(), replacement)
+        self.assertEqual(pool._timeouts, 1)
+        self.assertEqual(pool._recycled, 1)
+
+
+    def test_run_no_idle_worker(self):
+        """lib.verifier_pool.VerifierPool.run.no_idle_worker"""
+        # Create thing without any idle workers
+        pool = VerifierPool(1)
+
+        # Run the method
+        finished, result = pool.run('target', ('payload', 3), 0.05)
+
+        # Run assertions
+        self.assertIsNone(finished)
+        self.assertIsNone(result)
+        self.assertEqual(pool._timeouts, 1)
+
+
+    @mock.patch("lib.verifier_pool.VerifierWorker")
+    def test_run_dead_worker(self, m_vw):
+        """lib.verifier_pool.VerifierPool.run.dead_worker"""
+        # Create thing with a dead worker, which should be replaced before the job is sent
+        pool = VerifierPool(1)
+        dead_worker = MockVerifierWorker(None, alive=False)
+        pool._idle.put(dead_worker)
+        replacement = MockVerifierWorker('verified!')
+        m_vw.return_value = replacement
+
+        # Run the method
+        finished, result = pool.run('target', ('payload', 3), 10)
+
+        # Run assertions
+        self.assertTrue(finished)
+        self.assertEqual(result, 'verified!')
+        self.assertTrue(dead_worker.terminated)
+        self.assertEqual(dead_worker.jobs, [])
+        self.assertEqual(len(replacement.jobs), 1)
+
+
+    def test_loop(self):
+        """lib.verifier_pool.VerifierWorker.loop"""
+        # Create the queues, with one live job, one expired job, and the stop signal
+        job_queue = queue.Queue()
+        result_queue = queue.Queue()
+        job_queue.put((MockVerifierWorker.target, ('hello',), time.time() + 100))
+        job_queue.put((MockVerifierWorker.target, ('too late',), time.time() - 100))
+        job_queue.put(None)
+
+        # Run the method
+        VerifierWorker.loop(job_queue, result_queue)
+
+        # Run assertions
+        self.assertEqual(result_queue.get_nowait(), 'hello')
+        self.assertIsNone(result_queue.get_nowait())
+        self.assertTrue(result_queue.empty())
+
+
+    def test_loop_parent_exited(self):
+        """lib.verifier_pool.VerifierWorker.loop.parent_exited"""
+        # Create the queues, without any jobs, and a parent process id that isn't this process's parent
+        job_queue = queue.Queue()
+        result_queue = queue.Queue()
+
+        # Run the method, which returns instead of waiting on jobs forever
+        VerifierWorker.loop(job_queue, result_queue, parent_pid=-1, poll_interval=0.01)
+
+        # Run assertions
+        self.assertTrue(result_queue.empty())
+
+
+    def test_shutdown(self):
+        """lib.verifier_pool.VerifierPool.shutdown"""
+        # Create thing with two idle workers
+        pool = VerifierPool(2)
+        workers = [MagicMock(), MagicMock()]
+        for worker in workers:
+            pool._idle.put(worker)
+
+        # Run the method
+        pool.shutdown(timeout=0.5)
+
+        # Run assertions, every worker is asked to stop and waited on
+        for worker in workers:
+            worker.stop.assert_called_once()
+            worker.join.assert_called_once_with(0.5)
+        self.assertEqual(pool.stats()['idle'], 0)
+
+
+class MockVerifierWorker:
+
+    def __init__(self, result, answers=True, alive=True):
+        """Sets variables used to keep track of the jobs sent to the worker."""
+        self.result = result
+        self.answers = answers
+        self.alive = alive
+        self.jobs = []
+        self.terminated = False
+        self.pid = 1234
+        self.job_queue = MagicMock(put=self.put_job)
+        self.result_queue = queue.Queue()
+
+    def put_job(self, job):
+        self.jobs.append(job)
+        if self.answers:
+            self.result_queue.put(self.result)
+
+    def is_alive(self):
+        return self.alive
+
+    def terminate(self):
+        self.terminated = True
+
+    @staticmethod
+    def target(result_queue, value):
+        result_queue.put(value)
@@ -0,0 +1,58 @@
+from unittest import TestCase
+from lib.whitelist import Whitelist
+
+
+class TestWhitelist(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.whitelist.Whitelist.__init__.invalid"""
+        with self.assertRaises(ValueError):
+            Whitelist(['*.'])
+        with self.assertRaises(ValueError):
+            Whitelist(['ksu.*.example.com'])
+
+
+    def test_init_skips_blank(self):
+        """lib.whitelist.Whitelist.__init__.skips_blank"""
+        # Create thing from a split .env value with a trailing comma
+        whitelist = Whitelist('ksu._device.example.com,'.split(','))
+
+        # Run assertions
+        self.assertEqual(len(whitelist), 1)
+
+
+    def test_contains_exact(self):
+        """lib.whitelist.Whitelist.__contains__.exact"""
+        # Create thing
+        whitelist = Whitelist(['ksu._device.example.com'])
+
+        # Run assertions, including case and trailing dot differences
+        self.assertIn('ksu._device.example.com', whitelist)
+        self.assertIn('KSU._device.Example.com.', whitelist)
+        self.assertNotIn('_device.example.com', whitelist)
+        self.assertNotIn('other.ksu._device.example.com', whitelist)
+        self.assertNotIn('uga._device.example.com', whitelist)
+
+
+    def test_contains_wildcard(self):
+        """lib.whitelist.Whitelist.__contains__.wildcard"""
+        # Create thing
+        whitelist = Whitelist(['*._device.fleet.example.com'])
+
+        # Run assertions
+        self.assertIn('ksu._device.fleet.example.com', whitelist)
+        self.assertIn('a.b._device.fleet.example.com', whitelist)
+        self.assertNotIn('_device.fleet.example.com', whitelist)
+        self.assertNotIn('ksu._device.example.com', whitelist)
+        self.assertNotIn('ksu_device.fleet.example.com', whitelist)
+
+
+    def test_exact_names(self):
+        """lib.whitelist.Whitelist.exact_names"""
+        # Create thing with a mix of exact names and wildcard rules
+        whitelist = Whitelist(['ksu._device.example.com', '*._device.fleet.example.com', 'UGA._device.example.com.'])
+
+        # Run assertions
+        self.assertEqual(whitelist.exact_names(), ['ksu._device.example.com', 'uga._device.example.com'])
+        self.assertEqual(len(whitelist), 3)
@@ -0,0 +1,139 @@
+from unittest import mock, TestCase
+from lib.worker_pool import WorkerPool
+import threading
+
+
+class TestWorkerPool(TestCase):
+
+
+    def test_init_invalid(self):
+        """lib.worker_pool.WorkerPool.__init__.invalid"""
+        # Run the method with each invalid argument
+        with self.assertRaises(ValueError):
+            WorkerPool(0, 10)
+        with self.assertRaises(ValueError):
+            WorkerPool(1, 0)
+        with self.assertRaises(ValueError):
+            WorkerPool(1, 10, 'drop-everything')
+
+
+    def test_submit_runs_jobs(self):
+        """lib.worker_pool.WorkerPool.submit.runs_jobs"""
+        # Create and start the pool
+        pool = WorkerPool(4, 100)
+        pool.start()
+
+        # Submit a bunch of jobs that record their argument
+        results = []
+        lock = threading.Lock()
+        def job(value):
+            with lock:
+                results.append(value)
+        for value in range(50):
+            self.assertTrue(pool.submit(job, value))
+
+        # Shut down, which finishes every queued job
+        pool.shutdown()
+
+        # Run assertions
+        self.assertEqual(sorted(results), list(range(50)))
+        stats = pool.stats()
+        self.assertEqual(stats['submitted'], 50)
+        self.assertEqual(stats['completed'], 50)
+        self.assertEqual(stats['dropped'], 0)
+        self.assertEqual(stats['queue_depth'], 0)
+
+
+    def test_submit_drop_newest(self):
+        """lib.worker_pool.WorkerPool.submit.drop_newest"""
+        # Create the pool, but don't start it so the queue fills up
+        pool = WorkerPool(1, 2, 'drop-newest')
+
+        # Run the method
+        accepted = [pool.submit(print, value) for value in range(4)]
+
+        # Run assertions
+        self.assertEqual(accepted, [True, True, False, False])
+        self.assertEqual(pool.stats()['queue_depth'], 2)
+        self.assertEqual(pool.stats()['dropped'], 2)
+        self.assertEqual([job[2] for job in pool._queue], [(0,), (1,)])
+
+
+    def test_submit_drop_oldest(self):
+        """lib.worker_pool.WorkerPool.submit.drop_oldest"""
+        # Create the pool, but don't start it so the queue fills up
+        pool = WorkerPool(1, 2, 'drop-oldest')
+
+        # Run the method
+        accepted = [pool.submit(print, value) for value in range(4)]
+
+        # Run assertions
+        self.assertEqual(accepted, [True, True, True, True])
+        self.assertEqual(pool.stats()['queue_depth'], 2)
+        self.assertEqual(pool.stats()['dropped'], 2)
+        self.assertEqual([job[2] for job in pool._queue], [(2,), (3,)])
+
+
+    def test_submit_block(self):
+        """lib.worker_pool.WorkerPool.submit.block"""
+        # Create the pool with a single-job queue, and a job that holds the only worker
+        pool = WorkerPool(1, 1, 'block')
+        release = threading.Event()
+        pool.start()
+        pool.submit(release.wait)
+        pool.submit(print, 'queued')
+
+        # Submit a third job from another thread, which should block until the queue has room
+        submitter = threading.Thread(target=pool.submit, args=(print, 'blocked'))
+        submitter.start()
+        submitter.join(0.1)
+        self.assertTrue(submitter.is_alive())
+
+        # Let the worker go, which should unblock the submitter
+        release.set()
+        submitter.join(1)
+        pool.shutdown()
+
+        # Run assertions
+        self.assertFalse(submitter.is_alive())
+        self.assertEqual(pool.stats()['completed'], 3)
+
+
+    @mock.patch("logging.error")
+    def test_work_exception(self, m_e):
+        """lib.worker_pool.WorkerPool._work.exception"""
+        # Create and start the pool
+        pool = WorkerPool(1, 10)
+        pool.start()
+
+        # Submit a job that raises, then one that doesn't
+        def bad_job():
+            raise RuntimeError('whoops')
+        results = []
+        pool.submit(bad_job)
+        pool.submit(results.append, 'still alive')
+        pool.shutdown()
+
+        # Run assertions
+        m_e.assert_called_once()
+        self.assertEqual(results, ['still alive'])
+        self.assertEqual(pool.stats()['completed'], 2)
+
+
+    @mock.patch("time.monotonic")
+    def test_work_run_time(self, m_m):
+        """lib.worker_pool.WorkerPool._work.run_time"""
+        # Set the clock so that the job waits 1 second, then takes 2 seconds
+        m_m.side_effect = [10.0, 11.0, 11.0, 13.0]
+        pool = WorkerPool(1, 10)
+        pool.submit(print, 'job')
+
+        # Run the method on this thread, with the pool already shut down so it returns once the queue is empty
+        pool._running = False
+        pool._work()
+
+        # Run assertions
+        stats = pool.stats()
+        self.assertEqual(stats['average_wait_seconds'], 1.0)
+        self.assertEqual(stats['average_run_seconds'], 2.0)
+        self.assertEqual(stats['max_run_seconds'], 2.0)